@@ -7,43 +7,74 @@ do banco PostgreSQL.
 - Código limpo e bem documentado
 - Compatível com o SQLAlchemy 2.x
 - Facilita consultas e agregações para o módulo analytics_service.py
+- Espelha as tabelas REAIS do ERP (data/schema_postgres.sql); o schema oficial
+  continua sendo o .sql — os modelos mapeiam apenas as colunas usadas pela API
+  (FKs para tabelas não mapeadas, como brands e customers, ficam só no .sql)
 """
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import (
+    Boolean, CHAR, Column, Date, DateTime, ForeignKey, Integer, Numeric, SmallInteger, String,
+)
 from sqlalchemy.orm import relationship
-from datetime import datetime
 from .session import Base
 
 
-# 🧾 Modelo de Tabela: Restaurantes
-class Restaurant(Base):
+# 🏬 Modelo de Tabela: Lojas
+class Store(Base):
     """
-    🍽️ Representa um restaurante cadastrado no sistema.
+    🍽️ Representa uma loja (ponto de venda) de uma marca.
     """
-    __tablename__ = "restaurants"
+    __tablename__ = "stores"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), nullable=False)
-    location = Column(String(150), nullable=True)
+    brand_id = Column(Integer, nullable=True)
+    sub_brand_id = Column(Integer, nullable=True)
+    name = Column(String(255), nullable=False)
+    city = Column(String(100), nullable=True)
+    state = Column(String(2), nullable=True)
+    is_active = Column(Boolean, default=True)
+    creation_date = Column(Date, nullable=True)
 
     # 🔗 Relacionamento com vendas
-    sales = relationship("Sale", back_populates="restaurant")
+    sales = relationship("Sale", back_populates="store")
+
+
+# 📡 Modelo de Tabela: Canais de venda
+class Channel(Base):
+    """
+    📡 Canal de venda (P = Presencial, D = Delivery).
+    """
+    __tablename__ = "channels"
+
+    id = Column(Integer, primary_key=True, index=True)
+    brand_id = Column(Integer, nullable=True)
+    name = Column(String(100), nullable=False)
+    description = Column(String(255), nullable=True)
+    type = Column(CHAR(1), nullable=True)
 
 
 # 💰 Modelo de Tabela: Vendas
 class Sale(Base):
     """
-    💵 Representa uma venda registrada (simulada ou real).
+    💵 Representa uma venda registrada no ERP (tabela sales).
     """
     __tablename__ = "sales"
 
     id = Column(Integer, primary_key=True, index=True)
-    restaurant_id = Column(Integer, ForeignKey("restaurants.id"), nullable=False)
-    product_name = Column(String(120), nullable=False)
-    quantity = Column(Integer, nullable=False, default=1)
-    total_value = Column(Float, nullable=False)
-    sale_channel = Column(String(50), nullable=False, default="Presencial")  # iFood, Rappi, etc.
-    sale_date = Column(DateTime, default=datetime.utcnow)
-
-    # 🔗 Relação reversa com restaurante
-    restaurant = relationship("Restaurant", back_populates="sales")
+    store_id = Column(Integer, ForeignKey("stores.id"), nullable=False)
+    sub_brand_id = Column(Integer, nullable=True)
+    customer_id = Column(Integer, nullable=True)
+    channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False)
+    cod_sale1 = Column(String(100), nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    sale_status_desc = Column(String(100), nullable=False)
+    total_amount_items = Column(Numeric(10, 2), nullable=False)
+    total_amount = Column(Numeric(10, 2), nullable=False)
+    production_seconds = Column(Integer, nullable=True)
+    delivery_seconds = Column(Integer, nullable=True)
+    # 📅 Dia (AAAAMMDD) e hora no fuso das lojas (ver calendar_service)
+    date_key = Column(Integer, nullable=True)
+    hour_key = Column(SmallInteger, nullable=True)
+
+    # 🔗 Relação reversa com a loja
+    store = relationship("Store", back_populates="sales")
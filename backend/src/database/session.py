@@ -8,12 +8,19 @@ usando SQLAlchemy para gerenciamento de sessões e engine.
 - Facilidade de integração com os serviços e modelos do projeto
 - Suporta conexão LOCAL ou CLOUD (Supabase)
 - Importa automaticamente o schema do banco (schema_postgres.sql) **APENAS QUANDO CHAMADO**
+- Roteia leituras analíticas para réplicas (round-robin + health check + limite de lag)
+- Mapa de shards por marca (brand_id → banco) para consultas por marca e entre marcas
 """
 
+from contextlib import contextmanager
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv, find_dotenv
 import os
+import threading
+import time
 
 # 🔧 Carrega variáveis de ambiente do arquivo .env (robusto, funciona a partir de subpastas)
 load_dotenv(find_dotenv(), override=False)
@@ -36,6 +43,19 @@ DATABASE_URL_CLOUD = os.getenv(
 # Seleciona a URL de conexão com base no modo
 DATABASE_URL = DATABASE_URL_CLOUD if DB_MODE == "CLOUD" else DATABASE_URL_LOCAL
 
+# Réplicas de leitura (opcional): lista separada por vírgulas
+# Ex.: DATABASE_URL_REPLICAS=postgresql://u:p@replica1:5432/db,postgresql://u:p@replica2:5432/db
+DATABASE_URL_REPLICAS = [
+    u.strip() for u in os.getenv("DATABASE_URL_REPLICAS", "").split(",") if u.strip()
+]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "30"))
+REPLICA_HEALTH_TTL_SECONDS = float(os.getenv("REPLICA_HEALTH_TTL_SECONDS", "10"))
+
+# Shards por marca (opcional): brand_id=url separados por vírgula
+# Ex.: BRAND_SHARDS=1=postgresql://u:p@h1:5432/marca1,2=postgresql://u:p@h2:5432/marca2
+# Marcas fora do mapa continuam no banco principal (DATABASE_URL).
+BRAND_SHARDS_RAW = os.getenv("BRAND_SHARDS", "")
+
 # ============================================================
 # ⚙️ Criação da engine do SQLAlchemy
 # ============================================================
@@ -49,6 +69,233 @@ engine = create_engine(
     pool_pre_ping=True,  # melhora resiliência a conexões ociosas
 )
 
+# ============================================================
+# 📚 Réplicas de leitura (roteamento das consultas analíticas)
+# ============================================================
+# - Escritas (gerador, ingestão, jobs) continuam usando `engine` (primário).
+# - Leituras de métricas usam read_connection(): round-robin entre réplicas
+#   saudáveis; se nenhuma estiver apta, cai para o primário.
+replica_engines = [
+    create_engine(
+        url,
+        echo=False,
+        future=True,
+        pool_pre_ping=True,
+        connect_args={"connect_timeout": 3},
+    )
+    for url in DATABASE_URL_REPLICAS
+]
+
+# Lag de replicação em segundos (0 quando a réplica está em dia ou não está em recovery)
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class ReplicaRouter:
+    """
+    🔀 Seleciona a engine de leitura.
+    - Round-robin entre réplicas
+    - Health check (SELECT de lag) com cache de REPLICA_HEALTH_TTL_SECONDS
+    - Réplica com lag > REPLICA_MAX_LAG_SECONDS é ignorada até o próximo check
+    - Um probe por réplica por vez; quem chega durante o probe usa o estado em cache
+    """
+
+    def __init__(self, primary: Engine, replicas: list):
+        self.primary = primary
+        self.replicas = replicas
+        self._next = 0
+        self._lock = threading.Lock()
+        # idx → {"healthy": bool, "lag": float | None, "checked_at": float, "probing": bool}
+        self._status = {
+            i: {"healthy": True, "lag": None, "checked_at": 0.0, "probing": False}
+            for i in range(len(replicas))
+        }
+
+    def _check(self, idx: int) -> bool:
+        # Reserva o probe sob o lock: com a réplica travada no connect, só uma
+        # requisição espera o health check; as demais seguem com o estado em cache
+        with self._lock:
+            st = self._status[idx]
+            if st["probing"] or time.monotonic() - st["checked_at"] < REPLICA_HEALTH_TTL_SECONDS:
+                return st["healthy"]
+            st["probing"] = True
+        healthy, lag = False, None
+        try:
+            with self.replicas[idx].connect() as conn:
+                lag = float(conn.execute(text(REPLICA_LAG_SQL)).scalar() or 0.0)
+            healthy = lag <= REPLICA_MAX_LAG_SECONDS
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                st.update(healthy=healthy, lag=lag, checked_at=time.monotonic(), probing=False)
+        return healthy
+
+    def get_read_engine(self) -> Engine:
+        """Próxima réplica saudável (round-robin) ou o primário."""
+        n = len(self.replicas)
+        for _ in range(n):
+            with self._lock:
+                idx = self._next
+                self._next = (self._next + 1) % n
+            if self._check(idx):
+                return self.replicas[idx]
+        return self.primary
+
+    def mark_down(self, eng: Engine) -> None:
+        """Marca uma réplica como indisponível (até o próximo health check)."""
+        with self._lock:
+            for idx, replica in enumerate(self.replicas):
+                if replica is eng:
+                    self._status[idx].update(healthy=False, checked_at=time.monotonic())
+
+    def status(self) -> list:
+        """Estado atual das réplicas (sem credenciais) para observabilidade."""
+        with self._lock:
+            return [
+                {
+                    "replica": self.replicas[i].url.host,
+                    "healthy": st["healthy"],
+                    "lag_seconds": st["lag"],
+                }
+                for i, st in self._status.items()
+            ]
+
+
+replica_router = ReplicaRouter(engine, replica_engines)
+
+
+def get_read_engine() -> Engine:
+    """Engine para leituras analíticas (réplica saudável ou primário)."""
+    return replica_router.get_read_engine()
+
+
+@contextmanager
+def read_connection():
+    """
+    🔄 Conexão somente-leitura para consultas de métricas.
+    Se a réplica escolhida recusar a conexão, marca-a como fora e usa o primário.
+    """
+    eng = get_read_engine()
+    try:
+        conn = eng.connect()
+    except OperationalError:
+        if eng is engine:
+            raise
+        replica_router.mark_down(eng)
+        conn = engine.connect()
+    with conn:
+        yield conn
+
+# ============================================================
+# 🧩 Shards por marca (brand_id → banco)
+# ============================================================
+# - Cada marca do mapa mora no banco da sua URL; marcas que dividem a URL
+#   dividem a engine. O banco principal guarda as marcas fora do mapa.
+# - Leituras de uma marca: brand_connection(brand_id).
+# - Consultas entre marcas: shard_map.shards() → uma consulta por banco,
+#   cada uma restrita às marcas que o banco POSSUI (sem contar duas vezes
+#   uma marca que ainda tenha cópia antiga no principal).
+
+
+def parse_shard_map(raw: str) -> dict:
+    """'1=url1,2=url2' → {1: 'url1', 2: 'url2'}; entrada malformada → ValueError."""
+    shards = {}
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        brand, sep, url = part.partition("=")
+        if not sep or not brand.strip().isdigit() or not url.strip():
+            raise ValueError(f"BRAND_SHARDS inválido: {part!r} (use brand_id=url)")
+        shards[int(brand)] = url.strip()
+    return shards
+
+
+class ShardMap:
+    """
+    🗺️ brand_id → engine.
+    - URL igual à do principal → a marca fica no principal (com réplicas)
+    - demais URLs → uma engine por URL distinta
+    """
+
+    def __init__(self, primary: Engine, primary_url: str, urls: dict):
+        self.primary = primary
+        self._engines = {}   # url → engine
+        self._brands = {}    # brand_id → url (None = principal)
+        for brand, url in sorted(urls.items()):
+            if url == primary_url:
+                self._brands[brand] = None
+                continue
+            if url not in self._engines:
+                self._engines[url] = create_engine(
+                    url,
+                    echo=False,
+                    future=True,
+                    pool_pre_ping=True,
+                    connect_args={"connect_timeout": 3},
+                )
+            self._brands[brand] = url
+
+    def engine_for(self, brand_id: int) -> Engine:
+        url = self._brands.get(brand_id)
+        return self._engines[url] if url else self.primary
+
+    def moved_brands(self) -> list:
+        """Marcas mapeadas para fora do principal."""
+        return sorted(b for b, url in self._brands.items() if url)
+
+    def shards(self) -> list:
+        """
+        Um item por banco: {"name", "engine", "brands", "exclude"}.
+        - brands: marcas que o banco possui (None = todas menos `exclude`)
+        - exclude: marcas que saíram do principal (só no item do principal)
+        """
+        out = [{
+            "name": self.primary.url.host or "primary",
+            "engine": self.primary,
+            "brands": None,
+            "exclude": self.moved_brands(),
+        }]
+        for url, eng in self._engines.items():
+            out.append({
+                "name": f"{eng.url.host}/{eng.url.database}",
+                "engine": eng,
+                "brands": sorted(b for b, u in self._brands.items() if u == url),
+                "exclude": [],
+            })
+        return out
+
+    def status(self) -> list:
+        """Shards configurados (sem credenciais) para observabilidade."""
+        return [{"shard": s["name"], "brands": s["brands"] or "demais"} for s in self.shards()]
+
+
+shard_map = ShardMap(engine, DATABASE_URL, parse_shard_map(BRAND_SHARDS_RAW))
+
+
+@contextmanager
+def shard_connection(eng: Engine):
+    """Conexão de leitura num shard; o principal segue pelas réplicas (read_connection)."""
+    if eng is engine:
+        with read_connection() as conn:
+            yield conn
+    else:
+        with eng.connect() as conn:
+            yield conn
+
+
+@contextmanager
+def brand_connection(brand_id: int):
+    """🔄 Conexão de leitura no banco que guarda a marca."""
+    with shard_connection(shard_map.engine_for(brand_id)) as conn:
+        yield conn
+
 # ============================================================
 # 🧱 Base declarativa usada pelos modelos ORM (models.py)
 # ============================================================
@@ -83,14 +330,16 @@ def get_db():
 def test_connection():
     """
     🔧 Testa a conexão com o banco de dados ativo
-    Retorna ✅ se OK, ❌ se houver erro
+    Retorna True (✅) se OK, False (❌) se houver erro
     """
     try:
         with engine.connect() as conn:
             result = conn.execute(text("SELECT 1"))
             print("✅ Conexão OK:", result.scalar())
+            return True
     except Exception as e:
         print("❌ Erro de conexão:", e)
+        return False
 
 # ============================================================
 # 📄 Função para importar schema do banco
@@ -5,14 +5,97 @@
 # Desenvolvedora: Magali Leodato
 # Descrição: Inicializa a API FastAPI, configura rotas,
 #             middlewares e conexão com o banco PostgreSQL.
+# ⚡ Startup: importar este módulo NÃO acessa o banco; conexão, DDL
+#    opcional e aquecimento rodam em segundo plano no lifespan.
 # ============================================================
 
-from fastapi import FastAPI
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 
 # 🔁 IMPORTS AJUSTADOS PARA PACOTE ABSOLUTO
-from src.routes import metrics, dashboard
-from src.database.session import engine, Base, test_connection
+from src.routes import metrics, dashboard, ingest, sales
+from src.database.session import engine, Base, test_connection, replica_router, shard_map
+from src.services.query_control import (
+    OverloadedError, QueryTimeoutError, ClientDisconnectedError, CircuitOpenError, breaker, limiter,
+)
+from src.services.readiness import readiness, run_step
+from src.services.analytics_service import coalescing_stats
+from src.services import archive_service, dimension_cache, forecast_service, prepared_queries, snapshot_store
+
+# DDL automática é opt-in: em CLOUD o schema já existe e o ERP é a fonte da verdade
+AUTO_CREATE_TABLES = os.getenv("AUTO_CREATE_TABLES", "false").lower() in ("1", "true", "yes")
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# ============================================================
+# 🔁 CICLO DE VIDA (lifespan)
+# ============================================================
+
+def _create_tables():
+    """DDL opcional (AUTO_CREATE_TABLES=true). None → passo desativado."""
+    if not AUTO_CREATE_TABLES:
+        return None
+    from src.database import models  # noqa: F401  (registra os modelos no metadata)
+    Base.metadata.create_all(bind=engine)
+    return True
+
+
+def _warm_cache():
+    """Aquece conexões, health das réplicas, o cache de dimensões e as métricas padrão do dashboard (30 dias)."""
+    if not WARMUP_ENABLED:
+        return None
+    from src.services import analytics_service
+
+    date_to = date.today()
+    date_from = date_to - timedelta(days=29)
+    window = {"date_from": date_from.isoformat(), "date_to": date_to.isoformat()}
+    dimension_cache.refresh()
+    analytics_service.total_revenue(**window)
+    analytics_service.average_ticket(**window)
+    analytics_service.total_orders(**window)
+    return True
+
+
+_startup_lock = threading.Lock()
+
+
+def _startup_sequence():
+    """Roda em thread: banco → DDL opcional → aquecimento (não bloqueia o boot)."""
+    if not _startup_lock.acquire(blocking=False):
+        return  # já existe uma sequência em andamento
+    try:
+        readiness.mark("database", "pending")
+        if not run_step("database", test_connection):
+            readiness.mark("schema", "skipped", detail="banco indisponível")
+            readiness.mark("cache", "skipped", detail="banco indisponível")
+            return
+        run_step("schema", _create_tables)
+        run_step("cache", _warm_cache)
+    finally:
+        _startup_lock.release()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    readiness.register("database", required=True)
+    readiness.register("schema", required=False)
+    readiness.register("cache", required=False)
+    loop = asyncio.get_running_loop()
+    startup = loop.run_in_executor(None, _startup_sequence)
+    snapshot_store.writer.start()  # só o worker eleito (flock) reconstrói o snapshot
+    try:
+        yield
+    finally:
+        if not startup.done():
+            startup.cancel()
+        snapshot_store.writer.stop()
+        engine.dispose()
 
 # ============================================================
 # 🌐 INICIALIZAÇÃO DA API FASTAPI
@@ -23,10 +106,11 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # ============================================================
-# 🔄 MIDDLEWARES (CORS)
+# 🔄 MIDDLEWARES (CORS + X-Data-Staleness)
 # ============================================================
 app.add_middleware(
     CORSMiddleware,
@@ -34,25 +118,49 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Data-Staleness"],
 )
 
+
+@app.middleware("http")
+async def data_staleness_header(request: Request, call_next):
+    """Resposta servida do último resultado bom → X-Data-Staleness: idade em segundos."""
+    response = await call_next(request)
+    staleness = getattr(request.state, "data_staleness", None)
+    if staleness is not None:
+        response.headers["X-Data-Staleness"] = str(staleness)
+    return response
+
 # ============================================================
-# 🗄️ CRIAR TABELAS NO BANCO
+# 🚦 TRATAMENTO DE SOBRECARGA / TIMEOUT DE CONSULTAS
 # ============================================================
-# ⚠️ Opcional: em CLOUD geralmente o schema já existe; em LOCAL é útil.
-try:
-    Base.metadata.create_all(bind=engine)
-    print("✅ Base.metadata.create_all executado (se tabelas não existiam, foram criadas).")
-except Exception as e:
-    # Evita derrubar a API caso o banco remoto não permita DDL
-    print("⚠️ create_all falhou (possível DDL bloqueada no CLOUD):", e)
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError):
+    """Limitador cheio → 503 com Retry-After (cliente tenta de novo depois)."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(QueryTimeoutError)
+async def query_timeout_handler(request: Request, exc: QueryTimeoutError):
+    """statement_timeout estourado → 504."""
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
-# (Opcional) teste rápido de conexão no startup
-try:
-    ok = test_connection()
-    print(f"✅ Conexão OK: {ok}")
-except Exception as e:
-    print("⚠️ Falha no teste de conexão (a API seguirá rodando):", e)
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    """Disjuntor do banco aberto e nada em cache → 503 imediato (sem ocupar conexão)."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(ClientDisconnectedError)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnectedError):
+    """Cliente já foi embora; 499 apenas para logs de acesso."""
+    return Response(status_code=499)
 
 # ============================================================
 # 🧭 INCLUIR ROTAS / ENDPOINTS
@@ -60,15 +168,41 @@ except Exception as e:
 # - Prefixos e tags padronizados
 app.include_router(metrics.router, prefix="/metrics", tags=["Metrics"])
 app.include_router(dashboard.router, prefix="/dashboard", tags=["Dashboard"])
+app.include_router(ingest.router, prefix="/ingest", tags=["Ingest"])
+app.include_router(sales.router, prefix="/sales", tags=["Sales"])
 
 # ============================================================
 # 🔥 ENDPOINTS DE SAÚDE E RAIZ
 # ============================================================
 @app.get("/health")
 def health():
-    """Healthcheck simples para orquestração/monitoramento."""
+    """Healthcheck simples para orquestração/monitoramento (liveness)."""
     return {"status": "ok"}
 
+@app.get("/ready")
+def ready():
+    """
+    Readiness: 200 quando o banco respondeu; 503 enquanto a inicialização
+    não terminou. Inclui estado do aquecimento, réplicas, limitador, single-flight
+    snapshot compartilhado, modelo de previsão, prepared statements, arquivo frio,
+    cache de dimensões e shards por marca.
+    """
+    if readiness.status("database") == "error":
+        # Banco voltou? Refaz a sequência em background; o próximo probe verá o resultado
+        threading.Thread(target=_startup_sequence, daemon=True).start()
+    body = readiness.snapshot()
+    body["replicas"] = replica_router.status()
+    body["admission"] = limiter.stats()
+    body["breaker"] = breaker.stats()
+    body["coalescing"] = coalescing_stats()
+    body["snapshot"] = snapshot_store.status()
+    body["forecast"] = forecast_service.status()
+    body["prepared"] = prepared_queries.status()
+    body["archive"] = archive_service.status()
+    body["dimensions"] = dimension_cache.status()
+    body["shards"] = shard_map.status()
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
 @app.get("/")
 def root():
     """Endpoint raiz para verificar se a API está rodando."""
@@ -79,6 +213,9 @@ def root():
 # ============================================================
 # - O arquivo backend/src/database/session.py deve conter a configuração
 #   do SQLAlchemy (engine e sessionmaker) e a função test_connection().
+# - Módulos pesados (pandas, numpy, scipy, pyarrow...) devem ser importados
+#   DENTRO das funções que os usam, nunca no topo de routes/services.
+# - Perfil de import: python -m src.utils.startup_profile (ver o módulo).
 # - As rotas devem ser organizadas em backend/src/routes/*.py.
 # - Manter padrão de comentários e organização do projeto.
 # ============================================================
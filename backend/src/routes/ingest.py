@@ -0,0 +1,76 @@
+# ============================================================
+# 📥 ROTAS DE INGESTÃO
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Entrada de vendas vindas de PDVs e marketplaces
+#            (NDJSON em lote, idempotente por store_id + cod_sale1).
+# ============================================================
+
+from datetime import date
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from src.services import ingest_service
+
+router = APIRouter()
+
+
+def _refresh_rollups(day_from: str, day_to: str) -> None:
+    """Recalcula daily_aggregates dos dias tocados pelo lote e absorve as vendas novas nas anomalias."""
+    from src.services import anomaly_service, sketch_service
+
+    try:
+        sketch_service.refresh_daily_aggregates(date.fromisoformat(day_from), date.fromisoformat(day_to))
+    except Exception as e:
+        print(f"⚠️ Falha ao recalcular agregados {day_from}..{day_to}: {e}")
+    try:
+        anomaly_service.refresh_anomalies()
+    except Exception as e:
+        print(f"⚠️ Falha ao atualizar anomalias: {e}")
+
+
+# ============================================================
+# 🔥 ENDPOINTS
+# ============================================================
+
+@router.post("/sales")
+async def post_sales(request: Request, background_tasks: BackgroundTasks):
+    """
+    Ingere um lote NDJSON de vendas (Content-Type: application/x-ndjson).
+    Retorna contadores (inserted/updated/duplicates/rejected), erros por
+    linha e a nova versão da marca d'água.
+    """
+    # Lê o corpo em partes, abortando cedo se passar do limite
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > ingest_service.INGEST_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Lote maior que o permitido")
+        chunks.append(chunk)
+
+    try:
+        result = await run_in_threadpool(ingest_service.ingest_sales, b"".join(chunks))
+    except ingest_service.IngestTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ingest_service.IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if result["days"]:
+        background_tasks.add_task(_refresh_rollups, result["days"]["from"], result["days"]["to"])
+    return result
+
+
+@router.get("/watermark")
+async def get_watermark():
+    """Versão atual dos dados de vendas (muda a cada lote ingerido)."""
+    return {"watermark": await run_in_threadpool(ingest_service.current_watermark)}
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Lotes recomendados: 1.000–20.000 vendas; o custo fixo (transação,
+#   merge) fica diluído e a resposta continua abaixo de poucos segundos.
+# - Linhas inválidas não derrubam o lote: aparecem em "errors" com o
+#   número da linha; o cliente corrige e reenvia só essas.
+# ============================================================
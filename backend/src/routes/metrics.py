@@ -7,9 +7,15 @@
 #            e produtos mais vendidos (GET com query string).
 # ============================================================
 
-from typing import Optional
-from fastapi import APIRouter, Query
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import BaseModel, Field
 from src.services import analytics_service  # ✅ import absoluto
+from src.services import (
+    anomaly_service, archive_service, basket_service, batch_service, cohort_service, forecast_service,
+    heatmap_service, pivot_service, rfm_service, sketch_service,
+)
+from src.services.query_control import run_query
 
 router = APIRouter()
 
@@ -21,16 +27,51 @@ router = APIRouter()
 #   total → {"total": ...}
 #   average-ticket → {"avg_ticket": ...}
 #   top-products → {"data": [...]}
+# - As consultas passam por run_query (timeout por endpoint, cancelamento
+#   se o cliente desconectar e limitador de concorrência → 503)
+# - compare=previous_period|same_period_last_year adiciona o bloco "compare"
+#   (valor anterior, delta e delta_pct); receita, pedidos e ticket saem de
+#   UMA consulta compartilhada (analytics_service.compare_kpis)
 # ============================================================
 
+def _comparison_window(date_from: Optional[str], date_to: Optional[str], compare: str) -> dict:
+    try:
+        return analytics_service.comparison_window(date_from, date_to, compare)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _compared(request: Request, endpoint: str, key: str, metric: str,
+                    date_from: Optional[str], date_to: Optional[str],
+                    channel: Optional[str], compare: str) -> dict:
+    """Resposta de card com comparação: {key: valor atual, "compare": {...}}."""
+    _comparison_window(date_from, date_to, compare)  # valida antes de ocupar vaga no banco
+    comparison = await run_query(
+        request, endpoint, analytics_service.compare_kpis,
+        date_from=date_from,
+        date_to=date_to,
+        channel=channel,
+        compare=compare,
+    )
+    return {
+        key: float(comparison["current"][metric]),
+        "compare": analytics_service.with_comparison(metric, comparison),
+    }
+
+
 @router.get("/total-revenue")
-def get_total_revenue(
+async def get_total_revenue(
+    request: Request,
     date_from: Optional[str] = Query(None, description="YYYY-MM-DD (opcional)"),
     date_to: Optional[str]   = Query(None, description="YYYY-MM-DD (opcional)"),
     channel: Optional[str]   = Query(None, description="P ou D (opcional)"),
+    compare: Optional[str]   = Query(None, description="previous_period ou same_period_last_year (opcional)"),
 ):
-    """Retorna o faturamento total no intervalo."""
-    total = analytics_service.total_revenue(
+    """Retorna o faturamento total no intervalo (opcionalmente vs outro período)."""
+    if compare:
+        return await _compared(request, "total-revenue", "total", "revenue", date_from, date_to, channel, compare)
+    total = await run_query(
+        request, "total-revenue", analytics_service.total_revenue,
         date_from=date_from,
         date_to=date_to,
         channel=channel,
@@ -39,13 +80,18 @@ def get_total_revenue(
 
 
 @router.get("/average-ticket")
-def get_average_ticket(
+async def get_average_ticket(
+    request: Request,
     date_from: Optional[str] = Query(None, description="YYYY-MM-DD (opcional)"),
     date_to: Optional[str]   = Query(None, description="YYYY-MM-DD (opcional)"),
     channel: Optional[str]   = Query(None, description="P ou D (opcional)"),
+    compare: Optional[str]   = Query(None, description="previous_period ou same_period_last_year (opcional)"),
 ):
-    """Retorna o ticket médio no intervalo."""
-    avg = analytics_service.average_ticket(
+    """Retorna o ticket médio no intervalo (opcionalmente vs outro período)."""
+    if compare:
+        return await _compared(request, "average-ticket", "avg_ticket", "avg_ticket", date_from, date_to, channel, compare)
+    avg = await run_query(
+        request, "average-ticket", analytics_service.average_ticket,
         date_from=date_from,
         date_to=date_to,
         channel=channel,
@@ -54,14 +100,16 @@ def get_average_ticket(
 
 
 @router.get("/top-products")
-def get_top_products(
+async def get_top_products(
+    request: Request,
     date_from: Optional[str] = Query(None, description="YYYY-MM-DD (opcional)"),
     date_to: Optional[str]   = Query(None, description="YYYY-MM-DD (opcional)"),
     channel: Optional[str]   = Query(None, description="P ou D (opcional)"),
     limit: int               = Query(5, ge=1, le=50, description="Qtd de itens (1–50)"),
 ):
     """Retorna os produtos mais vendidos no intervalo."""
-    rows = analytics_service.top_products(
+    rows = await run_query(
+        request, "top-products", analytics_service.top_products,
         date_from=date_from,
         date_to=date_to,
         channel=channel,
@@ -85,7 +133,8 @@ def get_top_products(
         }
         for r in (rows or [])
     ]
-    return {"data": data}
+    # Itens de meses arquivados (Parquet) não entram no ranking
+    return {"data": data, **archive_service.archive_note(date_from, date_to)}
 
 # ============================================================
 # 🔥 ENDPOINTS EXTRAS (GET)
@@ -94,12 +143,17 @@ def get_top_products(
 # ============================================================
 
 @router.get("/total-orders")
-def get_total_orders(
+async def get_total_orders(
+    request: Request,
     date_from: str,
     date_to: str,
     channel: Optional[str] = None,
+    compare: Optional[str] = None,
 ):
-    qty = analytics_service.total_orders(
+    if compare:
+        return await _compared(request, "total-orders", "total_orders", "orders", date_from, date_to, channel, compare)
+    qty = await run_query(
+        request, "total-orders", analytics_service.total_orders,
         date_from=date_from,
         date_to=date_to,
         channel=channel,
@@ -108,17 +162,397 @@ def get_total_orders(
 
 
 @router.get("/average-rating")
-def get_average_rating(
+async def get_average_rating(
+    request: Request,
     date_from: str,
     date_to: str,
     channel: Optional[str] = None,
+    compare: Optional[str] = None,
+):
+    avg = await run_query(
+        request, "average-rating", analytics_service.average_rating,
+        date_from=date_from,
+        date_to=date_to,
+        channel=channel,
+    )
+    body = {"average_rating": float(avg or 0.0)}
+    if compare:
+        # Rating não tem tabela fixa (colunas candidatas): a janela anterior é outra consulta
+        window = _comparison_window(date_from, date_to, compare)
+        prev = await run_query(
+            request, "average-rating", analytics_service.average_rating,
+            date_from=window["date_from"],
+            date_to=window["date_to"],
+            channel=channel,
+        )
+        comparison = {
+            "current": {"rating": body["average_rating"]},
+            "previous": {"rating": float(prev or 0.0)},
+            "window": {"compare": compare, "date_from": window["date_from"], "date_to": window["date_to"]},
+        }
+        body["compare"] = analytics_service.with_comparison("rating", comparison)
+    return body
+
+
+# ============================================================
+# 📐 ENDPOINTS APROXIMADOS (sketches diários)
+# - percentiles → p50/p90/p99 de production/delivery_seconds
+# - unique-customers → clientes distintos (HyperLogLog)
+# - Janela por dias completos [date_from, date_to); erros em docs/doc_metricas_aproximadas.md
+# ============================================================
+
+@router.get("/percentiles")
+async def get_percentiles(
+    request: Request,
+    metric: str              = Query("production_seconds", description="production_seconds ou delivery_seconds"),
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD (opcional)"),
+    date_to: Optional[str]   = Query(None, description="YYYY-MM-DD (opcional, exclusivo)"),
+    channel: Optional[str]   = Query(None, description="id do canal, P ou D (opcional)"),
+    store_id: Optional[int]  = Query(None, description="id da loja (opcional)"),
+    quantiles: str           = Query("0.5,0.9,0.99", description="Quantis separados por vírgula"),
+    group_by: str            = Query("none", description="none, channel ou store"),
+):
+    """Retorna percentis aproximados (t-digest) dos tempos de produção/entrega."""
+    try:
+        qs = [float(q) for q in quantiles.split(",") if q.strip()]
+        if not qs or any(not 0 <= q <= 1 for q in qs):
+            raise ValueError("quantiles deve conter valores entre 0 e 1")
+        data = await run_query(
+            request, "percentiles", sketch_service.percentiles,
+            metric=metric,
+            date_from=date_from,
+            date_to=date_to,
+            channel=channel,
+            store_id=store_id,
+            quantiles=qs,
+            group_by=group_by,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"metric": metric, "data": data}
+
+
+@router.get("/unique-customers")
+async def get_unique_customers(
+    request: Request,
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD (opcional)"),
+    date_to: Optional[str]   = Query(None, description="YYYY-MM-DD (opcional, exclusivo)"),
+    channel: Optional[str]   = Query(None, description="id do canal, P ou D (opcional)"),
+    store_id: Optional[int]  = Query(None, description="id da loja (opcional)"),
+    group_by: str            = Query("none", description="none, channel ou store"),
+):
+    """Retorna a contagem aproximada (HyperLogLog) de clientes distintos."""
+    try:
+        data = await run_query(
+            request, "unique-customers", sketch_service.unique_customers,
+            date_from=date_from,
+            date_to=date_to,
+            channel=channel,
+            store_id=store_id,
+            group_by=group_by,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"data": data}
+
+
+# ============================================================
+# 🧺 ANÁLISES DE CARDÁPIO
+# - basket → pares de produtos comprados juntos (support/confidence/lift)
+# - Resultado em cache por janela + filtros (ver basket_service)
+# ============================================================
+
+@router.get("/basket")
+async def get_basket(
+    request: Request,
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD (opcional)"),
+    date_to: Optional[str]   = Query(None, description="YYYY-MM-DD (opcional)"),
+    channel: Optional[str]   = Query(None, description="id do canal, P ou D (opcional)"),
+    store_id: Optional[int]  = Query(None, description="id da loja (opcional)"),
+    product_id: Optional[int] = Query(None, description="Só os pares deste produto (opcional)"),
+    limit: int               = Query(5, ge=1, le=20, description="Pares por produto (1–20)"),
+    min_count: int           = Query(5, ge=1, description="Mínimo de vendas com o par"),
+    sort: str                = Query("lift", description="lift, confidence ou support"),
+):
+    """Retorna os produtos mais comprados junto com cada produto."""
+    try:
+        return await run_query(
+            request, "basket", basket_service.basket_pairs,
+            date_from=date_from,
+            date_to=date_to,
+            channel=channel,
+            store_id=store_id,
+            product_id=product_id,
+            limit=limit,
+            min_count=min_count,
+            sort=sort,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ============================================================
+# 👥 ANÁLISES DE CLIENTES
+# - cohorts → retenção/receita por coorte do mês da 1ª compra
+# - Meses fechados vêm de cohort_monthly; só o mês corrente é recalculado
+# ============================================================
+
+@router.get("/cohorts")
+async def get_cohorts(
+    request: Request,
+    months: int              = Query(12, ge=1, le=36, description="Coortes (meses) a retornar"),
+    store_id: Optional[int]  = Query(None, description="Coortes de uma loja (opcional)"),
+    channel_id: Optional[int] = Query(None, description="Coortes de um canal (opcional)"),
+):
+    """Retorna a matriz de retenção e receita por coorte mensal de clientes."""
+    try:
+        return await run_query(
+            request, "cohorts", cohort_service.cohort_matrix,
+            months=months,
+            store_id=store_id,
+            channel_id=channel_id,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ============================================================
+# 🎯 SEGMENTOS RFM
+# - customer-segments → tamanho e participação na receita de cada segmento
+#   (customer_segments, atualizada pelo job noturno rfm_service)
+# ============================================================
+
+@router.get("/customer-segments")
+async def get_customer_segments(request: Request):
+    """Retorna os segmentos RFM de clientes com tamanho e participação na receita."""
+    return await run_query(request, "customer-segments", rfm_service.segment_summary)
+
+
+# ============================================================
+# 🚨 ANOMALIAS
+# - anomalies → horas fechadas em que loja × canal fugiu do normal (z-score
+#   contra EWMA da mesma hora da semana)
+# ============================================================
+
+@router.get("/anomalies")
+async def get_anomalies(
+    request: Request,
+    hours: int               = Query(24, ge=1, le=24 * 30, description="Horas fechadas a olhar para trás"),
+    min_z: float             = Query(3.0, ge=0, description="|z| mínimo para aparecer"),
+    metric: Optional[str]    = Query(None, description="revenue ou orders (opcional: qualquer um)"),
+    store_id: Optional[int]  = Query(None, description="id da loja (opcional)"),
+    channel: Optional[str]   = Query(None, description="id do canal, P ou D (opcional)"),
+):
+    """Retorna as horas anômalas (receita/pedidos) por loja e canal."""
+    try:
+        return await run_query(
+            request, "anomalies", anomaly_service.anomalies,
+            hours=hours,
+            min_z=min_z,
+            metric=metric,
+            store_id=store_id,
+            channel=channel,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ============================================================
+# 🏷️ MARCAS (SHARDS POR brand_id)
+# - brands                 → KPIs de todas as marcas (scatter-gather nos shards) + total
+# - brands/top-products    → top produtos entre marcas (merge dos tops de cada shard)
+# - brands/{id}            → KPIs de uma marca (consulta só no shard dela)
+# - brands/{id}/top-products
+# ============================================================
+
+@router.get("/brands")
+async def get_brands(
+    request: Request,
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD (opcional)"),
+    date_to: Optional[str]   = Query(None, description="YYYY-MM-DD (opcional)"),
+    channel: Optional[str]   = Query(None, description="id do canal, P ou D (opcional)"),
+):
+    """Receita, pedidos e ticket médio por marca, somando todos os shards."""
+    return await run_query(
+        request, "brands", analytics_service.cross_brand_kpis,
+        date_from=date_from,
+        date_to=date_to,
+        channel=channel,
+    )
+
+
+@router.get("/brands/top-products")
+async def get_brands_top_products(
+    request: Request,
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD (opcional)"),
+    date_to: Optional[str]   = Query(None, description="YYYY-MM-DD (opcional)"),
+    limit: int               = Query(5, ge=1, le=50, description="Qtd de itens (1–50)"),
+):
+    """Produtos mais vendidos entre todas as marcas."""
+    return await run_query(
+        request, "brands-top-products", analytics_service.cross_brand_top_products,
+        date_from=date_from,
+        date_to=date_to,
+        limit=limit,
+    )
+
+
+@router.get("/brands/{brand_id}")
+async def get_brand(
+    request: Request,
+    brand_id: int,
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD (opcional)"),
+    date_to: Optional[str]   = Query(None, description="YYYY-MM-DD (opcional)"),
+    channel: Optional[str]   = Query(None, description="id do canal, P ou D (opcional)"),
 ):
-    avg = analytics_service.average_rating(
+    """KPIs de uma marca, lidos do shard que a guarda."""
+    return await run_query(
+        request, "brand", analytics_service.brand_kpis,
+        brand_id=brand_id,
         date_from=date_from,
         date_to=date_to,
         channel=channel,
     )
-    return {"average_rating": float(avg or 0.0)}
+
+
+@router.get("/brands/{brand_id}/top-products")
+async def get_brand_top_products(
+    request: Request,
+    brand_id: int,
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD (opcional)"),
+    date_to: Optional[str]   = Query(None, description="YYYY-MM-DD (opcional)"),
+    limit: int               = Query(5, ge=1, le=50, description="Qtd de itens (1–50)"),
+):
+    """Produtos mais vendidos de uma marca."""
+    rows = await run_query(
+        request, "brand", analytics_service.brand_top_products,
+        brand_id=brand_id,
+        date_from=date_from,
+        date_to=date_to,
+        limit=limit,
+    )
+    return {"brand_id": brand_id, "data": rows, **archive_service.archive_note(date_from, date_to)}
+
+
+# ============================================================
+# 🧮 PIVÔ
+# - pivot → receita/pedidos por canal, loja, forma de pagamento e hora do
+#   dia, com TODAS as combinações (CUBE) numa única consulta
+# ============================================================
+
+@router.get("/pivot")
+async def get_pivot(
+    request: Request,
+    dims: str                = Query(..., description="Dimensões separadas por vírgula: channel, store, payment_type, hour"),
+    measures: Optional[str]  = Query(None, description="Medidas: revenue, orders, avg_ticket (padrão: revenue,orders)"),
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD (opcional)"),
+    date_to: Optional[str]   = Query(None, description="YYYY-MM-DD (opcional)"),
+    channel: Optional[str]   = Query(None, description="id do canal, P (presencial) ou D (delivery)"),
+    store_id: Optional[int]  = Query(None, description="id da loja (opcional)"),
+):
+    """Retorna cada quebra (subconjunto de dims) e o total geral, de uma só varredura."""
+    try:
+        return await run_query(
+            request, "pivot", pivot_service.pivot,
+            dims=dims,
+            measures=measures,
+            date_from=date_from,
+            date_to=date_to,
+            channel=channel,
+            store_id=store_id,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ============================================================
+# 🗺️ MAPA DE CALOR DE ENTREGAS
+# - delivery-heatmap → pedidos, receita e tempo médio de entrega por célula
+#   de grade (zoom 0–3), a partir de delivery_grid_daily (pré-agregada por dia)
+# ============================================================
+
+@router.get("/delivery-heatmap")
+async def get_delivery_heatmap(
+    request: Request,
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD (opcional; padrão: últimos 30 dias)"),
+    date_to: Optional[str]   = Query(None, description="YYYY-MM-DD (opcional)"),
+    zoom: int                = Query(2, ge=0, le=max(heatmap_service.GRID_ZOOMS), description="Nível da grade (0 = ~55 km … 3 = ~550 m)"),
+    store_id: Optional[int]  = Query(None, description="id da loja (opcional)"),
+    bbox: Optional[str]      = Query(None, description="min_lat,min_lon,max_lat,max_lon (opcional)"),
+):
+    """Retorna as células do mapa de calor de entregas na janela e zoom pedidos."""
+    try:
+        return await run_query(
+            request, "delivery-heatmap", heatmap_service.delivery_heatmap,
+            date_from=date_from,
+            date_to=date_to,
+            zoom=zoom,
+            store_id=store_id,
+            bbox=bbox,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ============================================================
+# 🔮 PREVISÃO
+# - forecast → receita/pedidos dos próximos dias por loja × canal
+#   (parâmetros em cache; reajuste em background quando os dados avançam)
+# ============================================================
+
+@router.get("/forecast")
+async def get_forecast(
+    request: Request,
+    days: int                 = Query(7, ge=1, le=forecast_service.FORECAST_MAX_HORIZON_DAYS, description="Dias à frente"),
+    store_id: Optional[int]   = Query(None, description="id da loja (opcional)"),
+    channel_id: Optional[int] = Query(None, description="id do canal (opcional)"),
+    hourly: bool              = Query(False, description="Distribui cada dia pelas horas"),
+):
+    """Retorna a previsão diária de receita e pedidos (opcionalmente por hora)."""
+    try:
+        return await run_query(
+            request, "forecast", forecast_service.forecast,
+            days=days,
+            store_id=store_id,
+            channel_id=channel_id,
+            hourly=hourly,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ============================================================
+# 📦 ENDPOINT EM LOTE (POST)
+# - Muitas specs {metric, filters} em uma chamada
+# - Resposta: {"results": {id: {"metric", "value"}}, "timing": {...}}
+# ============================================================
+
+class BatchFilters(BaseModel):
+    date_from: Optional[str] = Field(None, description="YYYY-MM-DD (opcional)")
+    date_to: Optional[str] = Field(None, description="YYYY-MM-DD (opcional)")
+    channel: Optional[str] = Field(None, description="id do canal, P ou D (opcional)")
+    store_id: Optional[int] = Field(None, description="id da loja (opcional)")
+
+
+class BatchSpec(BaseModel):
+    id: str = Field(..., description="Identificador da spec (chave do resultado)")
+    metric: str = Field(..., description="revenue, orders ou avg_ticket")
+    filters: BatchFilters = Field(default_factory=BatchFilters)
+
+
+class BatchRequest(BaseModel):
+    specs: List[BatchSpec]
+
+
+@router.post("/batch")
+async def post_batch(request: Request, body: BatchRequest):
+    """Executa várias métricas agrupando as que compartilham a mesma varredura."""
+    specs = [spec.model_dump() for spec in body.specs]
+    try:
+        batch_service.plan_batch(specs)  # valida antes de ocupar vaga no banco
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await run_query(request, "batch", batch_service.run_batch, specs=specs)
 
 
 # ============================================================
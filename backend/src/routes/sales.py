@@ -0,0 +1,75 @@
+# ============================================================
+# 🧾 ROTAS DE VENDAS (DRILL-DOWN)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Listagem paginada das vendas por trás dos cards
+#            do dashboard (filtros iguais aos de /metrics) e detalhe
+#            completo de uma ou várias vendas (JSON montado no banco).
+# ============================================================
+
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response
+from src.services import archive_service, sales_service
+from src.services.query_control import run_query
+
+router = APIRouter()
+
+# ============================================================
+# 🔥 ENDPOINTS
+# ============================================================
+
+@router.get("")
+async def get_sales(
+    request: Request,
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD (opcional)"),
+    date_to: Optional[str]   = Query(None, description="YYYY-MM-DD (opcional)"),
+    store_id: Optional[int]  = Query(None, description="id da loja (opcional)"),
+    channel: Optional[str]   = Query(None, description="id do canal, P ou D (opcional)"),
+    status: Optional[str]    = Query(None, description="sale_status_desc (ex.: PAID)"),
+    cursor: Optional[str]    = Query(None, description="next_cursor da página anterior"),
+    limit: int               = Query(50, ge=1, le=sales_service.MAX_PAGE_SIZE, description="Vendas por página"),
+    estimate: bool           = Query(False, description="Inclui total estimado (planner)"),
+    ids: Optional[str]       = Query(None, description="ids separados por vírgula → detalhe completo (ignora os filtros)"),
+):
+    """Lista vendas (mais recentes primeiro) com paginação por cursor; com ids, devolve o detalhe de cada uma."""
+    try:
+        if ids:
+            body = await run_query(request, "sale-detail", sales_service.sale_documents, ids=ids)
+            return Response(content=body, media_type="application/json")
+        return await run_query(
+            request, "sales", sales_service.list_sales,
+            date_from=date_from,
+            date_to=date_to,
+            store_id=store_id,
+            channel=channel,
+            status=status,
+            cursor=cursor,
+            limit=limit,
+            estimate=estimate,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/{sale_id}")
+async def get_sale(request: Request, sale_id: int):
+    """Venda completa: itens, complementos, pagamentos, entrega, endereço e cupons."""
+    body = await run_query(request, "sale-detail", sales_service.sale_document, sale_id=sale_id)
+    if body is None:
+        archived = archive_service.status()["archived_until"]
+        detail = f"venda {sale_id} não encontrada"
+        if archived:
+            detail += f" (vendas até {archived} estão no arquivo Parquet, fora do banco)"
+        raise HTTPException(status_code=404, detail=detail)
+    return Response(content=body, media_type="application/json")
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Para a próxima página, repita os MESMOS filtros e envie cursor=next_cursor.
+# - next_cursor = null → última página.
+# - /sales/{id} e /sales?ids=1,2,3 respondem o JSON gerado pelo Postgres
+#   como veio (Response com o texto, sem passar pelo encoder do FastAPI).
+# ============================================================
@@ -7,13 +7,24 @@
 #            métricas e agregações, utilizando helpers.py.
 # ============================================================
 
-from typing import List, Dict, Any, Optional
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from src.utils import helpers  # ✅ import absoluto
+from src.utils.singleflight import SingleFlight, make_key
 
 # 🔌 Acesso direto ao banco (LOCAL ou CLOUD)
 from sqlalchemy import text
-from sqlalchemy.exc import ProgrammingError, OperationalError
-from src.database.session import engine  # ✅ usa a mesma engine do projeto
+from sqlalchemy.exc import DBAPIError, ProgrammingError, OperationalError
+from src.database.session import read_connection  # ✅ leituras vão para réplicas (ou primário)
+from src.database.session import brand_connection, shard_connection, shard_map
+from src.services import archive_service, calendar_service, dimension_cache, prepared_queries, snapshot_store
+from src.services.query_control import (
+    apply_scope, raise_if_canceled, QueryTimeoutError, ClientDisconnectedError,
+)
 
 
 # ============================================================
@@ -26,16 +37,24 @@ DATE_CANDIDATES = ["created_at", "sale_date", "date", "order_date", "sold_at"]
 
 def _scalar(sql: str, params: dict) -> float:
     """Executa uma consulta escalar e retorna float (com fallback 0.0)."""
-    with engine.connect() as conn:
-        res = conn.execute(text(sql), params)
+    with read_connection() as conn, apply_scope(conn):
+        try:
+            res = conn.execute(text(sql), params)
+        except DBAPIError as e:
+            raise_if_canceled(e)  # timeout/cancelamento não entra no fallback
+            raise
         val = res.scalar()
         return float(val or 0.0)
 
 
 def _rows(sql: str, params: dict) -> List[Dict[str, Any]]:
     """Executa uma consulta e retorna lista de dicts (com chaves minúsculas)."""
-    with engine.connect() as conn:
-        res = conn.execute(text(sql), params)
+    with read_connection() as conn, apply_scope(conn):
+        try:
+            res = conn.execute(text(sql), params)
+        except DBAPIError as e:
+            raise_if_canceled(e)
+            raise
         cols = [c.lower() for c in res.keys()]
         data = [dict(zip(cols, row)) for row in res.fetchall()]
         return data
@@ -90,42 +109,95 @@ def _try_rows_with_datecols(base_no_date: str, table_alias: str, params: dict) -
 
 
 # ============================================================
-# 📊 FUNÇÕES DE MÉTRICAS
+# 🛬 SINGLE-FLIGHT (coalescência de consultas idênticas)
 # ============================================================
+# - Chamadas concorrentes com os mesmos argumentos compartilham UMA execução.
+# - Caminho síncrono: o próprio decorator (threads).
+# - Caminho assíncrono: query_control.run_query usa fn.flight / fn.flight_key.
 
-def total_revenue(
-    sales: Optional[List[Dict[str, Any]]] = None,
-    date_from: Optional[str] = None,
-    date_to: Optional[str] = None,
-    channel: Optional[str] = None,
-    **kwargs: Any
-) -> float:
+flight = SingleFlight()
+
+
+def coalesce(fn):
+    """Decorator: agrupa chamadas concorrentes idênticas da métrica."""
+    def key_for(*args, **kwargs):
+        return make_key(fn.__name__, args, kwargs)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            key = key_for(*args, **kwargs)
+            hash(key)
+        except TypeError:
+            # Argumentos não-hasheáveis (ex.: listas de dicts legadas) → sem coalescência
+            return fn(*args, **kwargs)
+        return flight.do(key, lambda: fn(*args, **kwargs))
+
+    wrapper.flight = flight
+    wrapper.flight_key = key_for
+    return wrapper
+
+
+def coalescing_stats() -> Dict[str, int]:
+    """Contadores do single-flight (execuções reais × chamadas coalescidas)."""
+    return flight.stats()
+
+
+def _prepared_kpis(date_from: Optional[str], date_to: Optional[str], channel: Optional[str]) -> Optional[Dict[str, float]]:
     """
-    Calcula o faturamento total a partir do banco de dados.
+    Faturamento, pedidos e ticket médio via prepared statement (uma varredura
+    para as três). Cards pedidos juntos compartilham a execução (single-flight).
+    None → caminho preparado indisponível; use o SQL tolerante.
+    """
+    def run():
+        with read_connection() as conn, apply_scope(conn):
+            return prepared_queries.kpi_totals(conn, date_from, date_to, channel)
+
+    return flight.do(make_key("kpi_totals", (), {"date_from": date_from, "date_to": date_to, "channel": channel}), run)
+
+
+def _kpi_scalar(select_sql: str, date_from: Optional[str], date_to: Optional[str], channel: Optional[str]) -> float:
+    """
+    KPI de sales pelo SQL tolerante (schemas fora do padrão):
+    - Dias inteiros: tenta primeiro o dia local (date_key), como o caminho preparado.
     - Tenta diversas colunas de data.
     - Filtro de canal com fallback (channel_id → channel).
     """
     params = {"date_from": date_from, "date_to": date_to, "channel": channel}
 
-    base_no_date = """
-        SELECT COALESCE(SUM(total_amount), 0) AS total
+    base_no_date = f"""
+        SELECT {select_sql}
         FROM sales s
         WHERE 1=1
     """
 
-    if not channel:
-        return _try_scalar_with_datecols(base_no_date, "s", params)
+    bases = [base_no_date]
+    if channel:
+        bases = [base_no_date + "  AND (:channel = s.channel_id)\n", base_no_date + "  AND (:channel = s.channel)\n"]
 
-    base_with_channel_id  = base_no_date + "  AND (:channel = s.channel_id)\n"
-    base_with_channel_txt = base_no_date + "  AND (:channel = s.channel)\n"
+    day_conds, day_params = calendar_service.window_conds(date_from, date_to)
+    if day_conds and calendar_service.day_keys(date_from, date_to) is not None:
+        day_filter = "".join(f"  AND {c}\n" for c in day_conds)
+        for base in bases:
+            try:
+                return _scalar(base + day_filter, {**params, **day_params})
+            except (ProgrammingError, OperationalError):
+                continue
 
     try:
-        return _try_scalar_with_datecols(base_with_channel_id, "s", params)
+        return _try_scalar_with_datecols(bases[0], "s", params)
     except (ProgrammingError, OperationalError):
-        return _try_scalar_with_datecols(base_with_channel_txt, "s", params)
+        if len(bases) == 1:
+            raise
+        return _try_scalar_with_datecols(bases[1], "s", params)
 
 
-def average_ticket(
+# ============================================================
+# 📊 FUNÇÕES DE MÉTRICAS
+# ============================================================
+
+@coalesce
+def total_revenue(
     sales: Optional[List[Dict[str, Any]]] = None,
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
@@ -133,34 +205,66 @@ def average_ticket(
     **kwargs: Any
 ) -> float:
     """
-    Calcula o ticket médio diretamente do banco.
-    - Tenta diversas colunas de data.
-    - Filtro de canal com fallback (channel_id → channel).
+    Calcula o faturamento total a partir do banco de dados.
+    - Usa o snapshot compartilhado quando a janela está coberta.
+    - Schema padrão: prepared statement (prepared_queries); senão SQL tolerante.
+    - Soma os meses arquivados em Parquet (archive_service).
     """
-    params = {"date_from": date_from, "date_to": date_to, "channel": channel}
+    # ⚡ Snapshot compartilhado (mmap) responde janelas por dia sem ir ao banco
+    totals = snapshot_store.lookup_totals(date_from, date_to, channel)
+    if totals is not None:
+        return totals["revenue"]
 
-    base_no_date = """
-        SELECT COALESCE(AVG(total_amount), 0) AS avg_ticket
-        FROM sales s
-        WHERE 1=1
+    # 📌 Schema padrão: statement preparado (sem parse/planejamento por requisição)
+    kpis = _prepared_kpis(date_from, date_to, channel)
+    if kpis is not None:
+        revenue = kpis["revenue"]
+    else:
+        revenue = _kpi_scalar("COALESCE(SUM(total_amount), 0) AS total", date_from, date_to, channel)
+
+    # 🧊 Meses arquivados (Parquet) somam ao que ainda está no banco
+    cold = archive_service.cold_totals(date_from, date_to, channel)
+    return revenue + (cold["revenue"] if cold else 0.0)
+
+
+@coalesce
+def average_ticket(
+    sales: Optional[List[Dict[str, Any]]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    channel: Optional[str] = None,
+    **kwargs: Any
+) -> float:
     """
+    Calcula o ticket médio diretamente do banco.
+    - Usa o snapshot compartilhado quando a janela está coberta.
+    - Schema padrão: prepared statement (prepared_queries); senão SQL tolerante.
+    - Soma os meses arquivados em Parquet (archive_service).
+    """
+    # ⚡ Snapshot compartilhado (mmap) responde janelas por dia sem ir ao banco
+    totals = snapshot_store.lookup_totals(date_from, date_to, channel)
+    if totals is not None:
+        return round(totals["revenue"] / totals["orders"], 2) if totals["orders"] else 0.0
 
-    if not channel:
-        return _try_scalar_with_datecols(base_no_date, "s", params)
+    # 🧊 Janela com meses arquivados: média ponderada de banco + Parquet
+    if archive_service.cold_totals(date_from, date_to, channel) is not None:
+        orders = total_orders(date_from=date_from, date_to=date_to, channel=channel)
+        revenue = total_revenue(date_from=date_from, date_to=date_to, channel=channel)
+        return round(revenue / orders, 2) if orders else 0.0
 
-    base_with_channel_id  = base_no_date + "  AND (:channel = s.channel_id)\n"
-    base_with_channel_txt = base_no_date + "  AND (:channel = s.channel)\n"
+    # 📌 Schema padrão: statement preparado (sem parse/planejamento por requisição)
+    kpis = _prepared_kpis(date_from, date_to, channel)
+    if kpis is not None:
+        return kpis["avg_ticket"]
 
-    try:
-        return _try_scalar_with_datecols(base_with_channel_id, "s", params)
-    except (ProgrammingError, OperationalError):
-        return _try_scalar_with_datecols(base_with_channel_txt, "s", params)
+    return _kpi_scalar("COALESCE(AVG(total_amount), 0) AS avg_ticket", date_from, date_to, channel)
 
 
 # ============================================================
 # ➕ NOVAS MÉTRICAS: TOTAL DE PEDIDOS e AVALIAÇÃO MÉDIA
 # ============================================================
 
+@coalesce
 def total_orders(
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
@@ -169,30 +273,28 @@ def total_orders(
 ) -> float:
     """
     Conta pedidos no intervalo.
-    - Usa sales s (COUNT(*)::float).
-    - Filtro de canal com fallback (channel_id → channel).
-    - Tenta created_at / sale_date etc. como nas demais.
-    """
-    params = {"date_from": date_from, "date_to": date_to, "channel": channel}
-
-    base_no_date = """
-        SELECT COUNT(*)::float AS qty
-        FROM sales s
-        WHERE 1=1
+    - Usa o snapshot compartilhado quando a janela está coberta.
+    - Schema padrão: prepared statement (prepared_queries); senão SQL tolerante.
+    - Soma os meses arquivados em Parquet (archive_service).
     """
+    # ⚡ Snapshot compartilhado (mmap) responde janelas por dia sem ir ao banco
+    totals = snapshot_store.lookup_totals(date_from, date_to, channel)
+    if totals is not None:
+        return float(totals["orders"])
 
-    if not channel:
-        return _try_scalar_with_datecols(base_no_date, "s", params)
+    # 📌 Schema padrão: statement preparado (sem parse/planejamento por requisição)
+    kpis = _prepared_kpis(date_from, date_to, channel)
+    if kpis is not None:
+        orders = kpis["orders"]
+    else:
+        orders = _kpi_scalar("COUNT(*)::float AS qty", date_from, date_to, channel)
 
-    base_with_channel_id  = base_no_date + "  AND (:channel = s.channel_id)\n"
-    base_with_channel_txt = base_no_date + "  AND (:channel = s.channel)\n"
-
-    try:
-        return _try_scalar_with_datecols(base_with_channel_id, "s", params)
-    except (ProgrammingError, OperationalError):
-        return _try_scalar_with_datecols(base_with_channel_txt, "s", params)
+    # 🧊 Meses arquivados (Parquet) somam ao que ainda está no banco
+    cold = archive_service.cold_totals(date_from, date_to, channel)
+    return orders + (cold["orders"] if cold else 0.0)
 
 
+@coalesce
 def average_rating(
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
@@ -240,6 +342,7 @@ def average_rating(
     return 0.0
 
 
+@coalesce
 def top_products(
     sales_items: Optional[List[Dict[str, Any]]] = None,
     top_n: int = 5,
@@ -247,58 +350,89 @@ def top_products(
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     channel: Optional[str] = None,
+    use_snapshot: bool = True,
     **kwargs: Any
 ) -> List[Dict[str, Any]]:
     """
     Retorna os produtos mais vendidos (por receita; fallback por quantidade).
     - Usa relação correta: item_product_sales → product_sales.
-    - Filtro de data em product_sales (ps.created_at).
+    - Dias inteiros filtram o dia local da venda (sales.date_key); datas com
+      hora filtram product_sales (ps.created_at).
     - Fallback agrega por dia na tabela sales (garante gráfico).
+    - Janela padrão do dashboard vem pré-calculada do snapshot compartilhado.
+    - Só o banco: itens de meses arquivados não entram (a rota marca a
+      resposta com archive_service.archive_note).
     """
     n = limit if isinstance(limit, int) and limit > 0 else top_n
+
+    if use_snapshot and not channel:
+        cached = snapshot_store.lookup_result(
+            "top_products", limit=n, date_from=date_from, date_to=date_to
+        )
+        if cached is not None:
+            return cached
     params = {"date_from": date_from, "date_to": date_to, "channel": channel, "n": n}
 
     # ⚠️ Seu schema não mostra canal em product_sales; mantemos sem filtro de canal aqui.
+    # Agrupa só pelo id; o nome vem do cache de dimensões (sem JOIN com items)
     base_no_date = """
         SELECT
             si.item_id AS product_id,
-            COALESCE(i.name, CONCAT('Item ', si.item_id)) AS product_name,
             COALESCE(SUM(si.quantity * si.price), 0) AS total_revenue,
             COALESCE(SUM(si.quantity), 0) AS total_sold
         FROM item_product_sales si
         JOIN product_sales ps ON ps.id = si.product_sale_id
-        LEFT JOIN items i ON i.id = si.item_id
+        {SALES_JOIN}
         WHERE 1=1
         {DATE_FILTER}
-        GROUP BY si.item_id, COALESCE(i.name, CONCAT('Item ', si.item_id))
+        GROUP BY si.item_id
         ORDER BY total_revenue DESC, total_sold DESC
         LIMIT :n
     """
 
+    # Dias inteiros: dia local da venda (sales.date_key), igual aos KPIs
+    day_conds, day_params = calendar_service.window_conds(date_from, date_to)
+    if calendar_service.day_keys(date_from, date_to) is not None:
+        sales_join = "JOIN sales s ON s.id = ps.sale_id"
+        date_filter = "".join(f"  AND {c}\n" for c in day_conds)
+    else:
+        sales_join = ""
+        date_filter = _build_date_clause("ps", "created_at")  # ✅ ps.created_at existe
+
     data: List[Dict[str, Any]] = []
     try:
-        sql_try = base_no_date.format(
-            DATE_FILTER=_build_date_clause("ps", "created_at")  # ✅ ps.created_at existe
-        )
-        data = _rows(sql_try, params)
+        sql_try = base_no_date.format(SALES_JOIN=sales_join, DATE_FILTER=date_filter)
+        data = _rows(sql_try, {**params, **day_params})
+        dimension_cache.enrich(data, "items", "product_id", "product_name", default="Item {id}")
+    except (QueryTimeoutError, ClientDisconnectedError):
+        raise
     except Exception:
         data = []
 
     # ✅ Fallback: se não houver itens, agrega por dia em sales (garante gráfico)
     if not data:
-        fb_sql = """
+        # Dia LOCAL da venda (date_key inteiro); o rótulo sai de dim_date só para as n linhas
+        fb_sql = f"""
             SELECT
-                TO_CHAR(s.created_at, 'YYYY-MM-DD') AS product_name,
-                COALESCE(SUM(total_amount), 0) AS total_revenue,
-                COUNT(*) AS total_sold
-            FROM sales s
-            WHERE (:date_from IS NULL OR s.created_at >= :date_from)
-              AND (:date_to   IS NULL OR s.created_at <= :date_to)
-            GROUP BY 1
-            ORDER BY total_revenue DESC
-            LIMIT :n
+                COALESCE(CAST(d.full_date AS TEXT), CAST(t.date_key AS TEXT)) AS product_name,
+                t.total_revenue,
+                t.total_sold
+            FROM (
+                SELECT
+                    {calendar_service.DATE_KEY_SQL} AS date_key,
+                    COALESCE(SUM(total_amount), 0) AS total_revenue,
+                    COUNT(*) AS total_sold
+                FROM sales s
+                WHERE TRUE
+                {"".join(f"  AND {c}" for c in day_conds)}
+                GROUP BY 1
+                ORDER BY total_revenue DESC
+                LIMIT :n
+            ) t
+            LEFT JOIN dim_date d ON d.date_key = t.date_key
+            ORDER BY t.total_revenue DESC
         """
-        data = _rows(fb_sql, params)
+        data = _rows(fb_sql, {**params, **day_params})
 
     out = []
     for r in data:
@@ -311,6 +445,382 @@ def top_products(
     return out
 
 
+# ============================================================
+# 📈 COMPARAÇÃO ENTRE PERÍODOS (compare=...)
+# ============================================================
+# - Os dois períodos saem de UMA varredura: SUM/COUNT ... FILTER (WHERE ...)
+#   sobre a união das janelas.
+# - previous_period: janela de mesmo tamanho imediatamente anterior
+#   [date_from - (date_to - date_from), date_from)
+# - same_period_last_year: a mesma janela deslocada um ano
+
+COMPARE_MODES = ("previous_period", "same_period_last_year")
+
+
+def _minus_one_year(d: datetime) -> datetime:
+    try:
+        return d.replace(year=d.year - 1)
+    except ValueError:  # 29/02 → 28/02
+        return d.replace(year=d.year - 1, day=28)
+
+
+def comparison_window(date_from: str, date_to: str, compare: str) -> Dict[str, Any]:
+    """Janela de comparação para (date_from, date_to); ValueError se inválida."""
+    if compare not in COMPARE_MODES:
+        raise ValueError(f"compare deve ser um de {', '.join(COMPARE_MODES)}")
+    if not (date_from and date_to):
+        raise ValueError("compare exige date_from e date_to")
+    start, end = datetime.fromisoformat(date_from), datetime.fromisoformat(date_to)
+    if end < start:
+        raise ValueError("date_to anterior a date_from")
+
+    if compare == "previous_period":
+        # Fim aberto: vendas exatamente em date_from pertencem só ao período atual
+        prev_from, prev_to, end_inclusive = start - (end - start), start, False
+    else:
+        prev_from, prev_to, end_inclusive = _minus_one_year(start), _minus_one_year(end), True
+    fmt = (lambda d: d.date().isoformat()) if len(date_from) == 10 and len(date_to) == 10 else (lambda d: d.isoformat())
+    return {"date_from": fmt(prev_from), "date_to": fmt(prev_to), "end_inclusive": end_inclusive}
+
+
+def _delta(current: float, previous: float) -> Dict[str, Any]:
+    return {
+        "previous": round(previous, 2),
+        "delta": round(current - previous, 2),
+        "delta_pct": round((current - previous) / previous * 100, 2) if previous else None,
+    }
+
+
+def _kpis(revenue: float, orders: float) -> Dict[str, float]:
+    return {
+        "revenue": round(revenue, 2),
+        "orders": float(orders),
+        "avg_ticket": round(revenue / orders, 2) if orders else 0.0,
+    }
+
+
+@coalesce
+def compare_kpis(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    channel: Optional[str] = None,
+    compare: str = "previous_period",
+    **kwargs: Any
+) -> Dict[str, Any]:
+    """
+    Receita, pedidos e ticket médio do período atual e do de comparação.
+    Retorna {"current": {...}, "previous": {...}, "window": {...}}.
+    - Os cards de receita/pedidos/ticket compartilham esta chamada (single-flight).
+    - Snapshot compartilhado responde sem banco quando cobre as duas janelas.
+    - Sem snapshot: banco + meses arquivados em Parquet (archive_service).
+    """
+    window = comparison_window(date_from, date_to, compare)
+
+    # ⚡ Snapshot (dias [from, to)) equivale ao filtro SQL quando as datas não têm hora
+    cur = snapshot_store.lookup_totals(date_from, date_to, channel)
+    prev = snapshot_store.lookup_totals(window["date_from"], window["date_to"], channel)
+    if cur is not None and prev is not None:
+        current, previous = _kpis(cur["revenue"], cur["orders"]), _kpis(prev["revenue"], prev["orders"])
+    else:
+        # Dias inteiros → date_key (dia local); com hora → created_at
+        cur_conds, params = calendar_service.window_conds(date_from, date_to)
+        prev_conds, prev_params = calendar_service.window_conds(
+            window["date_from"], window["date_to"], suffix="_prev", end_inclusive=window["end_inclusive"]
+        )
+        params.update(prev_params)
+        cur_cond, prev_cond = " AND ".join(cur_conds), " AND ".join(prev_conds)
+        channel_cond = ""
+        if channel:
+            channel_cond = "  AND s.channel_id = ANY(:channel_ids)\n"
+            params["channel_ids"] = dimension_cache.channel_ids(channel)
+        sql = f"""
+            SELECT
+                COALESCE(SUM(s.total_amount) FILTER (WHERE {cur_cond}), 0) AS cur_revenue,
+                COUNT(*) FILTER (WHERE {cur_cond}) AS cur_orders,
+                COALESCE(SUM(s.total_amount) FILTER (WHERE {prev_cond}), 0) AS prev_revenue,
+                COUNT(*) FILTER (WHERE {prev_cond}) AS prev_orders
+            FROM sales s
+            WHERE (({cur_cond}) OR ({prev_cond}))
+            {channel_cond}
+        """
+        row = _rows(sql, params)[0]
+        # 🧊 Meses arquivados (Parquet) de cada janela
+        no_cold = {"revenue": 0.0, "orders": 0.0}
+        cur_cold = archive_service.cold_totals(date_from, date_to, channel) or no_cold
+        prev_cold = archive_service.cold_totals(
+            window["date_from"], window["date_to"], channel, end_inclusive=window["end_inclusive"]
+        ) or no_cold
+        current = _kpis(float(row["cur_revenue"]) + cur_cold["revenue"], row["cur_orders"] + cur_cold["orders"])
+        previous = _kpis(float(row["prev_revenue"]) + prev_cold["revenue"], row["prev_orders"] + prev_cold["orders"])
+
+    return {
+        "current": current,
+        "previous": previous,
+        "window": {"compare": compare, "date_from": window["date_from"], "date_to": window["date_to"]},
+    }
+
+
+def with_comparison(metric: str, comparison: Dict[str, Any]) -> Dict[str, Any]:
+    """Bloco "compare" de um card: valor anterior + deltas absoluto e percentual."""
+    return {
+        **_delta(comparison["current"][metric], comparison["previous"][metric]),
+        **comparison["window"],
+    }
+
+
+# ============================================================
+# 🏷️ MARCAS (shards por brand_id)
+# ============================================================
+# - Versões por marca: a consulta vai para o banco da marca
+#   (session.shard_map) e filtra as lojas dela (um banco pode guardar
+#   mais de uma marca).
+# - Entre marcas (admin): scatter-gather — uma consulta por shard, em
+#   paralelo, e merge no Python (somas; ticket médio = receita / pedidos,
+#   nunca média das médias).
+# - Só tabelas quentes: snapshot, prepared statements, cache de dimensões
+#   e arquivo frio descrevem o banco principal, não os shards. Janela que
+#   alcança meses arquivados sai com archive_excluded=true (archive_note).
+
+MAX_SHARD_WORKERS = 8
+
+BRAND_STORES = "s.store_id IN (SELECT id FROM stores WHERE brand_id = :brand_id)"
+
+
+def _sales_window(date_from: Optional[str], date_to: Optional[str], channel: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+    """Filtros de janela/canal sobre sales s (canal resolvido no próprio shard)."""
+    conds, params = calendar_service.window_conds(date_from, date_to)
+    if channel:
+        conds.append(
+            "s.channel_id IN (SELECT id FROM channels "
+            "WHERE CAST(id AS TEXT) = :channel OR type = :channel)"
+        )
+        params["channel"] = channel
+    return "".join(f"  AND {c}\n" for c in conds), params
+
+
+def _shard_brands(shard: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Marcas que o shard possui (no principal: todas menos as que saíram)."""
+    if shard["brands"] is not None:
+        return "st.brand_id = ANY(:shard_brands)", {"shard_brands": shard["brands"]}
+    return "st.brand_id <> ALL(:moved_brands)", {"moved_brands": shard["exclude"]}
+
+
+def _brand_rows(brand_id: int, sql: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    with brand_connection(brand_id) as conn, apply_scope(conn):
+        try:
+            return [dict(r) for r in conn.execute(text(sql), {**params, "brand_id": brand_id}).mappings().all()]
+        except DBAPIError as e:
+            raise_if_canceled(e)
+            raise
+
+
+def _scatter(query: Callable[[Dict[str, Any]], Tuple[str, Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Roda query(shard) → (sql, params) em todos os shards em paralelo.
+    Shard fora do ar vira {"error": ...} no relatório (resposta parcial);
+    se TODOS falharem, o erro sobe (a rota responde erro, não zeros).
+    Timeout/cancelamento da requisição continua interrompendo tudo.
+    """
+    shards = shard_map.shards()
+
+    def run(shard):
+        started = time.perf_counter()
+        sql, params = query(shard)
+        report = {"shard": shard["name"]}
+        try:
+            with shard_connection(shard["engine"]) as conn, apply_scope(conn):
+                try:
+                    rows = [dict(r) for r in conn.execute(text(sql), params).mappings().all()]
+                except DBAPIError as e:
+                    raise_if_canceled(e)
+                    raise
+        except (QueryTimeoutError, ClientDisconnectedError):
+            raise
+        except (DBAPIError, OperationalError) as e:
+            rows = []
+            report["error"] = type(getattr(e, "orig", e)).__name__
+            report["exception"] = e
+        report.update(rows=len(rows), ms=round((time.perf_counter() - started) * 1000, 2))
+        return rows, report
+
+    with ThreadPoolExecutor(max_workers=min(MAX_SHARD_WORKERS, len(shards))) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, run, shard) for shard in shards]
+        results = [f.result() for f in futures]
+    reports = [report for _, report in results]
+    errors = [r.pop("exception") for r in reports if "exception" in r]
+    if errors and len(errors) == len(reports):
+        raise errors[0]
+    rows = [row for shard_rows, _ in results for row in shard_rows]
+    return rows, reports
+
+
+def brand_kpis(
+    brand_id: int,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    channel: Optional[str] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """Receita, pedidos e ticket médio de uma marca, numa varredura no shard dela."""
+    where, params = _sales_window(date_from, date_to, channel)
+    row = _brand_rows(brand_id, f"""
+        SELECT COALESCE(SUM(s.total_amount), 0) AS revenue, COUNT(*) AS orders
+        FROM sales s
+        WHERE {BRAND_STORES}
+        {where}
+    """, params)[0]
+    return {
+        "brand_id": brand_id,
+        **_kpis(float(row["revenue"]), row["orders"]),
+        **archive_service.archive_note(date_from, date_to),
+    }
+
+
+def brand_total_revenue(brand_id: int, **kwargs: Any) -> float:
+    return brand_kpis(brand_id, **kwargs)["revenue"]
+
+
+def brand_total_orders(brand_id: int, **kwargs: Any) -> float:
+    return brand_kpis(brand_id, **kwargs)["orders"]
+
+
+def brand_average_ticket(brand_id: int, **kwargs: Any) -> float:
+    return brand_kpis(brand_id, **kwargs)["avg_ticket"]
+
+
+def brand_top_products(
+    brand_id: int,
+    limit: int = 5,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    **kwargs: Any,
+) -> List[Dict[str, Any]]:
+    """Mesma métrica de top_products (item_product_sales), restrita às lojas da marca."""
+    where, params = _sales_window(date_from, date_to, None)
+    rows = _brand_rows(brand_id, f"""
+        SELECT t.product_id, COALESCE(i.name, CONCAT('Item ', t.product_id)) AS product_name,
+               t.total_revenue, t.total_sold
+        FROM (
+            SELECT si.item_id AS product_id,
+                   COALESCE(SUM(si.quantity * si.price), 0) AS total_revenue,
+                   COALESCE(SUM(si.quantity), 0) AS total_sold
+            FROM item_product_sales si
+            JOIN product_sales ps ON ps.id = si.product_sale_id
+            JOIN sales s ON s.id = ps.sale_id
+            WHERE {BRAND_STORES}
+            {where}
+            GROUP BY si.item_id
+            ORDER BY total_revenue DESC, total_sold DESC
+            LIMIT :n
+        ) t
+        LEFT JOIN items i ON i.id = t.product_id
+        ORDER BY t.total_revenue DESC, t.total_sold DESC
+    """, {**params, "n": limit})
+    return [
+        {
+            "product_id": r["product_id"],
+            "product_name": r["product_name"],
+            "total_sold": float(r["total_sold"] or 0),
+            "total_revenue": float(r["total_revenue"] or 0),
+        }
+        for r in rows
+    ]
+
+
+def cross_brand_kpis(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    channel: Optional[str] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """KPIs por marca de TODOS os shards + total geral (admin)."""
+    where, params = _sales_window(date_from, date_to, channel)
+
+    def query(shard):
+        owned, owned_params = _shard_brands(shard)
+        return f"""
+            SELECT st.brand_id, b.name AS brand_name,
+                   COALESCE(SUM(s.total_amount), 0) AS revenue, COUNT(*) AS orders
+            FROM sales s
+            JOIN stores st ON st.id = s.store_id
+            LEFT JOIN brands b ON b.id = st.brand_id
+            WHERE {owned}
+            {where}
+            GROUP BY st.brand_id, b.name
+        """, {**params, **owned_params}
+
+    rows, shards = _scatter(query)
+    data = [
+        {"brand_id": r["brand_id"], "brand_name": r["brand_name"], **_kpis(float(r["revenue"]), r["orders"])}
+        for r in rows
+    ]
+    data.sort(key=lambda d: d["revenue"], reverse=True)
+    total = _kpis(sum(float(r["revenue"]) for r in rows), sum(int(r["orders"]) for r in rows))
+    return {
+        "data": data,
+        "total": total,
+        "partial": any("error" in s for s in shards),
+        "shards": shards,
+        **archive_service.archive_note(date_from, date_to),
+    }
+
+
+def cross_brand_top_products(
+    limit: int = 5,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """
+    Top produtos entre marcas: top `limit` de cada shard e merge pelo
+    maior faturamento (cada item pertence a um único shard, então o top
+    global está contido na união dos tops locais).
+    """
+    where, params = _sales_window(date_from, date_to, None)
+
+    def query(shard):
+        owned, owned_params = _shard_brands(shard)
+        return f"""
+            SELECT t.brand_id, t.product_id,
+                   COALESCE(i.name, CONCAT('Item ', t.product_id)) AS product_name,
+                   t.total_revenue, t.total_sold
+            FROM (
+                SELECT st.brand_id, si.item_id AS product_id,
+                       COALESCE(SUM(si.quantity * si.price), 0) AS total_revenue,
+                       COALESCE(SUM(si.quantity), 0) AS total_sold
+                FROM item_product_sales si
+                JOIN product_sales ps ON ps.id = si.product_sale_id
+                JOIN sales s ON s.id = ps.sale_id
+                JOIN stores st ON st.id = s.store_id
+                WHERE {owned}
+                {where}
+                GROUP BY st.brand_id, si.item_id
+                ORDER BY total_revenue DESC, total_sold DESC
+                LIMIT :n
+            ) t
+            LEFT JOIN items i ON i.id = t.product_id
+        """, {**params, **owned_params, "n": limit}
+
+    rows, shards = _scatter(query)
+    rows.sort(key=lambda r: (float(r["total_revenue"] or 0), float(r["total_sold"] or 0)), reverse=True)
+    data = [
+        {
+            "brand_id": r["brand_id"],
+            "product_id": r["product_id"],
+            "product_name": r["product_name"],
+            "total_sold": float(r["total_sold"] or 0),
+            "total_revenue": float(r["total_revenue"] or 0),
+        }
+        for r in rows[:limit]
+    ]
+    return {
+        "data": data,
+        "partial": any("error" in s for s in shards),
+        "shards": shards,
+        **archive_service.archive_note(date_from, date_to),
+    }
+
+
 # ============================================================
 # 🔄 FUNÇÕES DE AGRUPAMENTO E FILTROS
 # ============================================================
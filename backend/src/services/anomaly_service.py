@@ -0,0 +1,397 @@
+# ============================================================
+# 🚨 SERVICE DE ANOMALIAS (RECEITA / PEDIDOS POR HORA)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Detecta horas em que uma loja × canal fugiu muito do normal
+#            (ex.: marketplace fora do ar → pedidos zerados).
+#            - "normal" = média/variância EWMA por loja × canal × hora da
+#              semana (168 slots), em anomaly_stats
+#            - incremental: cada venda nova (id acima do checkpoint) é somada
+#              UMA vez ao balde da sua hora (anomaly_buckets); horas fechadas
+#              viram uma observação por série — nada do histórico é relido
+#            - z-score gravado no fechamento da hora (anomaly_scores), contra
+#              a estatística ANTERIOR à observação
+#            - atualização só pelo CLI (cron) e pela ingestão em background;
+#              o endpoint apenas lê e informa o atraso (stale)
+# ============================================================
+
+import json
+import math
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from src.database.session import engine, read_connection
+from src.services import dimension_cache
+from src.services.calendar_service import (
+    SALES_TIMEZONE, TZ_PARAMS, date_key, key_to_date, stored_keys_sql,
+)
+from src.services.query_control import apply_scope
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.2"))          # peso da observação nova
+ANOMALY_MIN_OBSERVATIONS = int(os.getenv("ANOMALY_MIN_OBSERVATIONS", "4"))  # semanas até pontuar
+ANOMALY_GRACE_MINUTES = int(os.getenv("ANOMALY_GRACE_MINUTES", "10"))       # atraso tolerado ao fechar a hora
+ANOMALY_RETENTION_DAYS = 30
+MIN_SD = {"revenue": 10.0, "orders": 1.0}  # piso do desvio (séries quase constantes)
+METRICS = ("revenue", "orders")
+CHECKPOINT_NAME = "anomalies"
+LOCK_KEY = 40_001  # pg_advisory_xact_lock: um worker por vez dobra as horas
+
+State = List[float]                     # [n, revenue_mean, revenue_var, orders_mean, orders_var]
+
+
+# ============================================================
+# 🧮 EWMA
+# ============================================================
+
+def ewma_update(mean: float, var: float, x: float, alpha: float = ANOMALY_ALPHA) -> Tuple[float, float]:
+    """Média/variância exponenciais (West, 1979): O(1), sem guardar histórico."""
+    delta = x - mean
+    mean += alpha * delta
+    var = (1 - alpha) * (var + alpha * delta * delta)
+    return mean, var
+
+
+def z_score(x: float, mean: float, var: float, metric: str) -> float:
+    sd = max(math.sqrt(max(var, 0.0)), MIN_SD[metric])
+    return (x - mean) / sd
+
+
+def hour_of_week(hour: datetime) -> int:
+    """0 = domingo 00h … 167 = sábado 23h (mesmo dow de dim_date)."""
+    return ((hour.weekday() + 1) % 7) * 24 + hour.hour
+
+
+def _hour_of(dk: int, hk: int) -> datetime:
+    return datetime.combine(key_to_date(dk), datetime.min.time()) + timedelta(hours=hk)
+
+
+def _local_now() -> datetime:
+    from zoneinfo import ZoneInfo
+    return datetime.now(ZoneInfo(SALES_TIMEZONE)).replace(tzinfo=None)
+
+
+# ============================================================
+# 💾 CHECKPOINT
+# ============================================================
+
+def _load_checkpoint(conn) -> Dict[str, Any]:
+    raw = conn.execute(
+        text("SELECT checkpoint FROM job_checkpoints WHERE name = :name"), {"name": CHECKPOINT_NAME}
+    ).scalar()
+    cp = json.loads(raw) if raw else {}
+    return {
+        "last_sale_id": int(cp.get("last_sale_id") or 0),
+        "folded_until": datetime.fromisoformat(cp["folded_until"]) if cp.get("folded_until") else None,
+    }
+
+
+def _save_checkpoint(conn, last_sale_id: int, folded_until: Optional[datetime]) -> None:
+    conn.execute(text("""
+        INSERT INTO job_checkpoints (name, checkpoint, updated_at)
+        VALUES (:name, :checkpoint, NOW())
+        ON CONFLICT (name) DO UPDATE SET checkpoint = EXCLUDED.checkpoint, updated_at = NOW()
+    """), {
+        "name": CHECKPOINT_NAME,
+        "checkpoint": json.dumps({
+            "last_sale_id": last_sale_id,
+            "folded_until": folded_until.isoformat() if folded_until else None,
+        }),
+    })
+
+
+# ============================================================
+# 🔄 ATUALIZAÇÃO INCREMENTAL
+# ============================================================
+
+def _absorb_new_sales(conn, last_sale_id: int, max_id: int, folded_until: Optional[datetime]) -> Dict[str, int]:
+    """Soma as vendas (last_sale_id, max_id] aos baldes das suas horas locais."""
+    date_expr, hour_expr = stored_keys_sql("s")
+    rows = conn.execute(text(f"""
+        SELECT s.store_id, s.channel_id, {date_expr} AS date_key, {hour_expr} AS hour_key,
+               COALESCE(SUM(s.total_amount), 0) AS revenue, COUNT(*) AS orders
+        FROM sales s
+        WHERE s.id > :last_id AND s.id <= :max_id
+        GROUP BY 1, 2, 3, 4
+    """), {"last_id": last_sale_id, "max_id": max_id, **TZ_PARAMS}).all()
+
+    buckets, late = [], 0
+    for store_id, channel_id, dk, hk, revenue, orders in rows:
+        if folded_until is not None and _hour_of(dk, hk) <= folded_until:
+            late += orders  # hora já fechada: não reabre a estatística
+            continue
+        buckets.append({
+            "store_id": store_id, "channel_id": channel_id, "date_key": dk, "hour_key": hk,
+            "revenue": float(revenue), "orders": int(orders),
+        })
+    if buckets:
+        conn.execute(text("""
+            INSERT INTO anomaly_buckets (date_key, hour_key, store_id, channel_id, revenue, orders)
+            VALUES (:date_key, :hour_key, :store_id, :channel_id, :revenue, :orders)
+            ON CONFLICT (date_key, hour_key, store_id, channel_id) DO UPDATE SET
+                revenue = anomaly_buckets.revenue + EXCLUDED.revenue,
+                orders = anomaly_buckets.orders + EXCLUDED.orders
+        """), buckets)
+    return {"sales": sum(r[5] for r in rows), "late": late}
+
+
+def _fold_closed_hours(conn, folded_until: Optional[datetime], close_before: datetime) -> Tuple[int, Optional[datetime]]:
+    """
+    Fecha as horas em (folded_until, close_before): cada série vira uma
+    observação (0 se não vendeu) no slot da hora da semana.
+    Retorna (horas fechadas, novo folded_until).
+    """
+    pending = conn.execute(text("""
+        SELECT date_key, hour_key, store_id, channel_id, revenue, orders
+        FROM anomaly_buckets
+        WHERE (date_key, hour_key) < (:dk, :hk)
+    """), {"dk": date_key(close_before.date()), "hk": close_before.hour}).all()
+    observed: Dict[Tuple[datetime, int, int], Tuple[float, int]] = {
+        (_hour_of(r[0], r[1]), r[2], r[3]): (float(r[4]), int(r[5])) for r in pending
+    }
+    if folded_until is None:
+        if not observed:
+            return 0, None
+        first = min(h for h, _, _ in observed)
+    else:
+        first = folded_until + timedelta(hours=1)
+    hours = []
+    h = first
+    while h < close_before:
+        hours.append(h)
+        h += timedelta(hours=1)
+    if not hours:
+        return 0, folded_until
+
+    series = {(r[0], r[1]) for r in conn.execute(text("SELECT DISTINCT store_id, channel_id FROM anomaly_stats"))}
+    series |= {(s, c) for _, s, c in observed}
+    slots = sorted({hour_of_week(h) for h in hours})
+    state: Dict[Tuple[int, int, int], State] = {
+        (r[0], r[1], r[2]): [r[3], r[4], r[5], r[6], r[7]]
+        for r in conn.execute(text("""
+            SELECT store_id, channel_id, hour_of_week, n, revenue_mean, revenue_var, orders_mean, orders_var
+            FROM anomaly_stats WHERE hour_of_week = ANY(:slots)
+        """), {"slots": slots})
+    }
+
+    scores = []
+    for hour in hours:
+        how = hour_of_week(hour)
+        for store_id, channel_id in sorted(series):
+            revenue, orders = observed.get((hour, store_id, channel_id), (0.0, 0))
+            st = state.get((store_id, channel_id, how))
+            if st is None:
+                if not orders:
+                    continue  # o slot só começa na primeira hora com venda
+                st = state[(store_id, channel_id, how)] = [0, 0.0, 0.0, 0.0, 0.0]
+            n = int(st[0])
+            if n >= ANOMALY_MIN_OBSERVATIONS or orders:
+                ready = n >= ANOMALY_MIN_OBSERVATIONS
+                scores.append({
+                    "date_key": date_key(hour.date()), "hour_key": hour.hour,
+                    "store_id": store_id, "channel_id": channel_id,
+                    "revenue": round(revenue, 2), "orders": orders,
+                    "revenue_expected": round(st[1], 2) if n else None,
+                    "orders_expected": round(st[3], 2) if n else None,
+                    "revenue_z": round(z_score(revenue, st[1], st[2], "revenue"), 3) if ready else None,
+                    "orders_z": round(z_score(orders, st[3], st[4], "orders"), 3) if ready else None,
+                })
+            if n == 0:
+                st[1], st[3] = revenue, float(orders)  # 1ª observação inicializa a média
+            else:
+                st[1], st[2] = ewma_update(st[1], st[2], revenue)
+                st[3], st[4] = ewma_update(st[3], st[4], float(orders))
+            st[0] = n + 1
+
+    if state:
+        conn.execute(text("""
+            INSERT INTO anomaly_stats
+                (store_id, channel_id, hour_of_week, n, revenue_mean, revenue_var, orders_mean, orders_var, updated_at)
+            VALUES (:store_id, :channel_id, :hour_of_week, :n, :rm, :rv, :om, :ov, NOW())
+            ON CONFLICT (store_id, channel_id, hour_of_week) DO UPDATE SET
+                n = EXCLUDED.n,
+                revenue_mean = EXCLUDED.revenue_mean, revenue_var = EXCLUDED.revenue_var,
+                orders_mean = EXCLUDED.orders_mean, orders_var = EXCLUDED.orders_var,
+                updated_at = NOW()
+        """), [
+            {"store_id": k[0], "channel_id": k[1], "hour_of_week": k[2],
+             "n": int(v[0]), "rm": v[1], "rv": v[2], "om": v[3], "ov": v[4]}
+            for k, v in state.items()
+        ])
+    if scores:
+        conn.execute(text("""
+            INSERT INTO anomaly_scores (
+                date_key, hour_key, store_id, channel_id, revenue, orders,
+                revenue_expected, orders_expected, revenue_z, orders_z
+            )
+            VALUES (
+                :date_key, :hour_key, :store_id, :channel_id, :revenue, :orders,
+                :revenue_expected, :orders_expected, :revenue_z, :orders_z
+            )
+            ON CONFLICT (date_key, hour_key, store_id, channel_id) DO NOTHING
+        """), scores)
+
+    last = hours[-1]
+    conn.execute(text("DELETE FROM anomaly_buckets WHERE (date_key, hour_key) <= (:dk, :hk)"),
+                 {"dk": date_key(last.date()), "hk": last.hour})
+    conn.execute(text("DELETE FROM anomaly_scores WHERE date_key < :dk"),
+                 {"dk": date_key((last - timedelta(days=ANOMALY_RETENTION_DAYS)).date())})
+    return len(hours), last
+
+
+def _close_before(now: datetime) -> datetime:
+    """Horas anteriores a este instante já podem ser fechadas (com a carência)."""
+    return (now - timedelta(minutes=ANOMALY_GRACE_MINUTES)).replace(minute=0, second=0, microsecond=0)
+
+
+def refresh_anomalies(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Absorve as vendas novas e fecha as horas completas. Uma transação;
+    se outro worker estiver atualizando, retorna {"skipped": True}.
+    """
+    started = time.perf_counter()
+    now = now or _local_now()
+    close_before = _close_before(now)
+
+    with engine.begin() as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": LOCK_KEY}).scalar():
+            return {"skipped": True}
+        cp = _load_checkpoint(conn)
+        max_id = int(conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM sales")).scalar())
+        absorbed = {"sales": 0, "late": 0}
+        if max_id > cp["last_sale_id"]:
+            absorbed = _absorb_new_sales(conn, cp["last_sale_id"], max_id, cp["folded_until"])
+        folded, folded_until = _fold_closed_hours(conn, cp["folded_until"], close_before)
+        if max_id != cp["last_sale_id"] or folded_until != cp["folded_until"]:
+            _save_checkpoint(conn, max(max_id, cp["last_sale_id"]), folded_until)
+
+    return {
+        "skipped": False,
+        "new_sales": absorbed["sales"],
+        "late_sales": absorbed["late"],
+        "hours_closed": folded,
+        "closed_until": folded_until.isoformat() if folded_until else None,
+        "ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+# ============================================================
+# 🔥 ENTRADA DO SERVICE
+# ============================================================
+
+def anomalies(
+    hours: int = 24,
+    min_z: float = 3.0,
+    metric: Optional[str] = None,
+    store_id: Optional[int] = None,
+    channel: Optional[str] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """
+    Horas fechadas das últimas `hours` com |z| >= min_z (receita e/ou pedidos).
+    metric: revenue | orders | None (qualquer um dos dois).
+    Só leitura: closed_until diz até que hora o job já fechou, e stale=True
+    quando ele está mais de uma hora atrás do que já poderia ter fechado.
+    """
+    if metric is not None and metric not in METRICS:
+        raise ValueError(f"metric deve ser um de {', '.join(METRICS)}")
+    now = _local_now()
+    since = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours)
+    z_cols = [f"a.{m}_z" for m in ([metric] if metric else METRICS)]
+    conds = ["(a.date_key, a.hour_key) >= (:dk, :hk)",
+             "(" + " OR ".join(f"ABS({c}) >= :min_z" for c in z_cols) + ")"]
+    params: Dict[str, Any] = {"dk": date_key(since.date()), "hk": since.hour, "min_z": min_z}
+    if store_id is not None:
+        conds.append("a.store_id = :store_id")
+        params["store_id"] = store_id
+    if channel:
+        conds.append("a.channel_id = ANY(:channel_ids)")
+        params["channel_ids"] = dimension_cache.channel_ids(channel)
+
+    with read_connection() as conn, apply_scope(conn):
+        folded_until = _load_checkpoint(conn)["folded_until"]
+        rows = conn.execute(text(f"""
+            SELECT a.date_key, a.hour_key, a.store_id, a.channel_id,
+                   a.revenue, a.revenue_expected, a.revenue_z,
+                   a.orders, a.orders_expected, a.orders_z
+            FROM anomaly_scores a
+            WHERE {" AND ".join(conds)}
+            ORDER BY a.date_key DESC, a.hour_key DESC, GREATEST({", ".join(f"ABS({c})" for c in z_cols)}) DESC
+        """), params).mappings().all()
+
+    data = []
+    for r in rows:
+        hour = _hour_of(r["date_key"], r["hour_key"])
+        data.append({
+            "hour": hour.isoformat(),
+            "store_id": r["store_id"],
+            "store_name": dimension_cache.label("stores", r["store_id"]),
+            "channel_id": r["channel_id"],
+            "channel_name": dimension_cache.label("channels", r["channel_id"]),
+            **{
+                m: {
+                    "value": float(r[m]) if m == "revenue" else int(r[m]),
+                    "expected": float(r[f"{m}_expected"]) if r[f"{m}_expected"] is not None else None,
+                    "z": float(r[f"{m}_z"]) if r[f"{m}_z"] is not None else None,
+                }
+                for m in METRICS
+            },
+        })
+    # Última hora que o job já poderia ter fechado (mesma regra de refresh_anomalies)
+    closable = _close_before(now) - timedelta(hours=1)
+    return {
+        "hours": hours,
+        "min_z": min_z,
+        "timezone": SALES_TIMEZONE,
+        "closed_until": folded_until.isoformat() if folded_until else None,
+        "stale": folded_until is None or folded_until < closable - timedelta(hours=1),
+        "data": data,
+    }
+
+
+# ============================================================
+# 🚀 CLI (cron / scheduler)
+# ============================================================
+
+def main():
+    from argparse import ArgumentParser
+
+    ap = ArgumentParser(description="Atualiza as estatísticas de anomalia (vendas novas + horas fechadas)")
+    ap.add_argument("--rebuild", action="store_true", help="Apaga o estado e reprocessa todo o histórico")
+    args = ap.parse_args()
+
+    if args.rebuild:
+        with engine.begin() as conn:
+            for table in ("anomaly_buckets", "anomaly_stats", "anomaly_scores"):
+                conn.execute(text(f"DELETE FROM {table}"))
+            conn.execute(text("DELETE FROM job_checkpoints WHERE name = :name"), {"name": CHECKPOINT_NAME})
+    result = refresh_anomalies()
+    print(f"✅ Anomalias: {result}")
+
+
+if __name__ == "__main__":
+    main()
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Cada slot (hora da semana) recebe uma observação por semana: com
+#   ANOMALY_ALPHA=0.2 a "memória" é de ~5 semanas; z só é calculado após
+#   ANOMALY_MIN_OBSERVATIONS semanas.
+# - Horas sem venda contam como 0 para séries que já venderam naquele slot —
+#   é isso que pega o canal fora do ar.
+# - Vendas que chegam depois de a hora fechar (late_sales) não reabrem a
+#   estatística; a hora só é fechada ANOMALY_GRACE_MINUTES após o fim.
+# - GET /metrics/anomalies nunca grava: rode este módulo no cron (ex.: a
+#   cada 5 min). A primeira execução (ou --rebuild) percorre o histórico
+#   todo; sem job, a resposta sai com stale=true e closed_until parado.
+# - O incremental segue sales.id: lotes com ids reservados e gravados fora
+#   de ordem (transações longas concorrentes) podem ficar de fora — use
+#   --rebuild se isso acontecer.
+# ============================================================
@@ -0,0 +1,577 @@
+# ============================================================
+# 🧊 ARQUIVO FRIO (MESES FECHADOS EM PARQUET)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Anos de vendas precisam ficar para auditoria, mas não no
+#            Postgres (disco + vacuum crescem junto). Este módulo:
+#            - JOB: move meses fechados de sales / product_sales / payments
+#              (e dos filhos de sales, que sairiam no ON DELETE CASCADE) para
+#              Parquet comprimido (zstd), particionado por tabela e mês,
+#              ordenado por created_at, com min/max por arquivo no manifesto
+#              e por row group nas estatísticas do próprio Parquet
+#            - LEITURA: totais de janelas históricas com pyarrow (vetorizado),
+#              pulando arquivos e row groups fora das datas pedidas; as métricas
+#              somam isso ao banco (que só tem o período quente)
+# Uso (a partir de backend/):
+#   python -m src.services.archive_service                 # arquiva até o limite
+#   python -m src.services.archive_service --dry-run       # só mostra os meses
+#   python -m src.services.archive_service --keep-months 6 --vacuum
+# ============================================================
+
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from src.database.session import engine
+from src.services import calendar_service
+from src.utils.pg_copy import copy_to_frame
+from src.utils.ttl_cache import TTLCache
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive_files")
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Meses fechados que continuam no banco (além do mês corrente)
+ARCHIVE_KEEP_MONTHS = int(os.getenv("ARCHIVE_KEEP_MONTHS", "13"))
+ARCHIVE_ROW_GROUP_ROWS = int(os.getenv("ARCHIVE_ROW_GROUP_ROWS", "100000"))
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+MANIFEST_NAME = "manifest.json"
+CHECKPOINT_NAME = "archive"
+STAT_CHECK_SECONDS = 1.0  # frequência com que leitores checam troca do manifesto
+
+# Lock do job (pg_try_advisory_xact_lock)
+ARCHIVE_LOCK_ID = 40002
+
+# Tabela → SELECT do mês (%(lo)s ≤ created_at < %(hi)s), ordenado por created_at.
+# Tabelas filhas levam created_at/store_id/channel_id da venda: o arquivo de
+# cada tabela é podado por data sozinho, sem JOIN com o arquivo de sales.
+_SALE_COLS = "s.created_at AS sale_created_at, s.store_id AS sale_store_id, s.channel_id AS sale_channel_id"
+_MONTH = "s.created_at >= %(lo)s AND s.created_at < %(hi)s"
+ARCHIVE_TABLES: Dict[str, str] = {
+    "sales": f"""
+        SELECT s.*, c.type AS channel_type
+        FROM sales s LEFT JOIN channels c ON c.id = s.channel_id
+        WHERE {_MONTH} ORDER BY s.created_at, s.id
+    """,
+    "product_sales": f"""
+        SELECT ps.*, {_SALE_COLS}
+        FROM product_sales ps JOIN sales s ON s.id = ps.sale_id
+        WHERE {_MONTH} ORDER BY s.created_at, ps.id
+    """,
+    "payments": f"""
+        SELECT p.*, {_SALE_COLS}
+        FROM payments p JOIN sales s ON s.id = p.sale_id
+        WHERE {_MONTH} ORDER BY s.created_at, p.id
+    """,
+    # Só auditoria (o DELETE de sales apagaria em cascata)
+    "item_product_sales": f"""
+        SELECT ips.*, {_SALE_COLS}
+        FROM item_product_sales ips
+        JOIN product_sales ps ON ps.id = ips.product_sale_id
+        JOIN sales s ON s.id = ps.sale_id
+        WHERE {_MONTH} ORDER BY s.created_at, ips.id
+    """,
+    "item_item_product_sales": f"""
+        SELECT iips.*, {_SALE_COLS}
+        FROM item_item_product_sales iips
+        JOIN item_product_sales ips ON ips.id = iips.item_product_sale_id
+        JOIN product_sales ps ON ps.id = ips.product_sale_id
+        JOIN sales s ON s.id = ps.sale_id
+        WHERE {_MONTH} ORDER BY s.created_at, iips.id
+    """,
+    "delivery_sales": f"""
+        SELECT ds.*, {_SALE_COLS}
+        FROM delivery_sales ds JOIN sales s ON s.id = ds.sale_id
+        WHERE {_MONTH} ORDER BY s.created_at, ds.id
+    """,
+    "delivery_addresses": f"""
+        SELECT da.*, {_SALE_COLS}
+        FROM delivery_addresses da JOIN sales s ON s.id = da.sale_id
+        WHERE {_MONTH} ORDER BY s.created_at, da.id
+    """,
+    "coupon_sales": f"""
+        SELECT cs.*, {_SALE_COLS}
+        FROM coupon_sales cs JOIN sales s ON s.id = cs.sale_id
+        WHERE {_MONTH} ORDER BY s.created_at, cs.id
+    """,
+}
+# Tipos fixos para colunas que a leitura filtra (coluna toda nula não vira float)
+ARCHIVE_DTYPES = {"sales": {"channel_id": "int64", "total_amount": "float64", "channel_type": "string"}}
+# Coluna de data usada na poda (manifesto + row groups)
+DATE_COLUMN = {t: ("created_at" if t == "sales" else "sale_created_at") for t in ARCHIVE_TABLES}
+
+
+# ============================================================
+# 🔧 HELPERS
+# ============================================================
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _add_months(d: date, n: int) -> date:
+    y, m = divmod(d.year * 12 + d.month - 1 + n, 12)
+    return date(y, m + 1, 1)
+
+
+def archive_cutoff(today: Optional[date] = None, keep_months: int = ARCHIVE_KEEP_MONTHS) -> date:
+    """Primeiro dia do mês mais antigo que fica no banco (meses antes dele vão para o arquivo)."""
+    return _add_months(_month_start(today or date.today()), -keep_months)
+
+
+def _parse_bound(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"data inválida: {value!r} (use YYYY-MM-DD)")
+
+
+def _write_json_atomic(path: str, payload: Dict[str, Any]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=1, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# ============================================================
+# 📒 MANIFESTO (arquivos + min/max)
+# ============================================================
+# {"generation": n, "files": [{"part", "table", "month", "path", "rows",
+#   "min_date", "max_date", "bytes", "state": "pending" | "archived"}]}
+# "pending": arquivo escrito, DELETE no banco ainda não confirmado.
+# Leitores só enxergam "archived".
+
+def manifest_path(root: str = ARCHIVE_DIR) -> str:
+    return os.path.join(root, MANIFEST_NAME)
+
+
+def load_manifest(root: str = ARCHIVE_DIR) -> Dict[str, Any]:
+    try:
+        with open(manifest_path(root), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"generation": 0, "files": []}
+
+
+def save_manifest(manifest: Dict[str, Any], root: str = ARCHIVE_DIR) -> None:
+    os.makedirs(root, exist_ok=True)
+    manifest["generation"] = int(manifest.get("generation", 0)) + 1
+    _write_json_atomic(manifest_path(root), manifest)
+
+
+class ArchiveReader:
+    """Manifesto atual em memória; relê quando o arquivo é trocado (novo inode)."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._files: List[Dict[str, Any]] = []
+        self._generation = 0
+        self._inode: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _reload(self) -> None:
+        try:
+            inode = os.stat(manifest_path(self.root)).st_ino
+        except FileNotFoundError:
+            self._files, self._generation, self._inode = [], 0, None
+            return
+        if inode == self._inode:
+            return
+        manifest = load_manifest(self.root)
+        files = []
+        for f in manifest.get("files", []):
+            if f.get("state") != "archived":
+                continue
+            files.append({
+                **f,
+                "min_date": datetime.fromisoformat(f["min_date"]),
+                "max_date": datetime.fromisoformat(f["max_date"]),
+            })
+        self._files, self._generation, self._inode = files, manifest.get("generation", 0), inode
+
+    def snapshot(self) -> Tuple[int, List[Dict[str, Any]]]:
+        now = time.monotonic()
+        if now - self._checked_at >= STAT_CHECK_SECONDS:
+            with self._lock:
+                self._reload()
+                self._checked_at = now
+        return self._generation, self._files
+
+    def files(
+        self, table: str, lo: Optional[datetime], hi: Optional[datetime]
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """Arquivos da tabela cujo [min_date, max_date] cruza a janela."""
+        generation, files = self.snapshot()
+        return generation, [
+            f for f in files
+            if f["table"] == table
+            and (lo is None or f["max_date"] >= lo)
+            and (hi is None or f["min_date"] <= hi)
+        ]
+
+
+reader = ArchiveReader(ARCHIVE_DIR)
+_results = TTLCache(maxsize=512, ttl=3600.0)  # arquivo é imutável por geração do manifesto
+
+
+# ============================================================
+# 🔎 LEITURA (pyarrow, com poda por row group)
+# ============================================================
+
+def _row_groups(pf, column: str, lo: Optional[datetime], hi: Optional[datetime]) -> List[int]:
+    """Row groups cujo min/max de `column` cruza a janela (sem estatística → lê)."""
+    idx = pf.schema_arrow.get_field_index(column)
+    keep = []
+    for i in range(pf.metadata.num_row_groups):
+        st = pf.metadata.row_group(i).column(idx).statistics
+        if st is not None and st.has_min_max:
+            if (lo is not None and st.max < lo) or (hi is not None and st.min > hi):
+                continue
+        keep.append(i)
+    return keep
+
+
+def _window_mask(table, column: str, lo, hi, hi_inclusive: bool):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    col = table[column]
+    mask = None
+    if lo is not None:
+        mask = pc.greater_equal(col, pa.scalar(lo, type=col.type))
+    if hi is not None:
+        cmp = pc.less_equal if hi_inclusive else pc.less
+        upper = cmp(col, pa.scalar(hi, type=col.type))
+        mask = upper if mask is None else pc.and_(mask, upper)
+    return mask
+
+
+def _channel_mask(table, channel: str):
+    """Mesmo filtro do SQL: id do canal OU tipo (P/D)."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    mask = pc.equal(table["channel_type"], pa.scalar(channel))
+    if channel.isdigit():
+        mask = pc.or_(mask, pc.equal(table["channel_id"], pa.scalar(int(channel), type=table["channel_id"].type)))
+    return pc.fill_null(mask, False)
+
+
+def _scan_bounds(date_from: Optional[str], date_to: Optional[str]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Faixa de created_at a podar (arquivos / row groups) para a janela."""
+    lo, hi = _parse_bound(date_from), _parse_bound(date_to)
+    if calendar_service.day_keys(date_from, date_to) is not None:
+        # Dia local ≠ dia do relógio: poda por created_at com 1 dia de folga
+        lo = lo - timedelta(days=1) if lo is not None else None
+        hi = hi + timedelta(days=1) if hi is not None else None
+    return lo, hi
+
+
+def _sales_files(date_from: Optional[str], date_to: Optional[str]) -> Tuple[int, List[Dict[str, Any]]]:
+    """Arquivos de sales que podem ter vendas da janela (geração do manifesto, arquivos)."""
+    return reader.files("sales", *_scan_bounds(date_from, date_to))
+
+
+def touches_archive(date_from: Optional[str] = None, date_to: Optional[str] = None) -> bool:
+    """True se a janela alcança meses já movidos para o Parquet (só lê o manifesto)."""
+    return ARCHIVE_ENABLED and bool(_sales_files(date_from, date_to)[1])
+
+
+def archive_note(date_from: Optional[str] = None, date_to: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Aviso para leituras que só enxergam o banco (itens, cesta, pivô por venda,
+    lista de vendas, marcas): {"archived_until", "archive_excluded": True}
+    quando a janela alcança meses arquivados; {} caso contrário.
+    """
+    if not ARCHIVE_ENABLED:
+        return {}
+    _, files = _sales_files(date_from, date_to)
+    if not files:
+        return {}
+    return {"archived_until": max(f["max_date"] for f in files).isoformat(), "archive_excluded": True}
+
+
+def cold_totals(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    channel: Optional[str] = None,
+    end_inclusive: bool = True,
+) -> Optional[Dict[str, float]]:
+    """
+    {"revenue", "orders"} das vendas arquivadas na janela, ou None quando
+    nenhum arquivo cruza a janela (caso comum: janela recente → sem custo).
+    Semântica igual ao SQL (calendar_service.window_conds): dias inteiros →
+    date_key local em [from, to); com hora → created_at >= from AND <=/< to.
+    """
+    if not ARCHIVE_ENABLED:
+        return None
+    keys = calendar_service.day_keys(date_from, date_to)
+    lo, hi = _scan_bounds(date_from, date_to)
+    generation, files = reader.files("sales", lo, hi)
+    if not files:
+        return None
+
+    key = (generation, date_from, date_to, channel, end_inclusive)
+    cached = _results.get(key)
+    if cached is not None:
+        return cached
+
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    revenue, orders = 0.0, 0
+    columns = ["created_at", "total_amount", "channel_id", "channel_type"]
+    for f in files:
+        pf = pq.ParquetFile(os.path.join(reader.root, f["path"]))
+        groups = _row_groups(pf, "created_at", lo, hi)
+        if not groups:
+            continue
+        by_key = keys is not None and pf.schema_arrow.get_field_index("date_key") >= 0
+        table = pf.read_row_groups(groups, columns=columns + (["date_key"] if by_key else []))
+        if by_key:
+            mask = _window_mask(table, "date_key", keys["key_from"], keys["key_to"], False)
+        else:
+            # Arquivo antigo sem date_key (ou janela com hora): relógio do servidor
+            mask = _window_mask(
+                table, "created_at", _parse_bound(date_from), _parse_bound(date_to), end_inclusive
+            )
+        if channel:
+            cmask = _channel_mask(table, channel)
+            mask = cmask if mask is None else pc.and_(mask, cmask)
+        if mask is not None:
+            table = table.filter(mask)
+        revenue += float(pc.sum(table["total_amount"]).as_py() or 0.0)
+        orders += table.num_rows
+
+    result = {"revenue": revenue, "orders": float(orders)}
+    _results.set(key, result)
+    return result
+
+
+def status() -> Dict[str, Any]:
+    generation, files = reader.snapshot()
+    sales = [f for f in files if f["table"] == "sales"]
+    return {
+        "enabled": ARCHIVE_ENABLED,
+        "generation": generation,
+        "files": len(files),
+        "sales_rows": sum(f["rows"] for f in sales),
+        "archived_until": max((f["max_date"].isoformat() for f in sales), default=None),
+        "cache": _results.stats(),
+    }
+
+
+# ============================================================
+# 🏗️ JOB DE ARQUIVAMENTO
+# ============================================================
+
+def _write_part(frame, table: str, month: date, part: str, root: str) -> Dict[str, Any]:
+    """Grava um DataFrame como Parquet (tmp + os.replace) e devolve a entrada do manifesto."""
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    date_col = DATE_COLUMN[table]
+    frame[date_col] = pd.to_datetime(frame[date_col])
+    rel = os.path.join(table, f"month={month:%Y-%m}", f"part-{part}.parquet")
+    path = os.path.join(root, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp = f"{path}.tmp"
+    pq.write_table(
+        pa.Table.from_pandas(frame, preserve_index=False),
+        tmp,
+        compression=ARCHIVE_COMPRESSION,
+        row_group_size=ARCHIVE_ROW_GROUP_ROWS,
+        coerce_timestamps="us",
+        allow_truncated_timestamps=True,
+        write_statistics=True,
+    )
+    os.replace(tmp, path)
+    return {
+        "part": part,
+        "table": table,
+        "month": f"{month:%Y-%m}",
+        "path": rel,
+        "rows": int(len(frame)),
+        "min_date": frame[date_col].min().isoformat(),
+        "max_date": frame[date_col].max().isoformat(),
+        "bytes": os.path.getsize(path),
+        "state": "pending",
+    }
+
+
+def _committed_parts(conn) -> List[str]:
+    raw = conn.execute(
+        text("SELECT checkpoint FROM job_checkpoints WHERE name = :name"), {"name": CHECKPOINT_NAME}
+    ).scalar()
+    return json.loads(raw).get("parts", []) if raw else []
+
+
+def recover(root: str = ARCHIVE_DIR) -> Dict[str, int]:
+    """
+    Resolve entradas "pending" de uma execução interrompida:
+    parte confirmada no banco → "archived"; senão o arquivo é descartado
+    (as linhas continuam no banco e serão arquivadas de novo).
+    """
+    manifest = load_manifest(root)
+    pending = [f for f in manifest["files"] if f.get("state") == "pending"]
+    if not pending:
+        return {"promoted": 0, "discarded": 0}
+    with engine.connect() as conn:
+        committed = set(_committed_parts(conn))
+    promoted = discarded = 0
+    kept = []
+    for f in manifest["files"]:
+        if f.get("state") != "pending":
+            kept.append(f)
+        elif f["part"] in committed:
+            kept.append({**f, "state": "archived"})
+            promoted += 1
+        else:
+            try:
+                os.remove(os.path.join(root, f["path"]))
+            except FileNotFoundError:
+                pass
+            discarded += 1
+    manifest["files"] = kept
+    save_manifest(manifest, root)
+    return {"promoted": promoted, "discarded": discarded}
+
+
+def archive_month(month: date, root: str = ARCHIVE_DIR) -> Dict[str, int]:
+    """
+    Arquiva um mês numa única transação REPEATABLE READ: extrai todas as
+    tabelas do mesmo snapshot, grava os Parquet ("pending"), apaga as vendas
+    do mês (filhos saem em cascata) e confirma a parte em job_checkpoints.
+    Só depois do COMMIT o manifesto marca os arquivos como "archived".
+    Meses já arquivados que receberam vendas atrasadas ganham uma parte nova.
+    """
+    lo, hi = month, _add_months(month, 1)
+    part = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    entries: List[Dict[str, Any]] = []
+    counts: Dict[str, int] = {}
+
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        with conn.begin():
+            got = conn.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": ARCHIVE_LOCK_ID}).scalar()
+            if not got:
+                raise RuntimeError("outro arquivamento em andamento")
+            for table, sql in ARCHIVE_TABLES.items():
+                frame = copy_to_frame(conn, sql, {"lo": lo, "hi": hi}, dtype=ARCHIVE_DTYPES.get(table))
+                counts[table] = int(len(frame))
+                if frame.empty:
+                    continue
+                entries.append(_write_part(frame, table, month, part, root))
+            if not counts["sales"]:
+                return counts
+
+            manifest = load_manifest(root)
+            manifest["files"].extend(entries)
+            save_manifest(manifest, root)
+
+            deleted = conn.execute(
+                text("DELETE FROM sales WHERE created_at >= :lo AND created_at < :hi"), {"lo": lo, "hi": hi}
+            ).rowcount
+            if deleted != counts["sales"]:
+                raise RuntimeError(f"{month:%Y-%m}: {deleted} vendas apagadas ≠ {counts['sales']} arquivadas")
+            parts = _committed_parts(conn) + [part]
+            conn.execute(text("""
+                INSERT INTO job_checkpoints (name, checkpoint, updated_at)
+                VALUES (:name, :checkpoint, CURRENT_TIMESTAMP)
+                ON CONFLICT (name) DO UPDATE SET
+                    checkpoint = EXCLUDED.checkpoint, updated_at = EXCLUDED.updated_at
+            """), {"name": CHECKPOINT_NAME, "checkpoint": json.dumps({"parts": parts})})
+
+    manifest = load_manifest(root)
+    for f in manifest["files"]:
+        if f["part"] == part:
+            f["state"] = "archived"
+    save_manifest(manifest, root)
+    return counts
+
+
+def months_to_archive(cutoff: date) -> List[date]:
+    """Meses com vendas no banco antes do limite (inclui vendas atrasadas de meses já arquivados)."""
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT DISTINCT CAST(date_trunc('month', created_at) AS DATE)
+            FROM sales
+            WHERE created_at < :cutoff
+            ORDER BY 1
+        """), {"cutoff": cutoff}).all()
+    return [r[0] for r in rows]
+
+
+def run_archive(keep_months: int = ARCHIVE_KEEP_MONTHS, root: str = ARCHIVE_DIR, dry_run: bool = False) -> Dict[str, Any]:
+    recovered = recover(root) if not dry_run else {}
+    cutoff = archive_cutoff(keep_months=keep_months)
+    months = months_to_archive(cutoff)
+    report: Dict[str, Any] = {"cutoff": cutoff.isoformat(), "recovered": recovered, "months": {}}
+    for month in months:
+        report["months"][f"{month:%Y-%m}"] = {} if dry_run else archive_month(month, root)
+    return report
+
+
+def main():
+    from argparse import ArgumentParser
+
+    ap = ArgumentParser(description="Arquiva meses fechados de vendas em Parquet")
+    ap.add_argument("--keep-months", type=int, default=ARCHIVE_KEEP_MONTHS,
+                    help="Meses fechados que ficam no banco (além do corrente)")
+    ap.add_argument("--dir", default=ARCHIVE_DIR)
+    ap.add_argument("--dry-run", action="store_true", help="Só lista os meses que seriam arquivados")
+    ap.add_argument("--vacuum", action="store_true", help="VACUUM (ANALYZE) das tabelas ao final")
+    args = ap.parse_args()
+
+    started = time.perf_counter()
+    report = run_archive(args.keep_months, args.dir, args.dry_run)
+    print(f"🧊 limite: vendas antes de {report['cutoff']} vão para {args.dir}")
+    if report["recovered"]:
+        print(f"↩️ execução anterior: {report['recovered']}")
+    for month, counts in report["months"].items():
+        detail = ", ".join(f"{t}={n}" for t, n in counts.items() if n) or "(dry-run)"
+        print(f"✅ {month}: {detail}")
+    if args.vacuum and not args.dry_run and report["months"]:
+        with engine.connect() as conn:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            for table in ARCHIVE_TABLES:
+                conn.exec_driver_sql(f"VACUUM (ANALYZE) {table}")
+        print("🧹 VACUUM (ANALYZE) concluído")
+    print(f"⏱️ {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Rode em cron mensal (ou diário: meses sem vendas no banco são ignorados).
+#   O diretório precisa estar no MESMO disco visto pela API (leitura local).
+# - Vendas atrasadas de um mês já arquivado continuam somando (o banco é
+#   sempre consultado na janela toda) e viram uma parte nova no próximo job.
+# - Valores DECIMAL vão como float64 no Parquet (leitura vetorizada).
+# - daily_aggregates, snapshot, coortes e anomalias NÃO são apagados; mas
+#   reconstruções completas a partir de sales (--rebuild) passam a ver só o
+#   período quente.
+# - KPIs somam banco + Parquet (cold_totals) e não usam o snapshot em
+#   janelas que alcançam o arquivo. Leituras só do banco (top produtos,
+#   cesta, pivô por venda, lista de vendas, marcas) respondem com
+#   archived_until + archive_excluded=true (archive_note).
+# - Poda em 2 níveis: manifesto (min/max por arquivo) e estatísticas de
+#   row group do Parquet (arquivo ordenado por created_at → faixas estreitas).
+# - Restaurar um mês: ler os Parquet e reinserir (COPY FROM) em ordem de FK.
+# ============================================================
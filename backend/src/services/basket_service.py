@@ -0,0 +1,245 @@
+# ============================================================
+# 🧺 SERVICE DE CESTA DE PRODUTOS (COMPRADOS JUNTOS)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Análise de co-ocorrência para engenharia de cardápio:
+#            - matriz esparsa venda × produto (incidência 0/1) montada a
+#              partir de product_sales da janela
+#            - co-ocorrência = Xᵀ·X (um produto de matrizes esparsas, sem
+#              self-join em SQL)
+#            - support, confidence e lift para cada par; top pares por produto
+#            - resultado em cache por janela (TTL) + single-flight
+# ============================================================
+
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from src.database.session import read_connection
+from src.services import archive_service, calendar_service, dimension_cache
+from src.services.query_control import apply_scope
+from src.utils.pg_copy import copy_to_frame
+from src.utils.singleflight import SingleFlight, make_key
+from src.utils.ttl_cache import TTLCache
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+BASKET_CACHE_TTL_SECONDS = float(os.getenv("BASKET_CACHE_TTL_SECONDS", "900"))
+BASKET_MAX_PAIRS_PER_PRODUCT = 20   # por critério, guardado no cache; a rota corta pelo `limit`
+BASKET_SORT_KEYS = ("lift", "confidence", "support")
+
+_cache = TTLCache(maxsize=64, ttl=BASKET_CACHE_TTL_SECONDS)
+_flight = SingleFlight()
+
+# Projeção venda → produto (linhas de item); filtros opcionais por canal/loja
+LINES_SQL = """
+    SELECT ps.sale_id, ps.product_id
+    FROM product_sales ps
+    JOIN sales s ON s.id = ps.sale_id
+    WHERE {where}
+"""
+
+
+def _where(date_from: Optional[str], date_to: Optional[str], channel: Optional[str], store_id: Optional[int]):
+    # Mesma janela dos cards (dias locais em date_key, fim exclusivo), com os
+    # :nome de window_conds no placeholder do psycopg2 (copy_to_frame)
+    window, params = calendar_service.window_conds(date_from, date_to)
+    conds = ["TRUE"] + [re.sub(r":(\w+)", r"%(\1)s", c) for c in window]
+    if channel:
+        conds.append("s.channel_id = ANY(%(channel_ids)s)")
+        params["channel_ids"] = dimension_cache.channel_ids(channel)
+    if store_id is not None:
+        conds.append("s.store_id = %(store_id)s")
+        params["store_id"] = store_id
+    return " AND ".join(conds), params
+
+
+# ============================================================
+# 🧮 CÁLCULO (matrizes esparsas)
+# ============================================================
+
+def compute_pairs(sale_ids, product_ids, min_count: int = 1, top: int = BASKET_MAX_PAIRS_PER_PRODUCT) -> Dict[str, Any]:
+    """
+    Recebe os vetores (sale_id, product_id) das linhas de item e devolve:
+    {"baskets": N, "products": {product_id: {"count", "support", "pairs": {sort: [...]}}}}
+    Um top-N por critério de BASKET_SORT_KEYS (desempate por contagem): cortar
+    pelo lift e reordenar depois perderia os pares fortes nos outros critérios.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    sale_codes, _ = _factorize(sale_ids)
+    prod_codes, prod_uniques = _factorize(product_ids)
+    n_baskets = int(sale_codes.max()) + 1 if len(sale_codes) else 0
+    if not n_baskets:
+        return {"baskets": 0, "products": {}}
+
+    # Incidência 0/1 (a mesma venda com o produto em 2 linhas conta uma vez)
+    x = sparse.csr_matrix(
+        (np.ones(len(sale_codes), dtype=np.float32), (sale_codes, prod_codes)),
+        shape=(n_baskets, len(prod_uniques)),
+    )
+    x.sum_duplicates()
+    x.data[:] = 1.0
+
+    co = (x.T @ x).tocsr()                 # co[a, b] = nº de vendas com a E b
+    counts = co.diagonal().astype(np.int64)  # nº de vendas com a
+    co.setdiag(0)
+    co.eliminate_zeros()
+    if min_count > 1:
+        co.data[co.data < min_count] = 0
+        co.eliminate_zeros()
+
+    # Métricas por par (vetorizado sobre os não-zeros da matriz)
+    coo = co.tocoo()
+    pair_counts = coo.data.astype(np.int64)
+    metrics = {"support": pair_counts / n_baskets}
+    metrics["confidence"] = pair_counts / counts[coo.row]
+    metrics["lift"] = metrics["confidence"] / (counts[coo.col] / n_baskets)
+
+    # Por critério: índices ordenados por (produto, métrica desc, contagem desc)
+    bounds = np.arange(len(prod_uniques))
+    ranked = {}
+    for sort_key in BASKET_SORT_KEYS:
+        order = np.lexsort((-pair_counts, -metrics[sort_key], coo.row))
+        rows_sorted = coo.row[order]
+        ranked[sort_key] = (order, np.searchsorted(rows_sorted, bounds), np.searchsorted(rows_sorted, bounds, side="right"))
+
+    pairs: Dict[int, Dict[str, Any]] = {}  # um dict por par, compartilhado entre as listas
+
+    def pair(i: int) -> Dict[str, Any]:
+        if i not in pairs:
+            pairs[i] = {
+                "product_id": int(prod_uniques[coo.col[i]]),
+                "count": int(pair_counts[i]),
+                "support": round(float(metrics["support"][i]), 6),
+                "confidence": round(float(metrics["confidence"][i]), 4),
+                "lift": round(float(metrics["lift"][i]), 4),
+            }
+        return pairs[i]
+
+    products: Dict[int, Dict[str, Any]] = {}
+    for a in range(len(prod_uniques)):
+        products[int(prod_uniques[a])] = {
+            "count": int(counts[a]),
+            "support": round(float(counts[a] / n_baskets), 6),
+            "pairs": {
+                sort_key: [pair(int(i)) for i in order[starts[a]:min(ends[a], starts[a] + top)]]
+                for sort_key, (order, starts, ends) in ranked.items()
+            },
+        }
+    return {"baskets": n_baskets, "products": products}
+
+
+def _factorize(values):
+    import pandas as pd
+
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes, uniques
+
+
+# ============================================================
+# 🔥 ENTRADA DO SERVICE
+# ============================================================
+
+def _load_and_compute(date_from, date_to, channel, store_id, min_count) -> Dict[str, Any]:
+    started = time.perf_counter()
+    where, params = _where(date_from, date_to, channel, store_id)
+    with read_connection() as conn, apply_scope(conn):
+        frame = copy_to_frame(
+            conn, LINES_SQL.format(where=where), params,
+            dtype={"sale_id": "int64", "product_id": "int64"},
+        )
+        loaded_ms = round((time.perf_counter() - started) * 1000, 2)
+        result = compute_pairs(frame["sale_id"].to_numpy(), frame["product_id"].to_numpy(), min_count=min_count)
+
+        ids = list(result["products"])
+        names = {}
+        if ids:
+            names = {
+                r[0]: r[1]
+                for r in conn.execute(text("SELECT id, name FROM products WHERE id = ANY(:ids)"), {"ids": ids})
+            }
+    for pid, info in result["products"].items():
+        info["name"] = names.get(pid)
+        for pairs in info["pairs"].values():
+            for pair in pairs:
+                pair["name"] = names.get(pair["product_id"])
+    result["line_items"] = int(len(frame))
+    result["timing"] = {"load_ms": loaded_ms, "total_ms": round((time.perf_counter() - started) * 1000, 2)}
+    return result
+
+
+def basket_pairs(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    channel: Optional[str] = None,
+    store_id: Optional[int] = None,
+    product_id: Optional[int] = None,
+    limit: int = 5,
+    min_count: int = 5,
+    sort: str = "lift",
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """
+    Top pares "comprados juntos" por produto na janela.
+    - product_id: restringe a resposta a um produto
+    - min_count: nº mínimo de vendas com o par (corta ruído de pares raros)
+    - sort: lift | confidence | support
+    """
+    if sort not in BASKET_SORT_KEYS:
+        raise ValueError(f"sort deve ser um de {', '.join(BASKET_SORT_KEYS)}")
+
+    key = make_key("basket", (), {
+        "date_from": date_from, "date_to": date_to, "channel": channel,
+        "store_id": store_id, "min_count": min_count,
+    })
+    result = _cache.get(key)
+    cached = result is not None
+    if not cached:
+        result = _flight.do(key, lambda: _load_and_compute(date_from, date_to, channel, store_id, min_count))
+        _cache.set(key, result)
+
+    items = result["products"].items()
+    if product_id is not None:
+        items = [(pid, info) for pid, info in items if pid == product_id]
+    data = []
+    for pid, info in items:
+        pairs = info["pairs"][sort]
+        data.append({
+            "product_id": pid,
+            "name": info["name"],
+            "count": info["count"],
+            "support": info["support"],
+            "pairs": pairs[:limit],
+        })
+    data.sort(key=lambda d: d["count"], reverse=True)
+    return {
+        "baskets": result["baskets"],
+        "line_items": result["line_items"],
+        "cached": cached,
+        "timing": result["timing"],
+        "data": data,
+        **archive_service.archive_note(date_from, date_to),
+    }
+
+
+def cache_stats() -> Dict[str, int]:
+    return _cache.stats()
+
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - support(a,b) = vendas com a e b / total de vendas com itens;
+#   confidence(a→b) = vendas com a e b / vendas com a;
+#   lift = confidence(a→b) / support(b)  (>1 = comprados juntos além do acaso).
+# - Memória: a matriz guarda só as linhas de item (≈12 bytes cada); Xᵀ·X tem no
+#   máximo produtos² entradas — cardápios de centenas de itens cabem folgados.
+# - O cache é por janela/filtros e guarda um top-N por critério de ordenação;
+#   limit, sort e product_id só escolhem/cortam a lista já pronta.
+# ============================================================
@@ -0,0 +1,252 @@
+# ============================================================
+# 📦 SERVICE DE MÉTRICAS EM LOTE (POST /metrics/batch)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Executa muitas especificações {metric, filters} em uma
+#            única requisição:
+#            - specs que compartilham a mesma varredura viram UMA consulta
+#              com GROUP BY loja + agregados condicionais FILTER (WHERE ...)
+#            - grupos independentes rodam em paralelo sobre o MESMO snapshot
+#              (pg_export_snapshot / SET TRANSACTION SNAPSHOT)
+# ============================================================
+
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from src.database.session import get_read_engine
+from src.services import calendar_service, dimension_cache
+from src.services.query_control import apply_scope, raise_if_canceled
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+BATCH_METRICS = ("revenue", "orders", "avg_ticket")
+MAX_BATCH_SPECS = 500
+MAX_PARALLEL_GROUPS = 4
+
+FilterKey = Tuple[Optional[str], Optional[str], Optional[str], Optional[int]]
+
+
+# ============================================================
+# 🧩 PLANEJAMENTO (agrupa specs por varredura)
+# ============================================================
+
+def _filter_key(filters: Dict[str, Any]) -> FilterKey:
+    return (
+        filters.get("date_from") or None,
+        filters.get("date_to") or None,
+        filters.get("channel") or None,
+        filters.get("store_id"),
+    )
+
+
+def plan_batch(specs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Agrupa as specs por canal (cada canal = uma varredura de sales).
+    Dentro do grupo:
+      - janelas distintas (date_from, date_to) → colunas FILTER (WHERE ...)
+      - lojas distintas → linhas do GROUPING SETS ((store_id), ())
+    Métricas diferentes sobre os mesmos filtros reaproveitam SUM/COUNT.
+    """
+    if len(specs) > MAX_BATCH_SPECS:
+        raise ValueError(f"Máximo de {MAX_BATCH_SPECS} specs por lote")
+
+    groups: Dict[Optional[str], Dict[str, Any]] = {}
+    seen_ids = set()
+    for spec in specs:
+        spec_id = str(spec.get("id"))
+        if spec_id in seen_ids:
+            raise ValueError(f"id duplicado no lote: {spec_id}")
+        seen_ids.add(spec_id)
+        if spec.get("metric") not in BATCH_METRICS:
+            raise ValueError(f"Métrica inválida em '{spec_id}': {spec.get('metric')}")
+
+        date_from, date_to, channel, store_id = _filter_key(spec.get("filters") or {})
+        group = groups.setdefault(channel, {"channel": channel, "windows": [], "stores": set(), "specs": []})
+        window = (date_from, date_to)
+        if window not in group["windows"]:
+            group["windows"].append(window)
+        group["stores"].add(store_id)
+        group["specs"].append({
+            "id": spec_id,
+            "metric": spec["metric"],
+            "window": group["windows"].index(window),
+            "store_id": store_id,
+        })
+    return list(groups.values())
+
+
+def _compile_group(group: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Gera o SQL de um grupo: uma varredura, N janelas, lojas via GROUPING SETS."""
+    params: Dict[str, Any] = {}
+    cols = []
+    for j, (date_from, date_to) in enumerate(group["windows"]):
+        # Dias inteiros → date_key (dia local); com hora → created_at
+        conds, window_params = calendar_service.window_conds(date_from, date_to, suffix=str(j))
+        params.update(window_params)
+        cond = " AND ".join(["TRUE"] + conds)
+        cols.append(f"COALESCE(SUM(s.total_amount) FILTER (WHERE {cond}), 0) AS sum{j}")
+        cols.append(f"COUNT(*) FILTER (WHERE {cond}) AS cnt{j}")
+
+    # Restringe a varredura à união das janelas (índice em date_key ou created_at)
+    where = ["TRUE"]
+    day_windows = [calendar_service.day_keys(*w) for w in group["windows"]]
+    bounds = None  # janelas mistas (dia inteiro × com hora): sem corte pela união
+    if all(k is not None for k in day_windows):
+        bounds = ("s.date_key", "<", [k["key_from"] for k in day_windows], [k["key_to"] for k in day_windows])
+    elif all(k is None for k in day_windows):
+        bounds = ("s.created_at", "<=", [w[0] for w in group["windows"]], [w[1] for w in group["windows"]])
+    if bounds is not None:
+        column, upper, froms, tos = bounds
+        if all(froms):
+            where.append(f"{column} >= :union_from")
+            params["union_from"] = min(froms)
+        if all(tos):
+            where.append(f"{column} {upper} :union_to")
+            params["union_to"] = max(tos)
+    if group["channel"]:
+        where.append("s.channel_id = ANY(:channel_ids)")
+        params["channel_ids"] = dimension_cache.channel_ids(group["channel"])
+
+    stores = group["stores"]
+    store_ids = sorted(s for s in stores if s is not None)
+    if None in stores:
+        sets = "(s.store_id), ()" if store_ids else "()"
+    else:
+        sets = "(s.store_id)"
+        where.append("s.store_id = ANY(:store_ids)")
+        params["store_ids"] = store_ids
+
+    sql = f"""
+        SELECT GROUPING(s.store_id) AS is_total, s.store_id,
+               {", ".join(cols)}
+        FROM sales s
+        WHERE {" AND ".join(where)}
+        GROUP BY GROUPING SETS ({sets})
+    """
+    return sql, params
+
+
+def _metric_value(metric: str, total: float, count: int) -> float:
+    if metric == "revenue":
+        return round(total, 2)
+    if metric == "orders":
+        return float(count)
+    return round(total / count, 2) if count else 0.0
+
+
+# ============================================================
+# 🔥 EXECUÇÃO
+# ============================================================
+
+def _run_group(conn, group: Dict[str, Any]) -> Dict[str, Any]:
+    """Executa a consulta do grupo e resolve cada spec a partir das linhas."""
+    started = time.perf_counter()
+    sql, params = _compile_group(group)
+    try:
+        rows = conn.execute(text(sql), params).mappings().all()
+    except DBAPIError as e:
+        raise_if_canceled(e)
+        raise
+
+    by_store = {None if r["is_total"] else r["store_id"]: r for r in rows}
+    results = {}
+    for spec in group["specs"]:
+        row = by_store.get(spec["store_id"])
+        j = spec["window"]
+        total = float(row[f"sum{j}"] or 0) if row else 0.0
+        count = int(row[f"cnt{j}"] or 0) if row else 0
+        results[spec["id"]] = {
+            "metric": spec["metric"],
+            "value": _metric_value(spec["metric"], total, count),
+        }
+    timing = {
+        "channel": group["channel"],
+        "specs": len(group["specs"]),
+        "windows": len(group["windows"]),
+        "ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    return {"results": results, "timing": timing}
+
+
+def _begin_snapshot(conn, snapshot_id: Optional[str] = None) -> None:
+    """Transação REPEATABLE READ somente leitura, opcionalmente importando um snapshot."""
+    conn.exec_driver_sql("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    if snapshot_id:
+        conn.exec_driver_sql(f"SET TRANSACTION SNAPSHOT '{snapshot_id}'")
+
+
+def run_batch(specs: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+    """
+    Executa o lote e retorna {"results": {id: {...}}, "timing": {...}}.
+    - Todos os grupos enxergam o mesmo snapshot (números consistentes entre si).
+    - Se o snapshot não puder ser exportado (ex.: réplica em recovery), os
+      grupos rodam em sequência na mesma transação REPEATABLE READ.
+    """
+    started = time.perf_counter()
+    groups = plan_batch(specs)
+    if not groups:
+        return {"results": {}, "timing": {"total_ms": 0.0, "groups": []}}
+
+    eng = get_read_engine()  # mesma engine para todas as conexões do lote
+    outputs: List[Dict[str, Any]] = []
+    with eng.connect() as lead:
+        _begin_snapshot(lead)
+        snapshot_id = None
+        if len(groups) > 1:
+            try:
+                snapshot_id = lead.exec_driver_sql("SELECT pg_export_snapshot()").scalar()
+            except DBAPIError:
+                # Transação abortada: recomeça e segue sem paralelismo
+                lead.rollback()
+                _begin_snapshot(lead)
+        setup_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        with apply_scope(lead):
+            if snapshot_id is None:
+                outputs = [_run_group(lead, g) for g in groups]
+            else:
+                def worker(group):
+                    with eng.connect() as conn:
+                        _begin_snapshot(conn, snapshot_id)
+                        with apply_scope(conn):
+                            return _run_group(conn, group)
+
+                # Primeiro grupo na conexão líder (mantém o snapshot vivo); demais em paralelo
+                with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_GROUPS, len(groups) - 1)) as pool:
+                    futures = [
+                        pool.submit(contextvars.copy_context().run, worker, g)
+                        for g in groups[1:]
+                    ]
+                    outputs = [_run_group(lead, groups[0])]
+                    outputs += [f.result() for f in futures]
+
+    results: Dict[str, Any] = {}
+    for out in outputs:
+        results.update(out["results"])
+    return {
+        "results": results,
+        "timing": {
+            "total_ms": round((time.perf_counter() - started) * 1000, 2),
+            "snapshot_setup_ms": setup_ms,
+            "shared_snapshot": snapshot_id is not None,
+            "groups": [out["timing"] for out in outputs],
+        },
+    }
+
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Métricas suportadas: revenue, orders, avg_ticket (janelas em dias inteiros
+#   pelo dia local date_key, com hora por sales.created_at — igual aos KPIs).
+# - Filtros: date_from, date_to (mesma semântica dos GET), channel (id, P ou D)
+#   e store_id. 20 lojas × 3 janelas × 3 métricas = 1 consulta, não 180.
+# - A conexão líder só fecha depois que todos os grupos terminam: o snapshot
+#   exportado deixa de ser importável quando a transação que o exportou acaba.
+# ============================================================
@@ -0,0 +1,340 @@
+# ============================================================
+# 📅 SERVICE DE CALENDÁRIO (dim_date / dim_hour / date_key)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Chaves de tempo no horário LOCAL das lojas:
+#            - sales.date_key (AAAAMMDD) e sales.hour_key (0–23) gravados
+#              na escrita (ingestão, gerador, trigger para o ERP, backfill) —
+#              agrupar por dia, dia da semana, hora ou feriado vira
+#              GROUP BY/JOIN de inteiros
+#            - janelas da API em dias inteiros filtram por date_key (dia de
+#              negócio local, índice idx_sales_date_key) — day_keys/window_conds
+#            - dim_date gerada em Python (feriados nacionais, inclusive os
+#              móveis da Páscoa); dim_hour é estática (schema_analytics.sql)
+# ============================================================
+
+import os
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from src.database.session import engine
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+# Fuso das lojas (dia/hora "de negócio")
+SALES_TIMEZONE = os.getenv("SALES_TIMEZONE", "America/Sao_Paulo")
+# Fuso em que sales.created_at (TIMESTAMP sem fuso) é gravado — relógio do servidor
+SALES_CLOCK_TIMEZONE = os.getenv("SALES_CLOCK_TIMEZONE", "UTC")
+DIM_DATE_FIRST_YEAR = int(os.getenv("DIM_DATE_FIRST_YEAR", "2015"))
+DIM_DATE_YEARS_AHEAD = 2
+BACKFILL_BATCH = 50_000
+
+# Parâmetros que acompanham as expressões de local_keys_sql()
+TZ_PARAMS = {"clock_tz": SALES_CLOCK_TIMEZONE, "local_tz": SALES_TIMEZONE}
+
+DAY_NAMES = ("domingo", "segunda", "terça", "quarta", "quinta", "sexta", "sábado")
+MONTH_NAMES = (
+    "janeiro", "fevereiro", "março", "abril", "maio", "junho",
+    "julho", "agosto", "setembro", "outubro", "novembro", "dezembro",
+)
+
+FIXED_HOLIDAYS = {
+    (1, 1): "Confraternização Universal",
+    (4, 21): "Tiradentes",
+    (5, 1): "Dia do Trabalho",
+    (9, 7): "Independência do Brasil",
+    (10, 12): "Nossa Senhora Aparecida",
+    (11, 2): "Finados",
+    (11, 15): "Proclamação da República",
+    (12, 25): "Natal",
+}
+# Deslocamento (dias) a partir do domingo de Páscoa
+EASTER_HOLIDAYS = ((-48, "Carnaval"), (-47, "Carnaval"), (-2, "Sexta-feira Santa"), (60, "Corpus Christi"))
+
+
+# ============================================================
+# 🔑 CHAVES
+# ============================================================
+
+def date_key(d: date) -> int:
+    return d.year * 10000 + d.month * 100 + d.day
+
+
+def key_to_date(key: int) -> date:
+    return date(key // 10000, key // 100 % 100, key % 100)
+
+
+def _local_keys(column: str, clock_tz: str, local_tz: str) -> Tuple[str, str]:
+    local = f"(({column} AT TIME ZONE {clock_tz}) AT TIME ZONE {local_tz})"
+    return (
+        f"CAST(TO_CHAR({local}, 'YYYYMMDD') AS INTEGER)",
+        f"CAST(EXTRACT(HOUR FROM {local}) AS SMALLINT)",
+    )
+
+
+def local_keys_sql(column: str) -> Tuple[str, str]:
+    """
+    Expressões SQL (date_key, hour_key) do horário local para um TIMESTAMP
+    gravado em SALES_CLOCK_TIMEZONE. Exigem os parâmetros de TZ_PARAMS.
+    """
+    return _local_keys(column, ":clock_tz", ":local_tz")
+
+
+# Dia/hora locais de uma venda: as colunas gravadas (ingestão, gerador,
+# trigger e backfill garantem o preenchimento — ver ensure_sales_keys_trigger)
+DATE_KEY_SQL = "s.date_key"
+HOUR_KEY_SQL = "s.hour_key"
+
+
+def stored_keys_sql(alias: str = "s") -> Tuple[str, str]:
+    """
+    (date_key, hour_key) para jobs que GRAVAM as chaves em tabelas derivadas
+    (NOT NULL): a coluna de sales, calculada só se a venda ainda não teve
+    backfill. Exigem TZ_PARAMS.
+    """
+    date_expr, hour_expr = local_keys_sql(f"{alias}.created_at")
+    return f"COALESCE({alias}.date_key, {date_expr})", f"COALESCE({alias}.hour_key, {hour_expr})"
+
+
+# ============================================================
+# 🗓️ JANELAS EM DIAS LOCAIS
+# ============================================================
+
+def day_keys(date_from: Optional[str], date_to: Optional[str]) -> Optional[Dict[str, Optional[int]]]:
+    """
+    Janela da API em dias de negócio quando nenhuma ponta tem hora:
+    {"key_from", "key_to"} com key_to EXCLUSIVO — a mesma semântica de
+    created_at >= 'AAAA-MM-DD' AND created_at <= 'AAAA-MM-DD' (que termina à
+    meia-noite), agora no fuso das lojas. None → alguma ponta tem hora.
+    """
+    keys: Dict[str, Optional[int]] = {}
+    for name, value in (("key_from", date_from), ("key_to", date_to)):
+        if not value:
+            keys[name] = None
+            continue
+        if len(value) != 10:
+            return None
+        try:
+            keys[name] = date_key(date.fromisoformat(value))
+        except ValueError:
+            return None
+    return keys
+
+
+def window_conds(
+    date_from: Optional[str],
+    date_to: Optional[str],
+    alias: str = "s",
+    suffix: str = "",
+    end_inclusive: bool = True,
+) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Condições (parâmetros :nome) da janela sobre sales: date_key para dias
+    inteiros, created_at (relógio do servidor) quando as datas têm hora.
+    `suffix` distingue os parâmetros de várias janelas na mesma consulta.
+    """
+    conds: List[str] = []
+    params: Dict[str, Any] = {}
+    keys = day_keys(date_from, date_to)
+    if keys is not None:
+        if keys["key_from"] is not None:
+            conds.append(f"{alias}.date_key >= :key_from{suffix}")
+            params[f"key_from{suffix}"] = keys["key_from"]
+        if keys["key_to"] is not None:
+            conds.append(f"{alias}.date_key < :key_to{suffix}")
+            params[f"key_to{suffix}"] = keys["key_to"]
+        return conds, params
+    if date_from:
+        conds.append(f"{alias}.created_at >= :date_from{suffix}")
+        params[f"date_from{suffix}"] = date_from
+    if date_to:
+        conds.append(f"{alias}.created_at {'<=' if end_inclusive else '<'} :date_to{suffix}")
+        params[f"date_to{suffix}"] = date_to
+    return conds, params
+
+
+# ============================================================
+# 🎉 FERIADOS NACIONAIS
+# ============================================================
+
+def easter(year: int) -> date:
+    """Domingo de Páscoa (algoritmo de Meeus/Jones/Butcher, calendário gregoriano)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return date(year, month, day)
+
+
+def holidays(year: int) -> Dict[date, str]:
+    out = {date(year, m, d): name for (m, d), name in FIXED_HOLIDAYS.items()}
+    if year >= 2024:  # feriado nacional a partir da Lei 14.759/2023
+        out[date(year, 11, 20)] = "Consciência Negra"
+    base = easter(year)
+    for offset, name in EASTER_HOLIDAYS:
+        out[base + timedelta(days=offset)] = name
+    return out
+
+
+# ============================================================
+# 🏗️ dim_date
+# ============================================================
+
+def dim_date_rows(first: date, last: date) -> List[Dict[str, Any]]:
+    """Uma linha por dia em [first, last] (inclusive)."""
+    by_year: Dict[int, Dict[date, str]] = {}
+    rows = []
+    d = first
+    while d <= last:
+        hol = by_year.setdefault(d.year, holidays(d.year)).get(d)
+        dow = (d.weekday() + 1) % 7  # 0 = domingo (igual a EXTRACT(DOW))
+        rows.append({
+            "date_key": date_key(d),
+            "full_date": d,
+            "year": d.year,
+            "quarter": (d.month - 1) // 3 + 1,
+            "month": d.month,
+            "day": d.day,
+            "dow": dow,
+            "iso_week": d.isocalendar()[1],
+            "day_name": DAY_NAMES[dow],
+            "month_name": MONTH_NAMES[d.month - 1],
+            "is_weekend": dow in (0, 6),
+            "is_holiday": hol is not None,
+            "holiday_name": hol,
+        })
+        d += timedelta(days=1)
+    return rows
+
+
+def ensure_dim_date(first: Optional[date] = None, last: Optional[date] = None) -> int:
+    """Upsert de dim_date (padrão: DIM_DATE_FIRST_YEAR até o fim de daqui a 2 anos)."""
+    first = first or date(DIM_DATE_FIRST_YEAR, 1, 1)
+    last = last or date(date.today().year + DIM_DATE_YEARS_AHEAD, 12, 31)
+    rows = dim_date_rows(first, last)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO dim_date (
+                date_key, full_date, year, quarter, month, day, dow, iso_week,
+                day_name, month_name, is_weekend, is_holiday, holiday_name
+            )
+            VALUES (
+                :date_key, :full_date, :year, :quarter, :month, :day, :dow, :iso_week,
+                :day_name, :month_name, :is_weekend, :is_holiday, :holiday_name
+            )
+            ON CONFLICT (date_key) DO UPDATE SET
+                is_holiday = EXCLUDED.is_holiday,
+                holiday_name = EXCLUDED.holiday_name
+        """), rows)
+    return len(rows)
+
+
+# ============================================================
+# 🔄 TRIGGER + BACKFILL DE sales.date_key / hour_key
+# ============================================================
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def ensure_sales_keys_trigger() -> None:
+    """
+    Trigger BEFORE INSERT/UPDATE OF created_at em sales: vendas gravadas direto
+    pelo ERP já nascem com date_key/hour_key (a ingestão e o gerador calculam
+    antes; a trigger só preenche o que veio NULL). Os fusos entram como
+    literais — rode de novo se SALES_TIMEZONE/SALES_CLOCK_TIMEZONE mudarem.
+    """
+    date_expr, hour_expr = _local_keys(
+        "NEW.created_at", _literal(SALES_CLOCK_TIMEZONE), _literal(SALES_TIMEZONE)
+    )
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"""
+            CREATE OR REPLACE FUNCTION sales_local_keys() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'UPDATE' OR NEW.date_key IS NULL OR NEW.hour_key IS NULL THEN
+                    NEW.date_key := {date_expr};
+                    NEW.hour_key := {hour_expr};
+                END IF;
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        conn.exec_driver_sql("DROP TRIGGER IF EXISTS trg_sales_local_keys ON sales")
+        conn.exec_driver_sql("""
+            CREATE TRIGGER trg_sales_local_keys
+            BEFORE INSERT OR UPDATE OF created_at ON sales
+            FOR EACH ROW EXECUTE FUNCTION sales_local_keys()
+        """)
+
+
+def backfill_sales_keys(batch: int = BACKFILL_BATCH) -> int:
+    """
+    Preenche date_key/hour_key das vendas que ainda não têm (histórico e
+    vendas gravadas direto pelo ERP). Faixas de id, uma transação por faixa.
+    """
+    date_expr, hour_expr = local_keys_sql("created_at")
+    with engine.connect() as conn:
+        lo, hi = conn.execute(text("SELECT MIN(id), MAX(id) FROM sales WHERE date_key IS NULL")).one()
+    if lo is None:
+        return 0
+
+    total = 0
+    for start in range(lo, hi + 1, batch):
+        with engine.begin() as conn:
+            total += conn.execute(text(f"""
+                UPDATE sales
+                SET date_key = {date_expr}, hour_key = {hour_expr}
+                WHERE id >= :lo AND id < :hi AND date_key IS NULL
+            """), {"lo": start, "hi": start + batch, **TZ_PARAMS}).rowcount
+    return total
+
+
+# ============================================================
+# 🚀 CLI (após aplicar schema_analytics.sql / cron diário)
+# ============================================================
+
+def main():
+    from argparse import ArgumentParser
+
+    ap = ArgumentParser(description="Gera dim_date, instala a trigger e preenche sales.date_key/hour_key")
+    ap.add_argument("--skip-backfill", action="store_true", help="Só (re)gera dim_date e a trigger")
+    args = ap.parse_args()
+
+    started = time.perf_counter()
+    n = ensure_dim_date()
+    print(f"✅ dim_date: {n} dias")
+    ensure_sales_keys_trigger()
+    print("✅ trigger trg_sales_local_keys instalada")
+    if not args.skip_backfill:
+        print(f"✅ sales.date_key: {backfill_sales_keys()} vendas preenchidas")
+    print(f"⏱️ {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - created_at continua no relógio do servidor (SALES_CLOCK_TIMEZONE); só as
+#   chaves são locais. Uma venda às 23h de São Paulo cai no dia local certo
+#   mesmo gravada como 02h UTC do dia seguinte.
+# - Feriados estaduais/municipais não entram (dependem da loja).
+# - Vendas gravadas direto pelo ERP ganham date_key/hour_key pela trigger;
+#   o backfill cobre o histórico anterior a ela (o índice parcial
+#   idx_sales_date_key_pending mantém a busca barata). As leituras usam só a
+#   coluna gravada: rode este módulo uma vez após aplicar o schema.
+# - KPIs, snapshot, daily_aggregates, pivô, lote e marcas filtram janelas de
+#   dias inteiros por date_key (dia local, fim exclusivo); datas com hora
+#   continuam comparando created_at no relógio do servidor.
+# ============================================================
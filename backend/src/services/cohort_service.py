@@ -0,0 +1,330 @@
+# ============================================================
+# 👥 SERVICE DE COORTES DE CLIENTES (RETENÇÃO / RECEITA)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Cada cliente entra na coorte do mês da sua primeira compra
+#            (no segmento: geral, loja ou canal); a matriz mostra, para
+#            cada coorte, clientes ativos / pedidos / receita nos meses
+#            seguintes.
+#            - projeção compacta cliente × mês (COPY → pandas) e operações
+#              de grupo ordenadas, sem laço por cliente
+#            - meses FECHADOS ficam gravados em cohort_monthly pelo job
+#              (CLI/cron); a consulta só lê essa tabela e recalcula o mês
+#              corrente, nunca a história inteira
+# ============================================================
+
+import os
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from src.database.session import engine, read_connection
+from src.services.query_control import apply_scope
+from src.utils.pg_copy import copy_to_frame
+from src.utils.singleflight import SingleFlight
+from src.utils.ttl_cache import TTLCache
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+COHORT_CURRENT_TTL_SECONDS = float(os.getenv("COHORT_CURRENT_TTL_SECONDS", "120"))
+CHECKPOINT_NAME = "cohorts"
+SEGMENTS: List[Tuple[str, Optional[str]]] = [("all", None), ("store", "store_id"), ("channel", "channel_id")]
+
+_current_cache = TTLCache(maxsize=4, ttl=COHORT_CURRENT_TTL_SECONDS)
+_flight = SingleFlight()
+
+# Projeção cliente × loja × canal × mês (já agregada no banco).
+# month = ano*12 + mês-1 (inteiro: ordena e subtrai sem datas)
+PROJECTION_SQL = """
+    SELECT s.customer_id, s.store_id, s.channel_id,
+           CAST(EXTRACT(YEAR FROM s.created_at) * 12 + EXTRACT(MONTH FROM s.created_at) - 1 AS INTEGER) AS month,
+           COUNT(*) AS orders,
+           COALESCE(SUM(s.total_amount), 0) AS revenue
+    FROM sales s
+    WHERE s.customer_id IS NOT NULL AND {where}
+    GROUP BY 1, 2, 3, 4
+"""
+PROJECTION_DTYPE = {
+    "customer_id": "int64", "store_id": "int32", "channel_id": "int32",
+    "month": "int32", "orders": "int64", "revenue": "float64",
+}
+
+
+def _month_index(d: date) -> int:
+    return d.year * 12 + d.month - 1
+
+
+def _month_date(idx: int) -> date:
+    return date(idx // 12, idx % 12 + 1, 1)
+
+
+# ============================================================
+# 🧮 CÁLCULO VETORIZADO
+# ============================================================
+
+def compute_cohorts(frame) -> "Any":
+    """
+    Recebe a projeção (customer_id, store_id, channel_id, month, orders, revenue)
+    e devolve um DataFrame com uma linha por
+    (segment_type, segment_id, cohort, month): customers, orders, revenue.
+    """
+    import pandas as pd
+
+    parts = []
+    for seg_type, col in SEGMENTS:
+        keys = ["customer_id"] if col is None else [col, "customer_id"]
+        # Uma linha por cliente × mês dentro do segmento (soma lojas/canais)
+        per_month = (
+            frame.groupby(keys + ["month"], sort=True)[["orders", "revenue"]]
+            .sum()
+            .reset_index()
+        )
+        # Ordenado por cliente e mês: o primeiro mês do grupo é a coorte
+        per_month["cohort"] = per_month.groupby(keys, sort=False)["month"].transform("first")
+        seg_keys = ([] if col is None else [col]) + ["cohort", "month"]
+        agg = (
+            per_month.groupby(seg_keys, sort=True)
+            .agg(customers=("customer_id", "size"), orders=("orders", "sum"), revenue=("revenue", "sum"))
+            .reset_index()
+        )
+        agg["segment_type"] = seg_type
+        agg["segment_id"] = 0 if col is None else agg[col]
+        parts.append(agg[["segment_type", "segment_id", "cohort", "month", "customers", "orders", "revenue"]])
+
+    return pd.concat(parts, ignore_index=True)
+
+
+# ============================================================
+# 💾 MESES FECHADOS (persistidos)
+# ============================================================
+
+def _checkpoint(conn) -> Optional[int]:
+    value = conn.execute(
+        text("SELECT checkpoint FROM job_checkpoints WHERE name = :name"), {"name": CHECKPOINT_NAME}
+    ).scalar()
+    return int(value) if value is not None else None
+
+
+def refresh_closed_months(today: Optional[date] = None) -> int:
+    """
+    Grava em cohort_monthly os meses fechados ainda não persistidos
+    (tudo antes do mês corrente). Retorna o nº de linhas gravadas.
+    Atribuir a coorte exige o histórico do cliente, então a projeção lê tudo
+    até o fim do último mês fechado — mas isso só acontece uma vez por mês.
+    """
+    today = today or date.today()
+    last_closed = _month_index(today) - 1
+
+    with engine.connect() as conn:
+        done = _checkpoint(conn)
+    if done is not None and done >= last_closed:
+        return 0
+
+    with engine.connect() as conn, apply_scope(conn):
+        frame = copy_to_frame(
+            conn,
+            PROJECTION_SQL.format(where="s.created_at < %(until)s"),
+            {"until": _month_date(last_closed + 1)},
+            dtype=PROJECTION_DTYPE,
+        )
+    cohorts = compute_cohorts(frame)
+    if done is not None:
+        cohorts = cohorts[cohorts["month"] > done]
+
+    rows = [
+        {
+            "segment_type": r.segment_type,
+            "segment_id": int(r.segment_id),
+            "cohort_month": _month_date(int(r.cohort)),
+            "activity_month": _month_date(int(r.month)),
+            "customers": int(r.customers),
+            "orders": int(r.orders),
+            "revenue": round(float(r.revenue), 2),
+        }
+        for r in cohorts.itertuples(index=False)
+    ]
+    with engine.begin() as conn:
+        if rows:
+            conn.execute(text("""
+                INSERT INTO cohort_monthly
+                    (segment_type, segment_id, cohort_month, activity_month, customers, orders, revenue)
+                VALUES (:segment_type, :segment_id, :cohort_month, :activity_month, :customers, :orders, :revenue)
+                ON CONFLICT (segment_type, segment_id, cohort_month, activity_month) DO UPDATE SET
+                    customers = EXCLUDED.customers,
+                    orders = EXCLUDED.orders,
+                    revenue = EXCLUDED.revenue,
+                    computed_at = NOW()
+            """), rows)
+        conn.execute(text("""
+            INSERT INTO job_checkpoints (name, checkpoint, updated_at)
+            VALUES (:name, :checkpoint, NOW())
+            ON CONFLICT (name) DO UPDATE SET checkpoint = EXCLUDED.checkpoint, updated_at = NOW()
+        """), {"name": CHECKPOINT_NAME, "checkpoint": str(last_closed)})
+    return len(rows)
+
+
+def _load_closed(segment_type: str, segment_id: int, first_cohort: int) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Células gravadas do segmento + último mês fechado já persistido (checkpoint)."""
+    with read_connection() as conn, apply_scope(conn):
+        done = _checkpoint(conn)
+        rows = conn.execute(text("""
+            SELECT cohort_month, activity_month, customers, orders, revenue
+            FROM cohort_monthly
+            WHERE segment_type = :segment_type AND segment_id = :segment_id
+              AND cohort_month >= :first_cohort
+        """), {
+            "segment_type": segment_type,
+            "segment_id": segment_id,
+            "first_cohort": _month_date(first_cohort),
+        }).all()
+    cells = [
+        {
+            "cohort": _month_index(r[0]),
+            "month": _month_index(r[1]),
+            "customers": int(r[2]),
+            "orders": int(r[3]),
+            "revenue": float(r[4]),
+        }
+        for r in rows
+    ]
+    return cells, done
+
+
+# ============================================================
+# 🔄 MÊS CORRENTE (recalculado, cache curto)
+# ============================================================
+
+def _compute_current(current: int):
+    """Coortes de quem comprou no mês corrente (histórico só desses clientes)."""
+    with read_connection() as conn, apply_scope(conn):
+        frame = copy_to_frame(
+            conn,
+            PROJECTION_SQL.format(where="""s.customer_id IN (
+                SELECT DISTINCT customer_id FROM sales
+                WHERE customer_id IS NOT NULL AND created_at >= %(month_start)s
+            )"""),
+            {"month_start": _month_date(current)},
+            dtype=PROJECTION_DTYPE,
+        )
+    cohorts = compute_cohorts(frame)
+    return cohorts[cohorts["month"] == current]
+
+
+def _current_rows(segment_type: str, segment_id: int, current: int) -> List[Dict[str, Any]]:
+    frame = _current_cache.get(current)
+    if frame is None:
+        frame = _flight.do(("cohorts-current", current), lambda: _compute_current(current))
+        _current_cache.set(current, frame)
+    sel = frame[(frame["segment_type"] == segment_type) & (frame["segment_id"] == segment_id)]
+    return [
+        {
+            "cohort": int(r.cohort),
+            "month": int(r.month),
+            "customers": int(r.customers),
+            "orders": int(r.orders),
+            "revenue": float(r.revenue),
+        }
+        for r in sel.itertuples(index=False)
+    ]
+
+
+# ============================================================
+# 🔥 ENTRADA DO SERVICE
+# ============================================================
+
+def cohort_matrix(
+    months: int = 12,
+    store_id: Optional[int] = None,
+    channel_id: Optional[int] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """
+    Matriz de coortes dos últimos `months` meses (o corrente incluso).
+    Cada coorte traz, por mês desde a entrada (offset 0, 1, 2...):
+    clientes ativos, retenção (ativos / tamanho da coorte), pedidos e receita.
+    Meses fechados ainda não gravados pelo job saem zerados, com stale=True
+    e materialized_until indicando até onde cohort_monthly está em dia.
+    """
+    if store_id is not None and channel_id is not None:
+        raise ValueError("Use store_id OU channel_id, não os dois")
+    segment_type, segment_id = "all", 0
+    if store_id is not None:
+        segment_type, segment_id = "store", store_id
+    elif channel_id is not None:
+        segment_type, segment_id = "channel", channel_id
+
+    started = time.perf_counter()
+    current = _month_index(date.today())
+    first_cohort = current - months + 1
+
+    cells, done = _load_closed(segment_type, segment_id, first_cohort)
+    cells += [c for c in _current_rows(segment_type, segment_id, current) if c["cohort"] >= first_cohort]
+
+    by_cohort: Dict[int, Dict[int, Dict[str, Any]]] = {}
+    for c in cells:
+        by_cohort.setdefault(c["cohort"], {})[c["month"] - c["cohort"]] = c
+
+    data = []
+    for cohort in sorted(by_cohort):
+        offsets = by_cohort[cohort]
+        size = offsets.get(0, {}).get("customers", 0)
+        span = current - cohort + 1
+        row = {"cohort": _month_date(cohort).strftime("%Y-%m"), "size": size,
+               "customers": [], "retention": [], "orders": [], "revenue": []}
+        for k in range(span):
+            cell = offsets.get(k)
+            active = cell["customers"] if cell else 0
+            row["customers"].append(active)
+            row["retention"].append(round(active / size, 4) if size else 0.0)
+            row["orders"].append(cell["orders"] if cell else 0)
+            row["revenue"].append(round(cell["revenue"], 2) if cell else 0.0)
+        data.append(row)
+
+    return {
+        "segment": {"type": segment_type, "id": segment_id if segment_type != "all" else None},
+        "months": months,
+        "materialized_until": _month_date(done).strftime("%Y-%m") if done is not None else None,
+        "stale": done is None or done < current - 1,
+        "data": data,
+        "ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+# ============================================================
+# 🚀 CLI (cron mensal / reconstrução)
+# ============================================================
+
+def main():
+    from argparse import ArgumentParser
+
+    ap = ArgumentParser(description="Persiste coortes dos meses fechados")
+    ap.add_argument("--rebuild", action="store_true", help="Apaga e recalcula todos os meses fechados")
+    args = ap.parse_args()
+
+    if args.rebuild:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM cohort_monthly"))
+            conn.execute(text("DELETE FROM job_checkpoints WHERE name = :name"), {"name": CHECKPOINT_NAME})
+    started = time.perf_counter()
+    n = refresh_closed_months()
+    print(f"✅ Coortes: {n} linhas gravadas em {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Só vendas com customer_id entram (vendas anônimas não formam coorte).
+# - Coorte por segmento: em "store"/"channel", a entrada é a primeira compra
+#   NAQUELA loja/canal.
+# - Vendas retroativas em meses já fechados (ex.: ingestão atrasada) só
+#   aparecem após python -m src.services.cohort_service --rebuild.
+# - Cron: python -m src.services.cohort_service no dia 1 de cada mês (lê a
+#   história toda uma vez). Até ele rodar, /metrics/cohorts responde com
+#   stale=true e o mês recém-fechado zerado — o endpoint nunca grava.
+# ============================================================
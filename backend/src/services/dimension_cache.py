@@ -0,0 +1,204 @@
+# ============================================================
+# 🏷️ CACHE DE DIMENSÕES EM MEMÓRIA (lojas, canais, produtos...)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Nomes e atributos das tabelas de dimensão carregados uma vez
+#            por worker e reaproveitados por todos os endpoints:
+#            - consultas de fatos agrupam só por ids inteiros; nomes entram
+#              depois, no Python (enrich), sem JOIN a cada chamada
+#            - canal 'P'/'D' vira lista de ids (channel_ids) sem subconsulta
+#            - detecção de mudança por assinatura (COUNT + md5 das colunas
+#              em cache) a cada DIM_CHECK_SECONDS; só as tabelas alteradas
+#              são recarregadas e a versão sobe
+# ============================================================
+
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import text
+from src.database.session import read_connection
+from src.services.query_control import apply_scope
+from src.utils.singleflight import SingleFlight
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+DIM_CHECK_SECONDS = float(os.getenv("DIM_CHECK_SECONDS", "30"))
+
+# Tabela → colunas em cache (a primeira é sempre a chave "id")
+DIMENSIONS: Dict[str, tuple] = {
+    "stores": ("id", "name", "brand_id", "sub_brand_id", "city", "state", "is_active"),
+    "sub_brands": ("id", "brand_id", "name"),
+    "channels": ("id", "brand_id", "name", "type"),
+    "products": ("id", "name", "brand_id", "sub_brand_id", "category_id"),
+    "items": ("id", "name", "brand_id", "sub_brand_id", "category_id"),
+    "payment_types": ("id", "brand_id", "description"),
+}
+# Coluna usada como rótulo (padrão: name)
+LABEL_COLUMNS = {"payment_types": "description"}
+
+_flight = SingleFlight()
+_lock = threading.Lock()
+# view: {"version", "tables": {tabela: {id: linha}}, "channels_by_type": {"P": [...], "D": [...]}}
+# trocada por inteiro a cada recarga → leitores nunca veem meia atualização
+_state: Dict[str, Any] = {"view": None, "signatures": {}, "checked_at": 0.0, "loaded_at": None}
+
+
+# ============================================================
+# 🔄 CARGA E DETECÇÃO DE MUDANÇA
+# ============================================================
+
+def _signatures(conn) -> Dict[str, str]:
+    """Assinatura por tabela numa única ida ao banco (tabelas de dimensão são pequenas)."""
+    parts = [
+        f"SELECT '{table}' AS tbl, COUNT(*) AS n, "
+        f"md5(COALESCE(string_agg(CAST(ROW({', '.join(cols)}) AS TEXT), ',' ORDER BY id), '')) AS sig "
+        f"FROM {table}"
+        for table, cols in DIMENSIONS.items()
+    ]
+    rows = conn.execute(text(" UNION ALL ".join(parts))).all()
+    return {r[0]: f"{r[1]}:{r[2]}" for r in rows}
+
+
+def _load_table(conn, table: str) -> Dict[int, Dict[str, Any]]:
+    rows = conn.execute(text(f"SELECT {', '.join(DIMENSIONS[table])} FROM {table}")).mappings().all()
+    return {int(r["id"]): dict(r) for r in rows}
+
+
+def _channels_by_type(channels: Dict[int, Dict[str, Any]]) -> Dict[str, List[int]]:
+    by_type: Dict[str, List[int]] = {}
+    for cid in sorted(channels):
+        ctype = (channels[cid].get("type") or "").strip()
+        if ctype:
+            by_type.setdefault(ctype, []).append(cid)
+    return by_type
+
+
+def refresh(force: bool = False) -> Dict[str, Any]:
+    """
+    Compara as assinaturas e recarrega só as tabelas que mudaram
+    (todas no primeiro uso ou com force=True).
+    """
+    with read_connection() as conn, apply_scope(conn):
+        signatures = _signatures(conn)
+        old = _state["signatures"]
+        changed = [t for t in DIMENSIONS if force or _state["view"] is None or signatures.get(t) != old.get(t)]
+        loaded = {t: _load_table(conn, t) for t in changed}
+
+    with _lock:
+        view = _state["view"]
+        if changed:
+            tables = dict(view["tables"]) if view else {}
+            tables.update(loaded)
+            _state["view"] = {
+                "version": (view["version"] if view else 0) + 1,
+                "tables": tables,
+                "channels_by_type": _channels_by_type(tables["channels"]),
+            }
+            _state["signatures"] = signatures
+            _state["loaded_at"] = time.time()
+        _state["checked_at"] = time.monotonic()
+        return {"version": _state["view"]["version"], "changed": changed}
+
+
+def current() -> Dict[str, Any]:
+    """
+    Versão em memória, checando mudanças a cada DIM_CHECK_SECONDS.
+    Se a checagem falhar, segue com a versão anterior; sem nenhuma carga, propaga o erro.
+    """
+    view = _state["view"]
+    if view is not None and time.monotonic() - _state["checked_at"] < DIM_CHECK_SECONDS:
+        return view
+    try:
+        _flight.do("dimensions", refresh)
+    except Exception:
+        if view is None:
+            raise
+        _state["checked_at"] = time.monotonic()  # nova tentativa só no próximo intervalo
+    return _state["view"]
+
+
+# ============================================================
+# 🔎 CONSULTA / ENRIQUECIMENTO
+# ============================================================
+
+def lookup(table: str, key: Optional[int]) -> Optional[Dict[str, Any]]:
+    """Linha da dimensão (colunas de DIMENSIONS) ou None."""
+    if key is None:
+        return None
+    return current()["tables"][table].get(int(key))
+
+
+def label(table: str, key: Optional[int], default: Optional[str] = None) -> Optional[str]:
+    row = lookup(table, key)
+    if row is None:
+        return default
+    return row.get(LABEL_COLUMNS.get(table, "name")) or default
+
+
+def enrich(
+    rows: Iterable[Dict[str, Any]],
+    table: str,
+    id_field: str,
+    label_field: str,
+    default: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Preenche row[label_field] a partir de row[id_field] (in-place; devolve a lista).
+    default aceita {id} (ex.: "Item {id}") para ids sem linha na dimensão.
+    """
+    rows = list(rows)
+    dim = current()["tables"][table]
+    col = LABEL_COLUMNS.get(table, "name")
+    for row in rows:
+        key = row.get(id_field)
+        found = dim.get(int(key)) if key is not None else None
+        value = found.get(col) if found else None
+        if value is None and default is not None and key is not None:
+            value = default.format(id=key)
+        row[label_field] = value
+    return rows
+
+
+def channel_ids(channel: Optional[str]) -> Optional[List[int]]:
+    """
+    Filtro de canal da API (id, 'P' ou 'D') → ids de channels.
+    None sem filtro; lista vazia se nada casar (mesma semântica do antigo
+    IN (SELECT id FROM channels WHERE CAST(id AS TEXT) = :channel OR type = :channel)).
+    """
+    if not channel:
+        return None
+    view = current()
+    ids = list(view["channels_by_type"].get(channel, []))
+    if channel.isdigit() and int(channel) in view["tables"]["channels"] and int(channel) not in ids:
+        ids.append(int(channel))
+    return sorted(ids)
+
+
+def status() -> Dict[str, Any]:
+    view = _state["view"]
+    if view is None:
+        return {"loaded": False}
+    return {
+        "loaded": True,
+        "version": view["version"],
+        "rows": {t: len(rows) for t, rows in view["tables"].items()},
+        "checked_seconds_ago": round(time.monotonic() - _state["checked_at"], 1),
+    }
+
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Cache por worker; cada worker carrega na primeira chamada que precisar
+#   e depois só paga a checagem de assinatura (uma consulta) por intervalo.
+# - A assinatura lê as colunas em cache de todas as tabelas: barato para
+#   dimensões (centenas/milhares de linhas); não use para tabelas de fatos.
+# - Caches de resultado guardam ids; o nome é aplicado na saída, então um
+#   renomeio de loja/canal aparece sem invalidar esses caches.
+# - prepared_queries mantém o filtro de canal por subconsulta: o plano
+#   preparado não depende da lista de ids do momento.
+# ============================================================
@@ -0,0 +1,300 @@
+# ============================================================
+# 🔮 SERVICE DE PREVISÃO (RECEITA / PEDIDOS — PRÓXIMOS DIAS)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Previsão por loja × canal para escala de equipe:
+#            - modelo diário: nível + tendência linear + efeito do dia da
+#              semana, ajustado por mínimos quadrados sobre daily_aggregates
+#            - TODAS as séries em um único np.linalg.lstsq (mesma matriz de
+#              desenho; cada coluna de Y é uma série × métrica)
+#            - perfil horário (dia da semana × hora) vem das médias EWMA de
+#              anomaly_stats — a previsão do dia é distribuída pelas horas
+#            - parâmetros em memória; quando a marca d'água avança, a
+#              requisição usa o ajuste atual e dispara o reajuste em background
+# ============================================================
+
+import os
+import threading
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from src.database.session import read_connection
+from src.services.query_control import apply_scope
+from src.utils.singleflight import SingleFlight
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+FORECAST_HISTORY_DAYS = int(os.getenv("FORECAST_HISTORY_DAYS", "56"))    # 8 semanas de ajuste
+FORECAST_MAX_HORIZON_DAYS = 14
+FORECAST_CHECK_SECONDS = float(os.getenv("FORECAST_CHECK_SECONDS", "30"))  # intervalo entre checagens da marca d'água
+METRICS = ("revenue", "orders")
+
+_flight = SingleFlight()
+_state_lock = threading.Lock()
+# model: último ajuste; checked_at: última checagem de versão; refitting: reajuste em andamento
+_state: Dict[str, Any] = {"model": None, "checked_at": 0.0, "refitting": False, "last_error": None}
+
+
+# ============================================================
+# 🧮 AJUSTE (vetorizado)
+# ============================================================
+
+def design_matrix(days, origin: date):
+    """
+    Colunas: [1, t, dom, seg, ter, qua, qui, sex] (sábado é a referência).
+    t em semanas desde `origin` (escala próxima das dummies → lstsq estável).
+    """
+    import numpy as np
+
+    ordinals = np.array([d.toordinal() for d in days], dtype=np.float64)
+    t = (ordinals - origin.toordinal()) / 7.0
+    dow = (np.array([d.weekday() for d in days]) + 1) % 7  # 0 = domingo
+    x = np.zeros((len(days), 8))
+    x[:, 0] = 1.0
+    x[:, 1] = t
+    for k in range(6):
+        x[:, 2 + k] = dow == k
+    return x
+
+
+def fit_series(frame, last_day: date, history_days: int = FORECAST_HISTORY_DAYS) -> Dict[str, Any]:
+    """
+    frame: DataFrame (day, store_id, channel_id, revenue, orders).
+    Devolve {"series": [(store_id, channel_id)], "coef": array (8, 2·séries),
+             "origin", "last_day", "rmse": array (2·séries)}.
+    """
+    import numpy as np
+    import pandas as pd
+
+    first_day = last_day - timedelta(days=history_days - 1)
+    days = [first_day + timedelta(days=i) for i in range(history_days)]
+    if frame.empty:
+        return {"series": [], "coef": np.zeros((8, 0)), "origin": first_day,
+                "last_day": last_day, "rmse": np.zeros(0)}
+    # Dias sem linha em daily_aggregates = zero vendas (loja fechada / canal parado)
+    wide = (
+        frame.pivot_table(index="day", columns=["store_id", "channel_id"],
+                          values=list(METRICS), aggfunc="sum", fill_value=0)
+        .reindex(pd.Index(days, name="day"), fill_value=0)
+    )
+    series = sorted({(int(s), int(c)) for _, s, c in wide.columns})
+    cols = [(m, s, c) for s, c in series for m in METRICS]  # revenue, orders por série
+    y = wide.reindex(columns=pd.MultiIndex.from_tuples(cols), fill_value=0).to_numpy(dtype=np.float64)
+
+    x = design_matrix(days, first_day)
+    coef, *_ = np.linalg.lstsq(x, y, rcond=None)
+    rmse = np.sqrt(np.mean((y - x @ coef) ** 2, axis=0))
+    return {"series": series, "coef": coef, "origin": first_day, "last_day": last_day, "rmse": rmse}
+
+
+def predict(model: Dict[str, Any], horizon: int):
+    """Previsão diária (horizon × 2·séries), truncada em zero."""
+    import numpy as np
+
+    days = [model["last_day"] + timedelta(days=i) for i in range(1, horizon + 1)]
+    return days, np.clip(design_matrix(days, model["origin"]) @ model["coef"], 0.0, None)
+
+
+# ============================================================
+# 💾 CARGA / VERSÃO / CACHE
+# ============================================================
+
+def _data_version() -> str:
+    """Versão dos insumos: ingestão + última escrita em daily_aggregates + dia corrente."""
+    with read_connection() as conn:
+        rollup = conn.execute(text("SELECT MAX(updated_at) FROM daily_aggregates")).scalar()
+        try:
+            ingested = conn.execute(text("SELECT version FROM data_watermark WHERE name = 'sales'")).scalar()
+        except ProgrammingError:
+            ingested = None
+    return f"{ingested}:{rollup}:{date.today().isoformat()}"
+
+
+def _hour_profile(conn) -> Dict[Tuple[int, int], Any]:
+    """(store_id, channel_id) → matriz 7 × 24 com a fração de cada hora no dia (receita e pedidos)."""
+    import numpy as np
+
+    try:
+        rows = conn.execute(text("""
+            SELECT store_id, channel_id, hour_of_week, revenue_mean, orders_mean
+            FROM anomaly_stats
+        """)).all()
+    except ProgrammingError:
+        return {}
+    raw: Dict[Tuple[int, int], Any] = {}
+    for store_id, channel_id, how, rev, orders in rows:
+        grid = raw.setdefault((store_id, channel_id), np.zeros((2, 7, 24)))
+        grid[0, how // 24, how % 24] = max(rev, 0.0)
+        grid[1, how // 24, how % 24] = max(orders, 0.0)
+    profiles = {}
+    for key, grid in raw.items():
+        totals = grid.sum(axis=2, keepdims=True)
+        profiles[key] = np.divide(grid, totals, out=np.zeros_like(grid), where=totals > 0)
+    return profiles
+
+
+def fit_model() -> Dict[str, Any]:
+    """Lê o histórico recente de daily_aggregates e ajusta todas as séries."""
+    import pandas as pd
+
+    started = time.perf_counter()
+    version = _data_version()
+    last_day = date.today() - timedelta(days=1)  # o dia corrente ainda está incompleto
+    first_day = last_day - timedelta(days=FORECAST_HISTORY_DAYS - 1)
+    with read_connection() as conn, apply_scope(conn):
+        rows = conn.execute(text("""
+            SELECT day, store_id, channel_id, orders, revenue
+            FROM daily_aggregates
+            WHERE day BETWEEN :first_day AND :last_day
+        """), {"first_day": first_day, "last_day": last_day}).all()
+        profiles = _hour_profile(conn)
+    frame = pd.DataFrame(
+        [(r[0], r[1], r[2], float(r[4]), float(r[3])) for r in rows],
+        columns=["day", "store_id", "channel_id", "revenue", "orders"],
+    )
+    model = fit_series(frame, last_day)
+    model.update(
+        version=version,
+        profiles=profiles,
+        fitted_at=time.time(),
+        fit_ms=round((time.perf_counter() - started) * 1000, 2),
+    )
+    return model
+
+
+def _refit_in_background() -> None:
+    def run():
+        try:
+            model = _flight.do("forecast-fit", fit_model)
+            with _state_lock:
+                _state["model"], _state["last_error"] = model, None
+        except Exception as e:
+            _state["last_error"] = str(e)[:300]
+        finally:
+            _state["refitting"] = False
+
+    threading.Thread(target=run, name="forecast-refit", daemon=True).start()
+
+
+def current_model() -> Tuple[Dict[str, Any], bool]:
+    """
+    Modelo para responder agora (e se ele está desatualizado).
+    Sem modelo → ajusta na hora; com modelo → no máximo uma checagem de
+    versão por FORECAST_CHECK_SECONDS e, se mudou, reajuste em background.
+    """
+    model = _state["model"]
+    if model is None:
+        model = _flight.do("forecast-fit", fit_model)
+        with _state_lock:
+            _state["model"], _state["checked_at"] = model, time.monotonic()
+        return model, False
+
+    stale = False
+    if time.monotonic() - _state["checked_at"] >= FORECAST_CHECK_SECONDS:
+        _state["checked_at"] = time.monotonic()
+        stale = _data_version() != model["version"]
+    with _state_lock:
+        start = stale and not _state["refitting"]
+        if start:
+            _state["refitting"] = True
+    if start:
+        _refit_in_background()
+    return model, stale or _state["refitting"]
+
+
+# ============================================================
+# 🔥 ENTRADA DO SERVICE
+# ============================================================
+
+def forecast(
+    days: int = 7,
+    store_id: Optional[int] = None,
+    channel_id: Optional[int] = None,
+    hourly: bool = False,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """
+    Previsão de receita e pedidos para os próximos `days` dias.
+    Sem filtros, soma todas as séries (o modelo é linear: a soma das
+    previsões é a previsão da soma). hourly=True distribui cada dia pelas
+    horas segundo o perfil dia da semana × hora da série.
+    """
+    import numpy as np
+
+    if not 1 <= days <= FORECAST_MAX_HORIZON_DAYS:
+        raise ValueError(f"days deve estar entre 1 e {FORECAST_MAX_HORIZON_DAYS}")
+
+    model, stale = current_model()
+    picked = [
+        i for i, (s, c) in enumerate(model["series"])
+        if (store_id is None or s == store_id) and (channel_id is None or c == channel_id)
+    ]
+    future, pred = predict(model, days)
+    n_metrics = len(METRICS)
+
+    data = []
+    for d_idx, day in enumerate(future):
+        dow = (day.weekday() + 1) % 7
+        row: Dict[str, Any] = {"day": day.isoformat()}
+        for m_idx, metric in enumerate(METRICS):
+            cols = [i * n_metrics + m_idx for i in picked]
+            row[metric] = round(float(pred[d_idx, cols].sum()), 2)
+        if hourly:
+            hours = np.zeros((n_metrics, 24))
+            for i in picked:
+                profile = model["profiles"].get(model["series"][i])
+                if profile is None:
+                    continue
+                for m_idx in range(n_metrics):
+                    hours[m_idx] += pred[d_idx, i * n_metrics + m_idx] * profile[m_idx, dow]
+            row["hours"] = [
+                {"hour": h, **{metric: round(float(hours[m_idx, h]), 2) for m_idx, metric in enumerate(METRICS)}}
+                for h in range(24)
+            ]
+        data.append(row)
+
+    rmse = model["rmse"]
+    return {
+        "days": days,
+        "series": len(picked),
+        "data": data,
+        "model": {
+            "history_days": FORECAST_HISTORY_DAYS,
+            "last_day": model["last_day"].isoformat(),
+            "rmse": {
+                metric: round(float(np.sqrt(sum(rmse[i * n_metrics + m] ** 2 for i in picked))), 2)
+                for m, metric in enumerate(METRICS)
+            },
+            "fit_ms": model["fit_ms"],
+            "stale": stale,
+        },
+    }
+
+
+def status() -> Dict[str, Any]:
+    model = _state["model"]
+    return {
+        "fitted": model is not None,
+        "series": len(model["series"]) if model else 0,
+        "version": model["version"] if model else None,
+        "refitting": _state["refitting"],
+        "last_error": _state["last_error"],
+    }
+
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Ajuste em ~8 semanas: 8 parâmetros por série e métrica; um lstsq resolve
+#   milhares de séries de uma vez (Y com uma coluna por série × métrica).
+# - daily_aggregates precisa estar em dia (sketch_service/ingestão); dias sem
+#   linha contam como zero.
+# - Perfil horário depende de anomaly_stats; sem ele, hourly traz zeros.
+# - rmse (no ajuste) dá a ordem de grandeza do erro diário; o combinado de
+#   várias séries assume erros independentes.
+# ============================================================
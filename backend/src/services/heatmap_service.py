@@ -0,0 +1,283 @@
+# ============================================================
+# 🗺️ SERVICE DE MAPA DE CALOR DAS ENTREGAS
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Pedidos, receita e tempo médio de entrega por célula de
+#            grade (lat/lon) a partir de delivery_addresses.
+#            - grade fixa em graus, uma por nível de zoom (GRID_ZOOMS)
+#            - delivery_grid_daily: uma linha por zoom × dia local × célula
+#              × loja, somada incrementalmente (endereços com id acima do
+#              checkpoint) — o mapa de um mês é uma leitura por faixa da PK,
+#              sem varrer endereços
+#            - a grade é somada só pelo CLI (cron); o endpoint apenas lê
+#              e informa o atraso (stale)
+# ============================================================
+
+import json
+import math
+import os
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from src.database.session import engine, read_connection
+from src.services.calendar_service import SALES_TIMEZONE, TZ_PARAMS, date_key, stored_keys_sql
+from src.services.query_control import apply_scope
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+# zoom → lado da célula em graus (~ no equador: 0.5° ≈ 55 km … 0.005° ≈ 550 m)
+GRID_ZOOMS: Dict[int, float] = {0: 0.5, 1: 0.1, 2: 0.02, 3: 0.005}
+HEATMAP_DEFAULT_DAYS = 30
+HEATMAP_MAX_DAYS = 366
+HEATMAP_MAX_CELLS = int(os.getenv("HEATMAP_MAX_CELLS", "5000"))
+CHECKPOINT_NAME = "delivery_heatmap"
+LOCK_KEY = 40_004  # pg_advisory_xact_lock: um worker por vez soma os endereços novos
+
+
+# ============================================================
+# 🔧 GRADE
+# ============================================================
+
+def cell_of(lat: float, lon: float, zoom: int) -> Tuple[int, int]:
+    """(cell_x, cell_y) da coordenada no zoom (mesma conta do SQL: FLOOR(coord / lado))."""
+    size = GRID_ZOOMS[zoom]
+    return math.floor(lon / size), math.floor(lat / size)
+
+
+def cell_bounds(cell_x: int, cell_y: int, zoom: int) -> Dict[str, float]:
+    size = GRID_ZOOMS[zoom]
+    return {
+        "min_lat": round(cell_y * size, 6), "min_lon": round(cell_x * size, 6),
+        "max_lat": round((cell_y + 1) * size, 6), "max_lon": round((cell_x + 1) * size, 6),
+    }
+
+
+def parse_bbox(bbox: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    """'min_lat,min_lon,max_lat,max_lon' → tupla (ValueError se inválida)."""
+    if not bbox:
+        return None
+    try:
+        min_lat, min_lon, max_lat, max_lon = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise ValueError("bbox deve ser min_lat,min_lon,max_lat,max_lon")
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= max_lon <= 180):
+        raise ValueError("bbox fora dos limites de latitude/longitude")
+    return min_lat, min_lon, max_lat, max_lon
+
+
+# ============================================================
+# 💾 CHECKPOINT
+# ============================================================
+
+def _load_checkpoint(conn) -> int:
+    raw = conn.execute(
+        text("SELECT checkpoint FROM job_checkpoints WHERE name = :name"), {"name": CHECKPOINT_NAME}
+    ).scalar()
+    return int(json.loads(raw).get("last_address_id") or 0) if raw else 0
+
+
+def _save_checkpoint(conn, last_address_id: int) -> None:
+    conn.execute(text("""
+        INSERT INTO job_checkpoints (name, checkpoint, updated_at)
+        VALUES (:name, :checkpoint, NOW())
+        ON CONFLICT (name) DO UPDATE SET checkpoint = EXCLUDED.checkpoint, updated_at = NOW()
+    """), {"name": CHECKPOINT_NAME, "checkpoint": json.dumps({"last_address_id": last_address_id})})
+
+
+# ============================================================
+# 🔄 ATUALIZAÇÃO INCREMENTAL
+# ============================================================
+# O cursor é delivery_addresses.id (o endereço pode chegar do ERP depois da
+# venda). Só o 1º endereço VÁLIDO de cada venda conta (venda com 2
+# endereços não vira 2 pedidos). Coordenadas nulas/fora do globo são
+# ignoradas — e não tiram a vez do endereço válido seguinte.
+
+def _valid_coords(alias: str) -> str:
+    return (
+        f"{alias}.latitude BETWEEN -90 AND 90 AND {alias}.longitude BETWEEN -180 AND 180"
+        f" AND NOT ({alias}.latitude = 0 AND {alias}.longitude = 0)"
+    )
+
+
+def _zoom_values() -> str:
+    return ", ".join(f"({z}, CAST({size!r} AS DOUBLE PRECISION))" for z, size in GRID_ZOOMS.items())
+
+
+ABSORB_SQL = f"""
+    INSERT INTO delivery_grid_daily
+        (zoom, date_key, cell_x, cell_y, store_id, orders, revenue, delivery_seconds_sum, delivery_samples)
+    SELECT z.zoom,
+           {stored_keys_sql("s")[0]},
+           CAST(FLOOR(da.longitude / z.size) AS INTEGER),
+           CAST(FLOOR(da.latitude / z.size) AS INTEGER),
+           s.store_id,
+           COUNT(*),
+           COALESCE(SUM(s.total_amount), 0),
+           COALESCE(SUM(s.delivery_seconds), 0),
+           COUNT(s.delivery_seconds)
+    FROM delivery_addresses da
+    JOIN sales s ON s.id = da.sale_id
+    CROSS JOIN (VALUES {_zoom_values()}) AS z(zoom, size)
+    WHERE da.id > :last_id AND da.id <= :max_id
+      AND {_valid_coords("da")}
+      AND NOT EXISTS (
+          SELECT 1 FROM delivery_addresses d2
+          WHERE d2.sale_id = da.sale_id AND d2.id < da.id
+            AND {_valid_coords("d2")}
+      )
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT (zoom, date_key, cell_x, cell_y, store_id) DO UPDATE SET
+        orders = delivery_grid_daily.orders + EXCLUDED.orders,
+        revenue = delivery_grid_daily.revenue + EXCLUDED.revenue,
+        delivery_seconds_sum = delivery_grid_daily.delivery_seconds_sum + EXCLUDED.delivery_seconds_sum,
+        delivery_samples = delivery_grid_daily.delivery_samples + EXCLUDED.delivery_samples
+"""
+
+
+def refresh_grid() -> Dict[str, Any]:
+    """
+    Soma os endereços novos às células. Uma transação; se outro worker
+    estiver atualizando, retorna {"skipped": True}.
+    """
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": LOCK_KEY}).scalar():
+            return {"skipped": True}
+        last_id = _load_checkpoint(conn)
+        max_id = int(conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM delivery_addresses")).scalar())
+        cells = 0
+        if max_id > last_id:
+            cells = conn.execute(text(ABSORB_SQL), {"last_id": last_id, "max_id": max_id, **TZ_PARAMS}).rowcount
+            _save_checkpoint(conn, max_id)
+    return {
+        "skipped": False,
+        "new_addresses": max(max_id - last_id, 0),
+        "cells_touched": cells,
+        "ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+# ============================================================
+# 🔥 ENTRADA DO SERVICE
+# ============================================================
+
+def delivery_heatmap(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    zoom: int = 2,
+    store_id: Optional[int] = None,
+    bbox: Optional[str] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """
+    Células do zoom com pedidos, receita e tempo médio de entrega na janela
+    [date_from, date_to] (dias locais, inclusive; padrão: últimos 30 dias).
+    bbox recorta a área visível do mapa.
+    Só leitura: pending_addresses conta os endereços que o job ainda não
+    somou (stale=True quando há algum).
+    """
+    if zoom not in GRID_ZOOMS:
+        raise ValueError(f"zoom deve ser um de {', '.join(str(z) for z in GRID_ZOOMS)}")
+    try:
+        last_day = date.fromisoformat(date_to[:10]) if date_to else date.today()
+        first_day = date.fromisoformat(date_from[:10]) if date_from else last_day - timedelta(days=HEATMAP_DEFAULT_DAYS - 1)
+    except ValueError:
+        raise ValueError("date_from/date_to devem estar em YYYY-MM-DD")
+    if first_day > last_day:
+        raise ValueError("date_from posterior a date_to")
+    if (last_day - first_day).days >= HEATMAP_MAX_DAYS:
+        raise ValueError(f"janela máxima de {HEATMAP_MAX_DAYS} dias")
+    box = parse_bbox(bbox)
+
+    conds = ["zoom = :zoom", "date_key BETWEEN :k_from AND :k_to"]
+    params: Dict[str, Any] = {
+        "zoom": zoom, "k_from": date_key(first_day), "k_to": date_key(last_day), "limit": HEATMAP_MAX_CELLS,
+    }
+    if store_id is not None:
+        conds.append("store_id = :store_id")
+        params["store_id"] = store_id
+    if box is not None:
+        x0, y0 = cell_of(box[0], box[1], zoom)
+        x1, y1 = cell_of(box[2], box[3], zoom)
+        conds.append("cell_x BETWEEN :x0 AND :x1 AND cell_y BETWEEN :y0 AND :y1")
+        params.update(x0=x0, x1=x1, y0=y0, y1=y1)
+
+    with read_connection() as conn, apply_scope(conn):
+        last_id = _load_checkpoint(conn)
+        max_id = int(conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM delivery_addresses")).scalar())
+        rows = conn.execute(text(f"""
+            SELECT cell_x, cell_y,
+                   SUM(orders) AS orders,
+                   SUM(revenue) AS revenue,
+                   SUM(delivery_seconds_sum) AS delivery_seconds_sum,
+                   SUM(delivery_samples) AS delivery_samples
+            FROM delivery_grid_daily
+            WHERE {" AND ".join(conds)}
+            GROUP BY cell_x, cell_y
+            ORDER BY orders DESC
+            LIMIT :limit
+        """), params).all()
+
+    size = GRID_ZOOMS[zoom]
+    cells: List[Dict[str, Any]] = []
+    for x, y, orders, revenue, secs, samples in rows:
+        cells.append({
+            "cell": f"{zoom}/{x}/{y}",
+            "lat": round((y + 0.5) * size, 6),
+            "lon": round((x + 0.5) * size, 6),
+            "bounds": cell_bounds(x, y, zoom),
+            "orders": int(orders),
+            "revenue": round(float(revenue), 2),
+            "avg_delivery_seconds": round(float(secs) / samples, 1) if samples else None,
+        })
+    return {
+        "date_from": first_day.isoformat(),
+        "date_to": last_day.isoformat(),
+        "timezone": SALES_TIMEZONE,
+        "zoom": zoom,
+        "cell_degrees": size,
+        "truncated": len(cells) == HEATMAP_MAX_CELLS,
+        "pending_addresses": max(max_id - last_id, 0),
+        "stale": max_id > last_id,
+        "data": cells,
+    }
+
+
+# ============================================================
+# 🚀 CLI (cron / reconstrução)
+# ============================================================
+
+def main():
+    from argparse import ArgumentParser
+
+    ap = ArgumentParser(description="Atualiza a grade do mapa de calor de entregas")
+    ap.add_argument("--rebuild", action="store_true", help="Apaga a grade e reprocessa todos os endereços")
+    args = ap.parse_args()
+
+    if args.rebuild:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM delivery_grid_daily"))
+            conn.execute(text("DELETE FROM job_checkpoints WHERE name = :name"), {"name": CHECKPOINT_NAME})
+    print(f"✅ Mapa de calor: {refresh_grid()}")
+
+
+if __name__ == "__main__":
+    main()
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Grade em graus (não geohash): a célula de uma coordenada é FLOOR(coord /
+#   lado), igual em SQL e Python, e o bbox vira faixa de cell_x/cell_y.
+#   Longe do equador a célula fica mais estreita no eixo leste-oeste.
+# - Mudar GRID_ZOOMS exige --rebuild.
+# - GET /metrics/delivery-heatmap nunca grava: rode este módulo no cron (ex.:
+#   a cada 5 min); a primeira execução (ou --rebuild) soma todos os endereços.
+# - Endereço corrigido depois (UPDATE de lat/lon) não move a venda de célula;
+#   use --rebuild. Vendas arquivadas (archive_service) continuam na grade.
+# - avg_delivery_seconds considera só vendas com delivery_seconds preenchido.
+# ============================================================
@@ -0,0 +1,488 @@
+# ============================================================
+# 📥 SERVICE DE INGESTÃO DE VENDAS (POST /ingest/sales)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Recebe lotes NDJSON (uma venda por linha, com product_sales
+#            e payments aninhados) vindos de PDVs e marketplaces:
+#            - valida linha a linha (linhas inválidas são rejeitadas, o
+#              restante do lote segue)
+#            - COPY para tabelas de staging UNLOGGED (sem WAL)
+#            - merge set-based: dedupe por (store_id, cod_sale1), INSERT das
+#              vendas novas + filhos, UPDATE das já existentes que mudaram
+#            - avança a marca d'água (data_watermark) na MESMA transação
+#            - grava só no banco principal: vendas de marcas movidas para um
+#              shard (BRAND_SHARDS) são recusadas, linha a linha
+# ============================================================
+
+import io
+import json
+import math
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from src.database.session import engine, shard_map
+from src.services.calendar_service import (
+    SALES_CLOCK_TIMEZONE,
+    TZ_PARAMS,
+    key_to_date,
+    local_keys_sql,
+)
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+INGEST_MAX_LINES = int(os.getenv("INGEST_MAX_LINES", "50000"))
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(64 * 1024 * 1024)))
+MAX_REPORTED_ERRORS = 100
+
+WATERMARK_NAME = "sales"
+
+
+class IngestError(ValueError):
+    """Lote recusado por inteiro (formato) → 400."""
+
+
+class IngestTooLarge(IngestError):
+    """Lote acima dos limites de tamanho (bytes / vendas) → 413."""
+
+
+# Colunas aceitas no payload: (nome, conversor, obrigatória); int = VARCHAR(n)
+SALE_FIELDS: List[Tuple[str, Any, bool]] = [
+    ("store_id", int, True),
+    ("sub_brand_id", int, False),
+    ("customer_id", int, False),
+    ("channel_id", int, True),
+    ("cod_sale1", 100, True),
+    ("cod_sale2", 100, False),
+    ("created_at", "timestamp", True),
+    ("customer_name", 100, False),
+    ("sale_status_desc", 100, True),
+    ("total_amount_items", float, True),
+    ("total_discount", float, False),
+    ("total_increase", float, False),
+    ("delivery_fee", float, False),
+    ("service_tax_fee", float, False),
+    ("total_amount", float, True),
+    ("value_paid", float, False),
+    ("production_seconds", int, False),
+    ("delivery_seconds", int, False),
+    ("people_quantity", int, False),
+    ("discount_reason", 300, False),
+    ("increase_reason", 300, False),
+    ("origin", 100, False),
+]
+PRODUCT_FIELDS: List[Tuple[str, Any, bool]] = [
+    ("product_id", int, True),
+    ("quantity", float, True),
+    ("base_price", float, True),
+    ("total_price", float, True),
+    ("observations", 300, False),
+]
+PAYMENT_FIELDS: List[Tuple[str, Any, bool]] = [
+    ("payment_type_id", int, False),
+    ("value", float, True),
+    ("is_online", bool, False),
+    ("description", 100, False),
+    ("currency", 10, False),
+]
+
+SALE_COLS = [f[0] for f in SALE_FIELDS]
+PRODUCT_COLS = [f[0] for f in PRODUCT_FIELDS]
+PAYMENT_COLS = [f[0] for f in PAYMENT_FIELDS]
+
+# DEFAULTs do schema do ERP (NULL vindo da staging não pode sobrescrevê-los)
+COLUMN_DEFAULTS = {
+    "total_discount": "0", "total_increase": "0", "delivery_fee": "0",
+    "service_tax_fee": "0", "value_paid": "0", "origin": "'POS'",
+    "is_online": "false", "currency": "'BRL'",
+}
+
+
+def _col_expr(column: str, alias: str = "") -> str:
+    col = f"{alias}{column}"
+    return f"COALESCE({col}, {COLUMN_DEFAULTS[column]})" if column in COLUMN_DEFAULTS else col
+
+
+def _select_cols(columns: List[str], alias: str = "") -> str:
+    return ", ".join(_col_expr(c, alias) for c in columns)
+
+
+# Campos que um reenvio pode alterar em uma venda já existente
+UPDATABLE_COLS = [
+    "sale_status_desc", "total_amount_items", "total_discount", "total_increase",
+    "delivery_fee", "service_tax_fee", "total_amount", "value_paid",
+    "production_seconds", "delivery_seconds",
+]
+
+# ============================================================
+# 🧹 PARSE + VALIDAÇÃO (direto para o formato texto do COPY)
+# ============================================================
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+# Conversores validam E já devolvem o texto no formato do COPY (uma passada só)
+def _integer(value: Any) -> str:
+    return str(int(value))
+
+
+def _number(value: Any) -> str:
+    number = float(value)
+    if not math.isfinite(number):  # NaN/Infinity passam no json.loads, mas não cabem em DECIMAL
+        raise ValueError("número não finito")
+    return repr(number)
+
+
+def _timestamp(value: Any) -> str:
+    dt = datetime.fromisoformat(str(value))
+    if dt.tzinfo is not None:
+        from zoneinfo import ZoneInfo
+        dt = dt.astimezone(ZoneInfo(SALES_CLOCK_TIMEZONE)).replace(tzinfo=None)
+    return dt.isoformat(" ")
+
+
+def _boolean(value: Any) -> str:
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return "t" if str(value).lower() in ("1", "true", "t", "yes") else "f"
+
+
+def _varchar(limit: int):
+    """VARCHAR(n): texto maior é rejeitado, não truncado (truncar mudaria a chave)."""
+    def convert(value: Any) -> str:
+        value = str(value)
+        if len(value) > limit:
+            raise ValueError(f"texto maior que {limit} caracteres")
+        return value.translate(_COPY_ESCAPES)
+    return convert
+
+
+def _converters(fields: List[Tuple[str, Any, bool]]) -> List[Tuple[str, Any, bool]]:
+    """Resolve o conversor de cada campo uma única vez (laço quente do parse)."""
+    simple = {int: _integer, float: _number, bool: _boolean, "timestamp": _timestamp}
+    return [
+        (name, _varchar(kind) if type(kind) is int else simple[kind], required)
+        for name, kind, required in fields
+    ]
+
+
+def _parse_fields(obj: Dict[str, Any], fields: List[Tuple[str, Any, bool]], where: str) -> str:
+    """Valida um objeto e devolve a linha COPY (colunas separadas por TAB)."""
+    values = []
+    append = values.append
+    get = obj.get
+    for name, conv, required in fields:
+        raw = get(name)
+        if raw is None or raw == "":
+            if required:
+                raise ValueError(f"{where}: campo obrigatório ausente '{name}'")
+            append("\\N")
+            continue
+        try:
+            append(conv(raw))
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"{where}: valor inválido em '{name}'") from None
+    return "\t".join(values)
+
+
+_SALE_CONV = _converters(SALE_FIELDS)
+_PRODUCT_CONV = _converters(PRODUCT_FIELDS)
+_PAYMENT_CONV = _converters(PAYMENT_FIELDS)
+
+
+def parse_ndjson(payload: bytes, batch_id: str) -> Dict[str, Any]:
+    """
+    Converte o corpo NDJSON em buffers prontos para COPY.
+    Cada venda recebe um `seq` (posição no lote) que liga os filhos à venda.
+    """
+    if len(payload) > INGEST_MAX_BYTES:
+        raise IngestTooLarge(f"Lote maior que {INGEST_MAX_BYTES} bytes")
+
+    sale_fields, product_fields, payment_fields = _SALE_CONV, _PRODUCT_CONV, _PAYMENT_CONV
+    sales, products, payments = io.StringIO(), io.StringIO(), io.StringIO()
+    errors: List[Dict[str, Any]] = []
+    lines: List[int] = []  # seq → nº da linha (para reportar rejeições do banco)
+    accepted = rejected = 0
+
+    for line_no, line in enumerate(payload.splitlines(), start=1):
+        if not line.strip():
+            continue
+        if accepted + rejected >= INGEST_MAX_LINES:
+            raise IngestTooLarge(f"Máximo de {INGEST_MAX_LINES} vendas por lote")
+        try:
+            obj = json.loads(line)
+            if not isinstance(obj, dict):
+                raise ValueError("linha não é um objeto JSON")
+            sale = _parse_fields(obj, sale_fields, "sale")
+            items = [
+                _parse_fields(p, product_fields, f"product_sales[{i}]")
+                for i, p in enumerate(obj.get("product_sales") or [])
+            ]
+            pays = [
+                _parse_fields(p, payment_fields, f"payments[{i}]")
+                for i, p in enumerate(obj.get("payments") or [])
+            ]
+        except (ValueError, TypeError, AttributeError) as e:
+            rejected += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"line": line_no, "error": str(e)[:200]})
+            continue
+
+        prefix = f"{batch_id}\t{accepted}\t"
+        lines.append(line_no)
+        accepted += 1
+        sales.write(prefix + sale + "\n")
+        for p in items:
+            products.write(prefix + p + "\n")
+        for p in pays:
+            payments.write(prefix + p + "\n")
+
+    return {
+        "sales": sales, "products": products, "payments": payments,
+        "accepted": accepted, "rejected": rejected, "errors": errors, "lines": lines,
+    }
+
+
+# ============================================================
+# 🔀 MERGE SET-BASED (staging → tabelas do ERP)
+# ============================================================
+
+def _copy(cursor, table: str, columns: List[str], buf: io.StringIO) -> None:
+    """COPY ... FROM STDIN (formato texto) de um buffer já serializado."""
+    if not buf.tell():
+        return
+    buf.seek(0)
+    cursor.copy_expert(f"COPY {table} (batch_id, seq, {', '.join(columns)}) FROM STDIN", buf)
+
+
+# 0) Referências inexistentes (loja, canal, produto...) → venda rejeitada, lote segue
+REJECT_ORPHANS_SQL = """
+    DELETE FROM ingest_sales_stage st
+    WHERE st.batch_id = :batch AND (
+        NOT EXISTS (SELECT 1 FROM stores x WHERE x.id = st.store_id)
+        OR NOT EXISTS (SELECT 1 FROM channels x WHERE x.id = st.channel_id)
+        OR (st.sub_brand_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM sub_brands x WHERE x.id = st.sub_brand_id))
+        OR (st.customer_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM customers x WHERE x.id = st.customer_id))
+        OR EXISTS (
+            SELECT 1 FROM ingest_product_sales_stage p
+            WHERE p.batch_id = st.batch_id AND p.seq = st.seq
+              AND NOT EXISTS (SELECT 1 FROM products x WHERE x.id = p.product_id)
+        )
+        OR EXISTS (
+            SELECT 1 FROM ingest_payments_stage p
+            WHERE p.batch_id = st.batch_id AND p.seq = st.seq AND p.payment_type_id IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM payment_types x WHERE x.id = p.payment_type_id)
+        )
+    )
+    RETURNING st.seq
+"""
+
+# Lojas de marcas que moram em outro banco (shard_map): a venda iria para o
+# principal, onde as consultas de marca já não a enxergam
+REJECT_MOVED_BRANDS_SQL = """
+    DELETE FROM ingest_sales_stage st
+    USING stores x
+    WHERE st.batch_id = :batch AND x.id = st.store_id AND x.brand_id = ANY(:moved_brands)
+    RETURNING st.seq, x.brand_id
+"""
+
+MERGE_SQL = [
+    # 1) Dedupe dentro do lote: a última ocorrência de (store_id, cod_sale1) vence
+    """
+    DELETE FROM ingest_sales_stage st
+    USING (
+        SELECT store_id, cod_sale1, MAX(seq) AS keep
+        FROM ingest_sales_stage
+        WHERE batch_id = :batch
+        GROUP BY store_id, cod_sale1
+        HAVING COUNT(*) > 1
+    ) d
+    WHERE st.batch_id = :batch AND st.store_id = d.store_id
+      AND st.cod_sale1 = d.cod_sale1 AND st.seq <> d.keep
+    """,
+    # 2) Vendas novas: INSERT ... ON CONFLICT DO NOTHING e guarda o id gerado
+    f"""
+    WITH ins AS (
+        INSERT INTO sales ({", ".join(SALE_COLS)}, date_key, hour_key)
+        SELECT {_select_cols(SALE_COLS)}, {", ".join(local_keys_sql("created_at"))}
+        FROM ingest_sales_stage
+        WHERE batch_id = :batch
+        ORDER BY created_at
+        ON CONFLICT (store_id, cod_sale1) WHERE cod_sale1 IS NOT NULL DO NOTHING
+        RETURNING id, store_id, cod_sale1
+    )
+    UPDATE ingest_sales_stage st
+    SET sale_id = ins.id
+    FROM ins
+    WHERE st.batch_id = :batch AND st.store_id = ins.store_id AND st.cod_sale1 = ins.cod_sale1
+    """,
+    # 3) Filhos apenas das vendas recém-inseridas (reenvio não duplica itens)
+    f"""
+    INSERT INTO product_sales (sale_id, {", ".join(PRODUCT_COLS)})
+    SELECT st.sale_id, {_select_cols(PRODUCT_COLS, "p.")}
+    FROM ingest_product_sales_stage p
+    JOIN ingest_sales_stage st ON st.batch_id = p.batch_id AND st.seq = p.seq
+    WHERE p.batch_id = :batch AND st.sale_id IS NOT NULL
+    """,
+    f"""
+    INSERT INTO payments (sale_id, {", ".join(PAYMENT_COLS)})
+    SELECT st.sale_id, {_select_cols(PAYMENT_COLS, "p.")}
+    FROM ingest_payments_stage p
+    JOIN ingest_sales_stage st ON st.batch_id = p.batch_id AND st.seq = p.seq
+    WHERE p.batch_id = :batch AND st.sale_id IS NOT NULL
+    """,
+]
+
+# 4) Vendas já existentes: atualiza só o que mudou (status, valores, tempos)
+UPDATE_EXISTING_SQL = f"""
+    UPDATE sales s
+    SET {", ".join(f"{c} = {_col_expr(c, 'st.')}" for c in UPDATABLE_COLS)}
+    FROM ingest_sales_stage st
+    WHERE st.batch_id = :batch AND st.sale_id IS NULL
+      AND s.store_id = st.store_id AND s.cod_sale1 = st.cod_sale1
+      AND ({", ".join("s." + c for c in UPDATABLE_COLS)})
+          IS DISTINCT FROM ({_select_cols(UPDATABLE_COLS, "st.")})
+    RETURNING s.date_key
+"""
+
+STAGE_CLEANUP_SQL = [
+    "DELETE FROM ingest_product_sales_stage WHERE batch_id = :batch",
+    "DELETE FROM ingest_payments_stage WHERE batch_id = :batch",
+    "DELETE FROM ingest_sales_stage WHERE batch_id = :batch",
+]
+
+# Marca d'água: versão monotônica + maior id de venda
+WATERMARK_SQL = """
+    INSERT INTO data_watermark (name, version, max_sale_id, updated_at)
+    SELECT :name, 1, MAX(sale_id), NOW()
+    FROM ingest_sales_stage WHERE batch_id = :batch
+    ON CONFLICT (name) DO UPDATE SET
+        version = data_watermark.version + 1,
+        max_sale_id = GREATEST(data_watermark.max_sale_id, EXCLUDED.max_sale_id),
+        updated_at = EXCLUDED.updated_at
+    RETURNING version
+"""
+
+# Dias LOCAIS (date_key) das vendas novas (os das atualizadas vêm do RETURNING do UPDATE)
+INSERTED_DAYS_SQL = f"""
+    SELECT MIN({local_keys_sql("created_at")[0]}), MAX({local_keys_sql("created_at")[0]})
+    FROM ingest_sales_stage
+    WHERE batch_id = :batch AND sale_id IS NOT NULL
+"""
+
+
+def reject_moved_brands(conn, batch_id: str) -> List[Tuple[int, int]]:
+    """Tira do staging as vendas de marcas movidas para um shard: [(seq, brand_id)]."""
+    moved = shard_map.moved_brands()
+    if not moved:
+        return []
+    rows = conn.execute(text(REJECT_MOVED_BRANDS_SQL), {"batch": batch_id, "moved_brands": moved})
+    return sorted((r[0], r[1]) for r in rows)
+
+
+def ingest_sales(payload: bytes) -> Dict[str, Any]:
+    """
+    Ingere um lote NDJSON e retorna contadores:
+    inserted, updated, duplicates, rejected (+ erros por linha), watermark e
+    a faixa de dias tocada (days). Tudo roda em UMA transação no primário.
+    """
+    started = time.perf_counter()
+    batch = {"batch": uuid.uuid4().hex, "name": WATERMARK_NAME, **TZ_PARAMS}
+    parsed = parse_ndjson(payload, batch["batch"])
+    result: Dict[str, Any] = {
+        "received": parsed["accepted"] + parsed["rejected"],
+        "inserted": 0,
+        "updated": 0,
+        "duplicates": 0,
+        "rejected": parsed["rejected"],
+        "errors": parsed["errors"],
+        "watermark": None,
+        "days": None,
+    }
+    if not parsed["accepted"]:
+        result["ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    with engine.begin() as conn:
+        cursor = conn.connection.cursor()
+        try:
+            _copy(cursor, "ingest_sales_stage", SALE_COLS, parsed["sales"])
+            _copy(cursor, "ingest_product_sales_stage", PRODUCT_COLS, parsed["products"])
+            _copy(cursor, "ingest_payments_stage", PAYMENT_COLS, parsed["payments"])
+        finally:
+            cursor.close()
+        result["copy_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+        refused = [
+            (seq, f"loja da marca {brand} (banco próprio em BRAND_SHARDS): envie ao banco da marca")
+            for seq, brand in reject_moved_brands(conn, batch["batch"])
+        ]
+        refused += [
+            (r[0], "referência inexistente (loja, canal, produto...)")
+            for r in conn.execute(text(REJECT_ORPHANS_SQL), batch)
+        ]
+        for seq, error in sorted(refused):
+            if len(result["errors"]) < MAX_REPORTED_ERRORS:
+                result["errors"].append({"line": parsed["lines"][seq], "error": error})
+        staged = parsed["accepted"] - len(refused)
+        deduped = staged - conn.execute(text(MERGE_SQL[0]), batch).rowcount
+        inserted = conn.execute(text(MERGE_SQL[1]), batch).rowcount
+        for sql in MERGE_SQL[2:]:
+            conn.execute(text(sql), batch)
+        updated_keys = [r[0] for r in conn.execute(text(UPDATE_EXISTING_SQL), batch)]
+
+        keys = list(updated_keys)
+        if inserted:
+            keys += list(conn.execute(text(INSERTED_DAYS_SQL), batch).one())
+        days = [key_to_date(k) for k in keys if k is not None]
+        if inserted or updated_keys:
+            result["watermark"] = conn.execute(text(WATERMARK_SQL), batch).scalar()
+        for sql in STAGE_CLEANUP_SQL:
+            conn.execute(text(sql), batch)
+
+    result.update(
+        inserted=inserted,
+        updated=len(updated_keys),
+        duplicates=(staged - deduped) + (deduped - inserted - len(updated_keys)),
+        rejected=parsed["rejected"] + len(refused),
+        days={"from": min(days).isoformat(), "to": max(days).isoformat()} if days else None,
+        ms=round((time.perf_counter() - started) * 1000, 2),
+    )
+    return result
+
+
+def current_watermark() -> Optional[Dict[str, Any]]:
+    """Marca d'água atual (None se ainda não houve ingestão)."""
+    from src.database.session import read_connection
+
+    with read_connection() as conn:
+        row = conn.execute(text(
+            "SELECT version, max_sale_id, updated_at "
+            "FROM data_watermark WHERE name = :name"
+        ), {"name": WATERMARK_NAME}).mappings().first()
+    return dict(row) if row else None
+
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Formato: uma venda JSON por linha, campos iguais às colunas de sales,
+#   com listas opcionais "product_sales" e "payments". cod_sale1 é obrigatório
+#   (é a chave de idempotência junto com store_id).
+# - Reenviar o mesmo lote é seguro: vendas existentes não ganham itens
+#   duplicados; só status/valores/tempos são atualizados se mudaram.
+# - As staging são UNLOGGED e compartilhadas entre workers; cada lote usa seu
+#   batch_id e apaga suas linhas na mesma transação (nada sobra após o commit).
+# - Consumidores de cache (snapshot compartilhado) comparam a versão de
+#   data_watermark; a rota agenda o recálculo de daily_aggregates para os
+#   dias tocados (days) logo após responder.
+# - Marcas em shard próprio (BRAND_SHARDS) não são ingeridas aqui: a linha
+#   volta como rejeitada; loja ausente no principal cai como referência
+#   inexistente. Ingestão direta no shard fica para o processo da marca.
+# - date_key/hour_key (dia/hora locais) são calculados no INSERT das vendas
+#   novas; created_at não muda em reenvios, então o UPDATE não mexe neles.
+# ============================================================
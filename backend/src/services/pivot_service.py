@@ -0,0 +1,354 @@
+# ============================================================
+# 🧮 SERVICE DE PIVÔ (GET /metrics/pivot)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Quebras ad-hoc de receita/pedidos por canal, loja, forma de
+#            pagamento e hora do dia — e todas as combinações — em UMA
+#            consulta:
+#            - dimensões e medidas em lista branca (nada do cliente vira SQL)
+#            - GROUP BY CUBE (...) → cada subconjunto das dimensões (e o
+#              total geral) sai da mesma varredura; GROUPING() diz a qual
+#              quebra cada linha pertence
+#            - canal/loja com janela em dias inteiros → lê daily_aggregates
+#              (rollup) em vez de sales
+#            - resultado em cache por especificação (TTL) + single-flight;
+#              nomes vêm do cache de dimensões na saída (consulta só com ids)
+# ============================================================
+
+import os
+import time
+from datetime import date
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from src.database.session import read_connection
+from src.services import archive_service, dimension_cache
+from src.services.calendar_service import HOUR_KEY_SQL, window_conds
+from src.services.query_control import apply_scope
+from src.utils.singleflight import SingleFlight, make_key
+from src.utils.ttl_cache import TTLCache
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+PIVOT_CACHE_TTL_SECONDS = float(os.getenv("PIVOT_CACHE_TTL_SECONDS", "300"))
+PIVOT_USE_ROLLUPS = os.getenv("PIVOT_USE_ROLLUPS", "true").lower() in ("1", "true", "yes")
+PIVOT_MAX_DIMS = 3  # CUBE de 3 dimensões = 8 quebras; acima disso a resposta explode
+
+# Dimensões aceitas (ordem canônica da consulta e das chaves de quebra):
+# - expr: chave de agrupamento sobre sales s (p = pagamentos da venda)
+# - rollup: coluna equivalente em daily_aggregates a (None = só via sales)
+# - labels: tabela de dimension_cache que dá nome à chave (None = rótulo fixo)
+PIVOT_DIMENSIONS: Dict[str, Dict[str, Any]] = {
+    "channel": {
+        "expr": "s.channel_id", "rollup": "a.channel_id",
+        "key": "channel_id", "label": "channel",
+        "labels": "channels",
+    },
+    "store": {
+        "expr": "s.store_id", "rollup": "a.store_id",
+        "key": "store_id", "label": "store",
+        "labels": "stores",
+    },
+    "payment_type": {
+        "expr": "p.payment_type_id", "rollup": None,
+        "key": "payment_type_id", "label": "payment_type",
+        "labels": "payment_types",
+    },
+    "hour": {
+        # hora local: a coluna gravada (ingestão, gerador, trigger, backfill)
+        "expr": HOUR_KEY_SQL, "rollup": None,
+        "key": "hour", "label": "hour_label",
+        "labels": None,  # mesmo rótulo de dim_hour ('14h')
+    },
+}
+PIVOT_MEASURES = ("revenue", "orders", "avg_ticket")
+DEFAULT_MEASURES = ("revenue", "orders")
+
+_cache = TTLCache(maxsize=128, ttl=PIVOT_CACHE_TTL_SECONDS)
+_flight = SingleFlight()
+
+# Pagamentos da venda somados por forma (uma linha por venda × forma).
+# n = 1 marca a primeira linha da venda: é nela que a venda conta nas
+# quebras SEM payment_type (sem duplicar receita/pedidos no join)
+PAYMENTS_LATERAL = """
+    LEFT JOIN LATERAL (
+        SELECT pm.payment_type_id, SUM(pm.value) AS value,
+               ROW_NUMBER() OVER (ORDER BY pm.payment_type_id) AS n
+        FROM payments pm
+        WHERE pm.sale_id = s.id
+        GROUP BY pm.payment_type_id
+    ) p ON TRUE
+"""
+
+
+# ============================================================
+# 🧩 ESPECIFICAÇÃO
+# ============================================================
+
+def _split(value: Any) -> List[str]:
+    if value is None:
+        return []
+    items = value.split(",") if isinstance(value, str) else list(value)
+    out: List[str] = []
+    for item in items:
+        item = str(item).strip().lower()
+        if item and item not in out:
+            out.append(item)
+    return out
+
+
+def parse_spec(dims: Any, measures: Any = None) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """Valida dims/measures contra a lista branca; dims na ordem canônica."""
+    wanted = _split(dims)
+    if not wanted:
+        raise ValueError(f"informe ao menos uma dimensão: {', '.join(PIVOT_DIMENSIONS)}")
+    unknown = [d for d in wanted if d not in PIVOT_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"dimensão inválida: {', '.join(unknown)} (aceitas: {', '.join(PIVOT_DIMENSIONS)})")
+    if len(wanted) > PIVOT_MAX_DIMS:
+        raise ValueError(f"máximo de {PIVOT_MAX_DIMS} dimensões por pivô")
+
+    chosen = _split(measures) or list(DEFAULT_MEASURES)
+    unknown = [m for m in chosen if m not in PIVOT_MEASURES]
+    if unknown:
+        raise ValueError(f"medida inválida: {', '.join(unknown)} (aceitas: {', '.join(PIVOT_MEASURES)})")
+    return tuple(d for d in PIVOT_DIMENSIONS if d in wanted), tuple(chosen)
+
+
+def _whole_day(value: Optional[str]) -> bool:
+    if value is None:
+        return True
+    if len(value) != 10:
+        return False
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def uses_rollup(dims: Tuple[str, ...], date_from: Optional[str], date_to: Optional[str]) -> bool:
+    """
+    daily_aggregates responde quando todas as dimensões existem no rollup e
+    a janela é de dias inteiros ('YYYY-MM-DD' sem hora).
+    """
+    return (
+        PIVOT_USE_ROLLUPS
+        and all(PIVOT_DIMENSIONS[d]["rollup"] for d in dims)
+        and _whole_day(date_from)
+        and _whole_day(date_to)
+    )
+
+
+# ============================================================
+# 🛠️ COMPILAÇÃO (uma consulta com CUBE)
+# ============================================================
+
+def compile_pivot(
+    dims: Tuple[str, ...],
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    channel: Optional[str] = None,
+    store_id: Optional[int] = None,
+    rollup: bool = False,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    SQL + parâmetros do pivô. Colunas por linha: gid (bitmask do GROUPING;
+    bit ligado = dimensão fora da quebra), k0..kN (ids),
+    revenue/orders (venda contada uma vez) e paid_revenue/paid_orders (por
+    forma de pagamento).
+    """
+    alias = "a" if rollup else "s"
+    conds, params = ["TRUE"], {}
+    if rollup:
+        # dias locais [date_from, date_to), como date_key no caminho por sales
+        if date_from:
+            conds.append("a.day >= CAST(:date_from AS DATE)")
+            params["date_from"] = date_from
+        if date_to:
+            conds.append("a.day < CAST(:date_to AS DATE)")
+            params["date_to"] = date_to
+    else:
+        # dias inteiros → date_key (mesmos dias locais do rollup); com hora → created_at
+        window, window_params = window_conds(date_from, date_to)
+        conds += window
+        params.update(window_params)
+    if channel:
+        conds.append(f"{alias}.channel_id = ANY(:channel_ids)")
+        params["channel_ids"] = dimension_cache.channel_ids(channel)
+    if store_id is not None:
+        conds.append(f"{alias}.store_id = :store_id")
+        params["store_id"] = store_id
+
+    if rollup:
+        keys = [PIVOT_DIMENSIONS[d]["rollup"] for d in dims]
+        source = "daily_aggregates a"
+        revenue, orders = "COALESCE(SUM(a.revenue), 0)", "COALESCE(SUM(a.orders), 0)"
+        paid, rows = revenue, orders
+    else:
+        keys = [PIVOT_DIMENSIONS[d]["expr"] for d in dims]
+        source = "sales s"
+        revenue, orders = "COALESCE(SUM(s.total_amount), 0)", "COUNT(*)"
+        paid, rows = revenue, orders
+        if "payment_type" in dims:
+            first = "COALESCE(p.n, 1) = 1"
+            source += PAYMENTS_LATERAL
+            revenue = f"COALESCE(SUM(s.total_amount) FILTER (WHERE {first}), 0)"
+            orders = f"COUNT(*) FILTER (WHERE {first})"
+            paid = "COALESCE(SUM(p.value), 0)"
+
+    key_cols = ", ".join(f"{k} AS k{i}" for i, k in enumerate(keys))
+    sql = f"""
+        SELECT GROUPING({", ".join(keys)}) AS gid, {key_cols},
+               {revenue} AS revenue, {orders} AS orders,
+               {paid} AS paid_revenue, {rows} AS paid_orders
+        FROM {source}
+        WHERE {" AND ".join(conds)}
+        GROUP BY CUBE ({", ".join(keys)})
+    """
+    return sql, params
+
+
+# ============================================================
+# 🔥 EXECUÇÃO
+# ============================================================
+
+def breakdown_name(dims: Tuple[str, ...]) -> str:
+    return ",".join(dims) if dims else "total"
+
+
+def _grouped_dims(gid: int, dims: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Dimensões presentes na linha (GROUPING põe a 1ª dimensão no bit mais alto)."""
+    n = len(dims)
+    return tuple(d for i, d in enumerate(dims) if not (gid >> (n - 1 - i)) & 1)
+
+
+def _run_pivot(
+    dims: Tuple[str, ...],
+    date_from: Optional[str],
+    date_to: Optional[str],
+    channel: Optional[str],
+    store_id: Optional[int],
+) -> Dict[str, Any]:
+    """Executa o CUBE e separa as linhas por quebra (ids + todas as medidas, para o cache)."""
+    started = time.perf_counter()
+    rollup = uses_rollup(dims, date_from, date_to)
+    sql, params = compile_pivot(dims, date_from, date_to, channel, store_id, rollup=rollup)
+    with read_connection() as conn, apply_scope(conn):
+        rows = conn.execute(text(sql), params).mappings().all()
+
+    breakdowns: Dict[str, List[Dict[str, Any]]] = {
+        breakdown_name(subset): []
+        for size in range(len(dims), -1, -1)
+        for subset in combinations(dims, size)
+    }
+    for r in rows:
+        present = _grouped_dims(int(r["gid"]), dims)
+        by_payment = "payment_type" in present
+        entry: Dict[str, Any] = {}
+        for i, dim in enumerate(dims):
+            if dim in present:
+                entry[PIVOT_DIMENSIONS[dim]["key"]] = r[f"k{i}"]
+        entry["revenue"] = float(r["paid_revenue"] if by_payment else r["revenue"])
+        entry["orders"] = int(r["paid_orders"] if by_payment else r["orders"])
+        breakdowns[breakdown_name(present)].append(entry)
+
+    if not breakdowns["total"]:
+        breakdowns["total"].append({"revenue": 0.0, "orders": 0})
+    return {
+        "source": "rollup" if rollup else "sales",
+        "breakdowns": breakdowns,
+        "query_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def _project(entry: Dict[str, Any], measures: Tuple[str, ...]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for dim, spec in PIVOT_DIMENSIONS.items():
+        if spec["key"] not in entry:
+            continue
+        key = entry[spec["key"]]
+        out[spec["key"]] = key
+        if spec["labels"]:
+            out[spec["label"]] = dimension_cache.label(spec["labels"], key)
+        else:
+            out[spec["label"]] = f"{key}h" if key is not None else None
+    for m in measures:
+        if m == "revenue":
+            out[m] = round(entry["revenue"], 2)
+        elif m == "orders":
+            out[m] = entry["orders"]
+        else:
+            out[m] = round(entry["revenue"] / entry["orders"], 2) if entry["orders"] else 0.0
+    return out
+
+
+def pivot(
+    dims: Any,
+    measures: Any = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    channel: Optional[str] = None,
+    store_id: Optional[int] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """
+    Todas as quebras do CUBE das dimensões pedidas, de uma só varredura.
+    - dims: ex. "channel,store,payment_type" (até PIVOT_MAX_DIMS)
+    - measures: revenue | orders | avg_ticket (padrão: revenue,orders)
+    Com payment_type na quebra, receita = valor pago naquela forma e
+    pedidos = vendas com aquela forma (venda dividida conta em cada uma).
+    """
+    dims_t, measures_t = parse_spec(dims, measures)
+    channel = channel or None
+
+    # Medidas não entram na chave: o cache guarda todas e projeta na saída
+    key = make_key("pivot", (), {
+        "dims": dims_t, "date_from": date_from, "date_to": date_to,
+        "channel": channel, "store_id": store_id,
+    })
+    result = _cache.get(key)
+    cached = result is not None
+    if not cached:
+        result = _flight.do(key, lambda: _run_pivot(dims_t, date_from, date_to, channel, store_id))
+        _cache.set(key, result)
+
+    sort_by = measures_t[0]
+    breakdowns: Dict[str, Any] = {}
+    for name, entries in result["breakdowns"].items():
+        projected = [_project(e, measures_t) for e in entries]
+        if name == "total":
+            breakdowns[name] = projected[0]
+        else:
+            breakdowns[name] = sorted(projected, key=lambda e: e[sort_by], reverse=True)
+    return {
+        "dims": list(dims_t),
+        "measures": list(measures_t),
+        "filters": {"date_from": date_from, "date_to": date_to, "channel": channel, "store_id": store_id},
+        "source": result["source"],
+        **(archive_service.archive_note(date_from, date_to) if result["source"] == "sales" else {}),
+        "cached": cached,
+        "query_ms": result["query_ms"],
+        "breakdowns": breakdowns,
+    }
+
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Exemplo: /metrics/pivot?dims=channel,store,payment_type&measures=revenue,orders
+#   → 8 quebras (channel,store,payment_type · channel,store · channel,payment_type
+#   · store,payment_type · channel · store · payment_type · total) em 1 consulta.
+# - payment_type: pagamentos somados por venda × forma num LATERAL (índice
+#   idx_payments_sale); a venda entra uma única vez nas quebras sem essa
+#   dimensão, então "channel" tem o mesmo total com ou sem payment_type no pivô.
+# - Rollup: daily_aggregates é por dia local (date_key), os mesmos dias
+#   [date_from, date_to) que o caminho por sales filtra em date_key. Ele cobre meses
+#   já arquivados (archive_service), o caminho por sales não — desligue com
+#   PIVOT_USE_ROLLUPS=false para comparar.
+# - Cache por (dims, filtros); medidas diferentes reaproveitam a mesma entrada.
+#   Linhas de cada quebra ordenadas pela 1ª medida pedida (decrescente).
+# ============================================================
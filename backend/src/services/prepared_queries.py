@@ -0,0 +1,366 @@
+# ============================================================
+# 📌 PREPARED STATEMENTS DAS MÉTRICAS QUENTES
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: As métricas de KPI (faturamento, ticket médio, pedidos) são
+#            o mesmo punhado de SQL repetido a cada polling do dashboard.
+#            Aqui elas viram PREPARE/EXECUTE nomeados no servidor:
+#            - preparados sob demanda, uma vez por conexão do pool
+#            - nomes já preparados ficam em conn.connection.info (some
+#              junto com a conexão DBAPI → reconexão prepara de novo)
+#            - "statement does not exist" / "cached plan must not change
+#              result type" (schema mudou) → prepara de novo e repete 1x
+#            - benchmark: o mesmo SELECT em texto × EXECUTE, em alta concorrência
+# Uso do benchmark (a partir de backend/):
+#   python -m src.services.prepared_queries --bench
+#   python -m src.services.prepared_queries --bench --requests 5000 --concurrency 12 \
+#       --date-from 2025-01-01 --date-to 2025-01-31 --channel 1
+# ============================================================
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import DBAPIError, ProgrammingError
+from src.database.session import read_connection
+from src.services.calendar_service import day_keys
+from src.services.query_control import current_scope, raise_if_canceled
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+# auto: liga, exceto em conexões pela porta do pooler em modo transação
+# (Supabase 6543 / pgbouncer), onde a sessão do servidor muda a cada transação
+PREPARED_STATEMENTS = os.getenv("PREPARED_STATEMENTS", "auto").lower()
+TRANSACTION_POOLER_PORTS = {6543}
+
+# SQLSTATE: invalid_sql_statement_name ("prepared statement ... does not exist")
+PG_UNDEFINED_PREPARED = "26000"
+# SQLSTATE: feature_not_supported ("cached plan must not change result type")
+PG_CACHED_PLAN_CHANGED = "0A000"
+
+_INFO_KEY = "prepared_statements"
+
+# ============================================================
+# 🧾 CATÁLOGO DE CONSULTAS
+# ============================================================
+# Uma consulta por combinação de filtros presentes (sem "(:x IS NULL OR ...)":
+# cada variante tem predicados simples → o plano genérico usa o índice de data).
+# As três métricas saem da mesma varredura.
+KPI_SELECT = """
+    SELECT COALESCE(SUM(s.total_amount), 0) AS revenue,
+           COUNT(*)                         AS orders,
+           COALESCE(AVG(s.total_amount), 0) AS avg_ticket
+    FROM sales s
+    WHERE TRUE
+"""
+# Dias inteiros filtram o dia local (date_key, fim exclusivo); datas com hora
+# comparam created_at (calendar_service.window_conds) — nunca os dois juntos.
+KPI_FILTERS = (
+    ("date_from", "timestamp", "s.created_at >= {p}"),
+    ("date_to", "timestamp", "s.created_at <= {p}"),
+    # mesmo filtro de canal das demais métricas novas: id do canal OU tipo (P/D)
+    ("channel", "text", "s.channel_id IN (SELECT id FROM channels WHERE CAST(id AS TEXT) = {p} OR type = {p})"),
+    ("key_from", "integer", "s.date_key >= {p}"),
+    ("key_to", "integer", "s.date_key < {p}"),
+)
+_TIMESTAMP_BITS, _KEY_BITS = 0b00011, 0b11000
+
+
+def _build_statements() -> Dict[str, Tuple[str, List[str]]]:
+    """nome → (PREPARE ..., [parâmetros na ordem de $1, $2, ...])."""
+    statements = {}
+    for mask in range(1 << len(KPI_FILTERS)):
+        if mask & _TIMESTAMP_BITS and mask & _KEY_BITS:
+            continue
+        used = [f for i, f in enumerate(KPI_FILTERS) if mask & (1 << i)]
+        flags = "".join("1" if mask & (1 << i) else "0" for i in range(len(KPI_FILTERS)))
+        name = f"kpi_totals_{flags}"
+        where = "".join(
+            f"      AND {clause.format(p=f'${n}')}\n" for n, (_, _, clause) in enumerate(used, start=1)
+        )
+        types = f" ({', '.join(t for _, t, _ in used)})" if used else ""
+        statements[name] = (f"PREPARE {name}{types} AS{KPI_SELECT}{where}", [p for p, _, _ in used])
+    return statements
+
+
+STATEMENTS = _build_statements()
+
+_lock = threading.Lock()
+_stats = {"prepared": 0, "executed": 0, "reprepared": 0}
+_disabled_reason: Optional[str] = None
+
+
+# ============================================================
+# 🔧 PREPARAR / EXECUTAR
+# ============================================================
+
+def _count(key: str) -> None:
+    with _lock:
+        _stats[key] += 1
+
+
+def enabled_for(conn) -> bool:
+    if _disabled_reason is not None or PREPARED_STATEMENTS in ("0", "false", "no", "off"):
+        return False
+    if PREPARED_STATEMENTS == "auto":
+        return conn.engine.url.port not in TRANSACTION_POOLER_PORTS
+    return True
+
+
+def _prepared_names(conn) -> set:
+    """
+    Nomes já preparados nesta conexão DBAPI. Na primeira vez consulta
+    pg_prepared_statements (a sessão pode ter sobrevivido a um reset do info).
+    """
+    info = conn.connection.info
+    names = info.get(_INFO_KEY)
+    if names is None:
+        rows = conn.exec_driver_sql("SELECT name FROM pg_prepared_statements").all()
+        names = info[_INFO_KEY] = {r[0] for r in rows}
+    return names
+
+
+def _prepare(conn, name: str) -> None:
+    names = _prepared_names(conn)
+    if name in names:
+        return
+    conn.exec_driver_sql(STATEMENTS[name][0])
+    names.add(name)
+    _count("prepared")
+
+
+def _execute(conn, name: str, params: Dict[str, Any]):
+    _prepare(conn, name)
+    args = tuple(params[p] for p in STATEMENTS[name][1])
+    placeholders = f" ({', '.join(['%s'] * len(args))})" if args else ""
+    return conn.exec_driver_sql(f"EXECUTE {name}{placeholders}", args)
+
+
+def _needs_reprepare(err: DBAPIError) -> bool:
+    return getattr(err.orig, "pgcode", None) in (PG_UNDEFINED_PREPARED, PG_CACHED_PLAN_CHANGED)
+
+
+def execute(conn, name: str, params: Dict[str, Any]):
+    """
+    EXECUTE do statement `name` (prepara se preciso). Se o servidor perdeu o
+    statement ou o schema mudou o tipo do resultado, descarta, prepara de
+    novo e repete uma vez — na mesma conexão, com o statement_timeout do escopo.
+    """
+    try:
+        return _execute(conn, name, params)
+    except DBAPIError as e:
+        if not _needs_reprepare(e):
+            raise
+    conn.rollback()  # transação abortada; SET LOCAL do escopo foi junto
+    scope = current_scope()
+    if scope is not None:
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(scope.timeout_ms)}")
+    names = _prepared_names(conn)
+    if name in names:
+        conn.exec_driver_sql(f"DEALLOCATE {name}")
+        names.discard(name)
+    _count("reprepared")
+    return _execute(conn, name, params)
+
+
+def kpi_params(date_from: Optional[str], date_to: Optional[str], channel: Optional[str]) -> Dict[str, Any]:
+    """Parâmetros da janela: date_key para dias inteiros, created_at com hora."""
+    keys = day_keys(date_from, date_to)
+    if keys is not None:
+        return {**keys, "channel": channel}
+    return {"date_from": date_from, "date_to": date_to, "channel": channel}
+
+
+def kpi_statement(params: Dict[str, Any]) -> str:
+    flags = "".join("1" if params.get(name) else "0" for name, _, _ in KPI_FILTERS)
+    return f"kpi_totals_{flags}"
+
+
+def kpi_totals(
+    conn,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    channel: Optional[str] = None,
+) -> Optional[Dict[str, float]]:
+    """
+    {"revenue", "orders", "avg_ticket"} via statement preparado, ou None
+    quando o caminho preparado não se aplica (desligado / pooler / schema
+    sem created_at/channel_id) — aí o chamador usa o SQL tolerante.
+    """
+    global _disabled_reason
+    if not enabled_for(conn):
+        return None
+    params = kpi_params(date_from, date_to, channel)
+    name = kpi_statement(params)
+    try:
+        row = execute(conn, name, params).one()
+    except ProgrammingError as e:
+        raise_if_canceled(e)
+        # Schema fora do padrão (coluna/tabela ausente): desliga no worker
+        _disabled_reason = str(getattr(e, "orig", e)).strip().splitlines()[0][:200]
+        conn.rollback()
+        return None
+    except DBAPIError as e:
+        raise_if_canceled(e)
+        raise
+    _count("executed")
+    return {"revenue": float(row[0] or 0.0), "orders": float(row[1] or 0), "avg_ticket": float(row[2] or 0.0)}
+
+
+def status() -> Dict[str, Any]:
+    with _lock:
+        out: Dict[str, Any] = dict(_stats)
+    out["mode"] = PREPARED_STATEMENTS
+    out["statements"] = len(STATEMENTS)
+    out["disabled_reason"] = _disabled_reason
+    return out
+
+
+# ============================================================
+# 🏁 BENCHMARK (mesmo SQL em texto × EXECUTE)
+# ============================================================
+
+def _percentile(sorted_ms: List[float], q: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    return sorted_ms[min(len(sorted_ms) - 1, int(q * len(sorted_ms)))]
+
+
+def _text_sql(params: Dict[str, Any]) -> str:
+    """
+    O mesmo SELECT dos statements (receita, pedidos e ticket médio, mesmos
+    filtros de janela/canal) em SQL texto com :parâmetros — a comparação
+    mede só o custo de parse/plano, não consultas diferentes.
+    """
+    where = "".join(
+        f"      AND {clause.format(p=':' + name)}\n" for name, _, clause in KPI_FILTERS if params.get(name)
+    )
+    return f"{KPI_SELECT}{where}"
+
+
+def _load(call, requests: int, concurrency: int) -> Dict[str, float]:
+    """Dispara `requests` chamadas com `concurrency` threads; latências no cliente."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def timed(_):
+        t0 = time.perf_counter()
+        call()
+        return (time.perf_counter() - t0) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        lat = sorted(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "qps": round(requests / elapsed, 1),
+        "p50_ms": round(_percentile(lat, 0.50), 2),
+        "p95_ms": round(_percentile(lat, 0.95), 2),
+        "p99_ms": round(_percentile(lat, 0.99), 2),
+    }
+
+
+def _explain_times(conn, sql: str, params, samples: int) -> Dict[str, float]:
+    """Médias de Planning/Execution Time do EXPLAIN ANALYZE (ms, lado servidor)."""
+    plan, execution = 0.0, 0.0
+    for _ in range(samples):
+        doc = conn.exec_driver_sql(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", params).scalar()
+        doc = doc[0] if isinstance(doc, list) else doc
+        plan += float(doc.get("Planning Time", 0.0))
+        execution += float(doc.get("Execution Time", 0.0))
+    return {"planning_ms": round(plan / samples, 3), "execution_ms": round(execution / samples, 3)}
+
+
+def benchmark(
+    requests: int = 2000,
+    concurrency: int = 8,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    channel: Optional[str] = None,
+    samples: int = 20,
+) -> Dict[str, Any]:
+    from sqlalchemy import text
+
+    params = kpi_params(date_from, date_to, channel)
+    text_sql = _text_sql(params)
+    name = kpi_statement(params)
+
+    def via_text():
+        with read_connection() as conn:
+            row = conn.execute(text(text_sql), params).one()
+            conn.commit()
+        return row
+
+    def via_prepared():
+        with read_connection() as conn:
+            row = execute(conn, name, params).one()
+            conn.commit()
+        return row
+
+    report: Dict[str, Any] = {"statement": name, "requests": requests, "concurrency": concurrency}
+    via_prepared()  # aquece: prepara no 1º uso (as demais conexões preparam sob carga)
+    report["text"] = _load(via_text, requests, concurrency)
+    report["prepared"] = _load(via_prepared, requests, concurrency)
+
+    # Tempo de servidor numa conexão só; o plano genérico do PREPARE entra
+    # após algumas execuções (plan_cache_mode=auto) → planning cai para ~0
+    with read_connection() as conn:
+        compiled = text(text_sql).compile(dialect=conn.dialect)
+        text_params = {k: params.get(k) for k in compiled.params}
+        report["text"].update(_explain_times(conn, str(compiled), text_params, samples))
+        _prepare(conn, name)
+        args = tuple(params[p] for p in STATEMENTS[name][1])
+        placeholders = f" ({', '.join(['%s'] * len(args))})" if args else ""
+        report["prepared"].update(_explain_times(conn, f"EXECUTE {name}{placeholders}", args, samples))
+        conn.rollback()
+    return report
+
+
+def main():
+    from argparse import ArgumentParser
+
+    ap = ArgumentParser(description="Prepared statements das métricas de KPI")
+    ap.add_argument("--bench", action="store_true", help="Compara SQL em texto × EXECUTE")
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=8, help="Threads (≤ pool do SQLAlchemy: 5 + 10)")
+    ap.add_argument("--samples", type=int, default=20, help="EXPLAIN ANALYZE por caminho")
+    ap.add_argument("--date-from")
+    ap.add_argument("--date-to")
+    ap.add_argument("--channel")
+    args = ap.parse_args()
+
+    if not args.bench:
+        for name, (sql, order) in STATEMENTS.items():
+            print(f"-- {name} {order}\n{sql.strip()}\n")
+        return
+
+    r = benchmark(args.requests, args.concurrency, args.date_from, args.date_to, args.channel, args.samples)
+    print(f"📌 {r['statement']} — {r['requests']} req × {r['concurrency']} threads")
+    print(f"{'caminho':<10}{'qps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'plan ms':>10}{'exec ms':>10}")
+    for path in ("text", "prepared"):
+        s = r[path]
+        print(f"{path:<10}{s['qps']:>10}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}"
+              f"{s['planning_ms']:>10}{s['execution_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Prepared statements vivem na SESSÃO do Postgres: atrás de pooler em modo
+#   transação (Supabase 6543, pgbouncer transaction) desligue
+#   (PREPARED_STATEMENTS=off — "auto" já faz isso pela porta 6543).
+# - PREPARE não é transacional: sobrevive a ROLLBACK e volta ao pool com a
+#   conexão; o pool_pre_ping/reconexão cria conexão nova (info vazio → prepara).
+# - Plano genérico (após ~5 execuções) pode ser pior para janelas muito
+#   diferentes; se o benchmark mostrar isso, use plan_cache_mode=force_custom_plan
+#   no role da API — ainda poupa o parse.
+# - Réplicas: cada engine tem seu pool; cada conexão prepara na sua sessão.
+# - A consulta por tipo de canal (P/D) usa o mesmo filtro de /sales e afins;
+#   erro de schema (sem created_at/channel_id) desliga o caminho no worker e
+#   as métricas voltam ao SQL tolerante de analytics_service.
+# ============================================================
@@ -0,0 +1,420 @@
+# ============================================================
+# 🚦 CONTROLE DE CONSULTAS (TIMEOUT, CANCELAMENTO E ADMISSÃO)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Protege o banco contra consultas longas ou abandonadas:
+#            - statement_timeout por endpoint (SET LOCAL)
+#            - cancelamento no servidor quando o cliente HTTP desconecta
+#            - limitador de concorrência que rejeita excesso com 503
+#            - circuit breaker do banco + último resultado bom servido
+#              como "velho" (X-Data-Staleness) quando o banco falha/demora
+# ============================================================
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import Request
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from starlette.concurrency import run_in_threadpool
+from src.utils.circuit_breaker import CircuitBreaker
+from src.utils.singleflight import SingleFlight, Abandoned, make_key
+from src.utils.ttl_cache import TTLCache
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+# Timeouts (ms) por endpoint; "default" vale para os não listados
+STATEMENT_TIMEOUTS_MS: Dict[str, int] = {
+    "default": int(os.getenv("STATEMENT_TIMEOUT_MS", "15000")),
+    "total-revenue": 5000,
+    "average-ticket": 5000,
+    "total-orders": 5000,
+    "average-rating": 5000,
+    "top-products": 10000,
+    "percentiles": 5000,
+    "unique-customers": 5000,
+    "batch": 20000,
+    "basket": 30000,
+    "cohorts": 60000,
+    "sales": 5000,
+    "sale-detail": 5000,
+    "anomalies": 15000,
+    "forecast": 15000,
+    "customer-segments": 10000,
+    "delivery-heatmap": 10000,
+    "pivot": 20000,
+    "brand": 10000,
+    "brands": 20000,
+    "brands-top-products": 20000,
+}
+
+MAX_CONCURRENT_QUERIES = int(os.getenv("MAX_CONCURRENT_QUERIES", "8"))
+MAX_HEAVY_QUERIES = int(os.getenv("MAX_HEAVY_QUERIES", "2"))
+ADMISSION_WAIT_SECONDS = float(os.getenv("ADMISSION_WAIT_SECONDS", "0.5"))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "2"))
+DISCONNECT_POLL_SECONDS = 0.25
+
+# Endpoints "pesados" têm cota própria para não esgotar as vagas dos
+# dashboards que fazem polling das métricas leves
+HEAVY_ENDPOINTS = {"top-products", "batch", "basket", "cohorts", "pivot", "brands", "brands-top-products"}
+
+# SQLSTATE do Postgres para query_canceled (timeout ou cancel request)
+PG_QUERY_CANCELED = "57014"
+
+# Circuit breaker do banco (por worker)
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() in ("1", "true", "yes")
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "30"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_RATE = float(os.getenv("BREAKER_SLOW_RATE", "0.5"))
+# "Lenta" é relativo ao timeout do endpoint: fração do statement_timeout,
+# com BREAKER_SLOW_MS como piso (cohorts em 20s é normal; total-revenue não)
+BREAKER_SLOW_MS = int(os.getenv("BREAKER_SLOW_MS", "3000"))
+BREAKER_SLOW_FRACTION = float(os.getenv("BREAKER_SLOW_FRACTION", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "15"))
+
+# Stale-while-revalidate: último resultado bom por (endpoint, argumentos)
+STALE_MAX_AGE_SECONDS = float(os.getenv("STALE_MAX_AGE_SECONDS", "3600"))
+STALE_MAX_ENTRIES = int(os.getenv("STALE_MAX_ENTRIES", "512"))
+# Com resultado velho disponível, espera no máximo esta fração do timeout do endpoint
+STALE_AFTER_FRACTION = float(os.getenv("STALE_AFTER_FRACTION", "0.5"))
+
+
+# ============================================================
+# ❗ EXCEÇÕES (mapeadas para HTTP em main.py)
+# ============================================================
+
+class OverloadedError(Exception):
+    """Sem vaga no limitador → 503 + Retry-After."""
+
+    def __init__(self, retry_after: int = RETRY_AFTER_SECONDS):
+        super().__init__("Servidor ocupado, tente novamente em instantes.")
+        self.retry_after = retry_after
+
+
+class QueryTimeoutError(Exception):
+    """Consulta cancelada pelo statement_timeout → 504."""
+
+
+class ClientDisconnectedError(Exception):
+    """Cliente desconectou e a consulta foi cancelada no servidor."""
+
+
+class CircuitOpenError(Exception):
+    """Disjuntor aberto e sem resultado velho para servir → 503 + Retry-After."""
+
+    def __init__(self, retry_after: int = RETRY_AFTER_SECONDS):
+        super().__init__("Banco de dados indisponível no momento, tente novamente em instantes.")
+        self.retry_after = retry_after
+
+
+def is_db_failure(err: BaseException) -> bool:
+    """Falhas que contam para o disjuntor (e liberam o resultado velho)."""
+    return isinstance(err, (DBAPIError, PoolTimeoutError, QueryTimeoutError))
+
+
+# ============================================================
+# 🎯 ESCOPO DA CONSULTA (por requisição)
+# ============================================================
+
+class QueryScope:
+    """
+    Guarda o timeout da requisição e as conexões DBAPI em uso, para que
+    a corrotina da rota consiga cancelar a consulta no Postgres.
+    """
+
+    def __init__(self, timeout_ms: int):
+        self.timeout_ms = timeout_ms
+        self.cancelled = False
+        self._conns: list = []
+        self._lock = threading.Lock()
+
+    def register(self, dbapi_conn) -> None:
+        with self._lock:
+            self._conns.append(dbapi_conn)
+            cancelled = self.cancelled
+        if cancelled:
+            self._cancel_conn(dbapi_conn)
+
+    def unregister(self, dbapi_conn) -> None:
+        with self._lock:
+            if dbapi_conn in self._conns:
+                self._conns.remove(dbapi_conn)
+
+    def cancel(self) -> None:
+        """Envia cancel request ao Postgres para as consultas em andamento."""
+        with self._lock:
+            self.cancelled = True
+            conns = list(self._conns)
+        for c in conns:
+            self._cancel_conn(c)
+
+    @staticmethod
+    def _cancel_conn(dbapi_conn) -> None:
+        try:
+            dbapi_conn.cancel()  # psycopg2: thread-safe, usa conexão própria
+        except Exception:
+            pass
+
+
+_current_scope: ContextVar[Optional[QueryScope]] = ContextVar("query_scope", default=None)
+
+
+def current_scope() -> Optional[QueryScope]:
+    return _current_scope.get()
+
+
+@contextmanager
+def apply_scope(conn):
+    """
+    Aplica o escopo atual a uma conexão SQLAlchemy já aberta:
+    - SET LOCAL statement_timeout (vale só para a transação implícita)
+    - registra a conexão DBAPI para cancelamento
+    Sem escopo ativo (jobs, CLI), não faz nada.
+    """
+    scope = current_scope()
+    if scope is None:
+        yield conn
+        return
+    conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(scope.timeout_ms)}")
+    dbapi_conn = conn.connection.dbapi_connection
+    scope.register(dbapi_conn)
+    try:
+        yield conn
+    finally:
+        scope.unregister(dbapi_conn)
+
+
+def is_query_canceled(err: BaseException) -> bool:
+    """True se o erro do driver é query_canceled (timeout ou cancelamento)."""
+    orig = getattr(err, "orig", err)
+    return getattr(orig, "pgcode", None) == PG_QUERY_CANCELED
+
+
+def raise_if_canceled(err: BaseException) -> None:
+    """Converte query_canceled em exceções próprias (fora do fallback tolerante)."""
+    if not is_query_canceled(err):
+        return
+    scope = current_scope()
+    if scope is not None and scope.cancelled:
+        raise ClientDisconnectedError() from err
+    raise QueryTimeoutError("Consulta excedeu o tempo limite.") from err
+
+
+# ============================================================
+# 🚦 LIMITADOR DE CONCORRÊNCIA (por worker)
+# ============================================================
+
+class AdmissionLimiter:
+    """
+    Semáforos assíncronos: um global e um para endpoints pesados.
+    Quem não consegue vaga em ADMISSION_WAIT_SECONDS recebe OverloadedError.
+    """
+
+    def __init__(self, max_total: int, max_heavy: int):
+        self.max_total = max_total
+        self.max_heavy = max_heavy
+        self._total: Optional[asyncio.Semaphore] = None
+        self._heavy: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.rejected = 0
+
+    def _semaphores(self):
+        # Criados sob demanda, já dentro do event loop do worker
+        if self._total is None:
+            self._total = asyncio.Semaphore(self.max_total)
+            self._heavy = asyncio.Semaphore(self.max_heavy)
+        return self._total, self._heavy
+
+    @staticmethod
+    async def _acquire(sem: asyncio.Semaphore) -> bool:
+        try:
+            await asyncio.wait_for(sem.acquire(), timeout=ADMISSION_WAIT_SECONDS)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    @asynccontextmanager
+    async def slot(self, heavy: bool = False):
+        total, heavy_sem = self._semaphores()
+        if heavy and not await self._acquire(heavy_sem):
+            self.rejected += 1
+            raise OverloadedError()
+        try:
+            if not await self._acquire(total):
+                self.rejected += 1
+                raise OverloadedError()
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+                total.release()
+        finally:
+            if heavy:
+                heavy_sem.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrent": self.max_total,
+            "max_heavy": self.max_heavy,
+            "rejected": self.rejected,
+        }
+
+
+limiter = AdmissionLimiter(MAX_CONCURRENT_QUERIES, MAX_HEAVY_QUERIES)
+
+breaker = CircuitBreaker(
+    window_seconds=BREAKER_WINDOW_SECONDS,
+    min_calls=BREAKER_MIN_CALLS,
+    failure_rate=BREAKER_FAILURE_RATE,
+    slow_rate=BREAKER_SLOW_RATE,
+    slow_seconds=BREAKER_SLOW_MS / 1000,
+    open_seconds=BREAKER_OPEN_SECONDS,
+)
+
+# (endpoint, argumentos) → (time.time() do cálculo, resultado)
+last_good = TTLCache(maxsize=STALE_MAX_ENTRIES, ttl=STALE_MAX_AGE_SECONDS)
+
+
+# ============================================================
+# 🔥 EXECUÇÃO DE MÉTRICAS A PARTIR DAS ROTAS
+# ============================================================
+
+def timeout_for(endpoint: str) -> int:
+    return STATEMENT_TIMEOUTS_MS.get(endpoint, STATEMENT_TIMEOUTS_MS["default"])
+
+
+def slow_seconds_for(endpoint: str) -> float:
+    """Limite de "chamada lenta" do endpoint para o disjuntor."""
+    return max(BREAKER_SLOW_MS, timeout_for(endpoint) * BREAKER_SLOW_FRACTION) / 1000
+
+
+def _run_in_scope(scope: QueryScope, fn: Callable[..., Any], args, kwargs) -> Any:
+    token = _current_scope.set(scope)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _current_scope.reset(token)
+
+
+async def _execute(scope: QueryScope, endpoint: str, fn: Callable[..., Any], args, kwargs) -> Any:
+    """Execução real: ocupa uma vaga do limitador, roda em threadpool e alimenta o disjuntor."""
+    async with limiter.slot(heavy=endpoint in HEAVY_ENDPOINTS):
+        started = time.monotonic()
+        try:
+            result = await run_in_threadpool(_run_in_scope, scope, fn, args, kwargs)
+        except Exception as e:
+            if is_db_failure(e) and not scope.cancelled:
+                breaker.record(False, time.monotonic() - started, slow_seconds_for(endpoint))
+            raise
+        breaker.record(True, time.monotonic() - started, slow_seconds_for(endpoint))
+        return result
+
+
+def _stale_key(endpoint: str, args, kwargs) -> Optional[Any]:
+    try:
+        key = make_key(endpoint, args, kwargs)
+        hash(key)
+        return key
+    except TypeError:
+        return None
+
+
+def _serve_stale(request: Request, cached) -> Any:
+    """Devolve o último resultado bom e marca a idade (middleware → X-Data-Staleness)."""
+    computed_at, result = cached
+    request.state.data_staleness = max(0, int(time.time() - computed_at))
+    return result
+
+
+async def run_query(request: Request, endpoint: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Executa uma função síncrona do service em threadpool com:
+    - vaga no limitador (503 se lotado)
+    - statement_timeout do endpoint
+    - coalescência (single-flight) se a função for decorada com @coalesce:
+      requisições idênticas simultâneas aguardam a mesma execução
+    - cancelamento no Postgres quando TODOS os clientes interessados desconectam
+    - circuit breaker + stale-while-revalidate: com o disjuntor aberto, falha
+      de banco ou execução mais lenta que STALE_AFTER_FRACTION do timeout,
+      serve o último resultado bom (a execução segue e atualiza o cache)
+    """
+    timeout_ms = timeout_for(endpoint)
+    flight = getattr(fn, "flight", None)
+    if flight is not None:
+        key = fn.flight_key(*args, **kwargs)
+        target = fn.__wrapped__  # evita contar duas vezes no caminho síncrono
+    else:
+        flight, key, target = SingleFlight(), endpoint, fn
+
+    stale_key = _stale_key(endpoint, args, kwargs)
+    cached = last_good.get(stale_key) if stale_key is not None else None
+    if BREAKER_ENABLED and not breaker.allow():
+        if cached is not None:
+            return _serve_stale(request, cached)
+        raise CircuitOpenError(breaker.retry_after())
+
+    detached = False  # True quando a resposta já saiu com o resultado velho
+
+    async def disconnected() -> bool:
+        return not detached and await request.is_disconnected()
+
+    def start():
+        scope = QueryScope(timeout_ms)
+        return scope, _execute(scope, endpoint, target, args, kwargs)
+
+    async def fetch():
+        result = await flight.do_async(
+            key,
+            start,
+            on_abandon=lambda scope: scope.cancel(),
+            until=disconnected,
+            poll_seconds=DISCONNECT_POLL_SECONDS,
+        )
+        if stale_key is not None:
+            last_good.set(stale_key, (time.time(), result))
+        return result
+
+    task = asyncio.ensure_future(fetch())
+    try:
+        if cached is not None:
+            done, _ = await asyncio.wait({task}, timeout=timeout_ms / 1000 * STALE_AFTER_FRACTION)
+            if not done:
+                detached = True
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())  # revalidação em background
+                return _serve_stale(request, cached)
+        return await task
+    except Abandoned:
+        raise ClientDisconnectedError()
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    except Exception as e:
+        if cached is not None and is_db_failure(e):
+            return _serve_stale(request, cached)
+        raise
+
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Limites são POR WORKER (uvicorn --workers N → N × MAX_CONCURRENT_QUERIES).
+# - SET LOCAL só vale dentro da transação implícita aberta pelo SQLAlchemy
+#   em conn.execute(); ao fechar a conexão, o valor volta ao padrão do pool.
+# - Jobs e scripts (sem escopo) não recebem timeout nem passam pelo limitador.
+# - Requisições coalescidas não ocupam vaga: só a execução compartilhada ocupa.
+# - Resultado velho: o cache last_good guarda o último sucesso por endpoint +
+#   argumentos (até STALE_MAX_AGE_SECONDS); sem ele, disjuntor aberto → 503
+#   e falha de banco → erro normal (500/504).
+# - O disjuntor é um só para o banco, mas "lenta" depende do endpoint
+#   (slow_seconds_for): pesados demorando o esperado não abrem o disjuntor
+#   para as métricas leves; só contam quando passam da metade do timeout.
+# ============================================================
@@ -0,0 +1,92 @@
+# ============================================================
+# 🚥 ESTADO DE PRONTIDÃO (READINESS) DA API
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Registro simples dos passos de inicialização executados
+#            em segundo plano pelo lifespan (banco, DDL opcional,
+#            aquecimento de cache). Consumido pelo endpoint /ready.
+# ============================================================
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Status possíveis de cada componente
+PENDING = "pending"
+OK = "ok"
+ERROR = "error"
+SKIPPED = "skipped"
+
+
+class Readiness:
+    """
+    🚥 Componentes de inicialização e seus status.
+    - required=True → o componente precisa estar "ok" para /ready responder 200
+    - required=False → apenas informativo (ex.: aquecimento de cache)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._components: Dict[str, Dict[str, Any]] = {}
+        self.started_at = time.time()
+
+    def register(self, name: str, required: bool = True) -> None:
+        with self._lock:
+            self._components[name] = {
+                "status": PENDING,
+                "required": required,
+                "detail": None,
+                "ms": None,
+            }
+
+    def mark(self, name: str, status: str, detail: Optional[str] = None, ms: Optional[float] = None) -> None:
+        with self._lock:
+            comp = self._components.setdefault(name, {"required": False})
+            comp.update(status=status, detail=detail, ms=round(ms, 1) if ms is not None else None)
+
+    def status(self, name: str) -> Optional[str]:
+        with self._lock:
+            comp = self._components.get(name)
+            return comp.get("status") if comp else None
+
+    def is_ready(self) -> bool:
+        with self._lock:
+            return all(
+                c["status"] in (OK, SKIPPED)
+                for c in self._components.values()
+                if c.get("required")
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            comps = {k: dict(v) for k, v in self._components.items()}
+        return {
+            "ready": self.is_ready(),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "components": comps,
+        }
+
+
+readiness = Readiness()
+
+
+def run_step(name: str, fn, *args, **kwargs) -> bool:
+    """Executa um passo de inicialização registrando status e duração."""
+    started = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        readiness.mark(name, ERROR, detail=str(e)[:300], ms=(time.perf_counter() - started) * 1000)
+        return False
+    status = SKIPPED if result is None else (OK if result else ERROR)
+    readiness.mark(name, status, ms=(time.perf_counter() - started) * 1000)
+    return status != ERROR
+
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - O passo retorna True/False (ok/erro) ou None quando foi desativado
+#   por configuração (skipped).
+# ============================================================
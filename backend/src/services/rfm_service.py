@@ -0,0 +1,356 @@
+# ============================================================
+# 🎯 SERVICE DE SEGMENTAÇÃO RFM (RECÊNCIA / FREQUÊNCIA / VALOR)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Segmentos de clientes para o marketing, em job noturno:
+#            1) agregados por cliente (1ª/última compra, pedidos, receita)
+#               somados em customer_segments por faixas de id de sales — só
+#               as vendas novas desde a última execução
+#            2) cortes de quintil (percentile_disc no banco) e notas R/F/M
+#               de 1 a 5 calculadas em lotes de clientes com numpy
+#            3) só as linhas cujo segmento mudou são regravadas (COPY →
+#               tabela temporária → UPDATE ... FROM)
+#            Memória limitada ao lote (RFM_CHUNK clientes), qualquer que
+#            seja o nº de clientes.
+# Uso (a partir de backend/):
+#   python -m src.services.rfm_service            # incremental (cron noturno)
+#   python -m src.services.rfm_service --rebuild  # recalcula tudo
+# ============================================================
+
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import text
+from src.database.session import engine, read_connection
+from src.services.calendar_service import SALES_CLOCK_TIMEZONE
+from src.services.query_control import apply_scope
+from src.utils.pg_copy import copy_from_frame, copy_to_frame
+from src.utils.ttl_cache import TTLCache
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+RFM_SALES_BATCH = int(os.getenv("RFM_SALES_BATCH", "500000"))   # ids de sales por transação (agregados)
+RFM_CHUNK = int(os.getenv("RFM_CHUNK", "200000"))               # clientes por lote (notas)
+CHECKPOINT_NAME = "rfm"
+RFM_LOCK_ID = 40003
+QUANTILES = (0.2, 0.4, 0.6, 0.8)
+
+# Ordem importa: a primeira regra que casa define o segmento
+SEGMENTS = (
+    "campeoes",          # compraram há pouco, muito e gastaram muito
+    "leais",             # compram com frequência
+    "novos",             # primeira compra recente
+    "promissores",       # recentes, ainda pouca frequência
+    "em_risco",          # eram frequentes, sumiram
+    "hibernando",        # pouco recentes e pouco frequentes
+    "precisam_atencao",  # o resto (meio da distribuição)
+)
+
+_summary_cache = TTLCache(maxsize=4, ttl=600.0)
+
+SCORE_SQL = """
+    SELECT customer_id,
+           EXTRACT(EPOCH FROM last_purchase)::float8 AS last_epoch,
+           orders, revenue::float8 AS revenue,
+           r_score, f_score, m_score, segment
+    FROM customer_segments
+    WHERE customer_id > %(after)s
+    ORDER BY customer_id
+    LIMIT %(n)s
+"""
+SCORE_DTYPE = {
+    "customer_id": "int64", "last_epoch": "float64", "orders": "int64", "revenue": "float64",
+    "r_score": "Int64", "f_score": "Int64", "m_score": "Int64", "segment": "string",
+}
+
+
+def _clock_now() -> datetime:
+    """Agora no relógio de sales.created_at (TIMESTAMP sem fuso)."""
+    return datetime.now(ZoneInfo(SALES_CLOCK_TIMEZONE)).replace(tzinfo=None)
+
+
+# ============================================================
+# 🧮 NOTAS E SEGMENTOS (vetorizado)
+# ============================================================
+
+def score(values, cuts):
+    """
+    Nota 1–5: 1 + nº de cortes de quintil estritamente abaixo do valor.
+    Empates no corte ficam na nota de baixo (ex.: a massa de clientes com
+    1 pedido recebe F=1, não uma nota inflada pelo empate).
+    """
+    import numpy as np
+
+    return np.searchsorted(np.asarray(cuts, dtype=np.float64), values, side="left") + 1
+
+
+def segment_of(r, f, m):
+    """Arrays de notas → array de nomes de segmento (regras de SEGMENTS)."""
+    import numpy as np
+
+    conditions = [
+        (r >= 4) & (f >= 4) & (m >= 4),
+        (r >= 3) & (f >= 4),
+        (r >= 5) & (f <= 1),
+        (r >= 4) & (f <= 3),
+        (r <= 2) & (f >= 3),
+        (r <= 2) & (f <= 2),
+    ]
+    return np.select(conditions, list(SEGMENTS[:-1]), default=SEGMENTS[-1])
+
+
+def score_frame(frame, cuts: Dict[str, List[float]]):
+    """Acrescenta r/f/m_score, rfm_code e segment a um lote (customer_id, last_epoch, orders, revenue)."""
+    r = score(frame["last_epoch"].to_numpy(), cuts["recency"])   # mais recente → nota maior
+    f = score(frame["orders"].to_numpy(), cuts["frequency"])
+    m = score(frame["revenue"].to_numpy(), cuts["monetary"])
+    out = frame.copy()
+    out["new_r"], out["new_f"], out["new_m"] = r, f, m
+    out["new_segment"] = segment_of(r, f, m)
+    out["rfm_code"] = (r * 100 + f * 10 + m).astype(str)
+    return out
+
+
+# ============================================================
+# 💾 CHECKPOINT
+# ============================================================
+
+def _load_checkpoint(conn) -> Dict[str, Any]:
+    raw = conn.execute(
+        text("SELECT checkpoint FROM job_checkpoints WHERE name = :name"), {"name": CHECKPOINT_NAME}
+    ).scalar()
+    return json.loads(raw) if raw else {"last_sale_id": 0}
+
+
+def _save_checkpoint(conn, checkpoint: Dict[str, Any]) -> None:
+    conn.execute(text("""
+        INSERT INTO job_checkpoints (name, checkpoint, updated_at)
+        VALUES (:name, :checkpoint, NOW())
+        ON CONFLICT (name) DO UPDATE SET checkpoint = EXCLUDED.checkpoint, updated_at = NOW()
+    """), {"name": CHECKPOINT_NAME, "checkpoint": json.dumps(checkpoint)})
+
+
+# ============================================================
+# 1) AGREGADOS INCREMENTAIS (sales novas → customer_segments)
+# ============================================================
+
+MERGE_AGGREGATES_SQL = """
+    INSERT INTO customer_segments (customer_id, first_purchase, last_purchase, orders, revenue, updated_at)
+    SELECT s.customer_id, MIN(s.created_at), MAX(s.created_at), COUNT(*), COALESCE(SUM(s.total_amount), 0), NOW()
+    FROM sales s
+    WHERE s.id > :lo AND s.id <= :hi AND s.customer_id IS NOT NULL
+    GROUP BY s.customer_id
+    ON CONFLICT (customer_id) DO UPDATE SET
+        first_purchase = LEAST(customer_segments.first_purchase, EXCLUDED.first_purchase),
+        last_purchase = GREATEST(customer_segments.last_purchase, EXCLUDED.last_purchase),
+        orders = customer_segments.orders + EXCLUDED.orders,
+        revenue = customer_segments.revenue + EXCLUDED.revenue,
+        updated_at = NOW()
+"""
+
+
+def absorb_new_sales(batch: int = RFM_SALES_BATCH) -> Dict[str, int]:
+    """Soma as vendas com id > checkpoint, uma transação por faixa de ids."""
+    with engine.connect() as conn:
+        checkpoint = _load_checkpoint(conn)
+        max_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM sales")).scalar()
+    last = int(checkpoint.get("last_sale_id", 0))
+    customers = 0
+    for lo in range(last, max_id, batch):
+        hi = min(lo + batch, max_id)
+        with engine.begin() as conn:
+            customers += conn.execute(text(MERGE_AGGREGATES_SQL), {"lo": lo, "hi": hi}).rowcount
+            checkpoint["last_sale_id"] = hi
+            _save_checkpoint(conn, checkpoint)
+    return {"sales_from": last, "sales_to": max(max_id, last), "customers_touched": customers}
+
+
+# ============================================================
+# 2) + 3) NOTAS EM LOTES → COPY só do que mudou
+# ============================================================
+
+def quintile_cuts(conn) -> Dict[str, List[float]]:
+    q = "ARRAY[" + ", ".join(str(x) for x in QUANTILES) + "]"
+    row = conn.execute(text(f"""
+        SELECT
+            percentile_disc({q}) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM last_purchase)),
+            percentile_disc({q}) WITHIN GROUP (ORDER BY orders),
+            percentile_disc({q}) WITHIN GROUP (ORDER BY revenue)
+        FROM customer_segments
+    """)).one()
+    return {
+        name: [float(v) for v in (values or [])]
+        for name, values in zip(("recency", "frequency", "monetary"), row)
+    }
+
+
+def rescore(chunk: int = RFM_CHUNK) -> Dict[str, int]:
+    """Recalcula as notas de todos os clientes; grava só as linhas alteradas."""
+    scored_at = _clock_now()
+    with engine.connect() as conn:
+        cuts = quintile_cuts(conn)
+    if not cuts["recency"]:
+        return {"customers": 0, "changed": 0}
+
+    after, seen, changed = 0, 0, 0
+    while True:
+        with engine.begin() as conn:
+            frame = copy_to_frame(conn, SCORE_SQL, {"after": after, "n": chunk}, dtype=SCORE_DTYPE)
+            if frame.empty:
+                break
+            scored = score_frame(frame, cuts)
+            # Sem nota ainda (cliente novo) → 0, sempre diferente
+            old = scored[["r_score", "f_score", "m_score"]].fillna(0).to_numpy(dtype="int64")
+            new = scored[["new_r", "new_f", "new_m"]].to_numpy(dtype="int64")
+            diff = (old != new).any(axis=1) | (
+                scored["segment"].fillna("").to_numpy(dtype=object) != scored["new_segment"].to_numpy(dtype=object)
+            )
+            out = scored.loc[diff, ["customer_id", "new_r", "new_f", "new_m", "rfm_code", "new_segment"]]
+            out.columns = ["customer_id", "r_score", "f_score", "m_score", "rfm_code", "segment"]
+            if not out.empty:
+                conn.execute(text("""
+                    CREATE TEMP TABLE rfm_scores_stage (
+                        customer_id INTEGER, r_score SMALLINT, f_score SMALLINT, m_score SMALLINT,
+                        rfm_code CHAR(3), segment VARCHAR(20)
+                    ) ON COMMIT DROP
+                """))
+                copy_from_frame(conn, "rfm_scores_stage", out)
+                conn.execute(text("""
+                    UPDATE customer_segments cs
+                    SET r_score = st.r_score, f_score = st.f_score, m_score = st.m_score,
+                        rfm_code = st.rfm_code, segment = st.segment, scored_at = :scored_at
+                    FROM rfm_scores_stage st
+                    WHERE cs.customer_id = st.customer_id
+                """), {"scored_at": scored_at})
+        seen += len(frame)
+        changed += len(out)
+        after = int(frame["customer_id"].iloc[-1])
+
+    with engine.begin() as conn:
+        checkpoint = _load_checkpoint(conn)
+        checkpoint.update(scored_at=scored_at.isoformat(), cuts=cuts, customers=seen)
+        _save_checkpoint(conn, checkpoint)
+    return {"customers": seen, "changed": changed}
+
+
+def refresh_segments(rebuild: bool = False) -> Dict[str, Any]:
+    """Job completo (agregados incrementais + notas). Um por vez (advisory lock)."""
+    started = time.perf_counter()
+    with engine.connect() as lock_conn:
+        got = lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": RFM_LOCK_ID}).scalar()
+        lock_conn.commit()  # lock de sessão: não segura transação aberta
+        if not got:
+            return {"skipped": "outro job RFM em andamento"}
+        try:
+            if rebuild:
+                with engine.begin() as conn:
+                    conn.execute(text("TRUNCATE customer_segments"))
+                    conn.execute(text("DELETE FROM job_checkpoints WHERE name = :name"), {"name": CHECKPOINT_NAME})
+            report: Dict[str, Any] = {"aggregates": absorb_new_sales(), "scores": rescore()}
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": RFM_LOCK_ID})
+            lock_conn.commit()
+    _summary_cache.clear()
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+# ============================================================
+# 🔥 ENTRADA DO SERVICE (endpoint)
+# ============================================================
+
+def segment_summary(**kwargs: Any) -> Dict[str, Any]:
+    """
+    Tamanho e participação na receita de cada segmento (última execução do job),
+    mais os cortes de quintil usados nas notas.
+    """
+    with read_connection() as conn, apply_scope(conn):
+        checkpoint = _load_checkpoint(conn)
+        version = checkpoint.get("scored_at")
+        cached = _summary_cache.get(version)
+        if cached is not None:
+            return cached
+        rows = conn.execute(text("""
+            SELECT segment,
+                   COUNT(*) AS customers,
+                   COALESCE(SUM(revenue), 0) AS revenue,
+                   AVG(orders) AS avg_orders,
+                   AVG(revenue) AS avg_revenue,
+                   AVG(EXTRACT(EPOCH FROM (:as_of - last_purchase)) / 86400.0) AS avg_recency_days
+            FROM customer_segments
+            WHERE segment IS NOT NULL
+            GROUP BY segment
+        """), {"as_of": _clock_now()}).all()
+        total_customers = conn.execute(text("SELECT COUNT(*) FROM customers")).scalar() or 0
+
+    scored = sum(r[1] for r in rows)
+    revenue = float(sum(r[2] for r in rows))
+    by_name = {r[0]: r for r in rows}
+    data = []
+    for name in SEGMENTS:
+        r = by_name.get(name)
+        n, rev = (r[1], float(r[2])) if r else (0, 0.0)
+        data.append({
+            "segment": name,
+            "customers": n,
+            "customer_share": round(n / scored, 4) if scored else 0.0,
+            "revenue": round(rev, 2),
+            "revenue_share": round(rev / revenue, 4) if revenue else 0.0,
+            "avg_orders": round(float(r[3]), 2) if r else 0.0,
+            "avg_revenue": round(float(r[4]), 2) if r else 0.0,
+            "avg_recency_days": round(float(r[5]), 1) if r else 0.0,
+        })
+    result = {
+        "scored_at": version,
+        "customers_scored": scored,
+        "customers_without_sales": max(total_customers - scored, 0),
+        "cuts": checkpoint.get("cuts"),
+        "data": data,
+    }
+    _summary_cache.set(version, result)
+    return result
+
+
+# ============================================================
+# 🚀 CLI (cron noturno)
+# ============================================================
+
+def main():
+    from argparse import ArgumentParser
+
+    ap = ArgumentParser(description="Atualiza os segmentos RFM (customer_segments)")
+    ap.add_argument("--rebuild", action="store_true", help="Apaga e recalcula a partir de todo o histórico")
+    args = ap.parse_args()
+
+    report = refresh_segments(rebuild=args.rebuild)
+    if "skipped" in report:
+        print(f"⏭️ {report['skipped']}")
+        return
+    agg, sc = report["aggregates"], report["scores"]
+    print(f"✅ Agregados: vendas {agg['sales_from']}→{agg['sales_to']}, {agg['customers_touched']} clientes")
+    print(f"✅ Notas: {sc['customers']} clientes, {sc['changed']} mudaram de segmento/nota")
+    print(f"⏱️ {report['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Só vendas com customer_id entram; clientes sem compra aparecem apenas em
+#   customers_without_sales.
+# - Incremental por sales.id: alterações/cancelamentos de vendas antigas não
+#   são revistas — rode --rebuild periodicamente (ex.: mensal).
+# - Os agregados ficam em customer_segments: vendas movidas para o arquivo
+#   frio (archive_service) continuam contando.
+# - Recência muda todo dia para todos; a regravação é só de quem mudou de
+#   nota/segmento (a leitura dos lotes é sequencial pela PK).
+# - M = receita total do cliente no histórico.
+# ============================================================
@@ -0,0 +1,316 @@
+# ============================================================
+# 🧾 SERVICE DE LISTAGEM DE VENDAS (DRILL-DOWN)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Lista as vendas por trás de um card do dashboard.
+#            - paginação keyset em (created_at, id) — sem OFFSET: a página
+#              10.000 custa o mesmo que a primeira (mesmo índice, mesmo range)
+#            - cursores opacos (base64 de created_at + id)
+#            - total ESTIMADO pelo planner (EXPLAIN), nunca COUNT(*)
+#            - detalhe completo (itens, complementos, pagamentos, entrega,
+#              cupons) montado em JSON pelo próprio Postgres numa consulta
+# ============================================================
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from src.database.session import read_connection
+from src.services import archive_service, calendar_service, dimension_cache
+from src.services.query_control import apply_scope, raise_if_canceled
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_DETAIL_IDS = 100
+CURSOR_VERSION = 1
+
+# Projeção enxuta (o detalhe completo da venda sai de sale_document)
+SALE_COLUMNS = """
+    s.id, s.created_at, s.store_id, s.channel_id, s.customer_id,
+    s.sale_status_desc, s.total_amount, s.production_seconds, s.delivery_seconds
+"""
+
+
+# ============================================================
+# 🔖 CURSORES OPACOS
+# ============================================================
+
+def encode_cursor(created_at: datetime, sale_id: int) -> str:
+    raw = json.dumps([CURSOR_VERSION, created_at.isoformat(), sale_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Cursor inválido/adulterado → ValueError (a rota devolve 400)."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        version, created_at, sale_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if version != CURSOR_VERSION:
+            raise ValueError
+        return datetime.fromisoformat(created_at), int(sale_id)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("cursor inválido") from None
+
+
+# ============================================================
+# 🧩 FILTROS
+# ============================================================
+
+def _filters(
+    date_from: Optional[str],
+    date_to: Optional[str],
+    store_id: Optional[int],
+    channel: Optional[str],
+    status: Optional[str],
+) -> Tuple[List[str], Dict[str, Any]]:
+    # Mesma janela dos cards (KPIs/batch/pivô): dias locais em date_key com fim
+    # exclusivo; created_at só quando as datas têm hora
+    conds, params = calendar_service.window_conds(date_from, date_to)
+    if store_id is not None:
+        conds.append("s.store_id = :store_id")
+        params["store_id"] = store_id
+    if channel:
+        conds.append("s.channel_id = ANY(:channel_ids)")
+        params["channel_ids"] = dimension_cache.channel_ids(channel)
+    if status:
+        conds.append("s.sale_status_desc = :status")
+        params["status"] = status
+    return conds, params
+
+
+def _estimate_rows(conn, where: str, params: Dict[str, Any]) -> Optional[int]:
+    """Linhas estimadas pelo planner (estatísticas do ANALYZE) para os filtros."""
+    plan = conn.execute(
+        text(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM sales s WHERE {where}"), params
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    try:
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+# ============================================================
+# 🔥 ENTRADA DO SERVICE
+# ============================================================
+
+def list_sales(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    store_id: Optional[int] = None,
+    channel: Optional[str] = None,
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    estimate: bool = False,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """
+    Uma página de vendas (mais recentes primeiro).
+    Resposta: {"data": [...], "next_cursor": str | None, "estimated_total": int | None}
+    (+ archived_until / archive_excluded quando a janela alcança meses arquivados:
+    a listagem só percorre o banco)
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    conds, params = _filters(date_from, date_to, store_id, channel, status)
+    base_where = " AND ".join(conds) or "TRUE"
+
+    page_conds = list(conds)
+    if cursor:
+        params["c_created_at"], params["c_id"] = decode_cursor(cursor)
+        # Comparação de linha: usa o índice (created_at, id) e começa logo após o cursor
+        page_conds.append("(s.created_at, s.id) < (:c_created_at, :c_id)")
+    params["limit"] = limit + 1  # +1 para saber se existe próxima página
+
+    sql = f"""
+        SELECT {SALE_COLUMNS}
+        FROM sales s
+        WHERE {" AND ".join(page_conds) or "TRUE"}
+        ORDER BY s.created_at DESC, s.id DESC
+        LIMIT :limit
+    """
+    with read_connection() as conn, apply_scope(conn):
+        try:
+            rows = conn.execute(text(sql), params).mappings().all()
+            estimated = _estimate_rows(conn, base_where, params) if estimate else None
+        except DBAPIError as e:
+            raise_if_canceled(e)
+            raise
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    data = [
+        {
+            **dict(r),
+            "created_at": r["created_at"].isoformat() if r["created_at"] else None,
+            "total_amount": float(r["total_amount"]) if r["total_amount"] is not None else None,
+        }
+        for r in rows
+    ]
+    next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if has_more else None
+    return {
+        "data": data,
+        "next_cursor": next_cursor,
+        "estimated_total": estimated,
+        **archive_service.archive_note(date_from, date_to),
+    }
+
+
+# ============================================================
+# 📄 DETALHE DA VENDA (documento JSON montado no Postgres)
+# ============================================================
+# Cada nível é uma subconsulta correlacionada com json_agg (índices por
+# sale_id / id do pai) → uma ida ao banco no lugar do N+1 por tabela filha.
+# O resultado sai como TEXT: o Python repassa os bytes sem desserializar.
+
+def _obj(alias: str, cols: Tuple[str, ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = [f"'{c}', {alias}.{c}" for c in cols] + [f"'{k}', {expr}" for k, expr in extra]
+    return f"json_build_object({', '.join(pairs)})"
+
+
+def _children(table: str, alias: str, fk: str, parent: str, cols: Tuple[str, ...],
+              extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    return (
+        f"COALESCE((SELECT json_agg({_obj(alias, cols, extra)} ORDER BY {alias}.id) "
+        f"FROM {table} {alias} WHERE {alias}.{fk} = {parent}), '[]'::json)"
+    )
+
+
+def _name(table: str, key: str, col: str = "name") -> str:
+    return f"(SELECT {col} FROM {table} WHERE id = {key})"
+
+
+_CUSTOMIZATIONS = _children(
+    "item_item_product_sales", "iips", "item_product_sale_id", "ips.id",
+    ("id", "item_id", "option_group_id", "quantity", "additional_price", "price", "amount"),
+    (("item_name", _name("items", "iips.item_id")),),
+)
+_ITEMS = _children(
+    "item_product_sales", "ips", "product_sale_id", "ps.id",
+    ("id", "item_id", "option_group_id", "quantity", "additional_price", "price", "amount", "observations"),
+    (("item_name", _name("items", "ips.item_id")), ("customizations", _CUSTOMIZATIONS)),
+)
+_PRODUCTS = _children(
+    "product_sales", "ps", "sale_id", "s.id",
+    ("id", "product_id", "quantity", "base_price", "total_price", "observations"),
+    (("product_name", _name("products", "ps.product_id")), ("items", _ITEMS)),
+)
+_PAYMENTS = _children(
+    "payments", "pm", "sale_id", "s.id",
+    ("id", "payment_type_id", "value", "is_online", "description", "currency"),
+    (("payment_type", _name("payment_types", "pm.payment_type_id", "description")),),
+)
+_DELIVERIES = _children(
+    "delivery_sales", "ds", "sale_id", "s.id",
+    ("id", "courier_id", "courier_name", "courier_phone", "courier_type", "delivered_by",
+     "delivery_type", "status", "delivery_fee", "courier_fee", "timing", "mode"),
+)
+_ADDRESSES = _children(
+    "delivery_addresses", "da", "sale_id", "s.id",
+    ("id", "delivery_sale_id", "street", "number", "complement", "formatted_address", "neighborhood",
+     "city", "state", "country", "postal_code", "reference", "latitude", "longitude"),
+)
+_COUPONS = _children(
+    "coupon_sales", "cs", "sale_id", "s.id",
+    ("id", "coupon_id", "value", "target", "sponsorship"),
+)
+SALE_DOCUMENT = _obj(
+    "s",
+    ("id", "created_at", "store_id", "sub_brand_id", "channel_id", "customer_id", "customer_name",
+     "cod_sale1", "cod_sale2", "sale_status_desc", "total_amount_items", "total_discount",
+     "total_increase", "delivery_fee", "service_tax_fee", "total_amount", "value_paid",
+     "production_seconds", "delivery_seconds", "people_quantity", "discount_reason",
+     "increase_reason", "origin"),
+    (
+        ("store_name", _name("stores", "s.store_id")),
+        ("channel_name", _name("channels", "s.channel_id")),
+        ("products", _PRODUCTS),
+        ("payments", _PAYMENTS),
+        ("deliveries", _DELIVERIES),
+        ("delivery_addresses", _ADDRESSES),
+        ("coupons", _COUPONS),
+    ),
+)
+
+
+def parse_ids(ids: Any) -> List[int]:
+    """'3,1,3' → [3, 1] (ordem do pedido, sem repetidos); inválido → ValueError."""
+    raw = ids.split(",") if isinstance(ids, str) else list(ids or [])
+    out: List[int] = []
+    for item in raw:
+        item = str(item).strip()
+        if not item:
+            continue
+        if not item.isdigit():
+            raise ValueError(f"id inválido: {item}")
+        if int(item) not in out:
+            out.append(int(item))
+    if not out:
+        raise ValueError("informe ao menos um id")
+    if len(out) > MAX_DETAIL_IDS:
+        raise ValueError(f"máximo de {MAX_DETAIL_IDS} ids por chamada")
+    return out
+
+
+def _fetch_json(sql: str, params: Dict[str, Any]) -> Optional[str]:
+    with read_connection() as conn, apply_scope(conn):
+        try:
+            return conn.execute(text(sql), params).scalar()
+        except DBAPIError as e:
+            raise_if_canceled(e)
+            raise
+
+
+def sale_document(sale_id: int, **kwargs: Any) -> Optional[str]:
+    """Documento JSON (texto) da venda com todas as tabelas filhas; None se não existir."""
+    return _fetch_json(
+        f"SELECT CAST({SALE_DOCUMENT} AS TEXT) FROM sales s WHERE s.id = :sale_id",
+        {"sale_id": sale_id},
+    )
+
+
+def sale_documents(ids: Any, **kwargs: Any) -> str:
+    """
+    Vários documentos numa consulta, na ordem dos ids pedidos.
+    Resposta (texto JSON): {"data": [...], "missing": [ids sem venda]}
+    """
+    sale_ids = parse_ids(ids)
+    return _fetch_json(f"""
+        SELECT CAST(json_build_object(
+            'data', COALESCE((
+                SELECT json_agg({SALE_DOCUMENT} ORDER BY u.ord)
+                FROM unnest(CAST(:ids AS INTEGER[])) WITH ORDINALITY AS u(id, ord)
+                JOIN sales s ON s.id = u.id
+            ), '[]'::json),
+            'missing', COALESCE((
+                SELECT json_agg(u.id ORDER BY u.ord)
+                FROM unnest(CAST(:ids AS INTEGER[])) WITH ORDINALITY AS u(id, ord)
+                WHERE NOT EXISTS (SELECT 1 FROM sales s WHERE s.id = u.id)
+            ), '[]'::json)
+        ) AS TEXT)
+    """, {"ids": sale_ids})
+
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Ordem estável: created_at DESC com desempate por id DESC (vendas no mesmo
+#   segundo não se repetem nem somem entre páginas).
+# - estimated_total vem das estatísticas do planner: ordem de grandeza para
+#   a UI ("~12 mil vendas"), não um número exato.
+# - Índice de apoio: idx_sales_created_at_id em data/schema_analytics.sql.
+# - Janela igual à dos cards (calendar_service.window_conds): o drill-down
+#   de date_from=2025-01-01&date_to=2025-02-01 lista exatamente as vendas que
+#   o card de janeiro contou.
+# - Detalhe: índices por chave do pai (idx_product_sales_sale etc.) no
+#   schema analítico; vendas já arquivadas (archive_service) não estão mais
+#   nas tabelas quentes e entram em "missing" / 404.
+# ============================================================
@@ -0,0 +1,262 @@
+# ============================================================
+# 📐 SERVICE DE SKETCHES DIÁRIOS (PERCENTIS E CLIENTES ÚNICOS)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Mantém a tabela daily_aggregates (uma linha por
+#            dia LOCAL (date_key) × loja × canal) com t-digests de production_seconds /
+#            delivery_seconds e HyperLogLog de customer_id, e responde
+#            percentis e contagens distintas mesclando os sketches.
+# ============================================================
+
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from src.database.session import engine, read_connection  # ✅ escrita no primário, leitura em réplica
+from src.services import dimension_cache
+from src.services.calendar_service import date_key, key_to_date
+from src.services.query_control import apply_scope, raise_if_canceled
+from src.utils.sketches import TDigest, HyperLogLog
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+QUANTILE_METRICS = {
+    "production_seconds": "production_digest",
+    "delivery_seconds": "delivery_digest",
+}
+GROUP_COLUMNS = {
+    "none": None,
+    "channel": "a.channel_id",
+    "store": "a.store_id",
+}
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+LOCK_KEY = 40_005  # pg_advisory_xact_lock: um recálculo por vez (ingestão × cron)
+
+
+# ============================================================
+# 🏗️ CONSTRUÇÃO DOS AGREGADOS DIÁRIOS
+# ============================================================
+
+def refresh_daily_aggregates(day_from: date, day_to: date) -> int:
+    """
+    Recalcula daily_aggregates para os dias [day_from, day_to] (inclusive).
+    - Uma única varredura ordenada das vendas da janela.
+    - Apaga e regrava os dias da faixa numa transação: (dia, loja, canal)
+      que deixou de ter vendas (venda removida / trocou de canal) some.
+    - Varredura e regravação rodam na MESMA transação, depois do advisory
+      lock: recálculos concorrentes (tarefas da ingestão, cron) entram em
+      fila em vez de colidir na PK ou gravar uma varredura mais antiga.
+    - Dias já arquivados (archive_service) ficam como estão: as vendas deles
+      não estão mais no banco e a reconstrução zeraria o dia.
+    Retorna a quantidade de linhas gravadas.
+    """
+    day_from = max(day_from, _first_hot_day())
+    if day_from > day_to:
+        return 0
+
+    # Dia local da venda (date_key): mesmos dias que KPIs e snapshot filtram
+    select_sql = text("""
+        SELECT s.date_key, s.store_id, s.channel_id,
+               s.total_amount, s.production_seconds, s.delivery_seconds, s.customer_id
+        FROM sales s
+        WHERE s.date_key >= :key_from AND s.date_key <= :key_to
+        ORDER BY 1, 2, 3
+    """)
+    delete_sql = text("DELETE FROM daily_aggregates WHERE day >= :day_from AND day <= :day_to")
+    insert_sql = text("""
+        INSERT INTO daily_aggregates (
+            day, store_id, channel_id, orders, revenue,
+            production_digest, delivery_digest, customers_hll, updated_at
+        )
+        VALUES (
+            :day, :store_id, :channel_id, :orders, :revenue,
+            :production_digest, :delivery_digest, :customers_hll, CURRENT_TIMESTAMP
+        )
+    """)
+
+    out: List[Dict[str, Any]] = []
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": LOCK_KEY})
+        res = conn.execution_options(stream_results=True).execute(
+            select_sql, {"key_from": date_key(day_from), "key_to": date_key(day_to)}
+        )
+        for key, group in groupby(res, key=lambda r: (r[0], r[1], r[2])):
+            production, delivery, customers = TDigest(), TDigest(), HyperLogLog()
+            orders, revenue = 0, 0.0
+            for _day, _store, _channel, amount, prod_s, deliv_s, customer_id in group:
+                orders += 1
+                revenue += float(amount or 0)
+                production.add(prod_s)
+                if deliv_s:  # vendas de balcão têm delivery_seconds = 0
+                    delivery.add(deliv_s)
+                customers.add(customer_id)
+            out.append({
+                "day": key_to_date(key[0]),
+                "store_id": key[1],
+                "channel_id": key[2],
+                "orders": orders,
+                "revenue": round(revenue, 2),
+                "production_digest": production.to_bytes(),
+                "delivery_digest": delivery.to_bytes(),
+                "customers_hll": customers.to_bytes(),
+            })
+
+        conn.execute(delete_sql, {"day_from": day_from, "day_to": day_to})
+        if out:
+            conn.execute(insert_sql, out)
+    return len(out)
+
+
+# ============================================================
+# 🔧 HELPERS INTERNOS
+# ============================================================
+
+def _first_hot_day() -> date:
+    """Primeiro dia depois da última venda arquivada (date.min sem arquivo)."""
+    from src.services import archive_service
+
+    archived_until = archive_service.status()["archived_until"]
+    if not archived_until:
+        return date.min
+    return datetime.fromisoformat(archived_until).date() + timedelta(days=1)
+
+
+def _load_sketch_rows(
+    column: str,
+    date_from: Optional[str],
+    date_to: Optional[str],
+    channel: Optional[str],
+    store_id: Optional[int],
+    group_by: str,
+) -> List[Dict[str, Any]]:
+    """Lê as linhas de daily_aggregates da janela: dias locais [date_from, date_to)."""
+    if group_by not in GROUP_COLUMNS:
+        raise ValueError(f"group_by inválido: {group_by}")
+    group_col = GROUP_COLUMNS[group_by] or "NULL"
+
+    sql = f"""
+        SELECT {group_col} AS grp, a.{column} AS sketch
+        FROM daily_aggregates a
+        WHERE a.{column} IS NOT NULL
+          AND (:date_from IS NULL OR a.day >= CAST(:date_from AS DATE))
+          AND (:date_to   IS NULL OR a.day <  CAST(:date_to AS DATE))
+          AND (CAST(:channel_ids AS INTEGER[]) IS NULL OR a.channel_id = ANY(CAST(:channel_ids AS INTEGER[])))
+          AND (:store_id  IS NULL OR a.store_id = :store_id)
+        ORDER BY 1
+    """
+    params = {
+        "date_from": date_from,
+        "date_to": date_to,
+        "channel_ids": dimension_cache.channel_ids(channel),
+        "store_id": store_id,
+    }
+    with read_connection() as conn, apply_scope(conn):
+        try:
+            res = conn.execute(text(sql), params)
+        except DBAPIError as e:
+            raise_if_canceled(e)
+            raise
+        return [{"group": r[0], "sketch": r[1]} for r in res.fetchall()]
+
+
+# ============================================================
+# 📊 FUNÇÕES DE MÉTRICAS
+# ============================================================
+
+def percentiles(
+    metric: str = "production_seconds",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    channel: Optional[str] = None,
+    store_id: Optional[int] = None,
+    quantiles: Sequence[float] = DEFAULT_QUANTILES,
+    group_by: str = "none",
+    **kwargs: Any
+) -> List[Dict[str, Any]]:
+    """
+    Percentis aproximados (t-digest) de production_seconds ou delivery_seconds.
+    - Mescla os digests diários da janela, opcionalmente por canal ou loja.
+    - delivery_seconds considera apenas vendas com entrega (> 0).
+    """
+    if metric not in QUANTILE_METRICS:
+        raise ValueError(f"Métrica inválida: {metric}")
+    rows = _load_sketch_rows(
+        QUANTILE_METRICS[metric], date_from, date_to, channel, store_id, group_by
+    )
+
+    out = []
+    for grp, items in groupby(rows, key=lambda r: r["group"]):
+        digest = TDigest()
+        for item in items:
+            digest.merge(TDigest.from_bytes(item["sketch"]))
+        entry: Dict[str, Any] = {"group": grp, "count": int(digest.count)}
+        for q in quantiles:
+            value = digest.quantile(q)
+            entry[f"p{round(q * 100, 1):g}"] = round(value, 1) if value is not None else None
+        out.append(entry)
+    return out
+
+
+def unique_customers(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    channel: Optional[str] = None,
+    store_id: Optional[int] = None,
+    group_by: str = "none",
+    **kwargs: Any
+) -> List[Dict[str, Any]]:
+    """
+    Clientes distintos (HyperLogLog) na janela, opcionalmente por canal/loja.
+    - Erro padrão relativo ≈ 1.6% (p=12), informado em "relative_error".
+    """
+    rows = _load_sketch_rows("customers_hll", date_from, date_to, channel, store_id, group_by)
+
+    out = []
+    for grp, items in groupby(rows, key=lambda r: r["group"]):
+        hll = HyperLogLog()
+        for item in items:
+            hll.merge(HyperLogLog.from_bytes(item["sketch"]))
+        out.append({
+            "group": grp,
+            "unique_customers": int(round(hll.cardinality())),
+            "relative_error": round(hll.relative_error(), 4),
+        })
+    return out
+
+
+# ============================================================
+# 🚀 CLI (job de agregação)
+# ============================================================
+
+def main():
+    from argparse import ArgumentParser
+
+    ap = ArgumentParser(description="Recalcula daily_aggregates (sketches diários)")
+    ap.add_argument("--days", type=int, default=2, help="Dias para trás a recalcular (default: 2)")
+    args = ap.parse_args()
+
+    today = date.today()
+    n = refresh_daily_aggregates(today - timedelta(days=max(args.days - 1, 0)), today)
+    print(f"✅ daily_aggregates atualizado: {n} linhas (dia × loja × canal).")
+
+
+if __name__ == "__main__":
+    main()
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Execute a partir de backend/: python -m src.services.sketch_service --days 90
+#   para o backfill inicial e depois periodicamente com --days 2.
+# - A janela dos endpoints é por DIAS COMPLETOS, com fim exclusivo: [date_from, date_to),
+#   a mesma convenção de KPIs, batch e pivô (date_key).
+# - O recálculo é DELETE + INSERT da faixa (não upsert): rode sempre com a
+#   faixa inteira que mudou; dias de fora não são tocados.
+# - Recálculos simultâneos esperam o advisory lock (LOCK_KEY) em vez de pular:
+#   cada chamada cobre dias que a outra pode não ter visto.
+# - Limites de erro documentados em docs/doc_metricas_aproximadas.md.
+# ============================================================
@@ -0,0 +1,425 @@
+# ============================================================
+# 🗂️ SNAPSHOT COMPARTILHADO ENTRE WORKERS (ARQUIVO MMAP)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Um único worker eleito (ou um cron) grava em disco um
+#            snapshot com rollups diários (dia × canal) e resultados
+#            pré-calculados; todos os workers leem o MESMO arquivo via
+#            mmap, sem cópia e sem consultar o banco.
+#            - Cabeçalho versionado (magic + versão + geração)
+#            - Troca atômica (arquivo temporário + fsync + os.replace)
+#            - Persiste entre reinícios → warm start imediato
+# ============================================================
+
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from datetime import date, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from src.database.session import read_connection
+from src.services import archive_service
+from src.services.calendar_service import date_key, key_to_date
+
+# ============================================================
+# ⚙️ CONFIGURAÇÃO
+# ============================================================
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "temp_files/metrics_snapshot.bin")
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "true").lower() in ("1", "true", "yes")
+SNAPSHOT_REFRESH_SECONDS = float(os.getenv("SNAPSHOT_REFRESH_SECONDS", "60"))
+SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("SNAPSHOT_MAX_AGE_SECONDS", "300"))
+SNAPSHOT_DAYS = int(os.getenv("SNAPSHOT_DAYS", "400"))
+STAT_CHECK_SECONDS = 1.0  # frequência com que leitores checam troca de arquivo
+
+MAGIC = b"RASNAP01"
+FORMAT_VERSION = 2  # 2: dias locais (date_key); arquivos v1 (dia UTC) são descartados
+HEADER = struct.Struct("<8sHHQdQQ")  # magic, versão, reservado, geração, built_at, meta_len, data_len
+HEADER_SIZE = 64
+
+# Tipos dos arrays (códigos do módulo array / memoryview.cast)
+ARRAY_TYPES = {"days": "i", "channels": "i", "revenue": "d", "orders": "q"}
+
+
+def _align8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def result_key(name: str, **kwargs: Any) -> str:
+    """Chave estável para resultados pré-calculados guardados no snapshot."""
+    items = sorted((k, v) for k, v in kwargs.items() if v is not None)
+    return name + "|" + "&".join(f"{k}={v}" for k, v in items)
+
+
+# ============================================================
+# ✍️ ESCRITA (worker eleito / cron)
+# ============================================================
+
+def _default_window() -> Dict[str, str]:
+    """Janela padrão do dashboard (últimos 30 dias, igual ao frontend)."""
+    today = date.today()
+    return {"date_from": (today - timedelta(days=29)).isoformat(), "date_to": today.isoformat()}
+
+
+def _data_version() -> str:
+    """
+    Marca d'água barata dos dados: versão da ingestão (data_watermark, muda
+    também quando vendas existentes são atualizadas) + MAX(id)/COUNT(*) para
+    cargas que não passam pela API (gerador, ETL).
+    """
+    with read_connection() as conn:
+        row = conn.execute(text("SELECT MAX(id), COUNT(*) FROM sales")).one()
+    try:
+        with read_connection() as conn:
+            ingested = conn.execute(
+                text("SELECT version FROM data_watermark WHERE name = 'sales'")
+            ).scalar()
+    except ProgrammingError:
+        ingested = None  # schema analítico ainda não aplicado
+    return f"{ingested}:{row[0]}:{row[1]}"
+
+
+def build_snapshot() -> Dict[str, Any]:
+    """Consulta o banco e monta metadados + arrays do snapshot."""
+    from src.services import analytics_service  # import tardio (evita ciclo)
+
+    start_day = date.today() - timedelta(days=SNAPSHOT_DAYS)
+    with read_connection() as conn:
+        # Dia local (date_key, índice idx_sales_date_key): mesmos dias dos KPIs
+        rows = conn.execute(text("""
+            SELECT s.date_key, s.channel_id,
+                   COALESCE(SUM(s.total_amount), 0) AS revenue, COUNT(*) AS orders
+            FROM sales s
+            WHERE s.date_key >= :start_key
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        """), {"start_key": date_key(start_day)}).all()
+        channel_types = {
+            int(r[0]): r[1]
+            for r in conn.execute(text("SELECT id, type FROM channels")).all()
+        }
+
+    channels = sorted(channel_types)
+    ch_index = {c: i for i, c in enumerate(channels)}
+    n_days = (date.today() - start_day).days + 1
+    days = array("i", (start_day.toordinal() + i for i in range(n_days)))
+    revenue = array("d", bytes(8 * n_days * len(channels)))
+    orders = array("q", bytes(8 * n_days * len(channels)))
+    for day_key, channel_id, rev, qty in rows:
+        ordinal = key_to_date(day_key).toordinal()
+        if channel_id not in ch_index or ordinal > days[-1]:
+            continue  # dia local de amanhã (fuso) fica para o próximo snapshot
+        pos = (ordinal - days[0]) * len(channels) + ch_index[channel_id]
+        revenue[pos] = float(rev)
+        orders[pos] = int(qty)
+
+    # Resultados pré-calculados (mesmas chaves que o service consulta)
+    window = _default_window()
+    results = {
+        result_key("top_products", limit=5, **window):
+            analytics_service.top_products.__wrapped__(limit=5, use_snapshot=False, **window),
+    }
+
+    return {
+        "meta": {
+            "data_version": _data_version(),
+            "coverage": {"from": start_day.isoformat(), "to": date.today().isoformat()},
+            "channel_types": {str(k): v for k, v in channel_types.items()},
+            "results": results,
+        },
+        "arrays": {"days": days, "channels": array("i", channels), "revenue": revenue, "orders": orders},
+    }
+
+
+def write_snapshot(snapshot: Dict[str, Any], path: str = SNAPSHOT_PATH) -> int:
+    """
+    Grava o snapshot com troca atômica e retorna a nova geração.
+    Leitores com o arquivo antigo mapeado continuam válidos até remapear.
+    """
+    generation = 1
+    current = reader.get(max_age=None)
+    if current is not None:
+        generation = current.generation + 1
+
+    meta = dict(snapshot["meta"])
+    layout = {}
+    offset = 0
+    for name, arr in snapshot["arrays"].items():
+        size = len(arr) * arr.itemsize
+        layout[name] = {"offset": offset, "length": len(arr), "type": arr.typecode}
+        offset = _align8(offset + size)
+    meta["arrays"] = layout
+    meta_bytes = json.dumps(meta, default=str).encode("utf-8")
+    data_start = _align8(HEADER_SIZE + len(meta_bytes))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, generation, time.time(), len(meta_bytes), offset)
+        f.write(header.ljust(HEADER_SIZE, b"\0"))
+        f.write(meta_bytes)
+        f.write(b"\0" * (data_start - HEADER_SIZE - len(meta_bytes)))
+        for name, arr in snapshot["arrays"].items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(arr.tobytes())
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return generation
+
+
+# ============================================================
+# 📖 LEITURA (todos os workers, zero-copy)
+# ============================================================
+
+class Snapshot:
+    """Visão somente leitura de um arquivo de snapshot mapeado em memória."""
+
+    def __init__(self, mm: mmap.mmap, inode: int):
+        self.inode = inode
+        magic, version, _r, self.generation, self.built_at, meta_len, data_len = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Snapshot com formato incompatível")
+        self.meta = json.loads(bytes(mm[HEADER_SIZE:HEADER_SIZE + meta_len]))
+        data_start = _align8(HEADER_SIZE + meta_len)
+        view = memoryview(mm)
+        self.arrays = {}
+        for name, spec in self.meta["arrays"].items():
+            start = data_start + spec["offset"]
+            size = spec["length"] * struct.calcsize(spec["type"])
+            self.arrays[name] = view[start:start + size].cast(spec["type"])  # sem cópia
+        self._mm = mm
+        self._channels = list(self.arrays["channels"])
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.built_at
+
+    def _channel_indexes(self, channel: Optional[str]):
+        if not channel:
+            return range(len(self._channels))
+        types = self.meta["channel_types"]
+        return [
+            i for i, c in enumerate(self._channels)
+            if str(c) == channel or types.get(str(c)) == channel
+        ]
+
+    def window_totals(self, date_from: str, date_to: str, channel: Optional[str] = None) -> Optional[Dict[str, float]]:
+        """
+        Soma receita e pedidos dos dias locais [date_from, date_to) — mesma
+        semântica do filtro date_key das métricas para datas sem hora.
+        Retorna None se a janela não estiver coberta pelo snapshot.
+        """
+        try:
+            d0 = date.fromisoformat(date_from).toordinal()
+            d1 = date.fromisoformat(date_to).toordinal()
+        except (TypeError, ValueError):
+            return None
+        days = self.arrays["days"]
+        if not len(days) or d0 < days[0] or d1 - 1 > days[-1]:
+            return None
+        i0 = bisect.bisect_left(days, d0)
+        i1 = bisect.bisect_left(days, d1)
+        n_ch = len(self._channels)
+        cols = self._channel_indexes(channel)
+        revenue, orders = self.arrays["revenue"], self.arrays["orders"]
+        total_rev, total_orders = 0.0, 0
+        for i in range(i0, i1):
+            base = i * n_ch
+            for j in cols:
+                total_rev += revenue[base + j]
+                total_orders += orders[base + j]
+        return {"revenue": round(total_rev, 2), "orders": total_orders}
+
+    def result(self, key: str) -> Optional[Any]:
+        return self.meta.get("results", {}).get(key)
+
+
+class SnapshotReader:
+    """Mantém o mmap atual e remapeia quando o arquivo é trocado (novo inode)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._snap: Optional[Snapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _reload(self) -> None:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._snap = None
+            return
+        if self._snap is not None and self._snap.inode == st.st_ino:
+            return
+        with open(self.path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._snap = Snapshot(mm, st.st_ino)
+        except (ValueError, struct.error, json.JSONDecodeError):
+            self._snap = None  # arquivo inválido/versão antiga → ignora até a próxima troca
+
+    def get(self, max_age: Optional[float] = SNAPSHOT_MAX_AGE_SECONDS) -> Optional[Snapshot]:
+        """Snapshot atual (None se ausente, inválido ou mais velho que max_age)."""
+        if not SNAPSHOT_ENABLED:
+            return None
+        now = time.monotonic()
+        if now - self._checked_at >= STAT_CHECK_SECONDS:
+            with self._lock:
+                self._reload()
+                self._checked_at = now
+        snap = self._snap
+        if snap is None or (max_age is not None and snap.age_seconds > max_age):
+            return None
+        return snap
+
+
+reader = SnapshotReader(SNAPSHOT_PATH)
+
+
+def lookup_totals(date_from: Optional[str], date_to: Optional[str], channel: Optional[str] = None):
+    """
+    Atalho usado pelo analytics_service: totais da janela ou None.
+    Janela que alcança meses arquivados não conta como coberta: o snapshot
+    só vê o banco, e o chamador soma banco + Parquet (cold_totals).
+    """
+    if not (date_from and date_to):
+        return None
+    if archive_service.touches_archive(date_from, date_to):
+        return None
+    snap = reader.get()
+    return snap.window_totals(date_from, date_to, channel) if snap else None
+
+
+def lookup_result(name: str, **kwargs: Any) -> Optional[Any]:
+    """Atalho usado pelo analytics_service: resultado pré-calculado ou None."""
+    snap = reader.get()
+    return snap.result(result_key(name, **kwargs)) if snap else None
+
+
+# ============================================================
+# 🗳️ ELEIÇÃO DO ESCRITOR + LAÇO DE ATUALIZAÇÃO
+# ============================================================
+
+class SnapshotWriter:
+    """
+    Worker que conseguir o flock exclusivo do arquivo .lock vira o escritor
+    e mantém o lock enquanto viver; os demais apenas leem.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_version: Optional[str] = None
+        self.last_error: Optional[str] = None
+
+    def try_elect(self) -> bool:
+        import fcntl  # POSIX; em outros sistemas o snapshot fica só via cron
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lock_file = open(f"{self.path}.lock", "a+")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock_file is not None
+
+    def refresh_once(self, force: bool = False) -> bool:
+        """Reconstrói o snapshot se os dados mudaram (ou se ele está velho)."""
+        current = reader.get(max_age=None)
+        version = _data_version()
+        fresh = current is not None and current.age_seconds < SNAPSHOT_MAX_AGE_SECONDS / 2
+        if not force and fresh and version == (current.meta.get("data_version") if current else None):
+            return False
+        write_snapshot(build_snapshot())
+        self.last_version = version
+        return True
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)[:300]
+            self._stop.wait(SNAPSHOT_REFRESH_SECONDS)
+
+    def start(self) -> bool:
+        """Inicia o laço em background se este processo for eleito."""
+        if not SNAPSHOT_ENABLED or not self.try_elect():
+            return False
+        self._thread = threading.Thread(target=self._loop, name="snapshot-writer", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._lock_file is not None:
+            self._lock_file.close()  # libera o flock para outro worker assumir
+            self._lock_file = None
+
+
+writer = SnapshotWriter(SNAPSHOT_PATH)
+
+
+def status() -> Dict[str, Any]:
+    """Estado do snapshot para o /ready."""
+    snap = reader.get(max_age=None)
+    return {
+        "enabled": SNAPSHOT_ENABLED,
+        "leader": writer.is_leader,
+        "generation": snap.generation if snap else None,
+        "age_seconds": round(snap.age_seconds, 1) if snap else None,
+        "last_error": writer.last_error,
+    }
+
+
+# ============================================================
+# 🚀 CLI (cron / scheduler)
+# ============================================================
+
+def main():
+    from argparse import ArgumentParser
+
+    ap = ArgumentParser(description="Reconstrói o snapshot compartilhado de métricas")
+    ap.add_argument("--force", action="store_true", help="Reconstrói mesmo sem dados novos")
+    args = ap.parse_args()
+
+    changed = writer.refresh_once(force=args.force)
+    snap = reader.get(max_age=None)
+    print(f"{'✅ Snapshot gravado' if changed else 'ℹ️ Snapshot já atualizado'}: "
+          f"geração {snap.generation if snap else '-'} em {SNAPSHOT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Janela do snapshot é por dia local: [date_from, date_to) — o mesmo filtro
+#   date_key que as métricas usam para datas sem hora.
+# - Janelas que alcançam meses arquivados (archive_service) caem no caminho
+#   banco + Parquet; com SNAPSHOT_DAYS maior que os meses mantidos no banco,
+#   os dias arquivados do snapshot ficariam zerados.
+# - O dia corrente reflete a última reconstrução (≤ SNAPSHOT_REFRESH_SECONDS);
+#   snapshots mais velhos que SNAPSHOT_MAX_AGE_SECONDS são ignorados.
+# - Com um scheduler dedicado, rode python -m src.services.snapshot_store
+#   periodicamente (mesma troca atômica); workers sem o flock apenas leem.
+# ============================================================
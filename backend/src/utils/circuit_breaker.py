@@ -0,0 +1,128 @@
+# ============================================================
+# 🔌 CIRCUIT BREAKER (taxa de falhas + latência)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Disjuntor por processo para chamadas a um recurso remoto
+#            (o banco). Com muitas falhas OU muitas chamadas lentas na
+#            janela recente, abre: chamadas falham na hora (sem ocupar
+#            conexão) até o banco ter fôlego. Depois, meio-aberto: uma
+#            chamada de teste por intervalo decide se fecha ou reabre.
+# ============================================================
+
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """
+    - window_seconds: janela deslizante das observações
+    - min_calls: nº mínimo de chamadas na janela para poder abrir
+    - failure_rate / slow_rate: frações que abrem o disjuntor
+    - slow_seconds: acima disso a chamada conta como lenta (padrão; cada
+      chamada pode trazer o seu limite em record(), ex.: por endpoint)
+    - open_seconds: tempo aberto antes do primeiro teste (meio-aberto)
+    - probe_interval: intervalo entre chamadas de teste no meio-aberto
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = 30.0,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        slow_rate: float = 0.5,
+        slow_seconds: float = 3.0,
+        open_seconds: float = 15.0,
+        probe_interval: float = 2.0,
+    ):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.probe_interval = probe_interval
+        self.state = CLOSED
+        self.opened = 0          # nº de aberturas (métrica)
+        self.rejected = 0        # chamadas recusadas com o disjuntor aberto
+        self.last_reason: Optional[str] = None
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()  # (instante, falhou, lenta)
+        self._open_until = 0.0
+        self._next_probe = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """True se a chamada pode ir ao recurso agora."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN and now >= self._open_until:
+                self.state = HALF_OPEN
+                self._next_probe = now
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and now >= self._next_probe:
+                self._next_probe = now + self.probe_interval
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok: bool, seconds: float, slow_seconds: Optional[float] = None) -> None:
+        """Registra o resultado de uma chamada que chegou ao recurso."""
+        now = time.monotonic()
+        slow = seconds >= (self.slow_seconds if slow_seconds is None else slow_seconds)
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if ok and not slow:
+                    self.state = CLOSED
+                    self._calls.clear()
+                else:
+                    self._trip(now, "teste falhou" if not ok else "teste lento")
+                return
+            self._calls.append((now, not ok, slow))
+            while self._calls and self._calls[0][0] < now - self.window_seconds:
+                self._calls.popleft()
+            n = len(self._calls)
+            if self.state != CLOSED or n < self.min_calls:
+                return
+            failures = sum(1 for _, failed, _ in self._calls if failed)
+            slows = sum(1 for _, _, was_slow in self._calls if was_slow)
+            if failures / n >= self.failure_rate:
+                self._trip(now, f"{failures}/{n} falhas")
+            elif slows / n >= self.slow_rate:
+                self._trip(now, f"{slows}/{n} lentas")
+
+    def _trip(self, now: float, reason: str) -> None:
+        self.state = OPEN
+        self.opened += 1
+        self.last_reason = reason
+        self._open_until = now + self.open_seconds
+        self._calls.clear()
+
+    def retry_after(self) -> int:
+        """Segundos até o próximo teste (para o Retry-After)."""
+        with self._lock:
+            target = self._open_until if self.state == OPEN else self._next_probe
+        return max(1, int(round(target - time.monotonic())))
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "last_reason": self.last_reason,
+                "window_calls": len(self._calls),
+            }
+
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Estado por worker (uvicorn --workers N → N disjuntores independentes).
+# - Só chamadas que CHEGARAM ao recurso são registradas; recusas do
+#   limitador, erros de validação e desistências do cliente não contam.
+# ============================================================
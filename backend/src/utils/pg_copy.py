@@ -0,0 +1,63 @@
+# ============================================================
+# 🚚 PROJEÇÕES GRANDES VIA COPY → pandas
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Carrega o resultado de um SELECT com COPY ... TO STDOUT
+#            (CSV) direto para um DataFrame, sem criar um objeto Python
+#            por linha. Usado pelas análises que leem milhões de linhas
+#            (cesta de produtos, coortes). No sentido inverso,
+#            copy_from_frame grava um DataFrame com COPY ... FROM STDIN.
+# ============================================================
+
+import io
+from typing import Any, Dict, Optional
+
+
+def copy_to_frame(conn, sql: str, params: Optional[Dict[str, Any]] = None, dtype: Optional[Dict[str, Any]] = None):
+    """
+    Executa `sql` (com parâmetros no estilo %(nome)s do psycopg2) dentro de
+    COPY (...) TO STDOUT e devolve um pandas.DataFrame.
+    - conn: conexão SQLAlchemy (respeita SET LOCAL statement_timeout do escopo)
+    - dtype: tipos das colunas para o parser C do pandas (ex.: {"sale_id": "int64"})
+    """
+    import pandas as pd  # import tardio (pesado)
+
+    cursor = conn.connection.cursor()
+    try:
+        query = cursor.mogrify(sql, params or {}).decode("utf-8")
+        buf = io.BytesIO()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", buf)
+    finally:
+        cursor.close()
+    buf.seek(0)
+    return pd.read_csv(buf, dtype=dtype, engine="c")
+
+
+def copy_from_frame(conn, table: str, frame) -> int:
+    """
+    Grava `frame` em `table` (colunas = colunas do DataFrame) com
+    COPY ... FROM STDIN (CSV), na transação da conexão SQLAlchemy.
+    NaN/None viram NULL. Retorna o nº de linhas.
+    """
+    if frame.empty:
+        return 0
+    buf = io.StringIO()
+    frame.to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table} ({', '.join(frame.columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+    finally:
+        cursor.close()
+    return len(frame)
+
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Parâmetros usam o placeholder do psycopg2 (%(nome)s), não o :nome do
+#   text(); mogrify faz o escape antes de montar o COPY.
+# - Colunas que podem vir vazias devem usar tipos anuláveis ("Int64",
+#   "float64") no dtype.
+# ============================================================
@@ -0,0 +1,177 @@
+# ============================================================
+# 🛬 SINGLE-FLIGHT (COALESCÊNCIA DE CHAMADAS IDÊNTICAS)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Chamadas concorrentes com a mesma chave aguardam UMA única
+#            execução em andamento e compartilham o resultado (ou o erro).
+#            Não há cache: terminada a execução, a próxima chamada consulta
+#            o banco de novo — nada de dado velho.
+# ============================================================
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+def make_key(name: str, args: tuple = (), kwargs: Optional[Dict[str, Any]] = None) -> Tuple:
+    """
+    Chave normalizada: nome da função + argumentos, ignorando valores None
+    e espaços nas pontas de strings (ordem dos kwargs não importa).
+    """
+    def norm(v):
+        if isinstance(v, str):
+            return v.strip()
+        if isinstance(v, list):
+            return tuple(v)
+        return v
+
+    items = tuple(sorted(
+        (k, norm(v)) for k, v in (kwargs or {}).items() if v is not None
+    ))
+    return (name, tuple(norm(a) for a in args), items)
+
+
+class Abandoned(Exception):
+    """O chamador desistiu de esperar (until() retornou True)."""
+
+
+class _Call:
+    """Execução síncrona em andamento."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _Flight:
+    """Execução assíncrona em andamento (task compartilhada + nº de interessados)."""
+
+    def __init__(self, task: "asyncio.Future", context: Any = None):
+        self.task = task
+        self.context = context
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    🛬 Agrupa chamadas idênticas em voo.
+    - do()        → caminho síncrono (threads: rotas sync, jobs, batch)
+    - do_async()  → caminho assíncrono (event loop das rotas async)
+    Contadores: executions (consultas reais) e coalesced (chamadas que pegaram carona).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    # --------------------------------------------------------
+    # 🧵 Caminho síncrono
+    # --------------------------------------------------------
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    # --------------------------------------------------------
+    # ⚡ Caminho assíncrono
+    # --------------------------------------------------------
+    async def do_async(
+        self,
+        key: Hashable,
+        start: Callable[[], Tuple[Any, Awaitable[Any]]],
+        on_abandon: Optional[Callable[[Any], None]] = None,
+        until: Optional[Callable[[], Awaitable[bool]]] = None,
+        poll_seconds: float = 0.25,
+    ) -> Any:
+        """
+        Aguarda a execução compartilhada de `key`.
+        - start() só é chamado pelo primeiro interessado e devolve
+          (contexto, awaitable); o contexto é repassado a on_abandon.
+        - until(): corrotina opcional consultada a cada poll_seconds; se
+          retornar True, este chamador desiste com Abandoned (ex.: cliente
+          desconectou). Quando o ÚLTIMO interessado desiste, on_abandon(contexto)
+          é chamado.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            context, awaitable = start()
+            flight = _Flight(asyncio.ensure_future(awaitable), context)
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda t, k=key, f=flight: self._forget(k, f, t))
+            with self._lock:
+                self.executions += 1
+        else:
+            with self._lock:
+                self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            while True:
+                done, _ = await asyncio.wait({flight.task}, timeout=poll_seconds if until else None)
+                if done:
+                    return flight.task.result()
+                if until is not None and await until():
+                    raise Abandoned()
+        except (Abandoned, asyncio.CancelledError):
+            if flight.waiters == 1 and not flight.task.done():
+                # Ninguém mais espera: novos chamadores não devem pegar carona
+                self._forget(key, flight, None)
+                if on_abandon:
+                    on_abandon(flight.context)
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: Hashable, flight: _Flight, task: Optional["asyncio.Future"]) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if task is not None and not task.cancelled():
+            task.exception()  # evita "exception was never retrieved" se todos desistiram
+
+    # --------------------------------------------------------
+    # 📊 Contadores
+    # --------------------------------------------------------
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._flights),
+            }
+
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Os dicionários assíncronos são acessados só pelo event loop do worker,
+#   por isso não precisam de lock; o lock protege apenas os contadores.
+# - Coalescência é por processo (worker): com N workers, no máximo N
+#   execuções simultâneas da mesma consulta chegam ao banco.
+# ============================================================
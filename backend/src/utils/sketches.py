@@ -0,0 +1,261 @@
+# ============================================================
+# 📐 SKETCHES MESCLÁVEIS (QUANTIS E CARDINALIDADE)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Estruturas probabilísticas compactas que podem ser
+#            serializadas por dia e MESCLADAS depois, para responder
+#            qualquer janela sem reler as vendas:
+#            - TDigest      → quantis (p50/p90/p99)
+#            - HyperLogLog  → contagem distinta (clientes únicos)
+# ============================================================
+
+import math
+import struct
+import hashlib
+from array import array
+from typing import Iterable, List, Optional, Tuple
+
+# ============================================================
+# 📈 T-DIGEST (variante "merging", função de escala k1)
+# ============================================================
+# - Erro de rank ~ O(1/δ) no meio da distribuição e bem menor nas caudas
+#   (é exatamente onde p90/p99 precisam de precisão).
+# - Com δ=100: erro típico de rank < 1% em p50 e < 0.1% em p99.
+# - Mesclar digests não degrada a garantia de forma significativa.
+
+TDIGEST_MAGIC = b"TDG1"
+DEFAULT_COMPRESSION = 100
+
+
+class TDigest:
+    """
+    📈 Sketch de quantis mesclável.
+    Guarda centróides (média, peso) ordenados; valores novos ficam em buffer
+    até a próxima compressão.
+    """
+
+    def __init__(self, compression: int = DEFAULT_COMPRESSION):
+        self.compression = int(compression)
+        self._centroids: List[Tuple[float, float]] = []
+        self._buffer: List[Tuple[float, float]] = []
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    # --------------------------------------------------------
+    # ➕ Inserção e mescla
+    # --------------------------------------------------------
+    def add(self, value: float, weight: float = 1.0) -> None:
+        """Adiciona um valor (ignora None/NaN)."""
+        if value is None:
+            return
+        value = float(value)
+        if math.isnan(value):
+            return
+        self._buffer.append((value, float(weight)))
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= self.compression * 10:
+            self._compress()
+
+    def update(self, values: Iterable[float]) -> "TDigest":
+        """Adiciona vários valores de uma vez."""
+        for v in values:
+            self.add(v)
+        return self
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        """Mescla outro digest neste (in-place) e retorna self."""
+        if other.count <= 0:
+            return self
+        self._buffer.extend(other._centroids)
+        self._buffer.extend(other._buffer)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _k(self, q: float) -> float:
+        """Função de escala k1: δ/(2π)·asin(2q−1)."""
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _compress(self) -> None:
+        """Funde buffer + centróides respeitando o limite da função de escala."""
+        if not self._buffer:
+            return
+        points = sorted(self._centroids + self._buffer)
+        self._buffer = []
+        total = sum(w for _, w in points)
+
+        merged: List[Tuple[float, float]] = []
+        cur_mean, cur_w = points[0]
+        w_before = 0.0
+        k_left = self._k(0.0)
+        for mean, w in points[1:]:
+            q_right = (w_before + cur_w + w) / total
+            if self._k(q_right) - k_left <= 1.0:
+                cur_mean += (mean - cur_mean) * w / (cur_w + w)
+                cur_w += w
+            else:
+                merged.append((cur_mean, cur_w))
+                w_before += cur_w
+                k_left = self._k(w_before / total)
+                cur_mean, cur_w = mean, w
+        merged.append((cur_mean, cur_w))
+        self._centroids = merged
+
+    # --------------------------------------------------------
+    # 🔍 Consulta
+    # --------------------------------------------------------
+    def quantile(self, q: float) -> Optional[float]:
+        """Estima o quantil q ∈ [0, 1] (None se vazio)."""
+        self._compress()
+        cs = self._centroids
+        if not cs:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        if len(cs) == 1:
+            return cs[0][0]
+
+        target = q * self.count
+        first_mean, first_w = cs[0]
+        if target < first_w / 2:
+            return self.min + (first_mean - self.min) * target / (first_w / 2)
+
+        last_mean, last_w = cs[-1]
+        if target > self.count - last_w / 2:
+            tail = self.count - target
+            return self.max - (self.max - last_mean) * tail / (last_w / 2)
+
+        cum = first_w / 2
+        for i in range(len(cs) - 1):
+            m0, w0 = cs[i]
+            m1, w1 = cs[i + 1]
+            step = (w0 + w1) / 2
+            if target <= cum + step:
+                frac = (target - cum) / step if step else 0.0
+                return m0 + (m1 - m0) * frac
+            cum += step
+        return last_mean
+
+    # --------------------------------------------------------
+    # 💾 Serialização (BYTEA)
+    # --------------------------------------------------------
+    def to_bytes(self) -> bytes:
+        self._compress()
+        header = struct.pack(
+            "<4sHdddI", TDIGEST_MAGIC, self.compression,
+            self.count, self.min, self.max, len(self._centroids),
+        )
+        flat = array("d")
+        for mean, w in self._centroids:
+            flat.append(mean)
+            flat.append(w)
+        return header + flat.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        size = struct.calcsize("<4sHdddI")
+        magic, compression, count, vmin, vmax, n = struct.unpack("<4sHdddI", data[:size])
+        if magic != TDIGEST_MAGIC:
+            raise ValueError("Formato de t-digest inválido")
+        td = cls(compression)
+        flat = array("d")
+        flat.frombytes(bytes(data[size:size + n * 16]))
+        td._centroids = [(flat[i], flat[i + 1]) for i in range(0, len(flat), 2)]
+        td.count, td.min, td.max = count, vmin, vmax
+        return td
+
+
+# ============================================================
+# 👥 HYPERLOGLOG (hash de 64 bits)
+# ============================================================
+# - Erro padrão relativo ≈ 1.04/√m, com m = 2^p registradores.
+# - p=12 → m=4096 registradores (4 KB/sketch) → erro ≈ 1.6%.
+# - Mescla = máximo registrador a registrador (sem perda de precisão).
+
+HLL_MAGIC = b"HLL1"
+DEFAULT_PRECISION = 12
+
+
+def _hash64(value) -> int:
+    """Hash estável de 64 bits (independe de PYTHONHASHSEED)."""
+    digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HyperLogLog:
+    """👥 Sketch de cardinalidade (contagem distinta) mesclável."""
+
+    def __init__(self, precision: int = DEFAULT_PRECISION):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision deve estar entre 4 e 16")
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+
+    def add(self, value) -> None:
+        """Adiciona um elemento (None é ignorado)."""
+        if value is None:
+            return
+        h = _hash64(value)
+        idx = h >> (64 - self.p)
+        rest = (h << self.p) & 0xFFFFFFFFFFFFFFFF
+        rho = min(64 - rest.bit_length() + 1, 64 - self.p + 1)
+        if rho > self.registers[idx]:
+            self.registers[idx] = rho
+
+    def update(self, values: Iterable) -> "HyperLogLog":
+        for v in values:
+            self.add(v)
+        return self
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Mescla outro HLL de mesma precisão (in-place)."""
+        if other.p != self.p:
+            raise ValueError("HLLs com precisões diferentes não podem ser mesclados")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def cardinality(self) -> float:
+        """Estimativa da quantidade de elementos distintos."""
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Correção para cardinalidades pequenas (linear counting)
+            return m * math.log(m / zeros)
+        return estimate
+
+    def relative_error(self) -> float:
+        """Erro padrão relativo teórico (1.04/√m)."""
+        return 1.04 / math.sqrt(self.m)
+
+    def to_bytes(self) -> bytes:
+        return HLL_MAGIC + bytes([self.p]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        data = bytes(data)
+        if data[:4] != HLL_MAGIC:
+            raise ValueError("Formato de HyperLogLog inválido")
+        hll = cls(data[4])
+        hll.registers = bytearray(data[5:5 + hll.m])
+        return hll
+
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Implementação em Python puro (sem dependências extras); o custo de
+#   construção é pago uma vez por dia/loja/canal no job de agregação.
+# - Os formatos binários têm "magic" versionado (TDG1/HLL1) para permitir
+#   evolução sem quebrar linhas antigas de daily_aggregates.
+# ============================================================
@@ -0,0 +1,81 @@
+# ============================================================
+# ⏱️ PERFIL DE IMPORTAÇÃO / STARTUP DA API
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Mede o custo de "import src.main" (o que cada worker do
+#            uvicorn paga no boot) usando `python -X importtime` e lista
+#            os módulos mais caros. Use antes/depois de adicionar
+#            dependências para manter o boot rápido.
+# Uso (a partir de backend/):
+#   python -m src.utils.startup_profile            # top 25
+#   python -m src.utils.startup_profile --top 50 --module src.main
+# ============================================================
+
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from typing import List, Tuple
+
+
+def profile_imports(module: str = "src.main") -> List[Tuple[str, int, int]]:
+    """
+    Importa `module` em um processo novo com -X importtime.
+    Retorna [(módulo, self_us, cumulative_us), ...].
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "falha no import")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        # Formato: "import time:   self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        rows.append((parts[2].rstrip(), int(parts[0]), int(parts[1])))
+    return rows
+
+
+def main():
+    ap = ArgumentParser(description="Perfil de importação do backend (python -X importtime)")
+    ap.add_argument("--module", default="src.main", help="Módulo a importar (default: src.main)")
+    ap.add_argument("--top", type=int, default=25, help="Quantidade de módulos listados (default: 25)")
+    args = ap.parse_args()
+
+    started = time.perf_counter()
+    rows = profile_imports(args.module)
+    wall_ms = (time.perf_counter() - started) * 1000
+
+    total_us = max((cum for _, _, cum in rows), default=0)
+    print(f"⏱️ import {args.module}: {total_us / 1000:.1f} ms (processo completo: {wall_ms:.0f} ms)")
+    print(f"{'cumulativo (ms)':>16} {'próprio (ms)':>13}  módulo")
+    for name, self_us, cum_us in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cum_us / 1000:16.1f} {self_us / 1000:13.1f}  {name}")
+
+    heavy = {"pandas", "numpy", "scipy", "pyarrow", "duckdb"}
+    loaded = sorted({name.strip().split(".")[0] for name, _, _ in rows} & heavy)
+    if loaded:
+        print(f"⚠️ Módulos pesados carregados no import: {', '.join(loaded)} (use import tardio)")
+    else:
+        print("✅ Nenhum módulo pesado carregado no import.")
+
+
+if __name__ == "__main__":
+    main()
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - O import de src.main não abre conexão com o banco: engines do
+#   SQLAlchemy conectam sob demanda e o lifespan faz o resto em background.
+# - Compare o resultado com `uvicorn --workers N`: o custo se multiplica
+#   por worker e por réplica no autoscaling.
+# ============================================================
@@ -0,0 +1,67 @@
+# ============================================================
+# 🗃️ CACHE EM MEMÓRIA COM TTL + LRU
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Cache por processo para resultados analíticos caros
+#            (cesta de produtos, coortes, ...). Entradas expiram por
+#            tempo e as menos usadas saem quando o limite é atingido.
+# ============================================================
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    🗃️ Dicionário thread-safe com expiração.
+    - ttl: segundos de validade padrão (set() aceita ttl próprio)
+    - maxsize: nº máximo de entradas (LRU)
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = 600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+# ============================================================
+# 💡 OBSERVAÇÕES
+# ============================================================
+# - Cache por worker: com N workers, cada um aquece o seu. Para dados
+#   compartilhados entre workers, use o snapshot (services/snapshot_store.py).
+# - Combine com SingleFlight para que misses simultâneos calculem uma vez só.
+# ============================================================
@@ -0,0 +1,17 @@
+# ============================================================
+# 🧪 CONFIGURAÇÃO DOS TESTES (pytest)
+# ============================================================
+# Projeto: Restaurant Analytics MVP
+# Desenvolvedora: Magali Leodato
+# Descrição: Testes das partes puras (sem Postgres). Rode a partir de backend/:
+#            python -m pytest -q tests
+# ============================================================
+
+import os
+import sys
+
+# `src` importável a partir de backend/ (mesmo layout do uvicorn src.main:app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Nenhum teste abre conexão: a engine só é criada (lazy) com a URL padrão
+os.environ.setdefault("DB_MODE", "LOCAL")
@@ -0,0 +1,65 @@
+# ============================================================
+# 🧪 TESTES — JANELAS QUE ALCANÇAM O ARQUIVO (Parquet)
+# ============================================================
+
+from datetime import datetime
+
+import pytest
+
+from src.services import archive_service, snapshot_store
+
+
+class _Reader:
+    """Manifesto falso: um arquivo de sales cobrindo janeiro/2024."""
+
+    files_meta = [{
+        "table": "sales", "path": "x.parquet", "rows": 10,
+        "min_date": datetime(2024, 1, 1), "max_date": datetime(2024, 1, 31, 23, 59),
+    }]
+
+    def files(self, table, lo, hi):
+        return 1, [
+            f for f in self.files_meta
+            if f["table"] == table and (lo is None or f["max_date"] >= lo) and (hi is None or f["min_date"] <= hi)
+        ]
+
+
+class _Snapshot:
+    def window_totals(self, date_from, date_to, channel=None):
+        return {"revenue": 1.0, "orders": 1}
+
+
+@pytest.fixture
+def archived(monkeypatch):
+    monkeypatch.setattr(archive_service, "ARCHIVE_ENABLED", True)
+    monkeypatch.setattr(archive_service, "reader", _Reader())
+
+
+def test_recent_window_does_not_touch_archive(archived):
+    assert not archive_service.touches_archive("2024-03-01", "2024-03-31")
+    assert archive_service.archive_note("2024-03-01", "2024-03-31") == {}
+
+
+def test_local_day_slack_catches_boundary_day(archived):
+    # 01/02 local pode conter vendas de 31/01 no relógio do servidor
+    assert archive_service.touches_archive("2024-02-01", "2024-02-15")
+    assert not archive_service.touches_archive("2024-02-01T12:00:00", "2024-02-15")
+
+
+def test_open_window_flags_archived_months(archived):
+    assert archive_service.archive_note(None, None) == {
+        "archived_until": "2024-01-31T23:59:00", "archive_excluded": True,
+    }
+
+
+def test_disabled_archive_never_flags(monkeypatch):
+    monkeypatch.setattr(archive_service, "ARCHIVE_ENABLED", False)
+    monkeypatch.setattr(archive_service, "reader", _Reader())
+    assert archive_service.archive_note(None, None) == {}
+    assert archive_service.cold_totals(None, None) is None
+
+
+def test_snapshot_does_not_cover_archived_windows(archived, monkeypatch):
+    monkeypatch.setattr(snapshot_store.reader, "get", lambda *a, **kw: _Snapshot())
+    assert snapshot_store.lookup_totals("2024-03-01", "2024-03-08") == {"revenue": 1.0, "orders": 1}
+    assert snapshot_store.lookup_totals("2024-01-10", "2024-03-08") is None
@@ -0,0 +1,87 @@
+# ============================================================
+# 🧪 TESTES — CESTA DE PRODUTOS (pontuação dos pares)
+# ============================================================
+
+import numpy as np
+import pytest
+
+from src.services import basket_service
+
+
+def _pairs(lines, **kwargs):
+    sales, products = zip(*lines)
+    return basket_service.compute_pairs(np.array(sales), np.array(products), **kwargs)
+
+
+def test_support_confidence_and_lift():
+    # 4 vendas: {1,2}, {1,2}, {1,3}, {3}
+    result = _pairs([(10, 1), (10, 2), (11, 1), (11, 2), (12, 1), (12, 3), (13, 3)])
+    assert result["baskets"] == 4
+    p1 = result["products"][1]
+    assert (p1["count"], p1["support"]) == (3, 0.75)
+    to2 = next(p for p in p1["pairs"]["lift"] if p["product_id"] == 2)
+    assert to2["count"] == 2
+    assert to2["support"] == 0.5
+    assert to2["confidence"] == pytest.approx(2 / 3, abs=1e-4)
+    assert to2["lift"] == pytest.approx((2 / 3) / (2 / 4), abs=1e-4)
+
+
+def test_duplicate_lines_in_same_sale_count_once():
+    result = _pairs([(1, 7), (1, 7), (1, 8)])
+    assert result["products"][7]["count"] == 1
+    assert result["products"][7]["pairs"]["lift"][0]["count"] == 1
+
+
+def test_min_count_drops_rare_pairs():
+    result = _pairs([(1, 1), (1, 2), (2, 1), (2, 3), (3, 1), (3, 3)], min_count=2)
+    assert [p["product_id"] for p in result["products"][1]["pairs"]["support"]] == [3]
+
+
+def test_each_sort_key_keeps_its_own_top_n():
+    # Produto 1 com o raro 2 (lift alto, 1 venda) e o popular 3 (muitas vendas)
+    lines = [(0, 1), (0, 2)]
+    for sale in range(1, 9):
+        lines += [(sale, 1), (sale, 3)]
+    lines += [(sale, 3) for sale in range(9, 20)]
+    result = _pairs(lines, top=1)
+    pairs = result["products"][1]["pairs"]
+    assert pairs["lift"][0]["product_id"] == 2
+    assert pairs["support"][0]["product_id"] == 3      # não sumiu no corte por lift
+    assert pairs["confidence"][0]["product_id"] == 3
+
+
+def test_basket_pairs_serves_the_list_for_the_requested_sort(monkeypatch):
+    lines = [(0, 1), (0, 2)] + [(s, p) for s in range(1, 9) for p in (1, 3)] + [(s, 3) for s in range(9, 20)]
+    sales, products = zip(*lines)
+    computed = basket_service.compute_pairs(np.array(sales), np.array(products), top=1)
+    for info in computed["products"].values():
+        info["name"] = None
+    computed.update(line_items=len(lines), timing={})
+    monkeypatch.setattr(basket_service, "_load_and_compute", lambda *a: computed)
+    basket_service._cache.clear()
+
+    by_support = basket_service.basket_pairs(product_id=1, sort="support", limit=1, date_from="2024-01-01")
+    by_lift = basket_service.basket_pairs(product_id=1, sort="lift", limit=1, date_from="2024-01-01")
+    assert by_support["data"][0]["pairs"][0]["product_id"] == 3
+    assert by_lift["data"][0]["pairs"][0]["product_id"] == 2
+    assert by_lift["cached"] is True
+
+
+def test_invalid_sort_is_value_error():
+    with pytest.raises(ValueError):
+        basket_service.basket_pairs(sort="count")
+
+
+def test_empty_input():
+    assert basket_service.compute_pairs(np.array([], dtype=np.int64), np.array([], dtype=np.int64)) == {
+        "baskets": 0, "products": {},
+    }
+
+
+def test_window_uses_card_days_in_psycopg2_placeholders():
+    where, params = basket_service._where("2025-01-01", "2025-02-01", None, 3)
+    assert where == "TRUE AND s.date_key >= %(key_from)s AND s.date_key < %(key_to)s AND s.store_id = %(store_id)s"
+    assert params == {"key_from": 20250101, "key_to": 20250201, "store_id": 3}
+    where, params = basket_service._where("2025-01-01T06:00:00", None, None, None)
+    assert where == "TRUE AND s.created_at >= %(date_from)s"
+    assert params == {"date_from": "2025-01-01T06:00:00"}
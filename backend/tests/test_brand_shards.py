@@ -0,0 +1,161 @@
+# ============================================================
+# 🧪 TESTES — SHARDS POR MARCA (mapa, scatter-gather, ingestão)
+# ============================================================
+
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from src.database.session import ShardMap, parse_shard_map
+from src.services import analytics_service, archive_service, ingest_service
+
+PRIMARY_URL = "postgresql://u:p@main:5432/db"
+SHARD_URL = "postgresql://u:p@brand2:5432/db"
+
+
+# ------------------------------------------------------------
+# Mapa
+# ------------------------------------------------------------
+
+def test_parse_shard_map():
+    assert parse_shard_map("") == {}
+    assert parse_shard_map(f" 2={SHARD_URL}, 3={SHARD_URL} ,") == {2: SHARD_URL, 3: SHARD_URL}
+
+
+@pytest.mark.parametrize("raw", ["2", "x=url", "2=", "=url"])
+def test_parse_shard_map_rejects_malformed(raw):
+    with pytest.raises(ValueError, match="BRAND_SHARDS inválido"):
+        parse_shard_map(raw)
+
+
+def test_shard_map_routes_and_excludes_moved_brands():
+    primary = create_engine(PRIMARY_URL)
+    sm = ShardMap(primary, PRIMARY_URL, {2: SHARD_URL, 3: SHARD_URL, 4: PRIMARY_URL})
+
+    assert sm.engine_for(1) is primary           # fora do mapa
+    assert sm.engine_for(4) is primary           # URL do principal
+    assert sm.engine_for(2) is sm.engine_for(3)  # mesma URL → mesma engine
+    assert sm.engine_for(2) is not primary
+    assert sm.moved_brands() == [2, 3]
+
+    main, shard = sm.shards()
+    assert main["engine"] is primary and main["brands"] is None and main["exclude"] == [2, 3]
+    assert shard["brands"] == [2, 3] and shard["exclude"] == []
+
+
+# ------------------------------------------------------------
+# Scatter-gather (conexões falsas por shard)
+# ------------------------------------------------------------
+
+class _Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class _Conn:
+    def __init__(self, rows=None, error=None):
+        self.rows, self.error, self.params = rows or [], error, None
+
+    def execute(self, sql, params=None):
+        if self.error is not None:
+            raise self.error
+        self.params = params
+        return _Result(self.rows)
+
+
+def _shards(monkeypatch, conns):
+    shards = [
+        {"name": "main", "engine": "main", "brands": None, "exclude": [2]},
+        {"name": "brand2", "engine": "brand2", "brands": [2], "exclude": []},
+    ]
+
+    @contextmanager
+    def connection(eng):
+        yield conns[eng]
+
+    monkeypatch.setattr(analytics_service.shard_map, "shards", lambda: shards)
+    monkeypatch.setattr(analytics_service, "shard_connection", connection)
+    monkeypatch.setattr(archive_service, "ARCHIVE_ENABLED", False)
+
+
+def test_cross_brand_kpis_sums_shards_and_recomputes_ticket(monkeypatch):
+    conns = {
+        "main": _Conn([
+            {"brand_id": 1, "brand_name": "A", "revenue": 300, "orders": 3},
+            {"brand_id": 3, "brand_name": "C", "revenue": 50, "orders": 1},
+        ]),
+        "brand2": _Conn([{"brand_id": 2, "brand_name": "B", "revenue": 1000, "orders": 4}]),
+    }
+    _shards(monkeypatch, conns)
+
+    out = analytics_service.cross_brand_kpis()
+    assert [d["brand_id"] for d in out["data"]] == [2, 1, 3]
+    assert out["total"] == {"revenue": 1350.0, "orders": 8, "avg_ticket": 168.75}  # não é média das médias
+    assert out["partial"] is False
+    assert conns["main"].params["moved_brands"] == [2]
+    assert conns["brand2"].params["shard_brands"] == [2]
+
+
+def test_cross_brand_top_products_merges_local_tops(monkeypatch):
+    def item(brand, pid, revenue):
+        return {"brand_id": brand, "product_id": pid, "product_name": f"P{pid}",
+                "total_revenue": revenue, "total_sold": 1}
+
+    conns = {
+        "main": _Conn([item(1, 10, 90.0), item(1, 11, 40.0)]),
+        "brand2": _Conn([item(2, 20, 100.0), item(2, 21, 50.0)]),
+    }
+    _shards(monkeypatch, conns)
+
+    out = analytics_service.cross_brand_top_products(limit=3)
+    assert [(d["brand_id"], d["product_id"]) for d in out["data"]] == [(2, 20), (1, 10), (2, 21)]
+    assert conns["main"].params["n"] == 3
+
+
+def test_partial_result_when_one_shard_is_down(monkeypatch):
+    down = OperationalError("SELECT", {}, ConnectionError("refused"))
+    conns = {
+        "main": _Conn([{"brand_id": 1, "brand_name": "A", "revenue": 10, "orders": 1}]),
+        "brand2": _Conn(error=down),
+    }
+    _shards(monkeypatch, conns)
+
+    out = analytics_service.cross_brand_kpis()
+    assert out["partial"] is True
+    assert out["total"]["revenue"] == 10.0
+    assert out["shards"][1]["error"] == "ConnectionError"
+
+
+def test_all_shards_down_raises(monkeypatch):
+    down = OperationalError("SELECT", {}, ConnectionError("refused"))
+    _shards(monkeypatch, {"main": _Conn(error=down), "brand2": _Conn(error=down)})
+    with pytest.raises(OperationalError):
+        analytics_service.cross_brand_kpis()
+
+
+# ------------------------------------------------------------
+# Ingestão: marcas movidas não gravam no principal
+# ------------------------------------------------------------
+
+def test_ingest_skips_moved_brand_check_without_shards(monkeypatch):
+    monkeypatch.setattr(ingest_service.shard_map, "moved_brands", lambda: [])
+    conn = _Conn(error=AssertionError("não deveria consultar"))
+    assert ingest_service.reject_moved_brands(conn, "b1") == []
+
+
+def test_ingest_rejects_sales_of_moved_brands(monkeypatch):
+    monkeypatch.setattr(ingest_service.shard_map, "moved_brands", lambda: [2, 3])
+    conn = _Conn([(5, 2), (1, 3)])
+    assert ingest_service.reject_moved_brands(conn, "b1") == [(1, 3), (5, 2)]
+    assert conn.params == {"batch": "b1", "moved_brands": [2, 3]}
@@ -0,0 +1,95 @@
+# ============================================================
+# 🧪 TESTES — JANELAS EM DIAS LOCAIS (date_key)
+# ============================================================
+
+from datetime import date
+
+from src.services.calendar_service import date_key, day_keys, key_to_date, window_conds
+from src.services.prepared_queries import STATEMENTS, _text_sql, kpi_params, kpi_statement
+
+
+def test_date_key_round_trip():
+    assert date_key(date(2024, 3, 8)) == 20240308
+    assert key_to_date(20240308) == date(2024, 3, 8)
+
+
+def test_day_keys_for_whole_days():
+    assert day_keys("2024-03-01", "2024-03-08") == {"key_from": 20240301, "key_to": 20240308}
+    assert day_keys(None, "2024-03-08") == {"key_from": None, "key_to": 20240308}
+
+
+def test_day_keys_none_when_a_bound_has_time_or_is_invalid():
+    assert day_keys("2024-03-01T12:00:00", "2024-03-08") is None
+    assert day_keys("2024-13-01", None) is None
+
+
+def test_window_conds_uses_date_key_with_exclusive_end():
+    conds, params = window_conds("2024-03-01", "2024-03-08", alias="x", suffix="0")
+    assert conds == ["x.date_key >= :key_from0", "x.date_key < :key_to0"]
+    assert params == {"key_from0": 20240301, "key_to0": 20240308}
+
+
+def test_window_conds_falls_back_to_created_at_with_time():
+    conds, params = window_conds("2024-03-01T06:00:00", "2024-03-01T12:00:00", end_inclusive=False)
+    assert conds == ["s.created_at >= :date_from", "s.created_at < :date_to"]
+    assert params == {"date_from": "2024-03-01T06:00:00", "date_to": "2024-03-01T12:00:00"}
+
+
+def test_window_conds_empty_window():
+    assert window_conds(None, None) == ([], {})
+
+
+def test_kpi_statement_picks_prepared_key_variant():
+    params = kpi_params("2024-03-01", "2024-03-08", "D")
+    name = kpi_statement(params)
+    assert name in STATEMENTS
+    assert STATEMENTS[name][1] == ["channel", "key_from", "key_to"]
+    assert "s.date_key >= $2" in STATEMENTS[name][0]
+
+
+def test_kpi_statement_timestamp_variant_with_time():
+    params = kpi_params("2024-03-01T06:00:00", None, None)
+    name = kpi_statement(params)
+    assert STATEMENTS[name][1] == ["date_from"]
+
+
+def test_mixed_timestamp_and_key_statements_are_not_built():
+    assert "kpi_totals_10001" not in STATEMENTS
+    assert len(STATEMENTS) == 14
+
+
+def test_benchmark_text_sql_matches_prepared_statement():
+    params = kpi_params("2024-03-01", "2024-03-08", "D")
+    prepared, order = STATEMENTS[kpi_statement(params)]
+    text_sql = _text_sql(params)
+    for n, name in enumerate(order, start=1):
+        prepared = prepared.replace(f"${n}", f":{name}")
+    assert prepared.endswith(text_sql)
+
+
+def test_sketch_window_matches_rollup_pivot_end(monkeypatch):
+    from contextlib import contextmanager
+
+    from src.services import pivot_service, sketch_service
+
+    seen = {}
+
+    class _Conn:
+        def execute(self, sql, params):
+            seen["sql"], seen["params"] = str(sql), params
+            return self
+
+        def fetchall(self):
+            return []
+
+    @contextmanager
+    def connection():
+        yield _Conn()
+
+    monkeypatch.setattr(sketch_service, "read_connection", connection)
+    monkeypatch.setattr(sketch_service, "apply_scope", lambda conn: connection())
+    sketch_service.unique_customers("2024-03-01", "2024-03-08")
+    pivot_sql, _ = pivot_service.compile_pivot(("channel",), "2024-03-01", "2024-03-08", rollup=True)
+    assert "a.day <  CAST(:date_to AS DATE)" in seen["sql"]
+    assert "a.day < CAST(:date_to AS DATE)" in pivot_sql
+    assert seen["params"]["date_to"] == "2024-03-08"
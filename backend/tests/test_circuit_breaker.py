@@ -0,0 +1,112 @@
+# ============================================================
+# 🧪 TESTES — CIRCUIT BREAKER (máquina de estados)
+# ============================================================
+
+import asyncio
+
+from src.services import query_control
+from src.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def _breaker(**kw):
+    opts = dict(window_seconds=60.0, min_calls=4, failure_rate=0.5, slow_rate=0.5,
+                slow_seconds=1.0, open_seconds=60.0, probe_interval=60.0)
+    opts.update(kw)
+    return CircuitBreaker(**opts)
+
+
+def test_stays_closed_below_min_calls():
+    b = _breaker()
+    for _ in range(3):
+        b.record(False, 0.1)
+    assert b.state == CLOSED and b.allow()
+
+
+def test_opens_on_failure_rate_and_rejects():
+    b = _breaker()
+    for ok in (True, True, False, False):
+        b.record(ok, 0.1)
+    assert b.state == OPEN
+    assert b.last_reason == "2/4 falhas"
+    assert not b.allow()
+    assert b.stats()["rejected"] == 1 and b.stats()["opened"] == 1
+
+
+def test_opens_on_slow_rate():
+    b = _breaker()
+    for seconds in (0.1, 0.1, 2.0, 2.0):
+        b.record(True, seconds)
+    assert b.state == OPEN and b.last_reason == "2/4 lentas"
+
+
+def test_half_open_probe_success_closes():
+    b = _breaker(open_seconds=0.0, probe_interval=60.0)
+    for _ in range(4):
+        b.record(False, 0.1)
+    assert b.allow()               # primeiro teste liberado
+    assert b.state == HALF_OPEN
+    assert not b.allow()           # só um teste por intervalo
+    b.record(True, 0.1)
+    assert b.state == CLOSED and b.stats()["window_calls"] == 0
+
+
+def test_half_open_slow_or_failed_probe_reopens():
+    for ok, seconds, reason in ((False, 0.1, "teste falhou"), (True, 2.0, "teste lento")):
+        b = _breaker(open_seconds=0.0)
+        for _ in range(4):
+            b.record(False, 0.1)
+        assert b.allow()
+        b.record(ok, seconds)
+        assert b.state == OPEN and b.last_reason == reason and b.opened == 2
+
+
+def test_per_call_slow_threshold_overrides_default():
+    b = _breaker()
+    for _ in range(4):
+        b.record(True, 2.0, slow_seconds=10.0)
+    assert b.state == CLOSED
+
+
+class _Clock:
+    """Relógio falso só para query_control (o asyncio segue no relógio real)."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+def _call(endpoint, clock, seconds):
+    def fn():
+        clock.now += seconds
+        return "ok"
+
+    scope = query_control.QueryScope(query_control.timeout_for(endpoint))
+    return asyncio.run(query_control._execute(scope, endpoint, fn, (), {}))
+
+
+def test_slow_heavy_endpoint_does_not_open_breaker_for_light_ones(monkeypatch):
+    b = _breaker(min_calls=query_control.BREAKER_MIN_CALLS, slow_seconds=query_control.BREAKER_SLOW_MS / 1000)
+    clock = _Clock()
+    monkeypatch.setattr(query_control, "breaker", b)
+    monkeypatch.setattr(query_control, "time", clock)
+    # cohorts levando 20s (timeout 60s) é o normal dele
+    for _ in range(query_control.BREAKER_MIN_CALLS):
+        assert _call("cohorts", clock, 20.0) == "ok"
+    assert b.state == CLOSED and b.allow()
+    # a mesma latência numa métrica leve conta como lenta
+    for _ in range(query_control.BREAKER_MIN_CALLS):
+        _call("total-revenue", clock, 20.0)
+    assert b.state == OPEN
+
+
+def test_slow_threshold_scales_with_endpoint_timeout():
+    assert query_control.slow_seconds_for("total-revenue") == query_control.BREAKER_SLOW_MS / 1000
+    assert query_control.slow_seconds_for("cohorts") == 60.0 * query_control.BREAKER_SLOW_FRACTION
+    assert query_control.slow_seconds_for("unknown") == max(
+        query_control.BREAKER_SLOW_MS, query_control.STATEMENT_TIMEOUTS_MS["default"] * query_control.BREAKER_SLOW_FRACTION
+    ) / 1000
@@ -0,0 +1,41 @@
+# ============================================================
+# 🧪 TESTES — JANELA DE COMPARAÇÃO (compare=...)
+# ============================================================
+
+import pytest
+
+from src.services.analytics_service import comparison_window
+
+
+def test_previous_period_has_same_length_and_open_end():
+    window = comparison_window("2024-03-08", "2024-03-15", "previous_period")
+    assert window == {"date_from": "2024-03-01", "date_to": "2024-03-08", "end_inclusive": False}
+
+
+def test_previous_period_keeps_time_precision():
+    window = comparison_window("2024-03-08T12:00:00", "2024-03-08T18:00:00", "previous_period")
+    assert window == {
+        "date_from": "2024-03-08T06:00:00", "date_to": "2024-03-08T12:00:00", "end_inclusive": False,
+    }
+
+
+def test_same_period_last_year_is_inclusive():
+    window = comparison_window("2024-03-01", "2024-03-31", "same_period_last_year")
+    assert window == {"date_from": "2023-03-01", "date_to": "2023-03-31", "end_inclusive": True}
+
+
+def test_leap_day_maps_to_feb_28():
+    window = comparison_window("2024-02-29", "2024-02-29", "same_period_last_year")
+    assert (window["date_from"], window["date_to"]) == ("2023-02-28", "2023-02-28")
+
+
+@pytest.mark.parametrize("date_from, date_to, compare", [
+    ("2024-03-01", "2024-03-31", "yesterday"),
+    (None, "2024-03-31", "previous_period"),
+    ("2024-03-01", None, "same_period_last_year"),
+    ("2024-03-31", "2024-03-01", "previous_period"),
+    ("março", "2024-03-31", "previous_period"),
+])
+def test_invalid_input_is_value_error(date_from, date_to, compare):
+    with pytest.raises(ValueError):
+        comparison_window(date_from, date_to, compare)
@@ -0,0 +1,93 @@
+# ============================================================
+# 🧪 TESTES — AJUSTE E PREVISÃO (fit_series / predict)
+# ============================================================
+
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.services.forecast_service import design_matrix, fit_series, predict
+
+LAST_DAY = date(2024, 3, 31)  # domingo
+WEEKDAY_LIFT = [5.0, 0.0, 1.0, 2.0, 3.0, 4.0, 10.0]  # seg..dom (weekday())
+
+
+def _frame(days, store_id=1, channel_id=1, revenue=None, orders=None):
+    return pd.DataFrame({
+        "day": days,
+        "store_id": store_id,
+        "channel_id": channel_id,
+        "revenue": [revenue(d) for d in days],
+        "orders": [orders(d) for d in days],
+    })
+
+
+def _history(n=28):
+    return [LAST_DAY - timedelta(days=i) for i in range(n - 1, -1, -1)]
+
+
+def test_design_matrix_uses_saturday_as_reference():
+    saturday, sunday = date(2024, 3, 30), date(2024, 3, 31)
+    x = design_matrix([saturday, sunday], origin=date(2024, 3, 23))
+    assert x[0].tolist() == [1.0, 1.0, 0, 0, 0, 0, 0, 0]
+    assert x[1, 2] == 1.0 and x[1, 1] == pytest.approx(8 / 7)
+
+
+def test_fit_recovers_trend_and_weekday_pattern():
+    days = _history()
+    origin = days[0]
+    frame = _frame(
+        days,
+        revenue=lambda d: 100 + 7 * (d - origin).days / 7 + 10 * WEEKDAY_LIFT[d.weekday()],
+        orders=lambda d: 20 + WEEKDAY_LIFT[d.weekday()],
+    )
+    model = fit_series(frame, LAST_DAY, history_days=28)
+
+    assert model["series"] == [(1, 1)]
+    assert model["origin"] == origin
+    assert np.allclose(model["rmse"], 0.0, atol=1e-8)
+
+    future, y = predict(model, 7)
+    assert future[0] == LAST_DAY + timedelta(days=1) and len(future) == 7
+    for i, d in enumerate(future):
+        assert y[i, 0] == pytest.approx(100 + (d - origin).days + 10 * WEEKDAY_LIFT[d.weekday()])
+        assert y[i, 1] == pytest.approx(20 + WEEKDAY_LIFT[d.weekday()])
+
+
+def test_missing_days_count_as_zero_sales():
+    days = _history()
+    frame = _frame(days[::2], revenue=lambda d: 50.0, orders=lambda d: 5.0)
+    model = fit_series(frame, LAST_DAY, history_days=28)
+    # com zeros nos dias sem linha a série não é constante → resíduo > 0
+    assert model["rmse"][0] > 0
+
+
+def test_columns_are_revenue_then_orders_per_sorted_series():
+    days = _history(14)
+    frame = pd.concat([
+        _frame(days, store_id=2, channel_id=1, revenue=lambda d: 200.0, orders=lambda d: 2.0),
+        _frame(days, store_id=1, channel_id=3, revenue=lambda d: 100.0, orders=lambda d: 1.0),
+    ])
+    model = fit_series(frame, LAST_DAY, history_days=14)
+    assert model["series"] == [(1, 3), (2, 1)]
+    _, y = predict(model, 1)
+    assert y[0].tolist() == pytest.approx([100.0, 1.0, 200.0, 2.0])
+
+
+def test_predict_is_clipped_at_zero():
+    days = _history()
+    origin = days[0]
+    frame = _frame(days, revenue=lambda d: max(0.0, 100 - 4 * (d - origin).days), orders=lambda d: 0.0)
+    model = fit_series(frame, LAST_DAY, history_days=28)
+    _, y = predict(model, 14)
+    assert (y >= 0).all()
+    assert y[-1, 0] == 0.0
+
+
+def test_empty_frame_has_no_series():
+    model = fit_series(pd.DataFrame(columns=["day", "store_id", "channel_id", "revenue", "orders"]), LAST_DAY)
+    assert model["series"] == []
+    _, y = predict(model, 3)
+    assert y.shape == (3, 0)
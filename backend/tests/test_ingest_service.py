@@ -0,0 +1,109 @@
+# ============================================================
+# 🧪 TESTES — VALIDAÇÃO DO PAYLOAD DE INGESTÃO
+# ============================================================
+
+import json
+
+import pytest
+
+from src.services import ingest_service
+
+
+def _sale(**overrides):
+    sale = {
+        "store_id": 1, "channel_id": 2, "cod_sale1": "A-1",
+        "created_at": "2024-05-01T12:30:00", "sale_status_desc": "COMPLETED",
+        "total_amount_items": 50, "total_amount": 55.5,
+        "product_sales": [{"product_id": 3, "quantity": 1, "base_price": 50, "total_price": 50}],
+        "payments": [{"payment_type_id": 1, "value": 55.5}],
+    }
+    sale.update(overrides)
+    return sale
+
+
+def _parse(*lines):
+    payload = "\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines)
+    return ingest_service.parse_ndjson(payload.encode(), "b1")
+
+
+def test_valid_sale_goes_to_copy_buffers():
+    parsed = _parse(_sale())
+    assert (parsed["accepted"], parsed["rejected"]) == (1, 0)
+    row = parsed["sales"].getvalue().rstrip("\n").split("\t")
+    assert row[:2] == ["b1", "0"]
+    assert row[2 + ingest_service.SALE_COLS.index("total_amount")] == "55.5"
+    assert parsed["products"].getvalue().count("\n") == 1
+    assert parsed["payments"].getvalue().count("\n") == 1
+
+
+def test_missing_required_field_rejects_only_that_line():
+    bad = _sale()
+    del bad["cod_sale1"]
+    parsed = _parse(_sale(), bad, _sale(cod_sale1="A-2"))
+    assert (parsed["accepted"], parsed["rejected"]) == (2, 1)
+    assert parsed["errors"][0]["line"] == 2
+    assert "cod_sale1" in parsed["errors"][0]["error"]
+    assert parsed["lines"] == [1, 3]
+
+
+@pytest.mark.parametrize("literal", ["NaN", "Infinity", "-Infinity"])
+def test_non_finite_numbers_are_rejected(literal):
+    line = json.dumps(_sale()).replace('"total_amount": 55.5', f'"total_amount": {literal}')
+    parsed = _parse(line)
+    assert parsed["accepted"] == 0
+    assert "total_amount" in parsed["errors"][0]["error"]
+
+
+def test_huge_integer_is_a_line_error_not_a_crash():
+    parsed = _parse(_sale(production_seconds=1e400))
+    assert parsed["rejected"] == 1
+
+
+def test_varchar_over_limit_is_rejected_not_truncated():
+    parsed = _parse(_sale(cod_sale1="x" * 101))
+    assert parsed["rejected"] == 1
+
+
+def test_copy_escapes_text():
+    parsed = _parse(_sale(customer_name="a\tb\\c"))
+    assert "a\\tb\\\\c" in parsed["sales"].getvalue()
+
+
+def test_timezone_aware_timestamp_is_converted_to_sales_clock():
+    parsed = _parse(_sale(created_at="2024-05-01T12:30:00+00:00"))
+    row = parsed["sales"].getvalue().split("\t")
+    created = row[2 + ingest_service.SALE_COLS.index("created_at")]
+    assert "+" not in created and created.startswith("2024-05-01")
+
+
+def test_invalid_json_and_non_object_lines():
+    parsed = _parse("{not json", "[1, 2]", _sale())
+    assert (parsed["accepted"], parsed["rejected"]) == (1, 2)
+
+
+def test_size_limits_raise_too_large(monkeypatch):
+    monkeypatch.setattr(ingest_service, "INGEST_MAX_LINES", 1)
+    with pytest.raises(ingest_service.IngestTooLarge):
+        _parse(_sale(), _sale(cod_sale1="A-2"))
+    monkeypatch.setattr(ingest_service, "INGEST_MAX_BYTES", 10)
+    with pytest.raises(ingest_service.IngestTooLarge):
+        _parse(_sale())
+
+
+@pytest.mark.parametrize("error, status", [
+    (ingest_service.IngestTooLarge("grande"), 413),
+    (ingest_service.IngestError("formato"), 400),
+])
+def test_route_maps_ingest_errors(monkeypatch, error, status):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from src.routes import ingest
+
+    def fail(payload):
+        raise error
+
+    monkeypatch.setattr(ingest_service, "ingest_sales", fail)
+    app = FastAPI()
+    app.include_router(ingest.router, prefix="/ingest")
+    response = TestClient(app).post("/ingest/sales", content=b"{}")
+    assert response.status_code == status
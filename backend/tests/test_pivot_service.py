@@ -0,0 +1,58 @@
+# ============================================================
+# 🧪 TESTES — PIVÔ (GROUPING → quebras, validação, rollup)
+# ============================================================
+
+from itertools import combinations
+
+import pytest
+
+from src.services import pivot_service
+from src.services.pivot_service import _grouped_dims, breakdown_name, parse_spec, uses_rollup
+
+DIMS = ("channel", "store", "hour")
+
+
+def test_grouping_bits_follow_dimension_order():
+    # GROUPING(a, b, c): bit 1 = coluna agregada; a 1ª dimensão é o bit mais alto
+    assert _grouped_dims(0b000, DIMS) == ("channel", "store", "hour")
+    assert _grouped_dims(0b100, DIMS) == ("store", "hour")
+    assert _grouped_dims(0b001, DIMS) == ("channel", "store")
+    assert _grouped_dims(0b101, DIMS) == ("store",)
+    assert _grouped_dims(0b111, DIMS) == ()
+
+
+def test_every_gid_maps_to_a_distinct_breakdown():
+    names = {breakdown_name(_grouped_dims(gid, DIMS)) for gid in range(1 << len(DIMS))}
+    expected = {
+        breakdown_name(subset) for size in range(len(DIMS) + 1) for subset in combinations(DIMS, size)
+    }
+    assert names == expected and "total" in names
+
+
+def test_single_dimension():
+    assert _grouped_dims(0, ("store",)) == ("store",)
+    assert _grouped_dims(1, ("store",)) == ()
+
+
+def test_parse_spec_orders_dims_canonically():
+    assert parse_spec("hour, channel", None) == (("channel", "hour"), ("revenue", "orders"))
+    assert parse_spec(["store"], "avg_ticket") == (("store",), ("avg_ticket",))
+
+
+@pytest.mark.parametrize("dims, measures, message", [
+    ("", None, "ao menos uma dimensão"),
+    ("city", None, "dimensão inválida"),
+    ("channel,store,payment_type,hour", None, "máximo de 3"),
+    ("channel", "profit", "medida inválida"),
+])
+def test_parse_spec_rejects_bad_input(dims, measures, message):
+    with pytest.raises(ValueError, match=message):
+        parse_spec(dims, measures)
+
+
+def test_rollup_only_for_rollup_dims_and_whole_days(monkeypatch):
+    monkeypatch.setattr(pivot_service, "PIVOT_USE_ROLLUPS", True)
+    assert uses_rollup(("channel", "store"), "2024-03-01", "2024-03-08")
+    assert uses_rollup(("channel",), None, None)
+    assert not uses_rollup(("channel", "hour"), "2024-03-01", "2024-03-08")
+    assert not uses_rollup(("channel",), "2024-03-01T10:00:00", None)
@@ -0,0 +1,105 @@
+# ============================================================
+# 🧪 TESTES — ROTEADOR DE RÉPLICAS (round-robin, lag, fallback)
+# ============================================================
+
+import threading
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from src.database import session
+from src.database.session import ReplicaRouter
+
+
+class _Conn:
+    def __init__(self, lag):
+        self.lag = lag
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        return self
+
+    def scalar(self):
+        return self.lag
+
+
+class _Engine:
+    """Engine falsa: `lag` é o resultado do probe; `fail` derruba o connect."""
+
+    def __init__(self, name, lag=0.0, fail=False):
+        self.name, self.lag, self.fail, self.connects = name, lag, fail, 0
+
+    def connect(self):
+        self.connects += 1
+        if self.fail:
+            raise OperationalError("connect", {}, ConnectionError("refused"))
+        return _Conn(self.lag)
+
+
+@pytest.fixture(autouse=True)
+def ttl(monkeypatch):
+    monkeypatch.setattr(session, "REPLICA_HEALTH_TTL_SECONDS", 60.0)
+    monkeypatch.setattr(session, "REPLICA_MAX_LAG_SECONDS", 30.0)
+
+
+def test_round_robin_between_healthy_replicas():
+    r1, r2 = _Engine("r1"), _Engine("r2")
+    router = ReplicaRouter(_Engine("primary"), [r1, r2])
+    assert [router.get_read_engine() for _ in range(4)] == [r1, r2, r1, r2]
+    assert (r1.connects, r2.connects) == (1, 1)  # um probe por réplica dentro do TTL
+
+
+def test_lagging_replica_is_skipped():
+    r1, r2 = _Engine("r1", lag=120.0), _Engine("r2", lag=2.0)
+    router = ReplicaRouter(_Engine("primary"), [r1, r2])
+    assert [router.get_read_engine() for _ in range(3)] == [r2, r2, r2]
+    assert router._status[0]["lag"] == 120.0 and not router._status[0]["healthy"]
+
+
+def test_falls_back_to_primary_when_no_replica_is_fit():
+    primary = _Engine("primary")
+    router = ReplicaRouter(primary, [_Engine("r1", fail=True), _Engine("r2", lag=99.0)])
+    assert router.get_read_engine() is primary
+    assert ReplicaRouter(primary, []).get_read_engine() is primary
+
+
+def test_only_one_probe_while_replica_hangs():
+    release, entered = threading.Event(), threading.Event()
+
+    class _Hanging(_Engine):
+        def connect(self):
+            self.connects += 1
+            entered.set()
+            release.wait(5)
+            return _Conn(0.0)
+
+    replica = _Hanging("r1")
+    router = ReplicaRouter(_Engine("primary"), [replica])
+    prober = threading.Thread(target=router.get_read_engine)
+    prober.start()
+    assert entered.wait(5)
+    for _ in range(5):
+        router.get_read_engine()  # usa o estado em cache, sem novo connect
+    release.set()
+    prober.join(5)
+    assert replica.connects == 1
+
+
+def test_read_connection_marks_refusing_replica_down(monkeypatch):
+    primary, replica = _Engine("primary"), _Engine("r1")
+    router = ReplicaRouter(primary, [replica])
+    monkeypatch.setattr(session, "engine", primary)
+    monkeypatch.setattr(session, "replica_router", router)
+
+    assert router.get_read_engine() is replica   # probe ok
+    replica.fail = True                          # cai entre o probe e a leitura
+    with session.read_connection() as conn:
+        assert conn.lag == 0.0
+    assert primary.connects == 1
+    assert not router._status[0]["healthy"]
+    assert router.get_read_engine() is primary   # fora até o próximo check
@@ -0,0 +1,55 @@
+# ============================================================
+# 🧪 TESTES — NOTAS RFM (score / segment_of / score_frame)
+# ============================================================
+
+import numpy as np
+import pandas as pd
+
+from src.services.rfm_service import score, score_frame, segment_of
+
+CUTS = [1.0, 2.0, 4.0, 8.0]
+
+
+def test_score_counts_cuts_strictly_below():
+    values = np.array([0.5, 1.5, 3.0, 5.0, 100.0])
+    assert score(values, CUTS).tolist() == [1, 2, 3, 4, 5]
+
+
+def test_ties_on_a_cut_stay_in_the_lower_score():
+    assert score(np.array([1.0, 2.0, 4.0, 8.0]), CUTS).tolist() == [1, 2, 3, 4]
+
+
+def test_mass_of_single_order_customers_gets_f1():
+    # quintis de uma base em que a maioria comprou 1 vez: vários cortes iguais a 1
+    assert score(np.array([1, 1, 2, 3]), [1.0, 1.0, 1.0, 2.0]).tolist() == [1, 1, 4, 5]
+
+
+def test_score_range_is_one_to_five():
+    values = np.random.default_rng(0).normal(size=1000)
+    cuts = np.quantile(values, (0.2, 0.4, 0.6, 0.8))
+    s = score(values, cuts)
+    assert s.min() == 1 and s.max() == 5
+    assert np.bincount(s)[1:].tolist() == [200] * 5
+
+
+def test_segment_rules_first_match_wins():
+    r = np.array([5, 3, 5, 4, 2, 1, 3])
+    f = np.array([5, 4, 1, 2, 3, 2, 3])
+    m = np.array([5, 1, 1, 1, 1, 1, 3])
+    assert segment_of(r, f, m).tolist() == [
+        "campeoes", "leais", "novos", "promissores", "em_risco", "hibernando", "precisam_atencao",
+    ]
+
+
+def test_score_frame_adds_scores_code_and_segment():
+    frame = pd.DataFrame({
+        "customer_id": [1, 2],
+        "last_epoch": [10.0, 0.0],
+        "orders": [9, 1],
+        "revenue": [500.0, 1.0],
+    })
+    cuts = {"recency": [1.0, 2.0, 3.0, 4.0], "frequency": CUTS, "monetary": [10.0, 20.0, 30.0, 40.0]}
+    out = score_frame(frame, cuts)
+    assert out["rfm_code"].tolist() == ["555", "111"]
+    assert out["new_segment"].tolist() == ["campeoes", "hibernando"]
+    assert "new_r" not in frame.columns  # não altera o lote de entrada
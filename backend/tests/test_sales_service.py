@@ -0,0 +1,58 @@
+# ============================================================
+# 🧪 TESTES — DRILL-DOWN DE VENDAS (janela, parse_ids)
+# ============================================================
+
+import pytest
+
+from src.services.calendar_service import window_conds
+from src.services.prepared_queries import kpi_params
+from src.services.sales_service import MAX_DETAIL_IDS, _filters, parse_ids
+
+
+@pytest.mark.parametrize("date_from, date_to", [
+    ("2025-01-01", "2025-02-01"),
+    ("2025-01-01", None),
+    ("2025-01-01T06:00:00", "2025-01-31T23:00:00"),
+])
+def test_drill_down_window_matches_kpi_cards(date_from, date_to):
+    conds, params = _filters(date_from, date_to, None, None, None)
+    assert (conds, params) == window_conds(date_from, date_to)
+    kpi = kpi_params(date_from, date_to, None)
+    assert {k: v for k, v in kpi.items() if v is not None and k != "channel"} == params
+
+
+def test_drill_down_whole_days_use_date_key_with_exclusive_end():
+    conds, params = _filters("2025-01-01", "2025-02-01", 3, None, "COMPLETED")
+    assert conds == ["s.date_key >= :key_from", "s.date_key < :key_to",
+                     "s.store_id = :store_id", "s.sale_status_desc = :status"]
+    assert params == {"key_from": 20250101, "key_to": 20250201, "store_id": 3, "status": "COMPLETED"}
+
+
+def test_parse_ids_keeps_order_and_drops_repeats():
+    assert parse_ids("3,1,3") == [3, 1]
+    assert parse_ids(" 7 , ,8,") == [7, 8]
+
+
+def test_parse_ids_accepts_lists():
+    assert parse_ids([5, "6", 5]) == [5, 6]
+
+
+@pytest.mark.parametrize("ids, message", [
+    ("1,abc", "id inválido: abc"),
+    ("-1", "id inválido: -1"),
+    ("1.5", "id inválido: 1.5"),
+    ("", "ao menos um id"),
+    (" , ", "ao menos um id"),
+    (None, "ao menos um id"),
+])
+def test_parse_ids_rejects_bad_input(ids, message):
+    with pytest.raises(ValueError, match=message):
+        parse_ids(ids)
+
+
+def test_parse_ids_limit_counts_distinct_ids():
+    assert len(parse_ids(",".join(["1"] * (MAX_DETAIL_IDS + 5)))) == 1
+    assert len(parse_ids(",".join(str(i) for i in range(MAX_DETAIL_IDS)))) == MAX_DETAIL_IDS
+    with pytest.raises(ValueError, match="máximo"):
+        parse_ids(",".join(str(i) for i in range(MAX_DETAIL_IDS + 1)))
+
@@ -0,0 +1,97 @@
+# ============================================================
+# 🧪 TESTES — SINGLE-FLIGHT
+# ============================================================
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.utils.singleflight import Abandoned, SingleFlight, make_key
+
+
+def test_make_key_normalizes_none_strings_and_kwarg_order():
+    a = make_key("revenue", ("P ",), {"date_from": "2024-01-01", "store": None, "x": [1, 2]})
+    b = make_key("revenue", ("P",), {"x": [1, 2], "date_from": " 2024-01-01"})
+    assert a == b
+    assert hash(a) == hash(b)
+    assert make_key("revenue", ("D",)) != make_key("revenue", ("P",))
+
+
+def test_sync_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(2)
+        return 42
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    deadline = time.monotonic() + 2
+    while flight.stats()["coalesced"] < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert results == [42] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"executions": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_sync_error_is_shared_and_not_cached():
+    flight = SingleFlight()
+
+    def boom():
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        flight.do("k", boom)
+    assert flight.do("k", lambda: "ok") == "ok"  # sem cache: nova execução
+    assert flight.stats()["executions"] == 2
+
+
+def test_async_waiters_coalesce():
+    flight = SingleFlight()
+    started = []
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "v"
+
+    def start():
+        started.append(1)
+        return None, work()
+
+    async def run():
+        return await asyncio.gather(*(flight.do_async("k", start) for _ in range(3)))
+
+    assert asyncio.run(run()) == ["v", "v", "v"]
+    assert len(started) == 1
+    assert flight.stats()["coalesced"] == 2
+
+
+def test_async_last_waiter_abandoning_calls_on_abandon():
+    flight = SingleFlight()
+    abandoned = []
+
+    async def run():
+        async def work():
+            await asyncio.sleep(1)
+
+        async def gone():
+            return True
+
+        with pytest.raises(Abandoned):
+            await flight.do_async("k", lambda: ("ctx", work()), on_abandon=abandoned.append,
+                                  until=gone, poll_seconds=0.01)
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(run())
+    assert abandoned == ["ctx"]
@@ -11,14 +11,21 @@
 # Observações:
 #   - NÃO cria tabelas (usa o schema já aplicado no banco)
 #   - Usa SQLAlchemy Core com INSERT em lote (performático)
+#   - Caminho padrão vetorizado (NumPy + COPY); --legacy mantém o laço antigo
+#   - --brand N semeia a marca N (id fixo) no shard dela (BRAND_SHARDS)
 # ============================================================
 
+import io
 import os
+import time
 import uuid
 import random
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 from argparse import ArgumentParser
 
+import numpy as np
+
 from dotenv import load_dotenv, find_dotenv
 from sqlalchemy import create_engine, text, bindparam
 from sqlalchemy.engine import Engine
@@ -37,6 +44,10 @@ DATABASE_URL = DATABASE_URL_CLOUD if DB_MODE == "CLOUD" else DATABASE_URL_LOCAL
 if not DATABASE_URL:
     raise RuntimeError("❌ Defina DATABASE_URL_LOCAL/CLOUD no .env e DB_MODE=LOCAL/CLOUD.")
 
+# Shards por marca (mesmo formato de backend/src/database/session.py):
+# BRAND_SHARDS=1=postgresql://u:p@h1:5432/marca1,2=postgresql://u:p@h2:5432/marca2
+BRAND_SHARDS_RAW = os.getenv("BRAND_SHARDS", "")
+
 # ============================================================
 # 🧠 PARÂMETROS PADRÃO
 # ============================================================
@@ -45,6 +56,10 @@ DEFAULT_ROWS = 10000           # vendas a gerar
 DEFAULT_MONTHS = 3             # janela temporal (meses)
 BATCH_SIZE = 1000              # tamanho do lote para inserts
 
+# 📅 created_at é gravado no relógio do servidor; date_key/hour_key no horário das lojas
+SALES_TIMEZONE = os.getenv("SALES_TIMEZONE", "America/Sao_Paulo")
+SALES_CLOCK_TIMEZONE = os.getenv("SALES_CLOCK_TIMEZONE", "UTC")
+
 # ============================================================
 # 🧰 Funções auxiliares
 # ============================================================
@@ -73,26 +88,55 @@ def weighted_pick(options):
 # ============================================================
 # 🔌 Engine (conexão resiliente)
 # ============================================================
-def get_engine() -> Engine:
-    return create_engine(DATABASE_URL, pool_pre_ping=True, future=True)
+def get_engine(url: str = DATABASE_URL) -> Engine:
+    return create_engine(url, pool_pre_ping=True, future=True)
 
 engine = get_engine()
 
+
+def shard_url(brand_id: int) -> str:
+    """URL do shard da marca (BRAND_SHARDS) ou o banco principal."""
+    for part in BRAND_SHARDS_RAW.split(","):
+        brand, sep, url = part.strip().partition("=")
+        if sep and brand.strip() == str(brand_id) and url.strip():
+            return url.strip()
+    return DATABASE_URL
+
+
+def _ensure_brand(conn, brand_id=None, name=None) -> int:
+    """
+    Sem brand_id: a 'Marca X' de sempre (id da sequence).
+    Com brand_id: a marca com esse id FIXO — o mesmo id em todos os shards,
+    que é como o backend roteia (brand_id → banco).
+    """
+    if brand_id is None:
+        conn.exec_driver_sql("""
+            INSERT INTO brands (name)
+            SELECT x.name FROM (VALUES ('Marca X')) AS x(name)
+            WHERE NOT EXISTS (SELECT 1 FROM brands b WHERE b.name = x.name);
+        """)
+        return conn.execute(text("SELECT id FROM brands WHERE name='Marca X' LIMIT 1")).scalar()
+    conn.execute(
+        text("INSERT INTO brands (id, name) VALUES (:id, :name) ON CONFLICT (id) DO NOTHING"),
+        {"id": brand_id, "name": name or f"Marca {brand_id}"},
+    )
+    # id explícito não avança a sequence: alinha para inserts futuros sem id
+    conn.execute(text("SELECT setval('brands_id_seq', (SELECT MAX(id) FROM brands))"))
+    return brand_id
+
 # ============================================================
 # 🧱 SEED DAS DIMENSÕES (idempotente simples)
 # ============================================================
-def seed_dimensions():
+def seed_dimensions(brand_id=None, brand_name=None) -> int:
     """
     🔧 Insere registros mínimos nas dimensões do ERP:
     - brands, sub_brands, stores, channels, categories, products, items, payment_types
+    Retorna o id da marca semeada.
     """
     with engine.begin() as conn:
         # brands
-        conn.exec_driver_sql("""
-            INSERT INTO brands (name)
-            SELECT x.name FROM (VALUES ('Marca X')) AS x(name)
-            WHERE NOT EXISTS (SELECT 1 FROM brands b WHERE b.name = x.name);
-        """)
+        brand_id = _ensure_brand(conn, brand_id, brand_name)
+        brand = {"brand_id": brand_id}
 
         # sub_brands
         conn.exec_driver_sql("""
@@ -100,11 +144,11 @@ def seed_dimensions():
             SELECT b.id, sb.name
             FROM brands b
             JOIN (VALUES ('SubMarca A'), ('SubMarca B')) AS sb(name) ON TRUE
-            WHERE b.name='Marca X'
+            WHERE b.id = %(brand_id)s
               AND NOT EXISTS (
                 SELECT 1 FROM sub_brands s WHERE s.brand_id=b.id AND s.name=sb.name
               );
-        """)
+        """, brand)
 
         # channels (P=Presencial, D=Delivery)
         conn.exec_driver_sql("""
@@ -117,11 +161,11 @@ def seed_dimensions():
               ('Rappi','Marketplace Rappi','D'),
               ('App Próprio','Delivery próprio','D')
             ) AS c(name, description, t) ON TRUE
-            WHERE b.name='Marca X'
+            WHERE b.id = %(brand_id)s
               AND NOT EXISTS (
                 SELECT 1 FROM channels ch WHERE ch.brand_id=b.id AND ch.name=c.name
               );
-        """)
+        """, brand)
 
         # stores
         conn.exec_driver_sql("""
@@ -135,12 +179,12 @@ def seed_dimensions():
               ('Loja Niterói','Niterói','RJ','Icaraí'),
               ('Loja Tijuca','Rio de Janeiro','RJ','Tijuca')
             ) AS s(name, city, state, district) ON TRUE
-            WHERE b.name='Marca X'
+            WHERE b.id = %(brand_id)s
               AND NOT EXISTS (
                 SELECT 1 FROM stores st
                  WHERE st.brand_id=b.id AND st.sub_brand_id=sb.id AND st.name=s.name
               );
-        """)
+        """, brand)
 
         # categories
         conn.exec_driver_sql("""
@@ -149,12 +193,12 @@ def seed_dimensions():
             FROM brands b
             JOIN sub_brands sb ON sb.brand_id=b.id
             JOIN (VALUES ('Lanches'), ('Bebidas'), ('Sobremesas')) AS c(name) ON TRUE
-            WHERE b.name='Marca X'
+            WHERE b.id = %(brand_id)s
               AND NOT EXISTS (
                 SELECT 1 FROM categories ct
                  WHERE ct.brand_id=b.id AND ct.sub_brand_id=sb.id AND ct.name=c.name
               );
-        """)
+        """, brand)
 
         # products
         conn.exec_driver_sql("""
@@ -167,13 +211,13 @@ def seed_dimensions():
               ('Hambúrguer Clássico'), ('Hambúrguer Duplo'), ('Batata Média'),
               ('Refrigerante Lata'), ('Milkshake Chocolate'), ('Água Mineral')
             ) AS p(name) ON TRUE
-            WHERE b.name='Marca X'
+            WHERE b.id = %(brand_id)s
               AND NOT EXISTS (
                 SELECT 1 FROM products pr
                  WHERE pr.brand_id=b.id AND pr.sub_brand_id=sb.id
                    AND pr.category_id=ct.id AND pr.name=p.name
               );
-        """)
+        """, brand)
 
         # items (adicionais)
         conn.exec_driver_sql("""
@@ -183,13 +227,13 @@ def seed_dimensions():
             JOIN sub_brands sb ON sb.brand_id=b.id
             JOIN categories ct ON ct.brand_id=b.id AND ct.sub_brand_id=sb.id
             JOIN (VALUES ('Queijo Extra'), ('Bacon'), ('Molho Especial'), ('Calda Chocolate')) AS i(name) ON TRUE
-            WHERE b.name='Marca X'
+            WHERE b.id = %(brand_id)s
               AND NOT EXISTS (
                 SELECT 1 FROM items it
                  WHERE it.brand_id=b.id AND it.sub_brand_id=sb.id
                    AND it.category_id=ct.id AND it.name=i.name
               );
-        """)
+        """, brand)
 
         # payment_types  ✅ corrigido alias: desc -> descr
         conn.exec_driver_sql("""
@@ -197,16 +241,16 @@ def seed_dimensions():
             SELECT b.id, pt.descr
             FROM brands b
             JOIN (VALUES ('Crédito'), ('Débito'), ('PIX'), ('Dinheiro')) AS pt(descr) ON TRUE
-            WHERE b.name='Marca X'
+            WHERE b.id = %(brand_id)s
               AND NOT EXISTS (
                 SELECT 1 FROM payment_types p WHERE p.brand_id=b.id AND p.description=pt.descr
               );
-        """)
+        """, brand)
 
 # ============================================================
 # 💰 SEED DE VENDAS / ITENS / PAGAMENTOS
 # ============================================================
-def seed_sales(rows: int, months: int):
+def seed_sales(rows: int, months: int, brand_id: int):
     """
     🧾 Gera <rows> vendas distribuídas nos últimos <months> meses.
     - Preenche: sales, product_sales, payments
@@ -216,7 +260,6 @@ def seed_sales(rows: int, months: int):
 
     with engine.begin() as conn:
         # 🔎 IDs auxiliares
-        brand_id = conn.execute(text("SELECT id FROM brands WHERE name='Marca X' LIMIT 1")).scalar()
         sub_brand_ids = [r[0] for r in conn.execute(text("SELECT id FROM sub_brands WHERE brand_id=:b"), {"b": brand_id})]
         store_ids = [r[0] for r in conn.execute(text("SELECT id FROM stores WHERE brand_id=:b"), {"b": brand_id})]
         channels = [dict(id=r[0], name=r[1], t=r[2]) for r in conn.execute(text("SELECT id,name,type FROM channels WHERE brand_id=:b"), {"b": brand_id}).all()]
@@ -408,6 +451,229 @@ def _flush_batch(conn, sales_buf, psales_buf, pays_buf):
                 )
             """), pay_rows)
 
+# ============================================================
+# ⚡ SEED VETORIZADO (NumPy + COPY)
+# ============================================================
+# Mesmas distribuições do seed_sales, mas sorteadas em blocos inteiros
+# (arrays NumPy) e gravadas com COPY; ids das vendas reservados na sequence,
+# então itens e pagamentos já saem vinculados (sem SELECT de volta).
+
+PRICE_CHOICES = np.array([18.0, 22.0, 28.0, 35.0, 12.0, 8.0, 6.0])
+DISCOUNT_CHOICES = np.array([0.0, 0.03, 0.05, 0.10, 0.0, 0.0])
+INCREASE_CHOICES = np.array([0.0, 0.0, 1.0, 2.0])
+VECTOR_CHUNK = 200_000         # vendas por bloco (memória ~ 100 MB por bloco)
+
+SALES_COPY_COLS = [
+    "id", "store_id", "sub_brand_id", "customer_id", "channel_id", "cod_sale1", "cod_sale2",
+    "created_at", "customer_name", "sale_status_desc", "total_amount_items", "total_discount",
+    "total_increase", "delivery_fee", "service_tax_fee", "total_amount", "value_paid",
+    "production_seconds", "delivery_seconds", "people_quantity", "discount_reason",
+    "increase_reason", "origin",
+]
+
+
+def _round2(x):
+    return np.round(x, 2)
+
+
+def local_keys(created_at):
+    """📅 (date_key AAAAMMDD, hour_key) no fuso das lojas, vetorizado (sem formatar strings)."""
+    import pandas as pd
+
+    local = (
+        pd.DatetimeIndex(created_at)
+        .tz_localize(SALES_CLOCK_TIMEZONE, ambiguous=False, nonexistent="shift_forward")
+        .tz_convert(SALES_TIMEZONE)
+    )
+    date_key = local.year * 10000 + local.month * 100 + local.day
+    return np.asarray(date_key, dtype=np.int32), np.asarray(local.hour, dtype=np.int16)
+
+
+def generate_sales_arrays(rng, n: int, months: int, now: datetime, dims: dict) -> dict:
+    """
+    🎲 Sorteia n vendas de uma vez. Retorna {"sales": {...}, "items": {...}}
+    com arrays colunares (itens carregam sale_pos = posição da venda no bloco).
+    dims: store_ids, sub_brand_ids, channel_ids, channel_weights, delivery_mask,
+          product_ids, paytype_ids (arrays NumPy).
+    """
+    days = months * 30
+    offset = rng.integers(0, max(1, days) + 1, n) * 86400 + rng.integers(0, 86400, n)
+    created_at = np.datetime64(now, "us") - offset.astype("timedelta64[s]")
+
+    store_id = rng.choice(dims["store_ids"], n)
+    sub_brand_id = rng.choice(dims["sub_brand_ids"], n)
+    ch_pos = rng.choice(len(dims["channel_ids"]), n, p=dims["channel_weights"])
+    channel_id = dims["channel_ids"][ch_pos]
+    is_delivery = dims["delivery_mask"][ch_pos]      # lookup vetorizado (sem any() por linha)
+
+    # 🧮 itens: 1..4 por venda, preço base + ruído, limitado a [4, 49]
+    n_items = rng.integers(1, 5, n)
+    sale_pos = np.repeat(np.arange(n), n_items)
+    m = len(sale_pos)
+    prices = _round2(rng.choice(PRICE_CHOICES, m) + rng.uniform(-2.0, 3.0, m))
+    prices = np.clip(prices, 4.0, 49.0)
+    total_items = _round2(np.bincount(sale_pos, weights=prices, minlength=n))
+
+    # taxas e ajustes (mesmas regras do laço original)
+    delivery_fee = np.where(is_delivery, _round2(rng.uniform(0, 9, n)), 0.0)
+    service_tax = np.where(is_delivery, 0.0, _round2(total_items * rng.uniform(0.0, 0.10, n)))
+    discount = _round2(total_items * rng.choice(DISCOUNT_CHOICES, n))
+    increase = rng.choice(INCREASE_CHOICES, n)
+    total_amount = _round2(total_items - discount + increase + delivery_fee + service_tax)
+
+    return {
+        "sales": {
+            "store_id": store_id,
+            "sub_brand_id": sub_brand_id,
+            "channel_id": channel_id,
+            "is_delivery": is_delivery,
+            "created_at": created_at,
+            "total_amount_items": total_items,
+            "total_discount": discount,
+            "total_increase": increase,
+            "delivery_fee": delivery_fee,
+            "service_tax_fee": service_tax,
+            "total_amount": total_amount,
+            "production_seconds": rng.integers(300, 1201, n),
+            "delivery_seconds": np.where(is_delivery, rng.integers(0, 2401, n), 0),
+            "people_quantity": rng.integers(1, 5, n),
+            "paytype_id": rng.choice(dims["paytype_ids"], n),
+        },
+        "items": {
+            "sale_pos": sale_pos,
+            "product_id": rng.choice(dims["product_ids"], m),
+            "price": prices,
+        },
+    }
+
+
+def _load_dims(conn, brand_id: int) -> dict:
+    col = lambda sql: np.array([r[0] for r in conn.execute(text(sql), {"b": brand_id})])
+    channels = conn.execute(text("SELECT id, name, type FROM channels WHERE brand_id=:b ORDER BY id"), {"b": brand_id}).all()
+    dims = {
+        "store_ids": col("SELECT id FROM stores WHERE brand_id=:b ORDER BY id"),
+        "sub_brand_ids": col("SELECT id FROM sub_brands WHERE brand_id=:b ORDER BY id"),
+        "product_ids": col("SELECT id FROM products WHERE brand_id=:b ORDER BY id"),
+        "paytype_ids": col("SELECT id FROM payment_types WHERE brand_id=:b ORDER BY id"),
+        "channel_ids": np.array([c[0] for c in channels]),
+        "delivery_mask": np.array([c[2] == "D" for c in channels], dtype=bool),
+    }
+    if not all(len(v) for v in dims.values()):
+        raise RuntimeError("❌ Dimensões insuficientes. Execute seed_dimensions primeiro.")
+    # date_key/hour_key só existem após schema_analytics.sql
+    dims["has_date_key"] = bool(conn.execute(text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'sales' AND column_name = 'date_key'
+    """)).scalar())
+    weights = np.array([0.45 if c[1] == "Presencial" else 0.183333 for c in channels])
+    dims["channel_weights"] = weights / weights.sum()
+    return dims
+
+
+def _copy_frame(cursor, table: str, frame) -> None:
+    buf = io.StringIO()
+    frame.to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(frame.columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def _write_chunk(conn, arrays: dict, run_id: str, first_pos: int, dims: dict) -> None:
+    """Reserva ids na sequence e grava sales/product_sales/payments via COPY."""
+    import pandas as pd
+
+    s, it = arrays["sales"], arrays["items"]
+    n = len(s["store_id"])
+    last_id = conn.execute(
+        text("SELECT setval('sales_id_seq', nextval('sales_id_seq') + :n - 1)"), {"n": n}
+    ).scalar()
+    ids = np.arange(last_id - n + 1, last_id + 1)
+
+    sales = pd.DataFrame({
+        "id": ids,
+        "store_id": s["store_id"],
+        "sub_brand_id": s["sub_brand_id"],
+        "customer_id": None,
+        "channel_id": s["channel_id"],
+        "cod_sale1": run_id + "-" + pd.Series(np.arange(first_pos, first_pos + n)).astype(str),
+        "cod_sale2": None,
+        "created_at": s["created_at"],
+        "customer_name": None,
+        "sale_status_desc": "PAID",
+        "total_amount_items": s["total_amount_items"],
+        "total_discount": s["total_discount"],
+        "total_increase": s["total_increase"],
+        "delivery_fee": s["delivery_fee"],
+        "service_tax_fee": s["service_tax_fee"],
+        "total_amount": s["total_amount"],
+        "value_paid": s["total_amount"],
+        "production_seconds": s["production_seconds"],
+        "delivery_seconds": s["delivery_seconds"],
+        "people_quantity": s["people_quantity"],
+        "discount_reason": None,
+        "increase_reason": None,
+        "origin": np.where(s["is_delivery"], "DELIVERY", "POS"),
+    }, columns=SALES_COPY_COLS)
+    if dims.get("has_date_key"):
+        sales["date_key"], sales["hour_key"] = local_keys(s["created_at"])
+    items = pd.DataFrame({
+        "sale_id": ids[it["sale_pos"]],
+        "product_id": it["product_id"],
+        "quantity": 1.0,
+        "base_price": it["price"],
+        "total_price": it["price"],
+    })
+    payments = pd.DataFrame({
+        "sale_id": ids,
+        "payment_type_id": s["paytype_id"],
+        "value": s["total_amount"],
+        "is_online": s["is_delivery"],
+        "description": "Pagamento único",
+        "currency": "BRL",
+    })
+
+    cursor = conn.connection.cursor()
+    try:
+        _copy_frame(cursor, "sales", sales)
+        _copy_frame(cursor, "product_sales", items)
+        _copy_frame(cursor, "payments", payments)
+    finally:
+        cursor.close()
+
+
+def seed_sales_vectorized(rows: int, months: int, seed: int = RANDOM_SEED, dry_run: bool = False, brand_id=None):
+    """
+    ⚡ Gera <rows> vendas em blocos vetorizados (mesmas distribuições do
+    seed_sales). Mesmo seed → mesmos dados (exceto a data base "agora").
+    dry_run=True só sorteia (benchmark da geração, sem banco).
+    """
+    rng = np.random.default_rng(seed)
+    now = datetime.now(ZoneInfo(SALES_CLOCK_TIMEZONE)).replace(tzinfo=None)
+    run_id = uuid.uuid4().hex[:12]   # cod_sale1 único entre execuções
+    started = time.perf_counter()
+
+    if dry_run:
+        # Dimensões do seed_dimensions (8 lojas, 36 produtos, 4 canais)
+        weights = np.array([0.45, 0.183333, 0.183333, 0.183333])
+        dims = {
+            "store_ids": np.arange(1, 9), "sub_brand_ids": np.arange(1, 3),
+            "product_ids": np.arange(1, 37), "paytype_ids": np.arange(1, 5),
+            "channel_ids": np.arange(1, 5), "delivery_mask": np.array([False, True, True, True]),
+            "channel_weights": weights / weights.sum(),
+        }
+        for pos in range(0, rows, VECTOR_CHUNK):
+            arrays = generate_sales_arrays(rng, min(VECTOR_CHUNK, rows - pos), months, now, dims)
+            local_keys(arrays["sales"]["created_at"])
+    else:
+        with engine.begin() as conn:
+            dims = _load_dims(conn, brand_id)
+            for pos in range(0, rows, VECTOR_CHUNK):
+                arrays = generate_sales_arrays(rng, min(VECTOR_CHUNK, rows - pos), months, now, dims)
+                _write_chunk(conn, arrays, run_id, pos, dims)
+                print(f"   … {min(pos + VECTOR_CHUNK, rows)}/{rows} vendas")
+
+    elapsed = time.perf_counter() - started
+    print(f"⏱️ {rows} vendas em {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} vendas/s)")
+
 # ============================================================
 # 🚀 CLI
 # ============================================================
@@ -416,15 +682,33 @@ def main():
     ap = ArgumentParser(description="Gerador de dados ERP compatível com schema_postgres.sql")
     ap.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="Quantidade de vendas a gerar (default: 10000)")
     ap.add_argument("--months", type=int, default=DEFAULT_MONTHS, help="Janela temporal (meses) (default: 3)")
+    ap.add_argument("--seed", type=int, default=RANDOM_SEED, help="Semente (default: 42)")
+    ap.add_argument("--legacy", action="store_true", help="Usa o laço linha a linha original (lento)")
+    ap.add_argument("--dry-run", action="store_true", help="Só sorteia os dados (benchmark, sem banco)")
+    ap.add_argument("--brand", type=int, default=None, help="brand_id a semear (id fixo; grava no shard de BRAND_SHARDS)")
+    ap.add_argument("--brand-name", default=None, help="Nome da marca com --brand (default: 'Marca <id>')")
     args = ap.parse_args()
 
-    print(f"🌍 Modo: {DB_MODE} | Conexão: {DATABASE_URL.split('@')[-1]}")
+    if args.dry_run:
+        seed_sales_vectorized(args.rows, args.months, seed=args.seed, dry_run=True)
+        return
+
+    url = DATABASE_URL
+    if args.brand is not None:
+        global engine
+        url = shard_url(args.brand)
+        engine = get_engine(url)
+    print(f"🌍 Modo: {DB_MODE} | Conexão: {url.split('@')[-1]}")
     print("🧱 Seeding dimensões...")
-    seed_dimensions()
-    print("✅ Dimensões OK.")
+    brand_id = seed_dimensions(args.brand, args.brand_name)
+    print(f"✅ Dimensões OK (marca {brand_id}).")
 
     print(f"🧾 Gerando {args.rows} vendas em {args.months} meses...")
-    seed_sales(args.rows, args.months)
+    if args.legacy:
+        seed_sales(args.rows, args.months, brand_id)
+        print("ℹ️ --legacy não grava date_key/hour_key: rode python -m src.services.calendar_service")
+    else:
+        seed_sales_vectorized(args.rows, args.months, seed=args.seed, brand_id=brand_id)
     print("✅ Vendas/itens/pagamentos inseridos com sucesso.")
     print("🏁 Pronto. Teste as rotas /metrics e o dashboard.")
 
@@ -0,0 +1,320 @@
+-- ============================================================
+-- 📊 SCHEMA ANALÍTICO - RESTAURANT ANALYTICS
+-- ============================================================
+-- Autor: Magali Leodato
+-- Projeto: Restaurant Analytics MVP
+-- Descrição: Tabelas DERIVADAS (agregados e sketches) mantidas pelo
+--            backend a partir das tabelas do ERP (schema_postgres.sql).
+--            Script idempotente: pode ser reaplicado com segurança.
+-- Uso:
+--   from src.database.session import import_schema
+--   import_schema("data/schema_analytics.sql")
+-- ============================================================
+
+-- ============================================================
+-- 📅 AGREGADOS DIÁRIOS POR LOJA × CANAL
+-- ============================================================
+-- Uma linha por (dia, loja, canal) com totais exatos e sketches
+-- mescláveis (t-digest para tempos, HyperLogLog para clientes).
+-- Qualquer janela é respondida mesclando poucas dezenas de linhas.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS daily_aggregates (
+    day DATE NOT NULL,
+    store_id INTEGER NOT NULL REFERENCES stores(id),
+    channel_id INTEGER NOT NULL REFERENCES channels(id),
+    orders BIGINT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    production_digest BYTEA,
+    delivery_digest BYTEA,
+    customers_hll BYTEA,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (day, store_id, channel_id)
+);
+
+-- Índice de apoio ao job de agregação (varredura por faixa de datas)
+CREATE INDEX IF NOT EXISTS idx_sales_created_at ON sales (created_at);
+
+-- Paginação keyset de /sales: ORDER BY created_at DESC, id DESC + (created_at, id) < cursor
+CREATE INDEX IF NOT EXISTS idx_sales_created_at_id ON sales (created_at DESC, id DESC);
+
+-- ============================================================
+-- 📥 INGESTÃO (POST /ingest/sales)
+-- ============================================================
+-- Chave de idempotência das vendas: (store_id, cod_sale1).
+-- Staging UNLOGGED (sem WAL): cada lote usa seu batch_id e apaga as
+-- próprias linhas na mesma transação do merge.
+-- ============================================================
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_sales_store_cod_sale1
+    ON sales (store_id, cod_sale1) WHERE cod_sale1 IS NOT NULL;
+
+CREATE UNLOGGED TABLE IF NOT EXISTS ingest_sales_stage (
+    batch_id VARCHAR(32) NOT NULL,
+    seq INTEGER NOT NULL,
+    sale_id INTEGER,
+    store_id INTEGER NOT NULL,
+    sub_brand_id INTEGER,
+    customer_id INTEGER,
+    channel_id INTEGER NOT NULL,
+    cod_sale1 VARCHAR(100) NOT NULL,
+    cod_sale2 VARCHAR(100),
+    created_at TIMESTAMP NOT NULL,
+    customer_name VARCHAR(100),
+    sale_status_desc VARCHAR(100) NOT NULL,
+    total_amount_items DECIMAL(10,2) NOT NULL,
+    total_discount DECIMAL(10,2),
+    total_increase DECIMAL(10,2),
+    delivery_fee DECIMAL(10,2),
+    service_tax_fee DECIMAL(10,2),
+    total_amount DECIMAL(10,2) NOT NULL,
+    value_paid DECIMAL(10,2),
+    production_seconds INTEGER,
+    delivery_seconds INTEGER,
+    people_quantity INTEGER,
+    discount_reason VARCHAR(300),
+    increase_reason VARCHAR(300),
+    origin VARCHAR(100)
+);
+CREATE INDEX IF NOT EXISTS idx_ingest_sales_stage_batch ON ingest_sales_stage (batch_id, seq);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS ingest_product_sales_stage (
+    batch_id VARCHAR(32) NOT NULL,
+    seq INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    quantity FLOAT NOT NULL,
+    base_price FLOAT NOT NULL,
+    total_price FLOAT NOT NULL,
+    observations VARCHAR(300)
+);
+CREATE INDEX IF NOT EXISTS idx_ingest_product_sales_stage_batch ON ingest_product_sales_stage (batch_id, seq);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS ingest_payments_stage (
+    batch_id VARCHAR(32) NOT NULL,
+    seq INTEGER NOT NULL,
+    payment_type_id INTEGER,
+    value DECIMAL(10,2) NOT NULL,
+    is_online BOOLEAN,
+    description VARCHAR(100),
+    currency VARCHAR(10)
+);
+CREATE INDEX IF NOT EXISTS idx_ingest_payments_stage_batch ON ingest_payments_stage (batch_id, seq);
+
+-- Marca d'água dos dados: versão sobe a cada lote que altera vendas.
+-- Caches e rollups comparam a versão para saber se precisam recalcular.
+CREATE TABLE IF NOT EXISTS data_watermark (
+    name VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    max_sale_id INTEGER,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- ============================================================
+-- 🔖 CHECKPOINTS DE JOBS INCREMENTAIS
+-- ============================================================
+-- Até onde cada job derivado já processou (mês, dia, id...), em texto.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS job_checkpoints (
+    name VARCHAR(50) PRIMARY KEY,
+    checkpoint TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- ============================================================
+-- 👥 COORTES DE CLIENTES (meses fechados)
+-- ============================================================
+-- Uma linha por (segmento, mês da coorte, mês de atividade).
+-- segment_type: all (segment_id = 0) | store | channel
+-- O mês corrente NÃO é gravado: é recalculado a cada consulta.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS cohort_monthly (
+    segment_type VARCHAR(10) NOT NULL,
+    segment_id INTEGER NOT NULL DEFAULT 0,
+    cohort_month DATE NOT NULL,
+    activity_month DATE NOT NULL,
+    customers INTEGER NOT NULL,
+    orders INTEGER NOT NULL,
+    revenue DECIMAL(14,2) NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (segment_type, segment_id, cohort_month, activity_month)
+);
+
+-- Histórico por cliente (coorte do mês corrente lê só quem comprou no mês)
+CREATE INDEX IF NOT EXISTS idx_sales_customer_created
+    ON sales (customer_id, created_at) WHERE customer_id IS NOT NULL;
+
+-- ============================================================
+-- 📅 CALENDÁRIO (horário LOCAL das lojas)
+-- ============================================================
+-- sales.date_key (AAAAMMDD) e sales.hour_key (0–23) no fuso das lojas
+-- (SALES_TIMEZONE), gravados pela ingestão e pelo gerador; o trigger
+-- trg_sales_local_keys preenche qualquer outro INSERT (e UPDATE de created_at).
+-- Histórico via python -m src.services.calendar_service (também gera dim_date
+-- e cria o trigger). KPIs, snapshot e rollups filtram por date_key (índice).
+-- ============================================================
+
+ALTER TABLE sales ADD COLUMN IF NOT EXISTS date_key INTEGER;
+ALTER TABLE sales ADD COLUMN IF NOT EXISTS hour_key SMALLINT;
+
+CREATE INDEX IF NOT EXISTS idx_sales_date_key ON sales (date_key);
+-- Fila do backfill: só as vendas ainda sem chave (fica vazio no dia a dia)
+CREATE INDEX IF NOT EXISTS idx_sales_date_key_pending ON sales (id) WHERE date_key IS NULL;
+
+CREATE TABLE IF NOT EXISTS dim_date (
+    date_key INTEGER PRIMARY KEY,          -- AAAAMMDD
+    full_date DATE NOT NULL UNIQUE,
+    year SMALLINT NOT NULL,
+    quarter SMALLINT NOT NULL,
+    month SMALLINT NOT NULL,
+    day SMALLINT NOT NULL,
+    dow SMALLINT NOT NULL,                 -- 0 = domingo (igual a EXTRACT(DOW))
+    iso_week SMALLINT NOT NULL,
+    day_name VARCHAR(10) NOT NULL,
+    month_name VARCHAR(10) NOT NULL,
+    is_weekend BOOLEAN NOT NULL,
+    is_holiday BOOLEAN NOT NULL DEFAULT FALSE,
+    holiday_name VARCHAR(50)
+);
+
+CREATE TABLE IF NOT EXISTS dim_hour (
+    hour_key SMALLINT PRIMARY KEY,         -- 0–23
+    label VARCHAR(5) NOT NULL,             -- '14h'
+    daypart VARCHAR(10) NOT NULL           -- madrugada | manhã | almoço | tarde | jantar | noite
+);
+
+INSERT INTO dim_hour (hour_key, label, daypart)
+SELECT h, h || 'h',
+       CASE
+           WHEN h < 6  THEN 'madrugada'
+           WHEN h < 11 THEN 'manhã'
+           WHEN h < 15 THEN 'almoço'
+           WHEN h < 18 THEN 'tarde'
+           WHEN h < 23 THEN 'jantar'
+           ELSE 'noite'
+       END
+FROM generate_series(0, 23) AS h
+ON CONFLICT (hour_key) DO NOTHING;
+
+-- ============================================================
+-- 🚨 ANOMALIAS POR HORA (loja × canal × hora da semana)
+-- ============================================================
+-- anomaly_buckets: horas ainda abertas (vendas novas somadas 1x cada)
+-- anomaly_stats:   média/variância EWMA por slot (0 = domingo 00h … 167)
+-- anomaly_scores:  z-score de cada hora fechada (retenção de 30 dias)
+-- Checkpoint em job_checkpoints (name = 'anomalies').
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS anomaly_buckets (
+    date_key INTEGER NOT NULL,
+    hour_key SMALLINT NOT NULL,
+    store_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    orders INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (date_key, hour_key, store_id, channel_id)
+);
+
+CREATE TABLE IF NOT EXISTS anomaly_stats (
+    store_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    hour_of_week SMALLINT NOT NULL,
+    n INTEGER NOT NULL DEFAULT 0,
+    revenue_mean DOUBLE PRECISION NOT NULL DEFAULT 0,
+    revenue_var DOUBLE PRECISION NOT NULL DEFAULT 0,
+    orders_mean DOUBLE PRECISION NOT NULL DEFAULT 0,
+    orders_var DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (store_id, channel_id, hour_of_week)
+);
+CREATE INDEX IF NOT EXISTS idx_anomaly_stats_slot ON anomaly_stats (hour_of_week);
+
+CREATE TABLE IF NOT EXISTS anomaly_scores (
+    date_key INTEGER NOT NULL,
+    hour_key SMALLINT NOT NULL,
+    store_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    revenue DECIMAL(14,2) NOT NULL,
+    orders INTEGER NOT NULL,
+    revenue_expected DOUBLE PRECISION,
+    orders_expected DOUBLE PRECISION,
+    revenue_z DOUBLE PRECISION,
+    orders_z DOUBLE PRECISION,
+    PRIMARY KEY (date_key, hour_key, store_id, channel_id)
+);
+
+-- ============================================================
+-- 🎯 SEGMENTOS RFM (recência / frequência / valor)
+-- ============================================================
+-- Uma linha por cliente com compra: agregados somados incrementalmente
+-- (checkpoint 'rfm' em job_checkpoints) + notas 1–5 e segmento.
+-- Job noturno: python -m src.services.rfm_service
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS customer_segments (
+    customer_id INTEGER PRIMARY KEY,
+    first_purchase TIMESTAMP NOT NULL,
+    last_purchase TIMESTAMP NOT NULL,
+    orders INTEGER NOT NULL,
+    revenue DECIMAL(14,2) NOT NULL,
+    r_score SMALLINT,
+    f_score SMALLINT,
+    m_score SMALLINT,
+    rfm_code CHAR(3),                      -- '545' = R5 F4 M5
+    segment VARCHAR(20),
+    scored_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_customer_segments_segment ON customer_segments (segment);
+
+-- ============================================================
+-- 🗺️ MAPA DE CALOR DE ENTREGAS (grade lat/lon por zoom)
+-- ============================================================
+-- Uma linha por zoom × dia local × célula × loja; somada a partir dos
+-- endereços novos (checkpoint 'delivery_heatmap' em job_checkpoints).
+-- Célula = FLOOR(longitude / lado), FLOOR(latitude / lado); lados por zoom
+-- em heatmap_service.GRID_ZOOMS.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS delivery_grid_daily (
+    zoom SMALLINT NOT NULL,
+    date_key INTEGER NOT NULL,
+    cell_x INTEGER NOT NULL,
+    cell_y INTEGER NOT NULL,
+    store_id INTEGER NOT NULL,
+    orders INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    delivery_seconds_sum BIGINT NOT NULL DEFAULT 0,
+    delivery_samples INTEGER NOT NULL DEFAULT 0,   -- vendas com delivery_seconds
+    PRIMARY KEY (zoom, date_key, cell_x, cell_y, store_id)
+);
+
+-- 1º endereço de cada venda (deduplicação no incremental)
+CREATE INDEX IF NOT EXISTS idx_delivery_addresses_sale ON delivery_addresses (sale_id, id);
+
+-- ============================================================
+-- 🧮 PIVÔ (GET /metrics/pivot)
+-- ============================================================
+-- Pagamentos de uma venda (dimensão payment_type: LATERAL por venda
+-- em vez de varrer payments inteira)
+-- ============================================================
+
+CREATE INDEX IF NOT EXISTS idx_payments_sale ON payments (sale_id, payment_type_id);
+
+-- ============================================================
+-- 📄 DETALHE DA VENDA (GET /sales/{id}, /sales?ids=)
+-- ============================================================
+-- Tabelas filhas pela chave do pai: cada nível do documento JSON é uma
+-- busca por índice (pagamentos e endereços já cobertos acima)
+-- ============================================================
+
+CREATE INDEX IF NOT EXISTS idx_product_sales_sale ON product_sales (sale_id);
+CREATE INDEX IF NOT EXISTS idx_item_product_sales_parent ON item_product_sales (product_sale_id);
+CREATE INDEX IF NOT EXISTS idx_item_item_product_sales_parent ON item_item_product_sales (item_product_sale_id);
+CREATE INDEX IF NOT EXISTS idx_delivery_sales_sale ON delivery_sales (sale_id);
+CREATE INDEX IF NOT EXISTS idx_coupon_sales_sale ON coupon_sales (sale_id);
+
+-- ============================================================
+-- ✅ FINALIZAÇÃO DO SCHEMA ANALÍTICO
+-- ============================================================